@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+HTTP传输层基准测试
+对比每次请求新建连接（裸 requests.get）与共享连接池（HTTPTransport）的单次请求耗时。
+本地模拟服务在每个新连接上等待 --handshake 毫秒，模拟公网TCP/TLS握手的往返开销。
+
+用法:
+    python benchmarks/bench_http_transport.py --requests 50 --handshake 30
+"""
+
+import argparse
+import socket
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import requests
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from modules.http_transport import HTTPTransport  # noqa: E402
+
+
+def start_server(handshake: float):
+    """启动本地HTTP/1.1服务，新连接建立时睡眠 handshake 秒"""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            time.sleep(handshake)
+            super().setup()
+            # 头和正文分两次写出，长连接上不关 Nagle 会被延迟确认卡住约40ms
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        def do_GET(self):
+            body = b'{"ok": true}'
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/"
+
+
+def bench(get, url: str, count: int):
+    timings = []
+    for _ in range(count):
+        start = time.perf_counter()
+        response = get(url)
+        response.raise_for_status()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(name: str, timings):
+    ordered = sorted(timings)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    print(f"{name:10s} 平均 {statistics.mean(timings) * 1000:.1f}ms  p50 {statistics.median(timings) * 1000:.1f}ms  "
+          f"p95 {p95 * 1000:.1f}ms")
+    return statistics.mean(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP传输层基准测试")
+    parser.add_argument("--requests", type=int, default=50, help="每种模式的请求数")
+    parser.add_argument("--handshake", type=float, default=30.0, help="模拟的建连耗时（毫秒）")
+    args = parser.parse_args()
+
+    server, url = start_server(args.handshake / 1000)
+    try:
+        bare = report("requests", bench(lambda u: requests.get(u, timeout=10), url, args.requests))
+        transport = HTTPTransport()
+        pooled = report("transport", bench(transport.get, url, args.requests))
+        for host, entry in transport.stats().items():
+            print(f"{host}: 请求 {entry['requests']}  新建连接 {entry['connections']}  "
+                  f"复用率 {entry['reuse_rate']:.0%}")
+        transport.close()
+        print(f"transport 相对 requests 加速: {bare / pooled:.2f}x")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+段落视频渲染基准测试
+对比分段渲染（N个片段编码 + 拼接 + 混音，共N+2个ffmpeg进程）与单次渲染（1个ffmpeg进程）
+
+用法:
+    python benchmarks/bench_paragraph_render.py --images 4 --duration 20 --runs 3
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import loop  # noqa: E402
+
+
+def make_fixtures(work_dir: Path, image_count: int, duration: float):
+    """用ffmpeg的lavfi生成测试图片和测试音频"""
+    images = []
+    for i in range(image_count):
+        img = work_dir / f"scene_{i}.jpg"
+        subprocess.run([
+            'ffmpeg', '-y', '-v', 'error',
+            '-f', 'lavfi', '-i', f'testsrc2=size=1920x1080:rate=1',
+            '-frames:v', '1', str(img)
+        ], check=True)
+        images.append(str(img))
+    audio = work_dir / "audio.wav"
+    subprocess.run([
+        'ffmpeg', '-y', '-v', 'error',
+        '-f', 'lavfi', '-i', f'sine=frequency=440:duration={duration}',
+        '-ar', '16000', '-ac', '1', str(audio)
+    ], check=True)
+    return images, str(audio)
+
+
+def bench(renderer: str, images, audio: str, work_dir: Path, runs: int):
+    timings = []
+    output = work_dir / f"{renderer}.mp4"
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = loop.render_paragraph_video(audio, images, str(output), renderer=renderer)
+        timings.append(time.perf_counter() - start)
+        if not result:
+            raise RuntimeError(f"{renderer} 渲染失败")
+    return timings, loop.get_audio_duration(str(output))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="段落视频渲染基准测试")
+    parser.add_argument("--images", type=int, default=4, help="场景图片数量")
+    parser.add_argument("--duration", type=float, default=20.0, help="音频时长（秒）")
+    parser.add_argument("--runs", type=int, default=3, help="每种渲染模式的重复次数")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = Path(tmp)
+        images, audio = make_fixtures(work_dir, args.images, args.duration)
+
+        results = {}
+        for renderer in ("segments", "single_pass"):
+            timings, output_duration = bench(renderer, images, audio, work_dir, args.runs)
+            results[renderer] = statistics.mean(timings)
+            processes = args.images + 2 if renderer == "segments" else 1
+            print(f"{renderer:12s} 平均 {results[renderer]:.2f}s  最快 {min(timings):.2f}s  "
+                  f"ffmpeg进程数 {processes}  输出时长 {output_duration:.2f}s")
+
+        print(f"single_pass 相对 segments 加速: {results['segments'] / results['single_pass']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
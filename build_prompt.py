@@ -1,10 +1,19 @@
 import os
+import re
 import json
-import time
-import requests
+import asyncio
+import argparse
 from pathlib import Path
 from tqdm import tqdm
 from loguru import logger
+from modules.artifact_io import read_sidecar, write_text
+from modules.character_registry import PROFILE_KEY, CharacterRegistry, build_registry, reference_context
+from modules.chunker import chunk_text, estimate_tokens, input_budget, merge_breakdowns
+from modules.json_repair import (FIX_TRUNCATED, check_breakdown, merge_paragraphs, paragraph_errors,
+                                 reask_prompt, repair_json)
+from modules.json_stream import IncrementalJSONParser
+from modules.llm_cache import LLMCache, get_llm_cache, prompt_version
+from modules.llm_client import LLMClient, LLMError
 
 # 配置
 API_KEY = os.getenv("CLAUDE_API_KEY")
@@ -13,21 +22,47 @@ MODEL = "doubao-1.5-pro-256k-250115"
 SYSTEM_PROMPT_PATH = Path("chapters/prompt_change.md")
 CHAPTERS_DIR = Path("chapters/split_chapters")
 OUTPUT_DIR = Path("chapters/processed")
-MAX_RETRY = 1
-RETRY_INTERVAL = 10  # seconds
+CONCURRENCY = 8  # 同时进行中的章节请求数；实际请求速率仍受 rate_limits.ark 约束
+REQUEST_TIMEOUT = (10, 900)  # (连接, 读取) 秒
+MAX_RETRIES = 5  # 超时、429、5xx 按带抖动的指数退避重试
+STREAM = True  # 流式输出，每个段落生成完即回调 on_scene
+SCENE_ARRAY_KEY = "场景拆解"
+CONTEXT_TOKENS = 256000  # 模型上下文窗口
+MAX_OUTPUT_TOKENS = 16384  # 为输出预留
+WINDOW_TOKENS = 4000  # 单个窗口的输入上限，约为一个普通章节；拆解输出远长于输入，窗口越小单次请求越快
+REGISTRY_PATH = Path("chapters/character_registry.json")  # 全局人物库，章节请求只附带本章提到的人物
+REPAIR_ROUNDS = 2  # 修复后仍有缺失或损坏的段落时，只追问这些段落的最多次数
+
+_client = None
+_registry = None
+
+
+def get_client():
+    """所有章节请求共享的客户端（连接池由全局 HTTP 传输层提供，http.pool_size 应不小于 CONCURRENCY）"""
+    global _client
+    if _client is None:
+        _client = LLMClient(API_URL, API_KEY, MODEL, limiter="ark", timeout=REQUEST_TIMEOUT,
+                            max_retries=MAX_RETRIES,
+                            headers={"x-api-key": API_KEY, "anthropic-version": "2023-06-01"},
+                            cache=get_llm_cache(SYSTEM_PROMPT_PATH.stem))
+    return _client
+
+
+def get_registry(rebuild=False):
+    """全局人物库；文件不存在（或 rebuild）时从已处理的章节重建"""
+    global _registry
+    if _registry is None or rebuild:
+        if REGISTRY_PATH.exists() and not rebuild:
+            _registry = CharacterRegistry(REGISTRY_PATH)
+        else:
+            _registry = build_registry(REGISTRY_PATH, sorted(OUTPUT_DIR.glob("chapter_*_processed.json")))
+    return _registry
 
 def load_system_prompt():
     with open(SYSTEM_PROMPT_PATH, "r", encoding="utf-8") as f:
         return f.read()
 
-def call_claude_api(system_prompt, user_input):
-    headers = {
-        "x-api-key": API_KEY,
-        "anthropic-version": "2023-06-01",
-        "Authorization": f"Bearer {API_KEY}",
-        "content-type": "application/json"
-    }
-
+def call_claude_api(system_prompt, user_input, on_scene=None):
     temp_json = """
     请直接按照以下格式输出，不要做多余的对话，不要输出任何解释。也不能偷懒，要把所有的段落和场景都完全生成，最大不要超过15个场景。
 
@@ -330,38 +365,233 @@ def call_claude_api(system_prompt, user_input):
     """
 
 
-    dataSystem = {
-        "model": MODEL,
-        "thinking": {
-            "type": "enabled"
-        },
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_input}
-        ],
-        "temperature": 0.7
-    }
+    messages, params = build_request(system_prompt, user_input)
+    if on_scene is None:
+        return LLMClient.content(get_client().chat(messages, **params))
+    return LLMClient.content(get_client().chat_stream(messages, on_text=scene_stream(on_scene), **params))
+
+
+def build_request(system_prompt, user_input, context=""):
+    """返回 (messages, 其他请求参数)；context 为附在章节正文前的人物库上下文"""
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": f"{context}\n\n{user_input}" if context else user_input}
+    ]
+    return messages, {"thinking": {"type": "enabled"}, "temperature": 0.7}
+
+
+def scene_stream(on_scene):
+    """返回流式文本回调：场景拆解 中每个段落对象完整到达时调用 on_scene(段落)"""
+    parser = IncrementalJSONParser([SCENE_ARRAY_KEY])
+
+    def on_text(delta):
+        for scene in parser.feed(delta):
+            on_scene(scene)
+
+    return on_text
+
+
+def output_path(chapter_file):
+    return OUTPUT_DIR / (chapter_file.stem.replace("_detailed", "") + "_processed.json")
+
+
+def read_chapter(chapter_file):
+    with open(chapter_file, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def chapter_no(chapter_file):
+    match = re.search(r"chapter_(\d+)", chapter_file.name)
+    return int(match.group(1)) if match else None
+
+
+def request_key(system_prompt, user_input):
+    """
+    章节请求键（模型、提示词、输入和生成参数的哈希），写入结果文件的元数据
+
+    不含人物库上下文：人物库随其他章节更新时不会让已有结果过期
+    """
+    messages, params = build_request(system_prompt, user_input)
+    return LLMCache.make_key({"model": MODEL, "messages": messages, **params})
+
+
+def is_up_to_date(chapter_file, system_prompt):
+    """
+    结果文件是否由当前提示词和输入生成
+
+    元数据中记录的请求键与当前不一致（提示词或章节文本改过）时视为过期；
+    没有记录请求键的旧结果无法判断，按已完成处理。
+    """
+    output_file = output_path(chapter_file)
+    if not output_file.exists():
+        return False
+    recorded = (read_sidecar(output_file) or {}).get("llm_key")
+    return recorded is None or recorded == request_key(system_prompt, read_chapter(chapter_file))
+
+
+async def repair_breakdown(client, messages, params, result, name):
+    """
+    解析并校验一个窗口的拆解结果
+
+    能修复的格式问题直接修复；仍有缺失或损坏的段落时，在原对话后追问只输出这些段落，
+    补回的有效段落按序号并入，最多追问 REPAIR_ROUNDS 次。
+
+    返回 (章节JSON, 追问补回的段落序号)；仍不完整时抛出 json.JSONDecodeError
+    """
+    data, fixes = repair_json(result)
+    if fixes:
+        logger.warning(f"{name} 输出已修复: {'、'.join(fixes)}")
+    report = check_breakdown(data, FIX_TRUNCATED in fixes)
+    patched = set()
+    for _ in range(REPAIR_ROUNDS):
+        if report.ok or report.errors:
+            break
+        numbers = [p.get("序号") for p in data.get(SCENE_ARRAY_KEY, []) if isinstance(p, dict)]
+        last = max((n for n in numbers if isinstance(n, int)), default=0)
+        prompt = reask_prompt(report, last)
+        logger.warning(f"{name} 重新请求段落: {prompt}")
+        follow_up = messages + [{"role": "assistant", "content": result}, {"role": "user", "content": prompt}]
+        reply = LLMClient.content(await client.chat_async(follow_up, **params))
+        try:
+            paragraphs = repair_json(reply)[0].get(SCENE_ARRAY_KEY) or []
+        except (json.JSONDecodeError, AttributeError):
+            logger.warning(f"{name} 追问的回复无法解析")
+            paragraphs = []
+        data = merge_paragraphs(data, paragraphs)
+        patched.update(p["序号"] for p in paragraphs if not paragraph_errors(p))
+        report = check_breakdown(data)
+    if not report.ok:
+        problems = report.errors + [f"段落 {n} 缺失或无效" for n in report.todo]
+        raise json.JSONDecodeError(f"拆解结果不完整: {'；'.join(problems) or '末尾被截断'}", result, 0)
+    return data, patched
+
+
+async def process_chapter(client, system_prompt, chapter_file, stream=STREAM, on_scene=None, registry=None):
+    """
+    拆解一个章节并原子写入结果
+
+    流式模式下每个段落生成完即调用 on_scene(chapter_file, 段落)（在请求线程中调用），
+    下游的图片和配音可以在模型写后面段落时先开始。
+
+    传入人物库时请求只附带本章提到的已登记人物，模型以引用代替重复描述；
+    附带的档案按章节记录在人物库中（章节输入不变时沿用，请求内容与LLM缓存键保持一致），
+    结果按同一份档案还原为完整JSON后写入，并把新人物和变化按章节号合并回人物库。
+
+    超出窗口预算的章节（如合并了多章的文件）按章节标题/段落边界切成多个窗口并行请求，
+    各窗口附带相同的人物库上下文，结果按窗口顺序合并并重新编号。
+
+    模型输出先做容错修复和结构校验，缺失或损坏的段落单独追问后按序号并入，不重跑整章。
+
+    返回是否成功；修复和追问后仍不完整时原文另存为 *_processed.raw.txt，
+    不占用结果文件，下次运行会重新请求该章节。
+    """
+    output_file = output_path(chapter_file)
+    user_input = read_chapter(chapter_file)
+    logger.info(f"Processing {chapter_file.name}")
+    context = ""
+    profiles = {}
+    if registry is not None:
+        profiles = registry.chapter_profiles(chapter_file.name, request_key(system_prompt, user_input),
+                                             registry.mentioned(user_input))
+        context = reference_context(profiles)
+        if profiles:
+            logger.info(f"{chapter_file.name} 附带已登记人物: {'、'.join(profiles)}")
+    budget = input_budget(CONTEXT_TOKENS, MAX_OUTPUT_TOKENS, system_prompt + context, WINDOW_TOKENS)
+    windows = chunk_text(user_input, budget)
+    if len(windows) > 1:
+        logger.info(f"{chapter_file.name} 约 {estimate_tokens(user_input)} tokens，分为 {len(windows)} 个窗口并行请求")
+
+    emitted = set()
+
+    def scene_ready(scene):
+        if paragraph_errors(scene):
+            return  # 损坏的段落等追问补回后再回调
+        emitted.add(scene.get("序号"))
+        if registry is not None:
+            scene = registry.expand_chapter(scene, base=profiles)  # 按请求时附带的档案还原
+        logger.info(f"{chapter_file.name} 段落 {scene.get('序号')} 已生成")
+        if on_scene is not None:
+            on_scene(chapter_file, scene)
+
+    async def request_window(index, window):
+        messages, params = build_request(system_prompt, window, context)
+        # 只有第一个窗口的段落序号在生成时就是最终序号，可以边生成边回调
+        if stream and index == 0:
+            result = await client.chat_stream_async(messages, on_text=scene_stream(scene_ready), **params)
+        else:
+            result = await client.chat_async(messages, **params)
+        return messages, params, LLMClient.content(result)
 
-    for attempt in range(MAX_RETRY):
+    replies = await asyncio.gather(*(request_window(i, w) for i, w in enumerate(windows)))
+    parsed = []
+    for index, (messages, params, result) in enumerate(replies):
         try:
-            response = requests.post(API_URL, headers=headers, json=dataSystem)
-            if response.status_code == 200:
-                result = response.json()
-                logger.info(result)
-                if result.get("error"):
-                    logger.error(f"API error: {result.get('error')}")
-                logger.info(f"Total tokens: {result['usage']['total_tokens']}")
-                logger.info(f"Prompt tokens: {result['usage']['prompt_tokens']}")
-                return result["choices"][0]["message"]["content"]
-            else:
-                logger.error(f"API error: {response.status_code} {response.text}")
-        except Exception as e:
-            logger.error(f"Request failed: {e}")
-        logger.info(f"Retrying in {RETRY_INTERVAL} seconds...")
-        time.sleep(RETRY_INTERVAL)
-    raise RuntimeError("Claude API failed after retries.")
+            data, patched = await repair_breakdown(client, messages, params, result, chapter_file.name)
+        except json.JSONDecodeError as e:
+            logger.error(f"解析JSON失败: {chapter_file.name}: {e}")
+            write_text(output_file.with_suffix(".raw.txt"), "\n\n".join(reply[2] for reply in replies))
+            if client.cache is not None:
+                client.cache.discard(client.payload(messages, **params))
+            return False
+        if index == 0:
+            emitted.difference_update(patched)  # 补回的段落替换了流式时收到的版本
+        parsed.append(data)
+    json_obj = merge_breakdowns(parsed)
+    if registry is not None:
+        json_obj = registry.expand_chapter(json_obj, base=profiles)
+        changed = registry.merge(chapter_no(chapter_file), json_obj.get(PROFILE_KEY) or {})
+        if changed:
+            logger.info(f"人物库更新: {'、'.join(changed)}")
+        registry.save()  # 同时保存本章附带的档案记录
+    if stream:
+        for scene in json_obj.get(SCENE_ARRAY_KEY, []):
+            if scene.get("序号") in emitted:
+                continue
+            logger.info(f"{chapter_file.name} 段落 {scene.get('序号')} 已生成")
+            if on_scene is not None:
+                on_scene(chapter_file, scene)
+    write_text(output_file, json.dumps(json_obj, ensure_ascii=False, indent=4),
+               extra={"llm_key": request_key(system_prompt, user_input)})
+    return True
+
+
+async def process_chapters(chapter_files, system_prompt, concurrency=CONCURRENCY, stream=STREAM, on_scene=None,
+                           registry=None):
+    """
+    并发拆解章节，同时进行中的请求数不超过 concurrency
+
+    返回成功的章节数
+    """
+    client = get_client()
+    semaphore = asyncio.Semaphore(concurrency)
+    progress = tqdm(total=len(chapter_files), desc="Processing chapters")
+
+    async def worker(chapter_file):
+        async with semaphore:
+            try:
+                return await process_chapter(client, system_prompt, chapter_file, stream, on_scene, registry)
+            except (LLMError, KeyError, IndexError, OSError) as e:
+                logger.error(f"处理 {chapter_file.name} 失败: {e}")
+                return False
+            finally:
+                progress.update(1)
+
+    try:
+        results = await asyncio.gather(*(worker(f) for f in chapter_files))
+    finally:
+        progress.close()
+    return sum(results)
+
 
 def main():
+    parser = argparse.ArgumentParser(description="调用大模型把章节拆解为场景JSON")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help=f"并发章节数（默认 {CONCURRENCY}）")
+    parser.add_argument("--no-stream", action="store_true", help="关闭流式输出，等完整回复后再解析")
+    parser.add_argument("--prune-cache", action="store_true", help="删除旧版本提示词产生的LLM缓存条目")
+    parser.add_argument("--no-registry", action="store_true", help="不使用全局人物库，每章完整描述所有人物")
+    parser.add_argument("--rebuild-registry", action="store_true", help="从已处理的章节重建全局人物库")
+    args = parser.parse_args()
+
     if not API_KEY:
         logger.error("请先设置环境变量 CLAUDE_API_KEY")
         return
@@ -371,31 +601,20 @@ def main():
 
     chapter_files = sorted(CHAPTERS_DIR.glob("chapter_*_detailed.txt"))
     logger.info(f"共检测到 {len(chapter_files)} 个章节文件。")
+    pending = [f for f in chapter_files if not is_up_to_date(f, system_prompt)]
+    if len(pending) < len(chapter_files):
+        logger.info(f"{len(chapter_files) - len(pending)} 个章节已有当前提示词的结果，跳过")
 
-    for chapter_file in tqdm(chapter_files, desc="Processing chapters"):
-        output_file = OUTPUT_DIR / (chapter_file.stem.replace("_detailed", "") + "_processed.json")
-        if output_file.exists():
-            logger.info(f"{output_file} 已存在，跳过")
-            continue  # 跳过已生成
-        with open(chapter_file, "r", encoding="utf-8") as f:
-            user_input = f.read()
-        try:
-            logger.info(f"Processing {chapter_file.name}")
-            result = call_claude_api(system_prompt, user_input)
-            # 尝试解析为JSON，如果失败则原样保存
-            try:
-                result = result.replace("```json", "").replace("```", "")
-                json_obj = json.loads(result)
-                with open(output_file, "w", encoding="utf-8") as out_f:
-                    logger.info(json_obj)
-                    json.dump(json_obj, out_f, ensure_ascii=False, indent=4)
-            except Exception as e:
-                logger.error(f"解析JSON失败: {e}")
-                with open(output_file, "w", encoding="utf-8") as out_f:
-                    out_f.write(result)
-            time.sleep(1.5)  # 防止触发速率限制
-        except Exception as e:
-            logger.error(f"处理 {chapter_file.name} 失败: {e}")
+    client = get_client()
+    if client.cache is not None and args.prune_cache:
+        client.cache.invalidate(prompt_version(system_prompt))
+    registry = None if args.no_registry else get_registry(rebuild=args.rebuild_registry)
+    done = asyncio.run(process_chapters(pending, system_prompt, max(1, args.concurrency), not args.no_stream,
+                                        registry=registry))
+    logger.info(f"完成 {done}/{len(pending)} 个章节")
+    if client.cache is not None:
+        stats = client.cache.stats()
+        logger.info(f"LLM缓存: 命中 {stats['hits']}，未命中 {stats['misses']}，节省 {stats['saved_tokens']} tokens")
 
 if __name__ == "__main__":
     main()
@@ -1,10 +1,16 @@
 import os
 import json
-import time
-import requests
+import argparse
 from pathlib import Path
 from tqdm import tqdm
 from loguru import logger
+from modules.artifact_io import read_sidecar, write_text
+from modules.character_registry import PROFILE_KEY, CharacterRegistry, build_registry, reference_context
+from modules.json_repair import repair_json
+from modules.json_stream import IncrementalJSONParser
+from modules.llm_batch import LLMBatch
+from modules.llm_cache import LLMCache, get_llm_cache
+from modules.llm_client import LLMClient
 
 # 配置
 API_KEY = os.getenv("CLAUDE_API_KEY")
@@ -13,21 +19,32 @@ MODEL = "claude-sonnet-4-20250514"
 SYSTEM_PROMPT_PATH = Path("chapters/prompt_image.md")
 CHAPTERS_DIR = Path("chapters/processed")
 OUTPUT_DIR = Path("chapters/processed")
-MAX_RETRY = 1
-RETRY_INTERVAL = 10  # seconds
+REQUEST_TIMEOUT = (10, 900)  # (连接, 读取) 秒
+MAX_RETRIES = 5
+SCENE_ARRAY_KEY = "场景提示词列表"
+REGISTRY_PATH = Path("chapters/character_registry.json")  # 与 build_prompt.py 共用的全局人物库
+BATCH_STATE_PATH = Path("cache/llm_batches/prompt_image.json")  # 批处理模式下已提交任务的记录，中断后继续轮询
+BATCH_POLL_INTERVAL = 60  # 秒
+
+_client = None
+
+
+def get_client():
+    global _client
+    if _client is None:
+        _client = LLMClient(API_URL, API_KEY, MODEL, limiter="claude", timeout=REQUEST_TIMEOUT,
+                            max_retries=MAX_RETRIES,
+                            headers={"x-api-key": API_KEY, "anthropic-version": "2023-06-01"},
+                            cache=get_llm_cache(SYSTEM_PROMPT_PATH.stem))
+    return _client
+
 
 def load_system_prompt():
     with open(SYSTEM_PROMPT_PATH, "r", encoding="utf-8") as f:
         return f.read()
 
-def call_claude_api(system_prompt, user_input):
-    headers = {
-        "x-api-key": API_KEY,
-        "anthropic-version": "2023-06-01",
-        "Authorization": f"Bearer {API_KEY}",
-        "content-type": "application/json"
-    }
-
+def build_request(system_prompt, user_input, context=""):
+    """返回 (messages, 其他请求参数)；assistant 消息预填充输出格式，context 为附在输入前的人物库上下文"""
     temp_json = """
     请直接按照以下*格式*输出，不要做多余的对话，不要输出任何解释
 
@@ -56,39 +73,170 @@ def call_claude_api(system_prompt, user_input):
     """
 
 
-    dataSystem = {
-        "model": MODEL,
-        "max_tokens": 200000,
-        # "system": system_prompt,
-        "stop": ["EOF"],
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_input},
-            {"role": "assistant", "content": temp_json}
-        ],
-        "temperature": 0.7
-    }
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": f"{context}\n\n{user_input}" if context else user_input},
+        {"role": "assistant", "content": temp_json}
+    ]
+    return messages, {"max_tokens": 200000, "stop": ["EOF"], "temperature": 0.7}
+
+
+def request_key(system_prompt, user_input):
+    """请求键（不含人物库上下文），写入结果文件的元数据，用于判断结果是否由当前提示词生成"""
+    messages, params = build_request(system_prompt, user_input)
+    return LLMCache.make_key({"model": MODEL, "messages": messages, **params})
+
+
+def prepare_request(system_prompt, user_input, registry=None):
+    """
+    返回 (messages, 其他请求参数, 输入章节的人物档案)
+
+    传入人物库时，章节JSON中已登记人物的档案换成引用、场景中的 详细外貌 删去，
+    改为在输入前附一次人物档案，并要求图片提示词中用 【人物:姓名】 代替外貌描述。
+    附带的是输入章节自己的档案而不是人物库当前版本，请求内容（和LLM缓存键）只取决于输入
+    """
+    if registry is None:
+        return (*build_request(system_prompt, user_input), {})
+    try:
+        chapter = json.loads(user_input)
+    except json.JSONDecodeError:
+        return (*build_request(system_prompt, user_input), {})
+    profiles = chapter.get(PROFILE_KEY) or {}
+    base = {name: profile for name, profile in profiles.items() if name in registry and isinstance(profile, dict)}
+    context = reference_context(base)
+    compact = json.dumps(registry.compact_chapter(chapter, base), ensure_ascii=False, indent=2)
+    return (*build_request(system_prompt, compact, context), profiles)
+
+
+def get_registry():
+    if REGISTRY_PATH.exists():
+        return CharacterRegistry(REGISTRY_PATH)
+    return build_registry(REGISTRY_PATH, sorted(CHAPTERS_DIR.glob("chapter_*_processed.json")))
+
+
+def call_claude_api(system_prompt, user_input, on_scene=None, registry=None):
+    """
+    流式请求图片提示词；每个场景对象完整到达时调用 on_scene(场景)
+
+    传入人物库时输入按引用压缩，on_scene 收到的场景已还原 【人物:姓名】；返回的原文仍需 expand_chapter
+    """
+    messages, params, profiles = prepare_request(system_prompt, user_input, registry)
+    parser = IncrementalJSONParser([SCENE_ARRAY_KEY])
+
+    def on_text(delta):
+        for scene in parser.feed(delta):
+            if registry is not None:
+                scene = registry.expand_chapter(scene, profiles)
+            logger.info(f"场景 {scene.get('场景基本信息', {}).get('场景序号')} 已生成")
+            if on_scene is not None:
+                on_scene(scene)
+
+    result = get_client().chat_stream(messages, on_text=on_text, **params)
+    return LLMClient.content(result)
+
+def save_result(system_prompt, user_input, result, output_file, key, registry):
+    """
+    解析回复并写入图片提示词JSON（容错修复代码块、说明文字、截断等）
+
+    仍无法解析时原文另存为 *.raw.txt 并丢弃该请求的缓存，下次运行重新请求；返回是否成功
+    """
+    try:
+        json_obj, fixes = repair_json(result)
+        if fixes:
+            logger.warning(f"{output_file.name} 输出已修复: {'、'.join(fixes)}")
+        if not isinstance(json_obj, dict) or not json_obj.get(SCENE_ARRAY_KEY):
+            raise json.JSONDecodeError(f"缺少{SCENE_ARRAY_KEY}", result, 0)
+    except json.JSONDecodeError as e:
+        logger.error(f"解析JSON失败: {e}")
+        write_text(output_file.with_suffix(".raw.txt"), result)
+        client = get_client()
+        if client.cache is not None:
+            messages, params, _ = prepare_request(system_prompt, user_input, registry)
+            client.cache.discard(client.payload(messages, **params))
+        return False
+    if registry is not None:
+        json_obj = registry.expand_chapter(json_obj, prepare_request(system_prompt, user_input, registry)[2])
+    logger.info(json_obj)
+    write_text(output_file, json.dumps(json_obj, ensure_ascii=False, indent=4), extra={"llm_key": key})
+    return True
+
+
+def output_path(chapter_file):
+    return OUTPUT_DIR / (chapter_file.stem.replace("_processed", "") + "_image.json")
+
+
+def is_up_to_date(output_file, key):
+    """结果文件是否由当前提示词和输入生成（没有记录请求键的旧结果无法判断，按已完成处理）"""
+    if not output_file.exists():
+        return False
+    recorded = (read_sidecar(output_file) or {}).get("llm_key")
+    return recorded is None or recorded == key
+
+
+def pending_chapters(system_prompt):
+    """需要（重新）生成的章节: [(章节文件, 输出文件, 输入文本, 请求键)]"""
+    pending = []
+    for chapter_file in sorted(CHAPTERS_DIR.glob("chapter_*_processed.json")):
+        output_file = output_path(chapter_file)
+        with open(chapter_file, "r", encoding="utf-8") as f:
+            user_input = f.read()
+        key = request_key(system_prompt, user_input)
+        if is_up_to_date(output_file, key):
+            logger.info(f"{output_file} 已存在，跳过")
+            continue
+        if output_file.exists():
+            logger.info(f"{output_file} 由旧版本提示词或输入生成，重新处理")
+        pending.append((chapter_file, output_file, user_input, key))
+    return pending
+
+
+async def process_chapter(client, system_prompt, chapter_file, registry=None):
+    """
+    协程版单章处理（供 pipeline.py 与章节拆解重叠执行）
+
+    结果已是最新时直接返回；返回输出文件路径，失败时返回 None
+    """
+    output_file = output_path(chapter_file)
+    with open(chapter_file, "r", encoding="utf-8") as f:
+        user_input = f.read()
+    key = request_key(system_prompt, user_input)
+    if is_up_to_date(output_file, key):
+        return output_file
+    logger.info(f"Processing {chapter_file.name}")
+    messages, params, _ = prepare_request(system_prompt, user_input, registry)
+    result = LLMClient.content(await client.chat_stream_async(messages, **params))
+    return output_file if save_result(system_prompt, user_input, result, output_file, key, registry) else None
+
+
+def run_batch(system_prompt, pending, registry, max_wait=None):
+    """
+    把所有待处理章节打包成一个批处理任务提交并轮询，每个章节的结果到达即写入
+
+    中断后再次运行会继续轮询已提交的任务；返回成功的章节数
+    """
+    client = get_client()
+    items = {chapter_file.stem: (user_input, output_file, key) for chapter_file, output_file, user_input, key in pending}
+    payloads = {}
+    for custom_id, (user_input, _, _) in items.items():
+        messages, params, _ = prepare_request(system_prompt, user_input, registry)
+        payloads[custom_id] = client.payload(messages, **params)
+
+    def on_result(custom_id, result):
+        user_input, output_file, key = items[custom_id]
+        return save_result(system_prompt, user_input, LLMClient.content(result), output_file, key, registry)
+
+    batch = LLMBatch(client, BATCH_STATE_PATH, poll_interval=BATCH_POLL_INTERVAL, max_wait=max_wait)
+    return sum(batch.run(payloads, on_result).values())
 
-    for attempt in range(MAX_RETRY):
-        try:
-            response = requests.post(API_URL, headers=headers, json=dataSystem)
-            if response.status_code == 200:
-                result = response.json()
-                logger.info(result)
-                if result.get("error"):
-                    logger.error(f"API error: {result.get('error')}")
-                logger.info(f"Total tokens: {result['usage']['total_tokens']}")
-                logger.info(f"Prompt tokens: {result['usage']['prompt_tokens']}")
-                return result["choices"][0]["message"]["content"]
-            else:
-                logger.error(f"API error: {response.status_code} {response.text}")
-        except Exception as e:
-            logger.error(f"Request failed: {e}")
-        logger.info(f"Retrying in {RETRY_INTERVAL} seconds...")
-        time.sleep(RETRY_INTERVAL)
-    raise RuntimeError("Claude API failed after retries.")
 
 def main():
+    parser = argparse.ArgumentParser(description="调用大模型为章节场景生成图片提示词")
+    parser.add_argument("--batch", action="store_true",
+                        help="批处理模式：所有待处理章节打包为一个批处理任务提交，延迟高但吞吐大、单价低")
+    parser.add_argument("--max-wait", type=float, default=None,
+                        help="批处理模式下本次最多等待的秒数，超时后下次运行继续轮询（默认等到任务结束）")
+    args = parser.parse_args()
+
     if not API_KEY:
         logger.error("请先设置环境变量 CLAUDE_API_KEY")
         return
@@ -96,33 +244,27 @@ def main():
     system_prompt = load_system_prompt()
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
-    chapter_files = sorted(CHAPTERS_DIR.glob("chapter_*_processed.json"))
-    logger.info(f"共检测到 {len(chapter_files)} 个章节文件。")
+    chapter_count = len(list(CHAPTERS_DIR.glob("chapter_*_processed.json")))
+    logger.info(f"共检测到 {chapter_count} 个章节文件。")
 
-    for chapter_file in tqdm(chapter_files, desc="Processing chapters"):
-        output_file = OUTPUT_DIR / (chapter_file.stem.replace("_processed", "") + "_image.json")
-        if output_file.exists():
-            logger.info(f"{output_file} 已存在，跳过")
-            continue  # 跳过已生成
-        with open(chapter_file, "r", encoding="utf-8") as f:
-            user_input = f.read()
-        try:
-            logger.info(f"Processing {chapter_file.name}")
-            result = call_claude_api(system_prompt, user_input)
-            # 尝试解析为JSON，如果失败则原样保存
+    client = get_client()
+    registry = get_registry()
+    pending = pending_chapters(system_prompt)
+    if args.batch:
+        done = run_batch(system_prompt, pending, registry, args.max_wait)
+        logger.info(f"批处理完成 {done}/{len(pending)} 个章节")
+    else:
+        for chapter_file, output_file, user_input, key in tqdm(pending, desc="Processing chapters"):
             try:
-                result = result.replace("```json", "").replace("```", "")
-                json_obj = json.loads(result)
-                with open(output_file, "w", encoding="utf-8") as out_f:
-                    logger.info(json_obj)
-                    json.dump(json_obj, out_f, ensure_ascii=False, indent=4)
+                logger.info(f"Processing {chapter_file.name}")
+                result = call_claude_api(system_prompt, user_input, registry=registry)
+                save_result(system_prompt, user_input, result, output_file, key, registry)
             except Exception as e:
-                logger.error(f"解析JSON失败: {e}")
-                with open(output_file, "w", encoding="utf-8") as out_f:
-                    out_f.write(result)
-            time.sleep(1.5)  # 防止触发速率限制
-        except Exception as e:
-            logger.error(f"处理 {chapter_file.name} 失败: {e}")
+                logger.error(f"处理 {chapter_file.name} 失败: {e}")
+
+    if client.cache is not None:
+        stats = client.cache.stats()
+        logger.info(f"LLM缓存: 命中 {stats['hits']}，未命中 {stats['misses']}，节省 {stats['saved_tokens']} tokens")
 
 if __name__ == "__main__":
     main()
@@ -3,11 +3,27 @@ import json
 import random
 from pathlib import Path
 from modules.audio import AudioGenerator
-from modules.volcengine_img2img_official import VolcengineImg2ImgOfficial, generate_image_from_prompt, generate_image_from_url
-from modules.config import get_config
+from modules.volcengine_img2img_official import VolcengineImg2ImgOfficial, VolcengineTaskBatch, generate_image_from_prompt, generate_image_from_url
+from modules.config import get_config, get_scheduler_config
+from modules.scheduler import TaskGraph, NETWORK, DONE, SKIPPED, default_cpu_workers
+from modules.artifact_cache import ArtifactCache, get_artifact_cache
+from modules.render_profiles import get_render_profile
+from modules.audio_master import get_mastering_settings, build_narration_cmd, build_master_cmd, build_mux_cmd, settings_signature
+from modules.hls_playlist import build_segment_cmd, update_chapter_playlist, update_novel_playlist, PLAYLIST_NAME, DEFAULT_SEGMENT_DURATION
+from modules.lease import work_through, default_owner, DEFAULT_TTL
+from modules.movie_manifest import load_manifest, save_manifest, plan_movie, build_manifest, stale_parts
+from modules.ledger import ArtifactJob, ArtifactKey, get_job_ledger, ledger_path, require_local_ledger, LedgerError
+from modules.planner import (RunPlan, build_plan, chapter_folder_name, chapter_number, paragraph_dir_name,
+                             resolve_chapter_files, MERGED_CHAPTERS_DIR, PROCESSED_CHAPTERS_DIR)
+from modules.artifact_io import commit, commit_guard, check_commit_guard, write_text, write_sidecar, verified_artifact, artifact_duration, temp_output_path, sidecar_path
+from functools import partial
 import subprocess
+import shutil
 import shlex
 import re
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
 
 def split_text_into_sentences(text):
     """
@@ -279,8 +295,7 @@ def create_srt_subtitle(text, start_time=0, duration=None, output_path=None):
             srt_content += f"{i+1}\n{start_srt} --> {end_srt}\n{sentence}\n\n"
     
     if output_path:
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(srt_content)
+        write_text(output_path, srt_content)
         print(f"字幕文件已生成: {output_path} (包含 {len(sentences)} 条字幕)")
     
     return srt_content
@@ -384,8 +399,7 @@ def merge_srt_files(srt_files, video_files, output_path):
         end_srt = seconds_to_srt_time(end_time)
         merged_content += f"{i+1}\n{start_srt} --> {end_srt}\n{text}\n\n"
 
-    with open(output_path, 'w', encoding='utf-8') as f:
-        f.write(merged_content)
+    write_text(output_path, merged_content)
     print(f"合并字幕文件已生成: {output_path} (严格对齐视频时长)")
     return str(output_path)
 
@@ -422,36 +436,77 @@ def get_random_camera_motion(frames):
     ]
     return random.choice(effects)
 
-def load_progress(progress_path):
-    if progress_path.exists():
-        try:
-            with open(progress_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception:
-            return {}
-    return {}
+def get_audio_duration(audio_path):
+    """获取音频/视频时长（秒）：优先读取产物元数据文件，否则进程内解析WAV/MP4头，未知格式回退到ffprobe"""
+    return artifact_duration(audio_path)
 
-def save_progress(progress_path, progress):
-    with open(progress_path, 'w', encoding='utf-8') as f:
-        json.dump(progress, f, ensure_ascii=False, indent=2)
+def build_segment_filter(zoompan_params, frames, profile):
+    """
+    构建单张图片的运镜滤镜链（分段渲染与单次渲染共用）
+    参数:
+    - zoompan_params: get_random_camera_motion 返回的zoompan参数
+    - frames: 片段帧数
+    - profile: 渲染档位，决定预放大、锐化、输出帧率和分辨率
+    """
+    filters = []
+    # 1. 首先将图片放大并应用锐化
+    if profile.prescale:
+        filters.append(f"scale={profile.prescale[0]}:{profile.prescale[1]}:flags=lanczos")
+    if profile.sharpen:
+        filters.append(f"unsharp={profile.sharpen}")
+    # 2. 应用运镜效果
+    filters.append(
+        f"zoompan={zoompan_params}"
+        f":d={frames}"  # 持续帧数
+        f":fps={profile.fps}"  # 输出帧率
+        f":s={profile.size}"  # 输出分辨率
+    )
+    # 3. 最终格式化
+    filters.append("format=yuv420p")
+    return ",".join(filters)
 
-def get_audio_duration(audio_path):
-    """用ffprobe获取音频时长（秒）"""
-    cmd = [
-        'ffprobe', '-v', 'error', '-show_entries', 'format=duration',
-        '-of', 'default=noprint_wrappers=1:nokey=1', str(audio_path)
-    ]
-    result = subprocess.run(cmd, capture_output=True, text=True)
+def optional_config(getter):
+    """读取可选配置段；没有 settings.yaml 时（如基准测试、单独渲染）返回空配置"""
     try:
-        return float(result.stdout.strip())
-    except Exception:
-        return 0.0
+        return getter() or {}
+    except FileNotFoundError:
+        return {}
+
+_segment_pool = None
+_segment_pool_lock = threading.Lock()
+
+def get_segment_workers():
+    """分段编码池大小：scheduler.segment_workers，默认为CPU核心数"""
+    workers = optional_config(get_scheduler_config).get("segment_workers")
+    return max(1, int(workers or os.cpu_count() or 1))
+
+def segment_encoder_threads():
+    """每个分段编码进程使用的x264线程数，保证整个池不超过CPU核心数"""
+    return max(1, (os.cpu_count() or 1) // get_segment_workers())
 
-def create_paragraph_video_ffmpeg(audio_path, image_paths, output_path):
+def get_segment_pool():
+    """
+    全局共享的分段编码池。每个任务都是一个独立的ffmpeg进程，
+    所有段落（包括任务图中并发渲染的段落）共用同一个池，总并发不超过池大小。
+    """
+    global _segment_pool
+    with _segment_pool_lock:
+        if _segment_pool is None:
+            _segment_pool = ThreadPoolExecutor(max_workers=get_segment_workers(), thread_name_prefix="ffmpeg-seg")
+        return _segment_pool
+
+def new_temp_token():
+    """生成临时文件名后缀，跨进程、跨线程唯一"""
+    return f"{os.getpid()}_{uuid.uuid4().hex[:12]}"
+
+def create_paragraph_video_ffmpeg(audio_path, image_paths, output_path, profile=None):
     """
     用ffmpeg将音频和多张图片合成视频，图片顺序与场景顺序一致，图片时长均分整个音频时长。
     添加运镜特效。
+    参数:
+    - profile: 渲染档位名称或对象，默认读取 render.profile
     """
+    profile = get_render_profile(profile)
     if not image_paths:
         print("没有场景图片，跳过视频生成")
         return None
@@ -476,67 +531,64 @@ def create_paragraph_video_ffmpeg(audio_path, image_paths, output_path):
     output_dir = Path(output_path).parent
     output_dir.mkdir(parents=True, exist_ok=True)
     
+    # 每次调用独立的临时文件前缀，多线程/多进程并发时互不冲突
+    temp_token = new_temp_token()
+    temp_videos = []
+    
     # 生成临时图片序列视频
     try:
-        # 1. 首先将每张图片转换为带运镜效果的视频片段
-        temp_videos = []
+        # 1. 首先将每张图片转换为带运镜效果的视频片段，各片段并行编码
+        segment_pool = get_segment_pool()
+        segment_futures = []
         for i, img in enumerate(valid_images):
-            temp_video = output_dir / f"temp_segment_{i}_{os.getpid()}.mp4"
+            temp_video = output_dir / f"temp_segment_{i}_{temp_token}.mp4"
             
-            # 计算帧数（使用30fps）
-            frames = int(image_duration * 30)
+            # 按档位帧率计算帧数
+            frames = int(image_duration * profile.fps)
             
             # 随机选择一种运镜效果
             effect_name, zoompan_params = get_random_camera_motion(frames)
             print(f"场景 {i+1}: 使用{effect_name}效果")
             
             # 构建滤镜参数
-            filter_complex = (
-                # 1. 首先将图片放大并应用锐化
-                f"scale=2400:1350:flags=lanczos,"
-                f"unsharp=3:3:1.5:3:3:0.5,"
-                # 2. 应用运镜效果
-                f"zoompan={zoompan_params}"
-                f":d={frames}"  # 持续帧数
-                ":fps=30"  # 输出帧率
-                ":s=1920x1080,"  # 输出分辨率
-                # 3. 最终格式化
-                "format=yuv420p"
-            )
+            filter_complex = build_segment_filter(zoompan_params, frames, profile)
             
             cmd = [
                 'ffmpeg', '-y',
                 '-i', str(Path(img).resolve()),
                 '-vf', filter_complex,
                 '-c:v', 'libx264',
-                '-preset', 'slow',  # 使用较慢的编码预设以提高质量
-                '-crf', '23',      # 控制视频质量
+                '-preset', profile.preset,  # 档位决定编码速度与质量的取舍
+                '-crf', str(profile.crf),   # 控制视频质量
+                '-threads', str(segment_encoder_threads()),
                 '-t', str(image_duration),
                 str(temp_video)
             ]
 
             print(f"执行命令: {' '.join(cmd)}")
             
-            print(f"生成视频片段 {i+1}/{len(valid_images)}")
-            res = subprocess.run(cmd, capture_output=True, text=True)
+            print(f"提交视频片段 {i+1}/{len(valid_images)}")
+            temp_videos.append(temp_video)
+            segment_futures.append(segment_pool.submit(subprocess.run, cmd, capture_output=True, text=True))
+        
+        # 只等待本段落自己的片段，全部结束后再检查结果，避免清理仍在写入的文件
+        wait(segment_futures)
+        for i, future in enumerate(segment_futures):
+            res = future.result()
             if res.returncode != 0:
                 print(f"生成视频片段失败 {i+1}:")
                 print(f"stderr: {res.stderr}")
                 print(f"stdout: {res.stdout}")
-                # 清理已生成的临时文件
-                for v in temp_videos:
-                    v.unlink(missing_ok=True)
                 return None
-            temp_videos.append(temp_video)
         
         # 2. 生成片段列表文件
-        temp_list = output_dir / f"temp_list_{os.getpid()}.txt"
+        temp_list = output_dir / f"temp_list_{temp_token}.txt"
         with open(temp_list, 'w', encoding='utf-8') as f:
             for v in temp_videos:
                 f.write(f"file '{v.resolve()}'\n")
         
         # 3. 合并所有视频片段
-        temp_final = output_dir / f"temp_final_{os.getpid()}.mp4"
+        temp_final = output_dir / f"temp_final_{temp_token}.mp4"
         cmd_concat = [
             'ffmpeg', '-y',
             '-f', 'concat',
@@ -551,21 +603,19 @@ def create_paragraph_video_ffmpeg(audio_path, image_paths, output_path):
             print("合并视频片段失败:")
             print(f"stderr: {res_concat.stderr}")
             print(f"stdout: {res_concat.stdout}")
-            # 清理临时文件
-            temp_list.unlink(missing_ok=True)
-            for v in temp_videos:
-                v.unlink(missing_ok=True)
             return None
         
-        # 4. 添加音频（不嵌入字幕）
+        # 4. 添加音频（不嵌入字幕），写临时文件后原子提交
+        temp_output = temp_output_path(output_path)
         cmd_audio = [
             'ffmpeg', '-y',
             '-i', str(temp_final),
             '-i', str(audio_path),
             '-c:v', 'copy',
             '-c:a', 'aac',
+            '-b:a', profile.audio_bitrate,
             '-shortest',
-            str(output_path)
+            str(temp_output)
         ]
         print("添加音频...")
             
@@ -575,6 +625,7 @@ def create_paragraph_video_ffmpeg(audio_path, image_paths, output_path):
             print(f"stderr: {res_audio.stderr}")
             print(f"stdout: {res_audio.stdout}")
             return None
+        commit(temp_output, output_path)
         
         print(f"段落视频已生成: {output_path}")
         return str(output_path)
@@ -591,15 +642,224 @@ def create_paragraph_video_ffmpeg(audio_path, image_paths, output_path):
             temp_list.unlink(missing_ok=True)
         if 'temp_final' in locals():
             temp_final.unlink(missing_ok=True)
+        if 'temp_output' in locals():
+            temp_output.unlink(missing_ok=True)
+
+def create_paragraph_video_single_pass(audio_path, image_paths, output_path, profile=None):
+    """
+    单次ffmpeg调用生成段落视频：所有场景图片作为输入，在同一个滤镜图中分别应用运镜、
+    拼接，并在同一遍中混入TTS音频，直接写出最终段落视频。
+    与 create_paragraph_video_ffmpeg（N个片段编码 + 拼接 + 混音）输出一致，
+    但只启动一个进程、只写一次容器。
+    参数:
+    - profile: 渲染档位名称或对象，默认读取 render.profile
+    """
+    profile = get_render_profile(profile)
+    if not image_paths:
+        print("没有场景图片，跳过视频生成")
+        return None
+    
+    valid_images = [img for img in image_paths if Path(img).exists()]
+    if not valid_images:
+        print("没有有效的场景图片文件")
+        return None
+    
+    duration = get_audio_duration(audio_path)
+    if duration <= 0:
+        print(f"音频时长无效: {audio_path}")
+        return None
+    
+    print(f"单次渲染段落视频: {len(valid_images)} 张图片，音频时长: {duration:.2f}秒")
+    image_duration = duration / len(valid_images)
+    frames = int(image_duration * profile.fps)
+    
+    output_dir = Path(output_path).parent
+    output_dir.mkdir(parents=True, exist_ok=True)
+    
+    temp_output = temp_output_path(output_path)
+    cmd = ['ffmpeg', '-y']
+    for img in valid_images:
+        cmd += ['-i', str(Path(img).resolve())]
+    cmd += ['-i', str(audio_path)]
+    
+    # 每张图片一条运镜链，最后在图内拼接
+    chains = []
+    for i in range(len(valid_images)):
+        effect_name, zoompan_params = get_random_camera_motion(frames)
+        print(f"场景 {i+1}: 使用{effect_name}效果")
+        chains.append(
+            f"[{i}:v]{build_segment_filter(zoompan_params, frames, profile)},"
+            f"setsar=1,trim=duration={image_duration},setpts=PTS-STARTPTS[v{i}]"
+        )
+    concat_inputs = "".join(f"[v{i}]" for i in range(len(valid_images)))
+    chains.append(f"{concat_inputs}concat=n={len(valid_images)}:v=1:a=0[vout]")
+    
+    cmd += [
+        '-filter_complex', ";".join(chains),
+        '-map', '[vout]',
+        '-map', f'{len(valid_images)}:a',
+        '-c:v', 'libx264',
+        '-preset', profile.preset,
+        '-crf', str(profile.crf),
+        '-c:a', 'aac',
+        '-b:a', profile.audio_bitrate,
+        '-shortest',
+        str(temp_output)
+    ]
+    
+    print(f"执行命令: {' '.join(cmd)}")
+    try:
+        res = subprocess.run(cmd, capture_output=True, text=True)
+        if res.returncode != 0:
+            print("单次渲染段落视频失败:")
+            print(f"stderr: {res.stderr}")
+            print(f"stdout: {res.stdout}")
+            return None
+        commit(temp_output, output_path)
+    except Exception as e:
+        print(f"创建段落视频时发生错误: {e}")
+        return None
+    finally:
+        temp_output.unlink(missing_ok=True)
+    
+    print(f"段落视频已生成: {output_path}")
+    return str(output_path)
+
+def render_paragraph_video(audio_path, image_paths, output_path, renderer=None, profile=None):
+    """
+    按渲染模式生成段落视频
+    参数:
+    - renderer: "segments"（逐片段编码后拼接，默认）或 "single_pass"（单次ffmpeg调用），
+      默认读取 render.paragraph_renderer 配置
+    - profile: 渲染档位名称或对象，默认读取 render.profile
+    """
+    if renderer is None:
+        renderer = optional_config(lambda: get_config().get("render")).get("paragraph_renderer", "segments")
+    if renderer == "single_pass":
+        return create_paragraph_video_single_pass(audio_path, image_paths, output_path, profile)
+    if renderer != "segments":
+        print(f"未知的段落渲染模式: {renderer}，使用 segments")
+    return create_paragraph_video_ffmpeg(audio_path, image_paths, output_path, profile)
+
+def run_ffmpeg(cmd, description):
+    """
+    执行ffmpeg命令，失败时打印输出
+    返回: 是否成功
+    """
+    res = subprocess.run(cmd, capture_output=True, text=True)
+    if res.returncode != 0:
+        print(f"{description}失败:")
+        print(f"stderr: {res.stderr}")
+        print(f"stdout: {res.stdout}")
+        return False
+    return True
+
+def write_concat_list(paths, list_path):
+    """写ffmpeg concat demuxer列表文件（使用绝对路径避免路径问题）"""
+    with open(list_path, 'w', encoding='utf-8') as f:
+        for p in paths:
+            f.write(f"file '{Path(p).resolve()}'\n")
+
+def concat_input(list_path):
+    """concat demuxer 输入参数"""
+    return ['-f', 'concat', '-safe', '0', '-i', str(list_path)]
+
+def chapter_narration_path(chapter_video, profile):
+    """章节视频对应的旁白时间线文件（无损FLAC，不含背景音乐）"""
+    return Path(chapter_video).parent / profile.output_name("chapter_narration.flac")
+
+def build_chapter_narration(paragraph_videos, paragraph_audios, narration_path):
+    """
+    生成章节旁白时间线：段落 audio.wav 按段落视频的真实时长补齐/截断后拼接，保存为无损FLAC；
+    缺少段落音频时退回到解码段落视频中的旁白音轨（段落视频不含背景音乐）
+    参数:
+    - paragraph_videos: 段落视频路径列表
+    - paragraph_audios: 对应的段落音频路径列表，可为None
+    - narration_path: 输出路径
+    """
+    narration_path = Path(narration_path)
+    temp_token = new_temp_token()
+    temp_narration = narration_path.with_name(f"temp_narration_{temp_token}.flac")
+    temp_list_file = narration_path.with_name(f"temp_narrationlist_{temp_token}.txt")
+    try:
+        if paragraph_audios and all(Path(a).exists() for a in paragraph_audios):
+            durations = [get_audio_duration(v) for v in paragraph_videos]
+            cmd = build_narration_cmd(paragraph_audios, durations, str(temp_narration), get_mastering_settings())
+        else:
+            write_concat_list(paragraph_videos, temp_list_file)
+            cmd = ['ffmpeg', '-y', *concat_input(temp_list_file), '-vn', '-c:a', 'flac', str(temp_narration)]
+        if not run_ffmpeg(cmd, "生成旁白时间线"):
+            return None
+        commit(temp_narration, narration_path)
+        return str(narration_path)
+    finally:
+        temp_narration.unlink(missing_ok=True)
+        temp_list_file.unlink(missing_ok=True)
+
+def master_and_mux(video_input, narration_input, output_path, profile, bgm_offset=0.0):
+    """
+    母带处理并封装：旁白 + 循环背景音乐一次完成闪避、混音和响度标准化，只编码一次音频，
+    再与流复制的视频封装，先写临时文件再替换
+    参数:
+    - video_input: 视频输入参数（['-i', 路径] 或 concat 列表参数）
+    - narration_input: 旁白输入参数
+    - output_path: 输出路径
+    - profile: 渲染档位对象，决定音频码率
+    - bgm_offset: 背景音乐起始位置（秒）
+    """
+    output_path = Path(output_path)
+    settings = get_mastering_settings()
+    temp_token = new_temp_token()
+    temp_master = output_path.parent / f"temp_master_{temp_token}.m4a"
+    temp_output = output_path.parent / f"temp_mux_{temp_token}.mp4"
+    try:
+        if settings.bgm is not None:
+            print(f"母带处理（背景音乐: {settings.bgm}，闪避、混音、响度标准化）...")
+        else:
+            print(f"背景音乐文件不存在: {settings.bgm_path}，仅做响度标准化")
+        master_cmd = build_master_cmd(narration_input, str(temp_master), settings, profile.audio_bitrate, bgm_offset)
+        if not run_ffmpeg(master_cmd, "母带处理"):
+            return None
+        print("封装最终音轨...")
+        if not run_ffmpeg(build_mux_cmd(video_input, str(temp_master), str(temp_output)), "封装"):
+            return None
+        commit(temp_output, output_path)
+        return str(output_path)
+    finally:
+        temp_master.unlink(missing_ok=True)
+        temp_output.unlink(missing_ok=True)
+
+def legacy_chapter_narration(chapter_video, temp_files):
+    """
+    旧版章节视频没有旁白时间线时，提取其音轨作为旁白（可能已含背景音乐）
+    参数:
+    - temp_files: 收集临时文件，由调用方清理
+    """
+    print(f"⚠️ 章节缺少旁白时间线，使用章节视频音轨（可能已含背景音乐，建议重新生成章节）: {chapter_video}")
+    temp_narration = Path(chapter_video).parent / f"temp_legacy_narration_{new_temp_token()}.flac"
+    temp_files.append(temp_narration)
+    cmd = ['ffmpeg', '-y', '-i', str(chapter_video), '-vn', '-c:a', 'flac', str(temp_narration)]
+    if not run_ffmpeg(cmd, "提取章节音轨"):
+        return None
+    return str(temp_narration)
 
-def create_chapter_video_ffmpeg(paragraph_videos, output_path, chapter_subtitle_path=None):
+def create_chapter_video_ffmpeg(paragraph_videos, output_path, chapter_subtitle_path=None, profile=None,
+                                paragraph_audios=None):
     """
     用ffmpeg将所有段落视频拼接成章节视频，并添加背景音乐和字幕
+    视频流复制拼接；音频先生成章节旁白时间线（chapter_narration.flac），再经母带处理得到唯一一条最终音轨
+    参数:
+    - profile: 渲染档位名称或对象，决定音频码率
+    - paragraph_audios: 与段落视频一一对应的段落音频（audio.wav），用于构建无损旁白时间线
     """
-    valid_videos = [v for v in paragraph_videos if Path(v).exists()]
-    if not valid_videos:
+    profile = get_render_profile(profile)
+    pairs = [(v, a) for v, a in zip(paragraph_videos, paragraph_audios or [None] * len(paragraph_videos))
+             if Path(v).exists()]
+    if not pairs:
         print("没有有效的段落视频，跳过章节视频生成")
         return None
+    valid_videos = [v for v, _ in pairs]
+    valid_audios = [a for _, a in pairs] if paragraph_audios else None
     
     print(f"拼接章节视频: {len(valid_videos)} 个段落视频")
     
@@ -607,86 +867,23 @@ def create_chapter_video_ffmpeg(paragraph_videos, output_path, chapter_subtitle_
     output_dir = Path(output_path).parent
     output_dir.mkdir(parents=True, exist_ok=True)
     
-    # 检查背景音乐文件
-    bgm_path = Path("configs/bgm.mp3")
-    if not bgm_path.exists():
-        print(f"背景音乐文件不存在: {bgm_path}，使用原始音频")
-        use_bgm = False
-    else:
-        print(f"使用背景音乐: {bgm_path}")
-        use_bgm = True
-    
-    temp_list_file = output_dir / f"temp_videolist_{os.getpid()}.txt"
-    temp_concat_video = output_dir / f"temp_concat_{os.getpid()}.mp4"
+    temp_list_file = output_dir / f"temp_videolist_{new_temp_token()}.txt"
     
     try:
-        # 1. 首先拼接所有段落视频（不带音频）
-        with open(temp_list_file, 'w', encoding='utf-8') as f:
-            for v in valid_videos:
-                # 使用绝对路径避免路径问题
-                abs_video_path = Path(v).resolve()
-                f.write(f"file '{abs_video_path}'\n")
+        # 1. 旁白时间线
+        print("生成章节旁白时间线...")
+        narration_path = build_chapter_narration(valid_videos, valid_audios, chapter_narration_path(output_path, profile))
+        if not narration_path:
+            return None
         
-        if use_bgm:
-            # 如果有背景音乐，分两步处理
-            # 第一步：拼接视频
-            cmd_concat = [
-                'ffmpeg', '-y', '-f', 'concat', '-safe', '0',
-                '-i', str(temp_list_file),
-                '-c', 'copy',
-                str(temp_concat_video)
-            ]
-            
-            print("拼接视频片段...")
-            res_concat = subprocess.run(cmd_concat, capture_output=True, text=True)
-            if res_concat.returncode != 0:
-                print(f"视频拼接失败:")
-                print(f"stderr: {res_concat.stderr}")
-                print(f"stdout: {res_concat.stdout}")
-                return None
-            
-            # 第二步：添加背景音乐和主音频混合（不嵌入字幕）
-            cmd_final = [
-                'ffmpeg', '-y',
-                '-i', str(temp_concat_video),  # 拼接后的视频
-                '-i', str(bgm_path.resolve()),  # 背景音乐
-                '-filter_complex', 
-                '[1:a]volume=0.3,aloop=loop=-1:size=2e+09[bgm];'  # 背景音乐降低音量到30%，循环播放
-                '[0:a][bgm]amix=inputs=2:duration=first:dropout_transition=2[audio_out]',  # 混合音频
-                '-map', '0:v',  # 使用原视频
-                '-map', '[audio_out]',  # 使用混合后的音频
-                '-c:v', 'copy',  # 视频不重新编码
-                '-c:a', 'aac',  # 音频编码为AAC
-                '-shortest',  # 以最短的输入为准
-                str(output_path)
-            ]
-            
-            print("添加背景音乐并混合音频...")
-            res_final = subprocess.run(cmd_final, capture_output=True, text=True)
-            if res_final.returncode != 0:
-                print(f"添加背景音乐失败:")
-                print(f"stderr: {res_final.stderr}")
-                print(f"stdout: {res_final.stdout}")
-                return None
-        else:
-            # 如果没有背景音乐，直接拼接（不嵌入字幕）
-            cmd = [
-                'ffmpeg', '-y', '-f', 'concat', '-safe', '0',
-                '-i', str(temp_list_file),
-                '-c', 'copy',
-                str(output_path)
-            ]
-            
-            print("拼接视频（无背景音乐）...")
-            res = subprocess.run(cmd, capture_output=True, text=True)
-            if res.returncode != 0:
-                print(f"章节视频拼接失败:")
-                print(f"stderr: {res.stderr}")
-                print(f"stdout: {res.stdout}")
-                return None
+        # 2. 母带处理并与流复制拼接的视频封装（不嵌入字幕）
+        write_concat_list(valid_videos, temp_list_file)
+        result = master_and_mux(concat_input(temp_list_file), ['-i', narration_path], output_path, profile)
+        if not result:
+            return None
         
         print(f"章节视频已生成: {output_path}")
-        return str(output_path)
+        return result
         
     except Exception as e:
         print(f"创建章节视频时发生错误: {e}")
@@ -694,17 +891,18 @@ def create_chapter_video_ffmpeg(paragraph_videos, output_path, chapter_subtitle_
     finally:
         # 清理临时文件
         temp_list_file.unlink(missing_ok=True)
-        if 'temp_concat_video' in locals():
-            temp_concat_video.unlink(missing_ok=True)
 
-def create_complete_video_ffmpeg(chapter_videos, output_path, complete_subtitle_path=None):
+def create_complete_video_ffmpeg(chapter_videos, output_path, complete_subtitle_path=None, profile=None):
     """
     用ffmpeg将所有章节视频拼接成完整视频，并添加背景音乐和字幕
+    视频流复制拼接；音频使用各章节的旁白时间线（不含背景音乐）重新做一次母带处理，避免背景音乐叠加
     参数:
     - chapter_videos: 章节视频路径列表
     - output_path: 输出完整视频路径
     - complete_subtitle_path: 完整字幕文件路径
+    - profile: 渲染档位名称或对象，决定音频码率
     """
+    profile = get_render_profile(profile)
     valid_videos = [v for v in chapter_videos if Path(v).exists()]
     if not valid_videos:
         print("没有有效的章节视频，跳过完整视频生成")
@@ -716,86 +914,29 @@ def create_complete_video_ffmpeg(chapter_videos, output_path, complete_subtitle_
     output_dir = Path(output_path).parent
     output_dir.mkdir(parents=True, exist_ok=True)
     
-    # 检查背景音乐文件
-    bgm_path = Path("configs/bgm.mp3")
-    if not bgm_path.exists():
-        print(f"背景音乐文件不存在: {bgm_path}，使用原始音频")
-        use_bgm = False
-    else:
-        print(f"使用背景音乐: {bgm_path}")
-        use_bgm = True
-    
-    temp_list_file = output_dir / f"temp_complete_videolist_{os.getpid()}.txt"
-    temp_concat_video = output_dir / f"temp_complete_concat_{os.getpid()}.mp4"
+    temp_token = new_temp_token()
+    temp_list_file = output_dir / f"temp_complete_videolist_{temp_token}.txt"
+    temp_narration_list = output_dir / f"temp_complete_narrationlist_{temp_token}.txt"
+    temp_files = []
     
     try:
-        # 1. 首先拼接所有章节视频
-        with open(temp_list_file, 'w', encoding='utf-8') as f:
-            for v in valid_videos:
-                # 使用绝对路径避免路径问题
-                abs_video_path = Path(v).resolve()
-                f.write(f"file '{abs_video_path}'\n")
+        narrations = []
+        for v in valid_videos:
+            narration = chapter_narration_path(v, profile)
+            if not narration.exists():
+                narration = legacy_chapter_narration(v, temp_files)
+                if not narration:
+                    return None
+            narrations.append(narration)
         
-        if use_bgm:
-            # 如果有背景音乐，分两步处理
-            # 第一步：拼接视频
-            cmd_concat = [
-                'ffmpeg', '-y', '-f', 'concat', '-safe', '0',
-                '-i', str(temp_list_file),
-                '-c', 'copy',
-                str(temp_concat_video)
-            ]
-            
-            print("拼接章节视频...")
-            res_concat = subprocess.run(cmd_concat, capture_output=True, text=True)
-            if res_concat.returncode != 0:
-                print(f"章节视频拼接失败:")
-                print(f"stderr: {res_concat.stderr}")
-                print(f"stdout: {res_concat.stdout}")
-                return None
-            
-            # 第二步：添加背景音乐（不嵌入字幕）
-            cmd_final = [
-                'ffmpeg', '-y',
-                '-i', str(temp_concat_video),  # 拼接后的视频
-                '-i', str(bgm_path.resolve()),  # 背景音乐
-                '-filter_complex', 
-                '[1:a]volume=0.3,aloop=loop=-1:size=2e+09[bgm];'  # 背景音乐降低音量到30%，循环播放
-                '[0:a][bgm]amix=inputs=2:duration=first:dropout_transition=2[audio_out]',  # 混合音频
-                '-map', '0:v',  # 使用原视频
-                '-map', '[audio_out]',  # 使用混合后的音频
-                '-c:v', 'copy',  # 视频不重新编码
-                '-c:a', 'aac',  # 音频编码为AAC
-                '-shortest',  # 以最短的输入为准
-                str(output_path)
-            ]
-            
-            print("添加背景音乐...")
-            res_final = subprocess.run(cmd_final, capture_output=True, text=True)
-            if res_final.returncode != 0:
-                print(f"添加背景音乐失败:")
-                print(f"stderr: {res_final.stderr}")
-                print(f"stdout: {res_final.stdout}")
-                return None
-        else:
-            # 如果没有背景音乐，直接拼接（不嵌入字幕）
-            cmd = [
-                'ffmpeg', '-y', '-f', 'concat', '-safe', '0',
-                '-i', str(temp_list_file),
-                '-c', 'copy',
-                str(output_path)
-            ]
-            print("拼接视频（无背景音乐）...")
-            
-            res = subprocess.run(cmd, capture_output=True, text=True)
-            if res.returncode != 0:
-                print(f"完整视频拼接失败:")
-                print(f"stderr: {res.stderr}")
-                print(f"stdout: {res.stdout}")
-                return None
+        write_concat_list(valid_videos, temp_list_file)
+        write_concat_list(narrations, temp_narration_list)
+        result = master_and_mux(concat_input(temp_list_file), concat_input(temp_narration_list), output_path, profile)
+        if not result:
+            return None
         
         print(f"完整视频已生成: {output_path}")
-        return str(output_path)
+        return result
         
     except Exception as e:
         print(f"创建完整视频时发生错误: {e}")
@@ -803,26 +944,25 @@ def create_complete_video_ffmpeg(chapter_videos, output_path, complete_subtitle_
     finally:
         # 清理临时文件
         temp_list_file.unlink(missing_ok=True)
-        if 'temp_concat_video' in locals():
-            temp_concat_video.unlink(missing_ok=True)
+        temp_narration_list.unlink(missing_ok=True)
+        for f in temp_files:
+            Path(f).unlink(missing_ok=True)
+
+def chapter_sort_key(name):
+    """章节目录排序键：按名称中的第一个数字排序，没有数字的排在最后"""
+    match = re.search(r'(\d+)', name)
+    if match:
+        return (0, int(match.group(1)), name)
+    return (1, 0, name)
 
-def create_complete_movie(output_base="output", movie_output_path="output/complete_movie.mp4"):
+def collect_chapter_videos(output_dir, profile):
     """
-    扫描output目录，收集所有章节视频和字幕，合并成完整电影
+    扫描输出目录，收集该档位的章节视频和字幕，按章节编号排序
     参数:
-    - output_base: 输出目录根路径
-    - movie_output_path: 完整电影输出路径
+    - output_dir: 输出目录
+    - profile: 渲染档位对象
+    返回: (章节目录名列表, 章节视频列表, 章节字幕列表)，没有字幕的章节对应空字符串
     """
-    print(f"\n{'='*80}")
-    print("开始创建完整电影")
-    print(f"{'='*80}")
-    
-    output_dir = Path(output_base)
-    if not output_dir.exists():
-        print(f"输出目录不存在: {output_dir}")
-        return None
-    
-    # 收集所有章节目录和视频文件
     chapter_dirs = []
     chapter_videos = []
     chapter_subtitles = []
@@ -830,8 +970,8 @@ def create_complete_movie(output_base="output", movie_output_path="output/comple
     # 扫描所有子目录，查找章节视频
     for item in output_dir.iterdir():
         if item.is_dir():
-            chapter_video = item / "chapter_video.mp4"
-            chapter_subtitle = item / "chapter_subtitle.srt"
+            chapter_video = item / profile.output_name("chapter_video.mp4")
+            chapter_subtitle = item / profile.output_name("chapter_subtitle.srt")
             
             if chapter_video.exists():
                 chapter_dirs.append(item.name)
@@ -841,30 +981,171 @@ def create_complete_movie(output_base="output", movie_output_path="output/comple
                     chapter_subtitles.append(str(chapter_subtitle))
                     print(f"发现章节: {item.name} (有视频和字幕)")
                 else:
+                    chapter_subtitles.append("")
                     print(f"发现章节: {item.name} (仅有视频)")
     
-    if not chapter_videos:
-        print("未找到任何章节视频文件")
+    # 按章节名称排序（尝试按数字排序）
+    sorted_data = sorted(zip(chapter_dirs, chapter_videos, chapter_subtitles), key=lambda x: chapter_sort_key(x[0]))
+    if not sorted_data:
+        return [], [], []
+    chapter_dirs, chapter_videos, chapter_subtitles = (list(x) for x in zip(*sorted_data))
+    return chapter_dirs, chapter_videos, chapter_subtitles
+
+def mix_movie_part(chapter_video, part_path, bgm_offset, profile):
+    """
+    为单个章节做母带处理，生成完整电影的一个分段（视频流复制，仅处理该章节的音频）
+    参数:
+    - chapter_video: 章节视频路径
+    - part_path: 分段输出路径
+    - bgm_offset: 该章节起点对应的背景音乐位置（秒），保证分段之间背景音乐连续
+    - profile: 渲染档位对象
+    """
+    part_path = Path(part_path)
+    part_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_files = []
+    try:
+        narration = chapter_narration_path(chapter_video, profile)
+        if not narration.exists():
+            narration = legacy_chapter_narration(chapter_video, temp_files)
+            if not narration:
+                return None
+        result = master_and_mux(['-i', str(chapter_video)], ['-i', str(narration)], part_path, profile, bgm_offset)
+        if not result:
+            print(f"章节混音失败: {chapter_video}")
+        return result
+    finally:
+        for f in temp_files:
+            Path(f).unlink(missing_ok=True)
+
+def concat_videos_copy(videos, output_path):
+    """
+    流复制拼接视频，先写临时文件再替换，失败时保留原有输出
+    """
+    output_path = Path(output_path)
+    temp_token = new_temp_token()
+    temp_list_file = output_path.parent / f"temp_complete_videolist_{temp_token}.txt"
+    temp_output = output_path.parent / f"temp_complete_concat_{temp_token}.mp4"
+    try:
+        with open(temp_list_file, 'w', encoding='utf-8') as f:
+            for v in videos:
+                f.write(f"file '{Path(v).resolve()}'\n")
+        cmd = [
+            'ffmpeg', '-y', '-f', 'concat', '-safe', '0',
+            '-i', str(temp_list_file),
+            '-c', 'copy',
+            str(temp_output)
+        ]
+        res = subprocess.run(cmd, capture_output=True, text=True)
+        if res.returncode != 0:
+            print(f"完整视频拼接失败:")
+            print(f"stderr: {res.stderr}")
+            return None
+        commit(temp_output, output_path)
+        return str(output_path)
+    finally:
+        temp_list_file.unlink(missing_ok=True)
+        temp_output.unlink(missing_ok=True)
+
+def append_complete_video(chapter_dirs, chapter_videos, output_path, profile):
+    """
+    增量拼接完整电影
+    按清单只为新增、变化或起点偏移的章节重新混音（背景音乐按章节起点偏移，保证连续），
+    其余章节复用上次的分段，最后流复制拼接所有分段；章节没有变化时直接复用现有电影
+    参数:
+    - chapter_dirs: 按电影顺序排列的章节目录名
+    - chapter_videos: 对应的章节视频路径
+    - output_path: 完整电影输出路径
+    - profile: 渲染档位对象
+    """
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    manifest_path = output_path.with_name(f"{output_path.stem}.manifest.json")
+    parts_dir = output_path.parent / ".movie_parts" / output_path.stem
+    
+    mastering = get_mastering_settings()
+    bgm = mastering.bgm
+    if bgm is not None:
+        print(f"使用背景音乐: {bgm}")
+        bgm_duration = get_audio_duration(str(bgm))
+    else:
+        # 章节视频已是母带处理后的最终音轨，无背景音乐时直接流复制拼接
+        print(f"背景音乐文件不存在: {mastering.bgm_path}，直接拼接章节视频")
+        bgm_duration = 0.0
+    settings = {"profile": profile.name, "audio_bitrate": profile.audio_bitrate,
+                "mastering": settings_signature(mastering)}
+    
+    chapters = [(name, video, get_audio_duration(video)) for name, video in zip(chapter_dirs, chapter_videos)]
+    previous = load_manifest(str(manifest_path))
+    entries, dirty = plan_movie(chapters, previous, settings, str(parts_dir) if bgm is not None else None)
+    
+    unchanged = (
+        not dirty
+        and output_path.exists()
+        and previous is not None
+        and [e["name"] for e in previous.get("chapters", [])] == [e["name"] for e in entries]
+    )
+    if unchanged:
+        print(f"章节没有变化，复用现有完整电影: {output_path}")
+        return str(output_path)
+    
+    print(f"增量拼接: {len(entries)} 个章节，需重新混音 {len(dirty) if bgm is not None else 0} 个")
+    if bgm is not None:
+        pool = get_segment_pool()
+        futures = []
+        for i in dirty:
+            entry = entries[i]
+            offset = entry["start"] % bgm_duration if bgm_duration > 0 else 0.0
+            print(f"  混音: {entry['name']} (起点 {entry['start']:.2f}秒)")
+            futures.append(pool.submit(mix_movie_part, entry["video"], entry["part"], offset, profile))
+        wait(futures)
+        if not all(f.result() for f in futures):
+            print("部分章节混音失败，保留原有完整电影")
+            return None
+    
+    concat_inputs = [e["part"] if bgm is not None else e["video"] for e in entries]
+    print("拼接分段...")
+    result = concat_videos_copy(concat_inputs, output_path)
+    if result is None:
         return None
     
-    # 按章节名称排序（尝试按数字排序）
-    def sort_key(name):
-        import re
-        match = re.search(r'(\d+)', name)
-        if match:
-            return int(match.group(1))
-        return name
+    save_manifest(str(manifest_path), build_manifest(entries, settings, str(output_path)))
+    for part in stale_parts(previous, entries):
+        Path(part).unlink(missing_ok=True)
+        sidecar_path(part).unlink(missing_ok=True)
+    print(f"完整视频已生成: {output_path}")
+    return result
+
+def create_complete_movie(output_base="output", movie_output_path=None, profile=None, append=False):
+    """
+    扫描output目录，收集所有章节视频和字幕，合并成完整电影
+    参数:
+    - output_base: 输出目录根路径
+    - movie_output_path: 完整电影输出路径，默认为 output_base 下按档位命名的 complete_movie.mp4
+    - profile: 渲染档位名称或对象，只收集该档位的章节视频
+    - append: 增量模式，按清单只处理新增或变化的章节（见 append_complete_video）
+    """
+    profile = get_render_profile(profile)
+    if movie_output_path is None:
+        movie_output_path = str(Path(output_base) / profile.output_name("complete_movie.mp4"))
+    print(f"\n{'='*80}")
+    print("开始创建完整电影")
+    print(f"{'='*80}")
     
-    # 创建排序后的列表，补齐字幕列表长度
-    while len(chapter_subtitles) < len(chapter_videos):
-        chapter_subtitles.append("")  # 为没有字幕的章节添加空字符串
+    output_dir = Path(output_base)
+    if not output_dir.exists():
+        print(f"输出目录不存在: {output_dir}")
+        return None
+    
+    # 收集所有章节目录和视频文件
+    chapter_dirs, chapter_videos, chapter_subtitles = collect_chapter_videos(output_dir, profile)
     
-    sorted_data = sorted(zip(chapter_dirs, chapter_videos, chapter_subtitles), key=lambda x: sort_key(x[0]))
-    chapter_dirs, chapter_videos, chapter_subtitles = zip(*sorted_data) if sorted_data else ([], [], [])
+    if not chapter_videos:
+        print("未找到任何章节视频文件")
+        return None
     
     # 过滤掉空的字幕文件
-    chapter_subtitles = [sub for sub in chapter_subtitles if sub and Path(sub).exists()]
     chapter_videos_for_subs = [v for v, s in zip(chapter_videos, chapter_subtitles) if s and Path(s).exists()]
+    chapter_subtitles = [sub for sub in chapter_subtitles if sub and Path(sub).exists()]
     
     print(f"找到 {len(chapter_videos)} 个章节视频，按顺序:")
     for i, (dir_name, video_path) in enumerate(zip(chapter_dirs, chapter_videos)):
@@ -874,17 +1155,21 @@ def create_complete_movie(output_base="output", movie_output_path="output/comple
     # 生成完整字幕文件
     complete_subtitle_path = None
     if chapter_subtitles and chapter_videos_for_subs:
-        complete_subtitle_path = Path(movie_output_path).parent / "complete_movie_subtitle.srt"
+        complete_subtitle_path = Path(movie_output_path).parent / profile.output_name("complete_movie_subtitle.srt")
         print(f"合并章节字幕到: {complete_subtitle_path}")
         merge_srt_files(list(chapter_subtitles), list(chapter_videos_for_subs), str(complete_subtitle_path))
     
     # 生成完整视频
     print(f"开始生成完整电影: {movie_output_path}")
-    result = create_complete_video_ffmpeg(
-        chapter_videos=list(chapter_videos),
-        output_path=movie_output_path,
-        complete_subtitle_path=str(complete_subtitle_path) if complete_subtitle_path else None
-    )
+    if append:
+        result = append_complete_video(chapter_dirs, chapter_videos, movie_output_path, profile)
+    else:
+        result = create_complete_video_ffmpeg(
+            chapter_videos=list(chapter_videos),
+            output_path=movie_output_path,
+            complete_subtitle_path=str(complete_subtitle_path) if complete_subtitle_path else None,
+            profile=profile
+        )
     
     if result:
         total_duration = get_audio_duration(result)
@@ -900,7 +1185,301 @@ def create_complete_movie(output_base="output", movie_output_path="output/comple
         print("❌ 完整电影生成失败")
         return None
 
-def process_chapter(chapter_json_path, output_base="output"):
+def tts_cache_key(audio_gen, text):
+    """段落音频的产物缓存键：腾讯云TTS + 文本、音色、语速、采样率等全部合成参数"""
+    return ArtifactCache.make_key("tencent_tts", "TextToVoice", audio_gen.build_params(text, "zh"))
+
+def image_cache_key(prompt):
+    """场景图片的产物缓存键：火山引擎 req_key + 提示词、尺寸、种子等全部请求参数"""
+    form = VolcengineImg2ImgOfficial.build_prompt_form(prompt)
+    return ArtifactCache.make_key("volcengine", form["req_key"], form)
+
+def store_in_cache(cache, key, path, info):
+    """把新生成的产物写入缓存，写入失败不影响主流程"""
+    if cache is None:
+        return
+    try:
+        cache.store(key, str(path), info=info)
+    except Exception as e:
+        print(f"写入产物缓存失败: {path}，错误: {e}")
+
+def ensure_paragraph_audio(audio_gen, para, audio_path, job, cache=None):
+    """
+    检查并生成段落音频（网络节点），调用腾讯云前先查产物缓存
+    - job: 本产物的台账记录器（ArtifactJob）
+    """
+    if verified_artifact(audio_path):
+        print(f"音频文件已存在且有效: {audio_path}")
+        job.done(str(audio_path))
+        return str(audio_path)
+
+    cache_key = tts_cache_key(audio_gen, para["场景文案"])
+    if cache and cache.fetch(cache_key, str(audio_path)):
+        print(f"音频文件来自缓存: {audio_path}")
+        write_sidecar(audio_path)
+        job.done(str(audio_path))
+        return str(audio_path)
+
+    print(f"生成音频文件: {audio_path}")
+    job.start()
+    try:
+        audio_file = audio_gen.generate(
+            text=para["场景文案"],
+            type="paragraph",
+            language="zh",
+            output_path=str(audio_path)
+        )
+    except Exception as e:
+        print(f"音频生成失败: {para['段落标题']}，错误: {e}")
+        job.failed(e)
+        raise
+    store_in_cache(cache, cache_key, audio_file, {"provider": "tencent_tts", "text": para["场景文案"][:50]})
+    job.done(audio_file)
+    return audio_file
+
+def ensure_scene_image(volc_cred, scene, img_path, job, cache=None):
+    """
+    检查并生成单个场景图片（网络节点），调用火山引擎前先查产物缓存
+    """
+    if verified_artifact(img_path):
+        print(f"场景图片已存在且有效: {img_path.name}")
+        job.done(str(img_path))
+        return str(img_path)
+
+    cache_key = image_cache_key(scene["图片提示词"])
+    if cache and cache.fetch(cache_key, str(img_path)):
+        print(f"场景图片来自缓存: {img_path.name}")
+        write_sidecar(img_path)
+        job.done(str(img_path))
+        return str(img_path)
+
+    print(f"生成缺失的场景图片: {img_path.name}")
+    job.start()
+    try:
+        generate_image_from_prompt(
+            output_path=str(img_path),
+            access_key_id=volc_cred["access_key_id"],
+            secret_access_key=volc_cred["secret_access_key"],
+            prompt=scene["图片提示词"],
+            on_submit=job.submitted,
+        )
+    except Exception as e:
+        print(f"图片生成失败: {img_path.name}，错误: {e}")
+        job.failed(e)
+        raise
+    store_in_cache(cache, cache_key, img_path, {"provider": "volcengine", "prompt": scene["图片提示词"][:50]})
+    job.done(str(img_path))
+    return str(img_path)
+
+def queue_scene_image(image_batch, scene, img_path, job, cache=None):
+    """
+    批量模式下登记单个缺失的场景图片，返回完成时结果为图片路径的Future
+    """
+    print(f"登记批量场景图片任务: {img_path.name}")
+    job.start()
+    future = image_batch.add(str(img_path), scene["图片提示词"], on_submit=job.submitted)
+
+    def on_done(f):
+        if f.exception() is not None:
+            print(f"图片生成失败: {img_path.name}，错误: {f.exception()}")
+            job.failed(f.exception())
+        else:
+            store_in_cache(cache, image_cache_key(scene["图片提示词"]), img_path,
+                           {"provider": "volcengine", "prompt": scene["图片提示词"][:50]})
+            job.done(str(img_path))
+
+    future.add_done_callback(on_done)
+    return future
+
+def ensure_paragraph_subtitles(para, para_dir, audio_path):
+    """
+    检查并生成场景字幕和段落字幕（CPU节点，依赖段落音频）
+    返回: (段落字幕路径, 场景字幕路径列表)
+    """
+    audio_duration = get_audio_duration(str(audio_path))
+    scene_count = len(para["场景列表"])
+    scene_duration = audio_duration / scene_count if scene_count > 0 else 10.0
+
+    scene_subtitles = []
+    for i, scene in enumerate(para["场景列表"]):
+        scene_id = scene["场景编号"]
+        scene_subtitle_path = para_dir / f"scene_{scene_id}_subtitle.srt"
+        if not verified_artifact(scene_subtitle_path):
+            print(f"生成场景字幕: scene_{scene_id}")
+            create_srt_subtitle(
+                text=para["场景文案"],
+                start_time=i * scene_duration,
+                duration=scene_duration,
+                output_path=str(scene_subtitle_path)
+            )
+        else:
+            print(f"场景字幕已存在: scene_{scene_id}")
+        scene_subtitles.append(str(scene_subtitle_path))
+
+    paragraph_subtitle_path = para_dir / "paragraph_subtitle.srt"
+    if not verified_artifact(paragraph_subtitle_path):
+        print(f"生成段落字幕: {para['段落标题']}")
+        create_srt_subtitle(
+            text=para["场景文案"],
+            start_time=0,
+            duration=audio_duration,
+            output_path=str(paragraph_subtitle_path)
+        )
+    else:
+        print(f"段落字幕已存在: {paragraph_subtitle_path}")
+
+    return str(paragraph_subtitle_path), scene_subtitles
+
+def ensure_paragraph_video(para_title, audio_path, scene_files, paragraph_video_path, job, profile):
+    """
+    检查并生成段落视频（CPU节点，依赖本段落的音频和全部场景图片）
+    """
+    audio_duration = get_audio_duration(str(audio_path))
+    video_meta = verified_artifact(paragraph_video_path)
+    if video_meta:
+        video_duration = video_meta.get("duration") or 0.0
+        if abs(video_duration - audio_duration) <= 1.0:
+            print(f"段落视频已存在且有效: {paragraph_video_path}")
+            job.done(str(paragraph_video_path))
+            return str(paragraph_video_path)
+        print(f"段落视频存在但时长不匹配 (视频: {video_duration:.2f}s, 音频: {audio_duration:.2f}s)，需要重新生成")
+
+    print(f"生成段落视频: {para_title}")
+    job.start()
+    video_path = render_paragraph_video(
+        audio_path=str(audio_path),
+        image_paths=scene_files,
+        output_path=str(paragraph_video_path),
+        profile=profile
+    )
+    if not video_path:
+        print(f"段落视频生成失败: {para_title}")
+        job.failed("render_paragraph_video 未生成视频")
+        raise RuntimeError(f"段落视频生成失败: {para_title}")
+    job.done(video_path)
+    print(f"段落视频生成成功: {para_title}")
+    return video_path
+
+def get_streaming_config():
+    """render.streaming 配置：enabled（是否输出HLS分段）、segment_duration（目标分段时长）"""
+    return optional_config(lambda: (get_config().get("render") or {}).get("streaming"))
+
+def ensure_paragraph_stream(paragraph_video_path, stream_dir, segment_duration):
+    """
+    把段落视频流复制切成HLS fMP4分段（CPU节点，依赖段落视频），分段比段落视频新时直接复用
+    返回: 段落播放列表路径
+    """
+    stream_dir = Path(stream_dir)
+    playlist = stream_dir / PLAYLIST_NAME
+    if playlist.exists() and playlist.stat().st_mtime >= Path(paragraph_video_path).stat().st_mtime:
+        return str(playlist)
+
+    # 先切到临时目录再整体替换，章节播放列表不会引用到切了一半的分段
+    temp_dir = stream_dir.with_name(f"temp_{new_temp_token()}_{stream_dir.name}")
+    temp_dir.mkdir(parents=True)
+    try:
+        if not run_ffmpeg(build_segment_cmd(str(paragraph_video_path), str(temp_dir), segment_duration), "切分HLS分段"):
+            raise RuntimeError(f"切分HLS分段失败: {paragraph_video_path}")
+        check_commit_guard()
+        if stream_dir.exists():
+            shutil.rmtree(stream_dir)
+        os.replace(temp_dir, stream_dir)
+    finally:
+        if temp_dir.exists():
+            shutil.rmtree(temp_dir)
+    print(f"段落HLS分段已生成: {playlist}")
+    return str(playlist)
+
+def publish_stream_playlists(output_base, chapter_playlist, paragraph_playlists, profile):
+    """
+    重写章节播放列表和整本小说播放列表，发布从头开始连续就绪的段落
+    参数:
+    - chapter_playlist: 章节播放列表路径
+    - paragraph_playlists: 本章所有段落播放列表路径（按顺序）
+    """
+    published = update_chapter_playlist(str(chapter_playlist), [str(p) for p in paragraph_playlists])
+    output_dir = Path(output_base)
+    playlist_name = profile.output_name("chapter.m3u8")
+    chapter_playlists = sorted(
+        (d / playlist_name for d in output_dir.iterdir() if (d / playlist_name).exists()),
+        key=lambda p: chapter_sort_key(p.parent.name)
+    )
+    update_novel_playlist(str(output_dir / profile.output_name("novel.m3u8")), [str(p) for p in chapter_playlists])
+    print(f"播放列表已更新: {chapter_playlist} ({published}/{len(paragraph_playlists)} 个段落)")
+
+def stream_paragraph(paragraph_video_path, paragraph_playlist, segment_duration,
+                     output_base, chapter_playlist, paragraph_playlists, profile):
+    """
+    段落HLS节点：切分段落视频并立即发布到章节和小说播放列表
+    """
+    ensure_paragraph_stream(paragraph_video_path, Path(paragraph_playlist).parent, segment_duration)
+    publish_stream_playlists(output_base, chapter_playlist, paragraph_playlists, profile)
+    return str(paragraph_playlist)
+
+def ensure_chapter_outputs(chapter_folder, chapter_output_dir, paragraph_videos, paragraph_subtitles, profile,
+                           paragraph_audios=None, job=None):
+    """
+    检查并生成章节字幕和章节视频（CPU节点，依赖全部段落视频）
+    """
+    job = job or ArtifactJob(None, None)
+    # 生成章节字幕文件
+    chapter_subtitle_path = chapter_output_dir / profile.output_name("chapter_subtitle.srt")
+    if paragraph_subtitles:
+        if not verified_artifact(chapter_subtitle_path):
+            print(f"生成章节字幕: {chapter_folder}")
+            merge_srt_files(paragraph_subtitles, paragraph_videos, str(chapter_subtitle_path))
+        else:
+            print(f"章节字幕已存在: {chapter_subtitle_path}")
+
+    # 检查并生成本章节视频
+    chapter_video_path = chapter_output_dir / profile.output_name("chapter_video.mp4")
+    narration_exists = verified_artifact(chapter_narration_path(chapter_video_path, profile)) is not None
+    chapter_meta = verified_artifact(chapter_video_path)
+    if chapter_meta and not narration_exists:
+        print(f"章节视频缺少旁白时间线（旧版输出），需要重新生成: {chapter_video_path}")
+    elif chapter_meta:
+        total_para_duration = sum(get_audio_duration(v) for v in paragraph_videos)
+        chapter_duration = chapter_meta.get("duration") or 0.0
+        if abs(total_para_duration - chapter_duration) <= 1.0:
+            print(f"章节视频已存在且有效: {chapter_video_path}")
+            job.done(str(chapter_video_path))
+            return str(chapter_video_path)
+        print(f"章节视频存在但时长不匹配 (视频: {chapter_duration:.2f}s, 预期: {total_para_duration:.2f}s)，需要重新生成")
+
+    print(f"生成章节视频: {chapter_folder}")
+    job.start()
+    chapter_video_result = create_chapter_video_ffmpeg(
+        paragraph_videos,
+        str(chapter_video_path),
+        chapter_subtitle_path=str(chapter_subtitle_path) if chapter_subtitle_path.exists() else None,
+        profile=profile,
+        paragraph_audios=paragraph_audios
+    )
+    if not chapter_video_result:
+        print(f"章节视频生成失败: {chapter_folder}")
+        job.failed("create_chapter_video_ffmpeg 未生成视频")
+        raise RuntimeError(f"章节视频生成失败: {chapter_folder}")
+    job.done(chapter_video_result)
+    print(f"章节视频生成成功: {chapter_video_result}")
+    return chapter_video_result
+
+def process_chapter(chapter_json_path, output_base="output", network_workers=None, cpu_workers=None,
+                    batch_images=None, profile=None, stream=None, lease=None):
+    """
+    处理单个章节：把音频、场景图片、字幕、段落视频和章节视频组织成任务图并发执行。
+    每个段落的视频只依赖本段落的音频和场景图片，就绪后立即开始渲染。
+    参数:
+    - network_workers: 网络节点（TTS、图片生成）并发数，默认读取 scheduler 配置
+    - cpu_workers: CPU节点（字幕、ffmpeg）并发数，默认读取 scheduler 配置
+    - batch_images: 是否一次性提交本章所有缺失场景图片并统一轮询，
+      默认读取 volcengine.image_to_image.batch.enabled
+    - profile: 渲染档位（preview / draft / final），默认读取 render.profile。
+      音频、图片、字幕各档位共用，视频按档位分别命名
+    - stream: 是否同时输出HLS分段，每完成一个段落就追加到章节和小说播放列表，
+      默认读取 render.streaming.enabled
+    - lease: 工作进程模式下本章节的租约；每个节点开始前和每次提交产物前都检查一次，
+      租约丢失时抛出 LeaseLost 中止，不与接管的进程同时写章节目录
+    """
     # 1. 读取章节JSON
     with open(chapter_json_path, "r", encoding="utf-8") as f:
         chapter_data = json.load(f)
@@ -909,269 +1488,261 @@ def process_chapter(chapter_json_path, output_base="output"):
 
     config = get_config()
     volc_cred = config.get("volcengine")["credentials"]
-    volc_params = config.get("volcengine")["image_to_image"]["default_params"]
     audio_gen = AudioGenerator()
-    volc_client = VolcengineImg2ImgOfficial(
-        access_key_id=volc_cred["access_key_id"],
-        secret_access_key=volc_cred["secret_access_key"],
-        region=volc_cred.get("region", "cn-north-1")
-    )
+    cache = get_artifact_cache()
+    profile = get_render_profile(profile)
+
+    scheduler_config = get_scheduler_config()
+    if network_workers is None:
+        network_workers = scheduler_config.get("network_workers", 4)
+    if cpu_workers is None:
+        cpu_workers = scheduler_config.get("cpu_workers")
+
+    streaming_config = get_streaming_config()
+    if stream is None:
+        stream = streaming_config.get("enabled", False)
+    segment_duration = streaming_config.get("segment_duration", DEFAULT_SEGMENT_DURATION)
+
+    # 批量图片模式：本章所有缺失场景先登记，统一提交和轮询
+    batch_config = config.get("volcengine", {}).get("image_to_image", {}).get("batch", {}) or {}
+    if batch_images is None:
+        batch_images = batch_config.get("enabled", False)
+    image_batch = None
+    if batch_images:
+        image_batch = VolcengineTaskBatch(
+            VolcengineImg2ImgOfficial(
+                access_key_id=volc_cred["access_key_id"],
+                secret_access_key=volc_cred["secret_access_key"],
+                region=volc_cred.get("region", "cn-north-1")
+            ),
+            max_in_flight=batch_config.get("max_in_flight", 4),
+            poll_interval=batch_config.get("poll_interval", 5),
+            max_wait_time=batch_config.get("max_wait_time", 300)
+        )
 
     # 章节目录名
-    chapter_num = chapter_info["章节号"].replace("第", "").replace("章", "")
-    chapter_title = chapter_info.get("标题", "")
-    chapter_folder = f"{chapter_num}-{chapter_title}" if chapter_title else f"{chapter_num}章"
+    chapter_folder = chapter_folder_name(chapter_info)
     chapter_output_dir = Path(output_base) / chapter_folder
-    progress_path = chapter_output_dir / ".progress.json"
-    progress = load_progress(progress_path)
-    paragraph_videos = []
-    paragraph_subtitles = []
+    ledger = get_job_ledger(output_base)
+    chapter_no = chapter_number(chapter_info)
+
+    def ledger_job(paragraph, kind, path):
+        key = ArtifactKey(chapter_folder, paragraph, kind, Path(path).name)
+        ledger.register(key, chapter_no=chapter_no, path=str(path))
+        return ArtifactJob(ledger, key)
 
     print(f"\n{'='*60}")
-    print(f"开始处理 {chapter_info['章节号']}: {chapter_folder}")
+    print(f"开始处理 {chapter_info['章节号']}: {chapter_folder} (渲染档位: {profile.name})")
     print(f"包含 {len(scene_breakdown)} 个段落")
     print(f"{'='*60}")
 
-    all_results = []
-    for para in scene_breakdown:
+    # 2. 构建任务图：每个产物一个节点
+    graph = TaskGraph()
+    paragraphs = []
+    chapter_playlist = chapter_output_dir / profile.output_name("chapter.m3u8")
+    paragraph_playlists = [
+        chapter_output_dir / paragraph_dir_name(para) / profile.output_name("stream") / PLAYLIST_NAME
+        for para in scene_breakdown
+    ]
+    for index, para in enumerate(scene_breakdown):
         para_title = para["段落标题"]
-        para_num = para["序号"]
-        para_dir = chapter_output_dir / f"{para_num}-{para_title}"
+        para_key = paragraph_dir_name(para)
+        para_dir = chapter_output_dir / para_key
         para_dir.mkdir(parents=True, exist_ok=True)
-        para_key = f"{chapter_info['章节号']}-{para_title}"
-        para_progress = progress.get(para_key, {})
-
-        print(f"\n处理段落: {chapter_info['章节号']} - {para_title}")
-
-        # 2. 检查并生成段落音频
         audio_path = para_dir / "audio.wav"
-        if audio_path.exists() and audio_path.stat().st_size > 0:
-            print(f"音频文件已存在且有效: {audio_path}")
-            audio_file = str(audio_path)
-        else:
-            print(f"生成音频文件: {audio_path}")
-            try:
-                audio_file = audio_gen.generate(
-                    text=para["场景文案"],
-                    type="paragraph",
-                    language="zh",
-                    output_path=str(audio_path)
-                )
-                para_progress["audio_done"] = True
-                save_progress(progress_path, progress)
-            except Exception as e:
-                print(f"音频生成失败: {para_title}，错误: {e}")
-                save_progress(progress_path, progress)
-                break
+        scene_paths = [para_dir / f"scene_{scene['场景编号']}.jpg" for scene in para["场景列表"]]
+        paragraph_video_path = para_dir / profile.output_name("paragraph_video.mp4")
 
-        # 3. 检查并生成场景图片和字幕
-        scene_files = []
-        scene_subtitles = []
-        missing_scenes = []
-        scene_count = len(para["场景列表"])
-        total_duration = get_audio_duration(str(audio_path)) if Path(audio_path).exists() else 0
-        scene_duration = total_duration / scene_count if scene_count > 0 else 10.0
-
-        for i, scene in enumerate(para["场景列表"]):
-            scene_id = scene["场景编号"]
-            img_path = para_dir / f"scene_{scene_id}.jpg"
-            scene_subtitle_path = para_dir / f"scene_{scene_id}_subtitle.srt"
-
-            # 生成场景字幕
-            if not scene_subtitle_path.exists():
-                scene_start_time = i * scene_duration
-                print(f"生成场景字幕: scene_{scene_id}")
-                create_srt_subtitle(
-                    text=para["场景文案"],
-                    start_time=scene_start_time,
-                    duration=scene_duration,
-                    output_path=str(scene_subtitle_path)
-                )
+        audio_node = graph.add(
+            f"p{index}/audio",
+            partial(ensure_paragraph_audio, audio_gen, para, audio_path,
+                    ledger_job(para_key, "audio", audio_path), cache),
+            pool=NETWORK
+        )
+        image_nodes = []
+        for scene, img_path in zip(para["场景列表"], scene_paths):
+            image_job = ledger_job(para_key, "scene", img_path)
+            image_missing = not verified_artifact(img_path)
+            if image_batch and image_missing and cache and cache.fetch(image_cache_key(scene["图片提示词"]), str(img_path)):
+                # 登记批量任务前先查缓存；命中后补写元数据，节点不再重复取回
+                print(f"场景图片来自缓存: {img_path.name}")
+                write_sidecar(img_path)
+                image_job.done(str(img_path))
+                image_func = partial(str, img_path)
+            elif image_batch and image_missing:
+                future = queue_scene_image(image_batch, scene, img_path, image_job, cache)
+                image_func = partial(lambda f: f, future)
             else:
-                print(f"场景字幕已存在: scene_{scene_id}")
+                image_func = partial(ensure_scene_image, volc_cred, scene, img_path, image_job, cache)
+            image_nodes.append(graph.add(f"p{index}/{img_path.name}", image_func, pool=NETWORK))
+        subtitle_node = graph.add(
+            f"p{index}/subtitles",
+            partial(ensure_paragraph_subtitles, para, para_dir, audio_path),
+            deps=[audio_node]
+        )
+        video_node = graph.add(
+            f"p{index}/video",
+            partial(ensure_paragraph_video, para_title, audio_path,
+                    [str(p) for p in scene_paths], paragraph_video_path,
+                    ledger_job(para_key, "video", paragraph_video_path), profile),
+            deps=[audio_node, *image_nodes]
+        )
+        if stream:
+            graph.add(
+                f"p{index}/stream",
+                partial(stream_paragraph, paragraph_video_path, paragraph_playlists[index], segment_duration,
+                        output_base, chapter_playlist, paragraph_playlists, profile),
+                deps=[video_node]
+            )
+        paragraphs.append({
+            "title": para_title,
+            "audio": str(audio_path),
+            "images": [str(p) for p in scene_paths],
+            "subtitle_node": subtitle_node,
+            "video_node": video_node,
+        })
 
-            scene_subtitles.append(str(scene_subtitle_path))
+    paragraph_nodes = [n for p in paragraphs for n in (p["subtitle_node"], p["video_node"])]
+    chapter_node = None
+    if paragraphs:
+        chapter_node = graph.add(
+            "chapter_video",
+            lambda: ensure_chapter_outputs(
+                chapter_folder,
+                chapter_output_dir,
+                [graph.result(p["video_node"]) for p in paragraphs],
+                [graph.result(p["subtitle_node"])[0] for p in paragraphs],
+                profile,
+                [p["audio"] for p in paragraphs],
+                ledger_job("", "chapter_video", chapter_output_dir / profile.output_name("chapter_video.mp4")),
+            ),
+            deps=paragraph_nodes
+        )
 
-            if img_path.exists() and img_path.stat().st_size > 0:
-                print(f"场景图片已存在且有效: scene_{scene_id}.jpg")
-                scene_files.append(str(img_path))
-            else:
-                missing_scenes.append((scene, img_path))
-
-        # 生成缺失的场景图片
-        for scene, img_path in missing_scenes:
-            print(f"生成缺失的场景图片: scene_{scene['场景编号']}.jpg")
-            try:
-                if scene.get("场景图片url"):
-                    image_url = scene.get("场景图片url")
-                else:
-                    image_url = f"http://zhuluoji.cn-sh2.ufileos.com/test/{scene.get('主角', '主角')}.jpeg"
-                generate_image_from_prompt(
-                    output_path=str(img_path),
-                    access_key_id=volc_cred["access_key_id"],
-                    secret_access_key=volc_cred["secret_access_key"],
-                    prompt=scene["图片提示词"],
-                )
-                scene_files.append(str(img_path))
-                para_progress["scene_files"] = scene_files
-                progress[para_key] = para_progress
-                save_progress(progress_path, progress)
-            except Exception as e:
-                print(f"图片生成失败: scene_{scene['场景编号']}.jpg，错误: {e}")
-                save_progress(progress_path, progress)
-                return all_results  # 断点退出
-
-        # 4. 生成段落字幕文件
-        paragraph_subtitle_path = para_dir / "paragraph_subtitle.srt"
-        audio_duration = get_audio_duration(str(audio_path))
-        if not paragraph_subtitle_path.exists():
-            print(f"生成段落字幕: {para_title}")
-            create_srt_subtitle(
-                text=para["场景文案"],
-                start_time=0,
-                duration=audio_duration,
-                output_path=str(paragraph_subtitle_path)
-            )
-        else:
-            print(f"段落字幕已存在: {paragraph_subtitle_path}")
-        paragraph_subtitles.append(str(paragraph_subtitle_path))
-
-        # 5. 检查并生成段落视频
-        paragraph_video_path = para_dir / "paragraph_video.mp4"
-        video_exists = paragraph_video_path.exists() and paragraph_video_path.stat().st_size > 0
-        if video_exists:
-            video_duration = get_audio_duration(str(paragraph_video_path))
-            duration_match = abs(video_duration - audio_duration) <= 1.0
-            if duration_match:
-                print(f"段落视频已存在且有效: {paragraph_video_path}")
-                paragraph_videos.append(str(paragraph_video_path))
-            else:
-                print(f"段落视频存在但时长不匹配 (视频: {video_duration:.2f}s, 音频: {audio_duration:.2f}s)，需要重新生成")
-                video_exists = False
-        if not video_exists:
-            print(f"生成段落视频: {para_title}")
-            video_path = create_paragraph_video_ffmpeg(
-                audio_path=str(audio_path),
-                image_paths=scene_files,
-                output_path=str(paragraph_video_path)
-            )
-            if video_path:
-                para_progress["video_done"] = True
-                progress[para_key] = para_progress
-                save_progress(progress_path, progress)
-                paragraph_videos.append(video_path)
-                print(f"段落视频生成成功: {para_title}")
-            else:
-                print(f"段落视频生成失败: {para_title}")
+    # 3. 执行任务图
+    if image_batch:
+        image_batch.start()
+    guard = lease.check if lease is not None else None
+    with commit_guard(guard):
+        try:
+            graph.run(network_workers=network_workers, cpu_workers=cpu_workers, guard=guard)
+        except BaseException:
+            # 任务图中止（如租约丢失）：不再提交新的图片任务
+            if image_batch:
+                image_batch.cancel_pending()
+            raise
+        finally:
+            # 等后台批量线程结束再返回；仍在租约检查下，丢失租约后不再写入图片
+            if image_batch:
+                image_batch.join()
 
-        # 6. 记录结果
+    # 4. 记录结果
+    all_results = []
+    paragraph_videos = []
+    for para in paragraphs:
+        if graph.state(para["video_node"]) != DONE:
+            continue
+        video_path = graph.result(para["video_node"])
+        paragraph_videos.append(video_path)
+        paragraph_subtitle, scene_subtitles = graph.result(para["subtitle_node"]) \
+            if graph.state(para["subtitle_node"]) == DONE else ("", [])
         all_results.append({
             "chapter": chapter_info["章节号"],
-            "para_title": para_title,
-            "audio": str(audio_path),
-            "images": scene_files,
-            "video": str(paragraph_video_path),
-            "paragraph_subtitle": str(paragraph_subtitle_path),
+            "para_title": para["title"],
+            "audio": para["audio"],
+            "images": para["images"],
+            "video": video_path,
+            "paragraph_subtitle": paragraph_subtitle,
             "scene_subtitles": scene_subtitles
         })
-        progress[para_key] = para_progress
-        save_progress(progress_path, progress)
 
-    # 7. 生成章节字幕文件
-    chapter_subtitle_path = chapter_output_dir / "chapter_subtitle.srt"
-    if paragraph_subtitles:
-        if not chapter_subtitle_path.exists():
-            print(f"生成章节字幕: {chapter_folder}")
-            merge_srt_files(paragraph_subtitles, paragraph_videos, str(chapter_subtitle_path))
-        else:
-            print(f"章节字幕已存在: {chapter_subtitle_path}")
-
-    # 8. 检查并生成本章节视频
-    chapter_video_path = chapter_output_dir / "chapter_video.mp4"
-    if paragraph_videos:
-        chapter_needs_update = True
-        if chapter_video_path.exists() and chapter_video_path.stat().st_size > 0:
-            total_para_duration = sum(get_audio_duration(v) for v in paragraph_videos)
-            chapter_duration = get_audio_duration(str(chapter_video_path))
-            if abs(total_para_duration - chapter_duration) <= 1.0:
-                print(f"章节视频已存在且有效: {chapter_video_path}")
-                chapter_needs_update = False
-            else:
-                print(f"章节视频存在但时长不匹配 (视频: {chapter_duration:.2f}s, 预期: {total_para_duration:.2f}s)，需要重新生成")
-        if chapter_needs_update:
-            print(f"生成章节视频: {chapter_folder}")
-            chapter_video_result = create_chapter_video_ffmpeg(
-                paragraph_videos, 
-                str(chapter_video_path),
-                chapter_subtitle_path=str(chapter_subtitle_path) if chapter_subtitle_path.exists() else None
-            )
-            if chapter_video_result:
-                print(f"章节视频生成成功: {chapter_video_result}")
-            else:
-                print(f"章节视频生成失败: {chapter_folder}")
-    else:
+    if chapter_node is None:
         print(f"没有有效的段落视频，跳过章节视频生成: {chapter_info['章节号']}")
+    elif graph.state(chapter_node) == SKIPPED:
+        print(f"存在未完成的段落，跳过章节视频生成: {chapter_info['章节号']}")
+
+    if cache:
+        stats = cache.stats()
+        print(f"产物缓存: 命中 {stats['hits']} 次, 未命中 {stats['misses']} 次, "
+              f"命中率 {stats['hit_rate']:.0%}, {stats['entries']} 个条目 {stats['bytes'] / 1024 ** 2:.1f}MB")
 
     print(f"\n{'='*60}")
-    print(f"章节处理完成！共生成 {len(paragraph_videos)} 个段落视频")
+    print(f"章节处理完成！共生成 {len(paragraph_videos)} 个段落视频 (节点状态: {graph.summary()})")
     for video in paragraph_videos:
         print(f"  - {video}")
     print(f"{'='*60}")
 
     return all_results
 
-def process_all_chapters(chapters_dir="chapters/processed", output_base="output"):
+# process_all_chapters 默认处理的章节文件（按顺序）
+CHAPTER_FILES = [
+    "chapter_001_processed.json",
+    "chapter_002_processed.json",
+    "chapter_003_processed.json",
+    "chapter_004_processed.json",
+    "chapter_005_processed.json",
+    "chapter_006_processed.json",
+    "chapter_007_processed.json",
+    "chapter_008_processed.json",
+    "chapter_009_processed.json",
+    "chapter_010_processed.json",
+    "chapter_011_processed.json",
+    "chapter_012_processed.json",
+    "chapter_013_processed.json",
+    "chapter_014_processed.json",
+    "chapter_015_processed.json",
+    "chapter_016_processed.json",
+    "chapter_017_processed.json",
+    "chapter_018_processed.json",
+    "chapter_019_processed.json",
+    "chapter_020_processed.json",
+    "chapter_021_processed.json",
+    "chapter_022_processed.json",
+    "chapter_023_processed.json",
+    "chapter_024_processed.json",
+    "chapter_025_processed.json",
+    "chapter_026_processed.json",
+    "chapter_027_processed.json",
+    "chapter_028_processed.json",
+    "chapter_029_processed.json",
+    "chapter_030_processed.json",
+    "chapter_031_processed.json",
+    "chapter_032_processed.json",
+    "chapter_033_processed.json",
+    "chapter_034_processed.json",
+    "chapter_035_processed.json",
+    "chapter_036_processed.json",
+    "chapter_037_processed.json",
+    "chapter_038_processed.json",
+    "chapter_039_processed.json",
+    "chapter_040_processed.json",
+]
+
+def process_all_chapters(chapters_dir=None, output_base="output", profile=None, append=False,
+                         stream=None, plan=None):
     """
     处理所有章节文件，生成视频
+    参数:
+    - chapters_dir: 章节JSON目录；默认逐章取 chapters/merged 中的文件，没有时取 chapters/processed
+    - profile: 渲染档位（preview / draft / final），默认读取 render.profile
+    - append: 以增量模式拼接完整电影，只处理新增或变化的章节
+    - stream: 是否同时输出HLS分段和播放列表，默认读取 render.streaming.enabled
+    - plan: make_run_plan 生成（或 RunPlan.load 读取）的运行计划，只处理计划中有工作的章节，
+      渲染档位默认使用计划的档位
     """
-    chapters_dir = Path(chapters_dir)
-    chapter_files = [
-        "chapter_001_processed.json",
-        "chapter_002_processed.json",
-        "chapter_003_processed.json",
-        "chapter_004_processed.json",
-        "chapter_005_processed.json",
-        "chapter_006_processed.json",
-        "chapter_007_processed.json",
-        "chapter_008_processed.json",
-        "chapter_009_processed.json",
-        "chapter_010_processed.json",
-        "chapter_011_processed.json",
-        "chapter_012_processed.json",
-        "chapter_013_processed.json",
-        "chapter_014_processed.json",
-        "chapter_015_processed.json",
-        "chapter_016_processed.json",
-        "chapter_017_processed.json",
-        "chapter_018_processed.json",
-        "chapter_019_processed.json",
-        "chapter_020_processed.json",
-        "chapter_021_processed.json",
-        "chapter_022_processed.json",
-        "chapter_023_processed.json",
-        "chapter_024_processed.json",
-        "chapter_025_processed.json",
-        "chapter_026_processed.json",
-        "chapter_027_processed.json",
-        "chapter_028_processed.json",
-        "chapter_029_processed.json",
-        "chapter_030_processed.json",
-        "chapter_031_processed.json",
-        "chapter_032_processed.json",
-        "chapter_033_processed.json",
-        "chapter_034_processed.json",
-        "chapter_035_processed.json",
-        "chapter_036_processed.json",
-        "chapter_037_processed.json",
-        "chapter_038_processed.json",
-        "chapter_039_processed.json",
-        "chapter_040_processed.json",
-    ]
+    if plan is not None and profile is None:
+        profile = plan.profile
+    profile = get_render_profile(profile)
+    if plan is not None:
+        chapter_paths = [Path(c.chapter_json) for c in plan.pending_chapters()]
+        print(f"按运行计划执行: {len(chapter_paths)}/{len(plan.chapters)} 个章节有待处理的工作")
+    else:
+        chapter_paths = resolve_chapter_files(CHAPTER_FILES, chapters_dir)
     
     all_results = []
     
-    for chapter_file in chapter_files:
-        chapter_path = chapters_dir / chapter_file
+    for chapter_path in chapter_paths:
+        chapter_file = chapter_path.name
         if not chapter_path.exists():
             print(f"章节文件不存在: {chapter_path}")
             continue
@@ -1181,7 +1752,7 @@ def process_all_chapters(chapters_dir="chapters/processed", output_base="output"
         print(f"{'='*50}")
         
         try:
-            results = process_chapter(str(chapter_path), output_base)
+            results = process_chapter(str(chapter_path), output_base, profile=profile, stream=stream)
             all_results.extend(results)
             print(f"章节 {chapter_file} 处理完成")
         except Exception as e:
@@ -1196,10 +1767,7 @@ def process_all_chapters(chapters_dir="chapters/processed", output_base="output"
     print("开始生成完整电影...")
     print(f"{'='*60}")
     
-    complete_movie_path = create_complete_movie(
-        output_base=output_base,
-        movie_output_path=f"{output_base}/complete_movie.mp4"
-    )
+    complete_movie_path = create_complete_movie(output_base=output_base, profile=profile, append=append)
     
     if complete_movie_path:
         print(f"✅ 完整电影已生成: {complete_movie_path}")
@@ -1208,40 +1776,232 @@ def process_all_chapters(chapters_dir="chapters/processed", output_base="output"
     
     return all_results
 
+def make_run_plan(chapters_dir=None, output_base="output", profile=None):
+    """
+    生成运行计划（只读：不启动ffprobe、不调用服务商、不写文件）
+    参数:
+    - chapters_dir: 章节JSON目录（默认同 process_all_chapters 逐章选择），章节顺序与 process_all_chapters 相同
+    - profile: 渲染档位，默认读取 render.profile
+    返回: RunPlan
+    """
+    profile = get_render_profile(profile)
+    chapter_paths = [path for path in resolve_chapter_files(CHAPTER_FILES, chapters_dir) if path.exists()]
+    cache = get_artifact_cache()
+    tts_key = None
+    if cache is not None:
+        audio_gen = AudioGenerator()
+        tts_key = partial(tts_cache_key, audio_gen)
+    scheduler_config = get_scheduler_config()
+    return build_plan(
+        [str(p) for p in chapter_paths],
+        output_base,
+        profile,
+        cache=cache,
+        tts_key=tts_key,
+        image_key=image_cache_key,
+        # 还没有台账时使用默认耗时，不为预演创建台账文件
+        ledger=get_job_ledger(output_base) if ledger_path(output_base).exists() else None,
+        network_workers=scheduler_config.get("network_workers", 4),
+        cpu_workers=scheduler_config.get("cpu_workers") or default_cpu_workers(),
+    )
+
+def format_seconds(seconds):
+    """秒数格式化为 1h02m03s"""
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    return f"{hours}h{minutes:02d}m{secs:02d}s" if hours else f"{minutes}m{secs:02d}s"
+
+def print_run_plan(plan, verbose=False):
+    """
+    打印运行计划
+    参数:
+    - verbose: 是否逐项列出每个产物
+    """
+    counts = plan.counts()
+    estimate = plan.estimate
+    print(f"\n{'='*60}")
+    print(f"运行计划 (渲染档位: {plan.profile})")
+    print(f"{'='*60}")
+    for chapter in plan.chapters:
+        if not chapter.jobs:
+            print(f"  {chapter.chapter}: 已完成")
+            continue
+        kinds = {}
+        for job in chapter.jobs:
+            label = f"{job.kind}/{job.action}"
+            kinds[label] = kinds.get(label, 0) + 1
+        print(f"  {chapter.chapter}: " + ", ".join(f"{k} {v}" for k, v in sorted(kinds.items())))
+        if verbose:
+            for job in chapter.jobs:
+                print(f"      [{job.action}] {job.kind} {job.paragraph}/{Path(job.path).name} ({job.reason})")
+    print(f"{'-'*60}")
+    print(f"TTS调用: {counts['tts_calls']} 次 ({counts['tts_chars']} 字)")
+    print(f"图片生成: {counts['image_jobs']} 个任务")
+    print(f"缓存取回: {counts['cache_fetches']} 个产物")
+    print(f"段落视频: {counts['paragraph_videos']} 个 ({counts['segment_encodes']} 个片段编码)")
+    print(f"章节重新封装: {counts['chapter_remuxes']} 个")
+    if estimate:
+        print(f"预计耗时: {format_seconds(estimate['wall_seconds'])} "
+              f"(串行总和: 网络 {format_seconds(estimate['network_seconds'])}, CPU {format_seconds(estimate['cpu_seconds'])})")
+        print(f"预计费用: ¥{estimate['cost']:.2f}")
+
+def run_worker(chapters_dir=None, output_base="output", profile=None, stream=None):
+    """
+    工作进程模式：多台渲染机（共享NFS）上的任意多个进程通过租约文件认领章节并处理，
+    同一章节目录同一时间只有一个进程在写；进程崩溃后其租约在 ttl 后过期，由其他进程接管。
+    租约以章节为单位（段落共用章节输出目录），完成标记按渲染档位分别记录。
+    配置 worker 段：lease_dir（默认 output_base/.leases）、lease_ttl、heartbeat_interval、poll_interval。
+    任务台账必须通过 ledger.path 放在本机磁盘上（输出目录是共享挂载，SQLite WAL 不能放在 NFS 上），否则直接报错退出
+    """
+    require_local_ledger(output_base)
+    profile = get_render_profile(profile)
+    worker_config = optional_config(lambda: get_config().get("worker"))
+    lease_dir = Path(worker_config.get("lease_dir") or Path(output_base) / ".leases")
+    owner = default_owner()
+    chapters = {path.stem: path.name for path in resolve_chapter_files(chapters_dir=chapters_dir)}
+
+    def handle(key, lease):
+        # 认领时再确定路径：等待期间合并完成的章节使用合并后的文件
+        chapter_path = resolve_chapter_files([chapters[key]], chapters_dir)[0]
+        with open(chapter_path, "r", encoding="utf-8") as f:
+            expected = len(json.load(f)["场景拆解"])
+        results = process_chapter(str(chapter_path), output_base, profile=profile, stream=stream, lease=lease)
+        return len(results) == expected
+
+    print(f"工作进程 {owner} 启动: {len(chapters)} 个章节，租约目录: {lease_dir}")
+    summary = work_through(
+        list(chapters),
+        handle,
+        str(lease_dir),
+        ttl=float(worker_config.get("lease_ttl", DEFAULT_TTL)),
+        heartbeat_interval=worker_config.get("heartbeat_interval"),
+        poll_interval=float(worker_config.get("poll_interval", 5)),
+        owner=owner,
+        done_dir=str(lease_dir / profile.name),
+    )
+    print(f"工作进程 {owner} 结束: 完成 {len(summary['done'])} 个章节，失败 {len(summary['failed'])} 个")
+    for key in summary["failed"]:
+        print(f"  失败: {key}")
+    return summary
+
+def parse_chapter_range(text):
+    """解析章节范围：'1-40' 或 '7'，返回闭区间 (起, 止)"""
+    start, _, end = text.partition("-")
+    return int(start), int(end or start)
+
+def print_ledger_status(output_base="output", state=None, kind=None, chapters=None):
+    """
+    查询任务台账：不带条件时按类型汇总各状态数量，带条件时列出匹配的产物
+    参数:
+    - state: 状态过滤，如 failed
+    - kind: 产物类型过滤：audio / scene / video / chapter_video
+    - chapters: 章节编号闭区间，如 (1, 40)
+    """
+    ledger = get_job_ledger(output_base)
+    print(f"任务台账: {ledger.path}")
+    if state is None and kind is None and chapters is None:
+        for artifact_kind, counts in sorted(ledger.summary().items()):
+            print(f"  {artifact_kind}: " + ", ".join(f"{k} {v}" for k, v in sorted(counts.items())))
+        return
+    rows = ledger.query(state=state, kind=kind, chapters=chapters)
+    for row in rows:
+        line = f"  [{row['state']}] {row['chapter']}/{row['paragraph']}/{row['name']} (尝试 {row['attempts']} 次)"
+        if row["task_id"]:
+            line += f" task_id={row['task_id']}"
+        if row["error"]:
+            line += f" 错误: {row['error']}"
+        print(line)
+    print(f"共 {len(rows)} 条")
+
 if __name__ == "__main__":
-    import sys
-    
-    if len(sys.argv) > 1:
-        arg = sys.argv[1]
-        
-        if arg == "--movie" or arg == "--complete":
-            # 只生成完整电影
-            print("生成完整电影...")
-            complete_movie_path = create_complete_movie()
-            if complete_movie_path:
-                print(f"✅ 完整电影生成完成: {complete_movie_path}")
-            else:
-                print("❌ 完整电影生成失败")
-        
-        elif arg.endswith('.json'):
-            # 处理单个章节
-            chapter_json = arg
-            print(f"处理单个章节: {chapter_json}")
-            results = process_chapter(chapter_json)
-            print("\n章节处理完成，结果：")
-            for para in results:
-                print(f"段落: {para['para_title']}")
-                print(f"  音频: {para['audio']}")
-                print(f"  视频: {para['video']}")
-                for img in para['images']:
-                    print(f"  场景图片: {img}")
+    import argparse
+    
+    parser = argparse.ArgumentParser(
+        description="章节视频生成",
+        epilog="""用法:
+  python loop.py [章节文件.json]     # 处理单个章节
+  python loop.py --movie              # 仅生成完整电影
+  python loop.py                      # 处理所有章节并生成完整电影
+  python loop.py --chapters-dir chapters/processed
+                                      # 指定章节JSON目录（默认逐章取 chapters/merged，没有时取 chapters/processed）
+  python loop.py --profile preview    # 以预览档位渲染（输出文件带 .preview 后缀）
+  python loop.py --movie --append     # 增量拼接完整电影，只处理新增或变化的章节
+  python loop.py --stream             # 同时输出HLS分段，段落完成即追加到 chapter.m3u8 / novel.m3u8
+  python loop.py --worker             # 工作进程模式，多进程/多机通过租约认领章节
+  python loop.py --status --state failed --kind scene --chapters 1-40
+                                      # 查询任务台账：第1-40章所有失败的场景图片
+  python loop.py plan --save-plan plan.json
+                                      # 只读预演：列出将要执行的工作并估算耗时和费用
+  python loop.py --plan plan.json     # 执行保存的计划""",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("chapter_json", nargs="?", help="单个章节JSON文件，或 plan（只生成运行计划）")
+    parser.add_argument("--movie", "--complete", dest="movie", action="store_true", help="仅生成完整电影")
+    parser.add_argument("--append", action="store_true", help="增量拼接完整电影（按清单只处理新增或变化的章节）")
+    parser.add_argument("--worker", action="store_true", help="工作进程模式：通过共享目录中的租约认领章节")
+    parser.add_argument("--stream", action="store_true", default=None,
+                        help="同时输出HLS分段和滚动播放列表（默认读取 render.streaming.enabled）")
+    parser.add_argument("--profile", help="渲染档位: preview / draft / final（默认读取 render.profile）")
+    parser.add_argument("--chapters-dir",
+                        help=f"章节JSON目录（默认逐章取 {MERGED_CHAPTERS_DIR} 中的文件，没有时取 {PROCESSED_CHAPTERS_DIR}）")
+    parser.add_argument("--save-plan", help="plan: 把运行计划保存为JSON")
+    parser.add_argument("--plan", help="执行保存的运行计划（JSON）")
+    parser.add_argument("--verbose", action="store_true", help="plan: 逐项列出每个产物")
+    parser.add_argument("--status", action="store_true", help="查询任务台账")
+    parser.add_argument("--state", help="台账查询: 状态过滤（pending / running / submitted / done / failed）")
+    parser.add_argument("--kind", help="台账查询: 产物类型过滤（audio / scene / video / chapter_video）")
+    parser.add_argument("--chapters", type=parse_chapter_range, help="台账查询: 章节编号范围，如 1-40")
+    args = parser.parse_args()
+    
+    if args.status:
+        print_ledger_status(state=args.state, kind=args.kind, chapters=args.chapters)
+        raise SystemExit(0)
+    
+    if args.chapter_json == "plan":
+        run_plan = make_run_plan(args.chapters_dir, profile=args.profile)
+        print_run_plan(run_plan, verbose=args.verbose)
+        if args.save_plan:
+            run_plan.save(args.save_plan)
+            print(f"运行计划已保存: {args.save_plan}")
+        raise SystemExit(0)
+    
+    run_plan = RunPlan.load(args.plan) if args.plan else None
+    render_profile = get_render_profile(args.profile or (run_plan.profile if run_plan else None))
+    
+    if args.worker:
+        try:
+            run_worker(args.chapters_dir, profile=render_profile, stream=args.stream)
+        except LedgerError as e:
+            print(f"❌ {e}")
+            raise SystemExit(1)
+    
+    elif args.movie:
+        # 只生成完整电影
+        print("生成完整电影...")
+        complete_movie_path = create_complete_movie(profile=render_profile, append=args.append)
+        if complete_movie_path:
+            print(f"✅ 完整电影生成完成: {complete_movie_path}")
         else:
-            print("用法:")
-            print("  python loop.py [章节文件.json]     # 处理单个章节")
-            print("  python loop.py --movie              # 仅生成完整电影")
-            print("  python loop.py                      # 处理所有章节并生成完整电影")
+            print("❌ 完整电影生成失败")
+    
+    elif args.chapter_json:
+        if not args.chapter_json.endswith('.json'):
+            parser.error(f"章节文件必须是 .json: {args.chapter_json}")
+        # 处理单个章节
+        chapter_json = args.chapter_json
+        print(f"处理单个章节: {chapter_json}")
+        results = process_chapter(chapter_json, profile=render_profile, stream=args.stream)
+        print("\n章节处理完成，结果：")
+        for para in results:
+            print(f"段落: {para['para_title']}")
+            print(f"  音频: {para['audio']}")
+            print(f"  视频: {para['video']}")
+            for img in para['images']:
+                print(f"  场景图片: {img}")
     else:
         # 处理所有章节
         print("处理所有章节")
-        all_results = process_all_chapters()
+        all_results = process_all_chapters(args.chapters_dir, profile=render_profile, append=args.append, stream=args.stream,
+                                           plan=run_plan)
         print(f"\n所有章节处理完成，共生成 {len(all_results)} 个段落视频")
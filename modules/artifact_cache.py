@@ -0,0 +1,234 @@
+"""
+内容寻址产物缓存模块
+按 提供方 + 模型/req_key + 生成参数（提示词/文本、尺寸、种子、音色、语速等）的哈希缓存图片和TTS音频，
+章节目录改名或移动后仍可复用已付费生成的产物
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from modules.config import get_config
+from modules.logger import get_logger
+
+DEFAULT_CACHE_ROOT = "cache/artifacts"
+DEFAULT_MAX_SIZE_GB = 20
+
+
+class ArtifactCache:
+    """
+    内容寻址的文件缓存
+
+    每个条目由数据文件 <key> 和元数据文件 <key>.json 组成，存放在 <root>/<key前两位>/ 下。
+    命中时把数据文件硬链接（跨文件系统时复制）到目标路径；元数据文件的修改时间
+    记录最近一次访问，超出容量时按最近最少使用淘汰。
+    总大小在首次写入时扫描一次，之后在内存中累加；只有累计值超出容量时才重新扫描整个缓存并淘汰
+    （其他进程写入的条目在下一次扫描时计入）。
+    """
+
+    def __init__(self, root: str = DEFAULT_CACHE_ROOT, max_bytes: int = DEFAULT_MAX_SIZE_GB * 1024 ** 3):
+        """
+        初始化缓存
+
+        Args:
+            root: 缓存根目录
+            max_bytes: 缓存容量上限（字节）
+        """
+        self.logger = get_logger(__name__)
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self._total: Optional[int] = None  # 缓存总大小（字节），None 表示尚未扫描
+
+    @staticmethod
+    def make_key(provider: str, model: str, params: Dict[str, Any]) -> str:
+        """
+        计算缓存键
+
+        Args:
+            provider: 提供方，如 volcengine / tencent_tts
+            model: 模型或 req_key
+            params: 影响生成结果的全部参数（提示词/文本、尺寸、种子、音色、语速等）
+
+        Returns:
+            sha256十六进制字符串
+        """
+        payload = json.dumps(
+            {"provider": provider, "model": model, "params": params},
+            ensure_ascii=False, sort_keys=True, separators=(",", ":")
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    def _meta_path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def contains(self, key: str) -> bool:
+        """检查条目是否存在（不计入命中统计）"""
+        return self._entry_path(key).exists()
+
+    def fetch(self, key: str, dest: str) -> bool:
+        """
+        命中时把缓存条目放到目标路径
+
+        Args:
+            key: 缓存键
+            dest: 目标文件路径
+
+        Returns:
+            是否命中
+        """
+        entry = self._entry_path(key)
+        if not entry.exists():
+            with self._lock:
+                self._stats["misses"] += 1
+            return False
+
+        dest_path = Path(dest)
+        dest_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = dest_path.with_name(f".{dest_path.name}.{uuid.uuid4().hex[:8]}.cache")
+        try:
+            try:
+                os.link(entry, temp_path)
+            except OSError:
+                shutil.copy2(entry, temp_path)
+            os.replace(temp_path, dest_path)
+        except FileNotFoundError:
+            # 条目在读取过程中被其他进程淘汰
+            temp_path.unlink(missing_ok=True)
+            with self._lock:
+                self._stats["misses"] += 1
+            return False
+
+        self._touch(key)
+        with self._lock:
+            self._stats["hits"] += 1
+        self.logger.info(f"缓存命中: {key[:12]} -> {dest}")
+        return True
+
+    def store(self, key: str, src: str, info: Optional[Dict[str, Any]] = None) -> None:
+        """
+        把新生成的产物写入缓存（复制一份，缓存条目与输出文件互不影响）
+
+        Args:
+            key: 缓存键
+            src: 产物文件路径
+            info: 写入元数据的附加信息（如提供方、提示词摘要）
+        """
+        entry = self._entry_path(key)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = entry.with_name(f".{key}.{uuid.uuid4().hex[:8]}.tmp")
+        shutil.copyfile(src, temp_path)
+        try:
+            replaced = entry.stat().st_size
+        except FileNotFoundError:
+            replaced = 0
+        os.replace(temp_path, entry)
+
+        meta = dict(info or {})
+        meta.update({"size": entry.stat().st_size, "stored_at": time.time()})
+        with open(self._meta_path(key), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+
+        with self._lock:
+            self._stats["stores"] += 1
+            if self._total is None:
+                self._total = sum(size for _, size, _ in self._entries())
+            else:
+                self._total += meta["size"] - replaced
+            over = self._total > self.max_bytes
+        if over:
+            self.evict()
+
+    def _touch(self, key: str) -> None:
+        try:
+            os.utime(self._meta_path(key))
+        except FileNotFoundError:
+            pass
+
+    def _entries(self) -> List[Tuple[float, int, str]]:
+        """返回 (最近访问时间, 大小, 键) 列表"""
+        entries = []
+        if not self.root.exists():
+            return entries
+        for meta in self.root.glob("??/*.json"):
+            key = meta.stem
+            entry = self._entry_path(key)
+            try:
+                entries.append((meta.stat().st_mtime, entry.stat().st_size, key))
+            except FileNotFoundError:
+                continue
+        return entries
+
+    def evict(self) -> int:
+        """
+        按最近最少使用淘汰条目，直到总大小不超过容量上限
+
+        Returns:
+            淘汰的条目数
+        """
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            self._entry_path(key).unlink(missing_ok=True)
+            self._meta_path(key).unlink(missing_ok=True)
+            total -= size
+            evicted += 1
+        with self._lock:
+            self._total = total
+            self._stats["evictions"] += evicted
+        if evicted:
+            self.logger.info(f"缓存淘汰 {evicted} 个条目，当前大小 {total / 1024 ** 2:.1f}MB")
+        return evicted
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        命中统计
+
+        Returns:
+            hits / misses / stores / evictions / hit_rate / entries / bytes
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        entries = self._entries()
+        stats["entries"] = len(entries)
+        stats["bytes"] = sum(size for _, size, _ in entries)
+        return stats
+
+
+_default_cache: Optional[ArtifactCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_artifact_cache() -> Optional[ArtifactCache]:
+    """
+    获取按 settings.yaml 中 cache 配置创建的全局缓存
+
+    Returns:
+        缓存实例；cache.enabled 为 false 时返回None
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            cache_config = get_config().get("cache", {}) or {}
+            if not cache_config.get("enabled", True):
+                return None
+            _default_cache = ArtifactCache(
+                root=cache_config.get("root", DEFAULT_CACHE_ROOT),
+                max_bytes=int(float(cache_config.get("max_size_gb", DEFAULT_MAX_SIZE_GB)) * 1024 ** 3)
+            )
+        return _default_cache
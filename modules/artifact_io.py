@@ -0,0 +1,308 @@
+"""
+产物原子写入与元数据文件模块
+所有产物（场景图片、TTS音频、字幕、每个ffmpeg输出）先写入同目录的临时文件，fsync 后原子改名到目标路径，
+崩溃或中断只会留下临时文件，不会留下写了一半的产物。
+
+提交时在产物旁写入 <文件名>.meta.json，记录大小、修改时间、sha256 和媒体时长。
+续跑时只比较元数据文件中的大小和修改时间（一次 stat），一致即视为完整并直接使用记录的时长，不再调用 ffprobe。
+没有元数据文件的旧产物按格式做一次结构检查（WAV data 块完整、MP4 有 moov、JPEG/PNG 结尾标记），
+通过后补写元数据文件，否则视为无效并重新生成。
+"""
+
+import hashlib
+import json
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, Optional, Union
+
+from modules.logger import get_logger
+from modules.media_info import get_media_duration, read_mp4_duration, read_wav_data_chunk
+
+SIDECAR_SUFFIX = ".meta.json"
+SIDECAR_VERSION = 1
+
+# 需要记录时长的媒体格式
+MEDIA_SUFFIXES = {".wav", ".mp4", ".m4a", ".mov", ".flac"}
+
+PathLike = Union[str, Path]
+
+logger = get_logger(__name__)
+
+# 提交前的检查（如工作进程的租约），抛出异常即放弃提交；见 commit_guard
+_commit_guard: Optional[Callable[[], None]] = None
+
+
+def sidecar_path(path: PathLike) -> Path:
+    """产物对应的元数据文件路径"""
+    path = Path(path)
+    return path.with_name(path.name + SIDECAR_SUFFIX)
+
+
+def temp_output_path(path: PathLike) -> Path:
+    """同目录下的隐藏临时文件路径，保留扩展名以便ffmpeg识别输出格式"""
+    path = Path(path)
+    return path.with_name(f".{path.stem}.{os.getpid()}_{uuid.uuid4().hex[:8]}.tmp{path.suffix}")
+
+
+def _fsync_file(path: Path) -> None:
+    with open(path, "rb") as f:
+        os.fsync(f.fileno())
+
+
+def _fsync_dir(path: Path) -> None:
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:  # Windows 上不能打开目录
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def describe(path: PathLike) -> Dict[str, Any]:
+    """
+    计算产物元数据
+
+    Args:
+        path: 产物路径
+
+    Returns:
+        {"version", "size", "mtime_ns", "sha256", "duration", "written_at"}，非媒体文件 duration 为None
+    """
+    path = Path(path)
+    st = path.stat()
+    duration = None
+    if path.suffix.lower() in MEDIA_SUFFIXES:
+        duration = get_media_duration(str(path)) or None
+    return {
+        "version": SIDECAR_VERSION,
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "sha256": _sha256(path),
+        "duration": duration,
+        "written_at": time.time(),
+    }
+
+
+def write_sidecar(path: PathLike, extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    为已完整写入的产物写元数据文件（同样先写临时文件再改名）
+
+    Args:
+        path: 产物路径
+        extra: 附加记录的字段（如生成该产物的请求键）
+
+    Returns:
+        元数据
+    """
+    meta = {**(extra or {}), **describe(path)}
+    target = sidecar_path(path)
+    temp_path = temp_output_path(target)
+    try:
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(temp_path, target)
+    finally:
+        temp_path.unlink(missing_ok=True)
+    return meta
+
+
+@contextmanager
+def commit_guard(check: Optional[Callable[[], None]]) -> Iterator[None]:
+    """
+    在此期间每次把产物改名到目标路径前先调用 check()，check 抛出异常时不提交（进程内全局生效）
+
+    工作进程用它在租约丢失后立即停止写章节目录：另一个进程可能已接管同一章节。
+
+    Args:
+        check: 检查函数，None 表示不检查
+    """
+    global _commit_guard
+    previous = _commit_guard
+    _commit_guard = check
+    try:
+        yield
+    finally:
+        _commit_guard = previous
+
+
+def check_commit_guard() -> None:
+    """执行当前的提交前检查（直接用 os.replace 发布产物的地方在改名前调用）"""
+    if _commit_guard is not None:
+        _commit_guard()
+
+
+def commit(temp_path: PathLike, path: PathLike, extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    提交临时文件：fsync 后原子改名到目标路径，再写元数据文件
+
+    Args:
+        temp_path: 已写完的临时文件
+        path: 目标路径
+        extra: 元数据文件中附加记录的字段
+
+    Returns:
+        元数据
+    """
+    temp_path, path = Path(temp_path), Path(path)
+    _fsync_file(temp_path)
+    check_commit_guard()
+    os.replace(temp_path, path)
+    _fsync_dir(path.parent)
+    try:
+        return write_sidecar(path, extra)
+    except OSError as e:
+        # 产物本身已完整落盘，缺少元数据文件时下次续跑会做结构检查后补写
+        logger.warning(f"写入元数据文件失败: {path}: {e}")
+        return {}
+
+
+def write_bytes(path: PathLike, data: bytes, extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """原子写入二进制产物并写元数据文件"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = temp_output_path(path)
+    try:
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        return commit(temp_path, path, extra)
+    finally:
+        temp_path.unlink(missing_ok=True)
+
+
+def write_text(path: PathLike, text: str, extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """原子写入文本产物（UTF-8）并写元数据文件"""
+    return write_bytes(path, text.encode("utf-8"), extra)
+
+
+def read_sidecar(path: PathLike) -> Optional[Dict[str, Any]]:
+    """读取元数据文件，不存在或损坏时返回None"""
+    try:
+        with open(sidecar_path(path), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    return meta if meta.get("version") == SIDECAR_VERSION else None
+
+
+def _image_complete(path: Path) -> bool:
+    """按文件内容（而不是扩展名）判断图片是否写完整"""
+    with open(path, "rb") as f:
+        head = f.read(12)
+        f.seek(max(0, path.stat().st_size - 32))
+        tail = f.read()
+    if head.startswith(b"\xff\xd8"):
+        return b"\xff\xd9" in tail
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return b"IEND" in tail[-12:]
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return int.from_bytes(head[4:8], "little") + 8 <= path.stat().st_size
+    return True
+
+
+def validate_file(path: PathLike) -> bool:
+    """
+    对没有元数据文件的产物做结构检查，识别写了一半的文件
+
+    Args:
+        path: 产物路径
+
+    Returns:
+        是否完整
+    """
+    path = Path(path)
+    try:
+        if path.stat().st_size == 0:
+            return False
+        suffix = path.suffix.lower()
+        if suffix == ".wav":
+            chunk = read_wav_data_chunk(str(path))
+            if chunk is None:
+                return False
+            _, declared, remaining = chunk
+            # 0 和 0xFFFFFFFF 是流式写出时的占位值
+            return remaining > 0 and (declared in (0, 0xFFFFFFFF) or remaining >= declared)
+        if suffix in (".mp4", ".m4a", ".mov"):
+            duration = read_mp4_duration(str(path))
+            return duration is not None and duration > 0
+        if suffix == ".flac":
+            with open(path, "rb") as f:
+                return f.read(4) == b"fLaC"
+        if suffix in (".jpg", ".jpeg", ".png", ".webp"):
+            return _image_complete(path)
+        return True
+    except OSError:
+        return False
+
+
+def verified_artifact(path: PathLike, adopt: bool = True) -> Optional[Dict[str, Any]]:
+    """
+    续跑检查：产物完整时返回其元数据，否则返回None
+
+    元数据文件与文件的大小、修改时间一致时直接信任；没有元数据文件（旧产物）或文件已被改动时
+    做一次结构检查，通过后补写元数据文件。
+
+    Args:
+        path: 产物路径
+        adopt: 是否为通过检查的旧产物补写元数据文件；为False时不写任何文件、不启动ffprobe，
+            返回的元数据只含大小和进程内解析出的时长
+
+    Returns:
+        元数据或None
+    """
+    path = Path(path)
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    meta = read_sidecar(path)
+    if meta and meta.get("size") == st.st_size and meta.get("mtime_ns") == st.st_mtime_ns:
+        return meta
+    if not validate_file(path):
+        logger.warning(f"产物不完整，需要重新生成: {path}")
+        return None
+    if not adopt:
+        duration = None
+        if path.suffix.lower() in MEDIA_SUFFIXES:
+            duration = get_media_duration(str(path), probe=False) or None
+        return {"version": SIDECAR_VERSION, "size": st.st_size, "mtime_ns": st.st_mtime_ns, "duration": duration}
+    try:
+        return write_sidecar(path)
+    except OSError as e:
+        logger.warning(f"写入元数据文件失败: {path}: {e}")
+        return describe(path)
+
+
+def artifact_duration(path: PathLike) -> float:
+    """
+    产物的媒体时长：优先使用元数据文件中记录的时长，没有时解析文件
+
+    Args:
+        path: 媒体文件路径
+
+    Returns:
+        时长（秒）；文件不存在或无法解析时返回0.0
+    """
+    meta = read_sidecar(path)
+    if meta and meta.get("duration"):
+        try:
+            st = Path(path).stat()
+        except OSError:
+            return 0.0
+        if meta.get("size") == st.st_size and meta.get("mtime_ns") == st.st_mtime_ns:
+            return float(meta["duration"])
+    return get_media_duration(str(path))
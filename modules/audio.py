@@ -7,6 +7,8 @@ from tencentcloud.common.profile.http_profile import HttpProfile
 from tencentcloud.tts.v20190823 import tts_client, models
 from modules.config import get_tencent_config
 from modules.logger import get_logger
+from modules.rate_limit import get_rate_limiter
+from modules.artifact_io import write_bytes
 from pathlib import Path
 
 class AudioGenerator:
@@ -30,6 +32,36 @@ class AudioGenerator:
             client_profile
         )
 
+    def build_params(self, text: str, language: str = "en") -> dict:
+        """
+        构建语音合成参数（不含SessionId），同样用作产物缓存键
+        
+        Args:
+            text: 要转换为语音的文本
+            language: 语言，en 或 zh
+            
+        Returns:
+            dict: TextToVoice 请求参数
+        """
+        # 根据语言选择不同的参数
+        if language == "zh":
+            primary_language = 1  # 中文
+            voice_type = self.tencent_config['voice_zh']   # 中文女声 (爱小璟)
+        else:
+            primary_language = 2  # 英文
+            voice_type = self.tencent_config['voice_en']   # 英文女声 (WeWinny)
+        
+        return {
+            "Text": text,
+            "ModelType": 1,           # 1: 标准音色
+            "Volume": 5,              # 音量大小
+            "Speed": 0.8,               # 语速
+            "SampleRate": 16000,      # 采样率
+            "Codec": "wav",           # 音频格式
+            "PrimaryLanguage": primary_language,
+            "VoiceType": voice_type,
+        }
+
     def generate(self, text: str, type: str = "word", language: str = "en", output_path: str = None) -> str:
         """
         使用腾讯云API生成语音
@@ -48,30 +80,14 @@ class AudioGenerator:
             # 创建请求对象
             req = models.TextToVoiceRequest()
             
-            # 根据语言选择不同的参数
-            if language == "zh":
-                primary_language = 1  # 中文
-                voice_type = self.tencent_config['voice_zh']   # 中文女声 (爱小璟)
-            else:
-                primary_language = 2  # 英文
-                voice_type = self.tencent_config['voice_en']   # 英文女声 (WeWinny)
-            
-            params = {
-                "Text": text,
-                "SessionId": f"session-{int(time.time())}",
-                "ModelType": 1,           # 1: 标准音色
-                "Volume": 5,              # 音量大小
-                "Speed": 0.8,               # 语速
-                "SampleRate": 16000,      # 采样率
-                "Codec": "wav",           # 音频格式
-                "PrimaryLanguage": primary_language,
-                "VoiceType": voice_type,
-            }
+            params = self.build_params(text, language)
+            params["SessionId"] = f"session-{int(time.time())}"
             req.from_json_string(json.dumps(params))
             
-            # 发送请求
+            # 发送请求（受 tencent_tts 限流器约束，被限流时自动降速）
             self.logger.debug("发送语音合成请求到腾讯云")
-            resp = self.client.TextToVoice(req)
+            with get_rate_limiter("tencent_tts").slot():
+                resp = self.client.TextToVoice(req)
             
             # 确定输出路径
             if not output_path:
@@ -83,10 +99,9 @@ class AudioGenerator:
             # 确保输出目录存在
             output_path.parent.mkdir(parents=True, exist_ok=True)
             
-            # 保存音频文件
+            # 保存音频文件（先写临时文件再改名，中断时不会留下截断的wav）
             decoded_audio_data = base64.b64decode(resp.Audio)
-            with open(str(output_path), 'wb') as f:
-                f.write(decoded_audio_data)
+            write_bytes(output_path, decoded_audio_data)
             
             self.logger.info(f"语音文件已保存: {output_path}")
             return str(output_path)
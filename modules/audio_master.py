@@ -0,0 +1,197 @@
+"""
+音频母带处理模块
+把旁白时间线和循环背景音乐在一次纯音频处理中完成闪避（sidechaincompress）、混音和响度标准化（loudnorm），
+只编码一次最终音轨，随后与流复制的视频封装，不再对音频做任何处理。
+
+旁白时间线由段落 audio.wav 按各段落视频的真实时长补齐/截断后拼接，以无损 FLAC 保存（chapter_narration.flac），
+完整电影直接拼接各章节的旁白时间线，避免把已混入背景音乐的章节音轨再混一次。
+背景音乐用 -stream_loop 在解码层循环，不再用 aloop 把整段音乐缓存在内存中。
+
+可在 configs/settings.yaml 中覆盖默认参数：
+
+render:
+  mastering:
+    bgm_path: configs/bgm.mp3
+    bgm_volume: 0.3
+    loudness: -16
+"""
+
+from dataclasses import dataclass, fields, replace
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+from modules.config import get_config
+
+
+@dataclass(frozen=True)
+class MasteringSettings:
+    """母带处理参数"""
+    bgm_path: Optional[str] = "configs/bgm.mp3"  # 背景音乐，文件不存在时只做响度标准化
+    bgm_volume: float = 0.3        # 背景音乐基础音量
+    duck_threshold: float = 0.05   # 旁白超过该电平时压低背景音乐
+    duck_ratio: float = 8.0
+    duck_attack: float = 20.0      # 毫秒
+    duck_release: float = 400.0    # 毫秒
+    loudness: float = -16.0        # 目标综合响度（LUFS）
+    true_peak: float = -1.5        # 真峰值上限（dBTP）
+    loudness_range: float = 11.0   # 响度范围（LU）
+    sample_rate: int = 48000
+
+    @property
+    def bgm(self) -> Optional[Path]:
+        """存在的背景音乐文件，未配置或不存在时为None"""
+        if not self.bgm_path:
+            return None
+        path = Path(self.bgm_path)
+        return path if path.exists() else None
+
+    @property
+    def audio_format(self) -> str:
+        """统一的采样格式滤镜"""
+        return f"aformat=sample_rates={self.sample_rate}:channel_layouts=stereo"
+
+
+def get_mastering_settings() -> MasteringSettings:
+    """
+    读取 settings.yaml 中 render.mastering 覆盖的母带处理参数
+
+    Returns:
+        母带处理参数
+
+    Raises:
+        ValueError: 包含未知字段
+    """
+    try:
+        overrides = (get_config().get("render", {}) or {}).get("mastering", {}) or {}
+    except FileNotFoundError:
+        overrides = {}
+    unknown = set(overrides) - {f.name for f in fields(MasteringSettings)}
+    if unknown:
+        raise ValueError(f"render.mastering 包含未知字段: {sorted(unknown)}")
+    return replace(MasteringSettings(), **overrides)
+
+
+def build_narration_cmd(audio_paths: Sequence[str], durations: Sequence[float], output_path: str,
+                        settings: MasteringSettings) -> List[str]:
+    """
+    拼接旁白时间线的ffmpeg命令：每段音频补齐/截断到对应视频的时长，输出无损FLAC
+
+    Args:
+        audio_paths: 段落音频路径（按时间顺序）
+        durations: 对应段落视频的时长（秒）
+        output_path: 输出路径（.flac）
+        settings: 母带处理参数
+
+    Returns:
+        ffmpeg命令
+    """
+    cmd = ['ffmpeg', '-y']
+    for path in audio_paths:
+        cmd += ['-i', str(path)]
+    chains = [
+        f"[{i}:a]{settings.audio_format},apad,atrim=end={duration:.3f},asetpts=PTS-STARTPTS[n{i}]"
+        for i, duration in enumerate(durations)
+    ]
+    labels = "".join(f"[n{i}]" for i in range(len(durations)))
+    filter_complex = ";".join(chains) + f";{labels}concat=n={len(durations)}:v=0:a=1[narration]"
+    cmd += ['-filter_complex', filter_complex, '-map', '[narration]', '-c:a', 'flac', str(output_path)]
+    return cmd
+
+
+def build_master_filter(settings: MasteringSettings, with_bgm: bool) -> str:
+    """
+    母带处理滤镜：旁白为输入0，背景音乐为输入1（可选）
+
+    Args:
+        settings: 母带处理参数
+        with_bgm: 是否混入背景音乐
+
+    Returns:
+        filter_complex 字符串，输出标签为 [master]
+    """
+    loudnorm = (
+        f"loudnorm=I={settings.loudness}:TP={settings.true_peak}:LRA={settings.loudness_range},"
+        f"aresample={settings.sample_rate}"
+    )
+    if not with_bgm:
+        return f"[0:a]{settings.audio_format},{loudnorm}[master]"
+    return (
+        f"[0:a]{settings.audio_format},asplit=2[voice][key];"
+        f"[1:a]{settings.audio_format},volume={settings.bgm_volume}[bed];"
+        f"[bed][key]sidechaincompress=threshold={settings.duck_threshold}:ratio={settings.duck_ratio}:"
+        f"attack={settings.duck_attack}:release={settings.duck_release}[ducked];"
+        f"[voice][ducked]amix=inputs=2:duration=first:dropout_transition=0,{loudnorm}[master]"
+    )
+
+
+def build_master_cmd(narration_input: Sequence[str], output_path: str, settings: MasteringSettings,
+                     audio_bitrate: str, bgm_offset: float = 0.0) -> List[str]:
+    """
+    母带处理的ffmpeg命令，只输出一条AAC音轨
+
+    Args:
+        narration_input: 旁白输入参数，如 ['-i', 'chapter_narration.flac'] 或 concat 列表参数
+        output_path: 输出音轨路径（.m4a）
+        settings: 母带处理参数
+        audio_bitrate: AAC码率
+        bgm_offset: 背景音乐起始位置（秒），分段处理时保证背景音乐连续
+
+    Returns:
+        ffmpeg命令
+    """
+    bgm = settings.bgm
+    cmd = ['ffmpeg', '-y', *narration_input]
+    if bgm is not None:
+        cmd += ['-stream_loop', '-1', '-ss', f"{bgm_offset:.3f}", '-i', str(bgm.resolve())]
+    cmd += [
+        '-filter_complex', build_master_filter(settings, bgm is not None),
+        '-map', '[master]',
+        '-vn',
+        '-c:a', 'aac',
+        '-b:a', audio_bitrate,
+        str(output_path)
+    ]
+    return cmd
+
+
+def build_mux_cmd(video_input: Sequence[str], audio_path: str, output_path: str) -> List[str]:
+    """
+    最终封装命令：视频和母带音轨都流复制
+
+    Args:
+        video_input: 视频输入参数，如 ['-i', 'video.mp4'] 或 concat 列表参数
+        audio_path: 母带音轨路径
+        output_path: 输出路径
+
+    Returns:
+        ffmpeg命令
+    """
+    return [
+        'ffmpeg', '-y', *video_input,
+        '-i', str(audio_path),
+        '-map', '0:v',
+        '-map', '1:a',
+        '-c', 'copy',
+        '-shortest',
+        str(output_path)
+    ]
+
+
+def settings_signature(settings: MasteringSettings) -> Dict[str, Any]:
+    """
+    影响母带结果的参数（含背景音乐文件签名），用于增量拼接清单判断是否需要重做
+
+    Args:
+        settings: 母带处理参数
+
+    Returns:
+        可JSON序列化的字典
+    """
+    signature = {f.name: getattr(settings, f.name) for f in fields(MasteringSettings)}
+    bgm = settings.bgm
+    if bgm is not None:
+        st = bgm.stat()
+        signature["bgm"] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    else:
+        signature["bgm"] = None
+    return signature
@@ -0,0 +1,401 @@
+"""
+全局人物库模块
+从已处理章节的 人物特征库 按姓名合并出全书共用的人物档案，每次外貌或服装变化记为新版本。
+
+章节请求只附带本章提到的已登记人物，并要求模型：
+- 人物特征库 中已登记人物只写 {"引用": 姓名}，有变化时附 "变化"（只含改变的字段）
+- 人物状态 中已登记人物省略 详细外貌
+- 图片提示词等描述中用 【人物:姓名】 代替五官和发型描述
+
+收到结果后 expand_chapter 按人物库还原完整内容，下游（loop.py、图片提示词生成）读到的JSON格式不变。
+
+章节并发处理，完成顺序与章节顺序无关：
+- 每章请求附带的档案快照按章节记录在人物库中（与该章的请求键一起），结果按同一份快照还原；
+  章节输入不变时重新请求使用同一份快照，请求内容不变，可以直接命中LLM缓存
+- 历史按章节号排序，每个人物的当前档案由历史依次合并得到；较早的章节晚完成时插入到对应位置，
+  不会用旧外貌覆盖后面章节的变化
+"""
+
+import copy
+import json
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from modules.artifact_io import write_text
+from modules.logger import get_logger
+
+REGISTRY_VERSION = 1
+PROFILE_KEY = "人物特征库"
+REFERENCE_KEY = "引用"
+DELTA_KEY = "变化"
+PLACEHOLDER_PATTERN = re.compile(r"【人物[:：]([^】]+)】")
+
+# 外貌描述中依次取的五官
+FACE_FEATURES = ("眼睛", "眉毛", "鼻子", "嘴巴")
+
+REFERENCE_INSTRUCTIONS = (
+    "以下人物已在全局人物库中登记，档案如下（JSON）。输出时请遵守：\n"
+    "1. 人物特征库 中这些人物只写 {\"引用\": \"姓名\"}；本章外貌或服装有变化时写 "
+    "{\"引用\": \"姓名\", \"变化\": {只包含改变的字段}}。新出现的人物照常完整描述。\n"
+    "2. 人物状态 中这些人物省略 详细外貌 字段，其余字段照常输出。\n"
+    "3. 图片提示词、场景描述中这些人物的年龄、脸型、肤色、五官和发型描述统一写成 【人物:姓名】，"
+    "服装、动作、表情、位置照常描述。\n"
+)
+
+logger = get_logger(__name__)
+
+
+def deep_merge(base: Dict[str, Any], delta: Dict[str, Any]) -> Dict[str, Any]:
+    """把 delta 递归合并进 base 的副本"""
+    merged = copy.deepcopy(base)
+    for key, value in delta.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = deep_merge(merged[key], value)
+        else:
+            merged[key] = copy.deepcopy(value)
+    return merged
+
+
+def diff(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    """new 相对 old 改变或新增的字段（递归）"""
+    changes = {}
+    for key, value in new.items():
+        if isinstance(value, dict) and isinstance(old.get(key), dict):
+            nested = diff(old[key], value)
+            if nested:
+                changes[key] = nested
+        elif old.get(key) != value:
+            changes[key] = copy.deepcopy(value)
+    return changes
+
+
+def reference_context(profiles: Dict[str, Dict[str, Any]]) -> str:
+    """
+    附在章节请求中的人物库上下文：引用规则 + 给定的人物档案
+
+    Args:
+        profiles: {姓名: 档案}
+
+    Returns:
+        文本；没有人物时为空字符串
+    """
+    if not profiles:
+        return ""
+    return REFERENCE_INSTRUCTIONS + json.dumps(profiles, ensure_ascii=False, separators=(",", ":"))
+
+
+def _history_order(item: Dict[str, Any]):
+    chapter = item.get("chapter")
+    return (chapter is not None, chapter if chapter is not None else 0, item.get("version", 0))
+
+
+def appearance(profile: Dict[str, Any]) -> str:
+    """
+    由人物档案生成紧凑的外貌描述（年龄、脸型、肤色、性别、五官、发型），用于展开 【人物:姓名】
+
+    Args:
+        profile: 人物特征库 中的单个人物
+
+    Returns:
+        描述文本
+    """
+    basic = profile.get("基本信息") or {}
+    face = profile.get("面部特征") or {}
+    parts = ["".join(str(v) for v in (basic.get("年龄"), face.get("脸型"), face.get("肤色"), basic.get("性别")) if v)]
+    for feature in FACE_FEATURES:
+        value = face.get(feature)
+        if isinstance(value, dict):
+            parts.append("".join(str(v) for v in value.values() if v))
+    hair = profile.get("头发特征") or {}
+    if isinstance(hair, dict):
+        parts.append("".join(str(v) for v in hair.values() if v))
+    return "，".join(p for p in parts if p)
+
+
+class CharacterRegistry:
+    """
+    全书人物库，保存在一个JSON文件中
+
+    结构: {"version", "updated_at", "characters": {姓名: {"version", "profile", "first_chapter",
+    "updated_chapter", "history": [{"version", "chapter", "changes"}]}},
+    "contexts": {章节: {"key": 请求键, "profiles": 请求时附带的档案}}}
+
+    history 按章节号排序，第一项的 changes 是完整档案，之后每项是相对前一项的变化；profile 是依次合并的结果。
+    """
+
+    def __init__(self, path: str):
+        """
+        初始化人物库（文件存在时读取）
+
+        Args:
+            path: 人物库文件路径
+        """
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.characters: Dict[str, Dict[str, Any]] = {}
+        self.contexts: Dict[str, Dict[str, Any]] = {}
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == REGISTRY_VERSION:
+                self.characters = data.get("characters", {})
+                self.contexts = data.get("contexts", {})
+        for entry in self.characters.values():
+            # 旧文件的第一项历史没有记录完整档案：以当前档案代替，依次合并后结果不变
+            if entry["history"] and entry["history"][0].get("changes") is None:
+                entry["history"][0]["changes"] = copy.deepcopy(entry["profile"])
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.characters
+
+    def profile(self, name: str) -> Optional[Dict[str, Any]]:
+        """人物当前版本的档案"""
+        entry = self.characters.get(name)
+        return copy.deepcopy(entry["profile"]) if entry else None
+
+    def version(self, name: str) -> int:
+        """人物当前版本号，未登记时为0"""
+        return self.characters.get(name, {}).get("version", 0)
+
+    def merge(self, chapter: Optional[int], profiles: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """
+        按姓名合并一章的 人物特征库，按章节号插入历史（与各章完成的先后无关）
+
+        同一章重新合并时替换该章原来的记录；插入较早的章节后，之后各章的变化按完整档案重新计算，
+        当前档案仍是最后一章的外貌。没有章节号的合并视为最新。
+
+        Args:
+            chapter: 章节编号
+            profiles: {姓名: 完整档案}
+
+        Returns:
+            {姓名: 该章相对前一章变化的字段}，只包含新登记或有变化的人物
+        """
+        changed = {}
+        with self._lock:
+            for name, profile in profiles.items():
+                if not isinstance(profile, dict) or REFERENCE_KEY in profile:
+                    continue
+                entry = self.characters.get(name)
+                if entry is None:
+                    self.characters[name] = {"version": 1, "profile": copy.deepcopy(profile),
+                                             "first_chapter": chapter, "updated_chapter": chapter,
+                                             "history": [{"version": 1, "chapter": chapter,
+                                                          "changes": copy.deepcopy(profile)}]}
+                    changed[name] = copy.deepcopy(profile)
+                    continue
+                changes = self._insert(entry, chapter, profile)
+                if changes:
+                    changed[name] = changes
+        return changed
+
+    @staticmethod
+    def _insert(entry: Dict[str, Any], chapter: Optional[int], profile: Dict[str, Any]) -> Dict[str, Any]:
+        """把一章的档案插入人物的历史，返回该章相对前一章的变化（没有改变历史时为空）"""
+        # 还原每项历史对应的完整档案
+        snapshots = []
+        full: Dict[str, Any] = {}
+        for item in sorted(entry["history"], key=_history_order):
+            full = deep_merge(full, item["changes"] or {})
+            if chapter is None or item["chapter"] != chapter:
+                snapshots.append((item, full))
+        new_item = {"version": entry["version"] + 1, "chapter": chapter}
+        position = len(snapshots) if chapter is None else \
+            sum(1 for item, _ in snapshots if _history_order(item) < _history_order(new_item))
+        before = snapshots[position - 1][1] if position else {}
+        snapshots.insert(position, (new_item, deep_merge(before, profile)))
+
+        # 重新计算相邻两项之间的变化，没有变化的项省略
+        history = []
+        previous: Dict[str, Any] = {}
+        for item, full in snapshots:
+            changes = diff(previous, full)
+            if changes or not history:
+                history.append({"version": item["version"], "chapter": item["chapter"], "changes": changes})
+            previous = full
+        old = [(h["chapter"], h["changes"]) for h in entry["history"]]
+        if [(h["chapter"], h["changes"]) for h in history] == old:
+            return {}
+        entry["version"] += 1
+        entry["history"] = history
+        entry["profile"] = copy.deepcopy(previous)
+        chapters = [h["chapter"] for h in history if h["chapter"] is not None]
+        entry["first_chapter"] = min(chapters) if chapters else None
+        entry["updated_chapter"] = max(chapters) if chapters else None
+        return next((h["changes"] for h in history if h["version"] == new_item["version"]), {})
+
+    def mentioned(self, text: str) -> List[str]:
+        """文本中出现的已登记人物（按登记顺序）"""
+        return [name for name in self.characters if name in text]
+
+    def snapshot(self, names: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """这些人物当前档案的副本（未登记的忽略）"""
+        with self._lock:
+            return {name: copy.deepcopy(self.characters[name]["profile"])
+                    for name in names if name in self.characters}
+
+    def context(self, names: Iterable[str]) -> str:
+        """
+        附在章节请求中的人物库上下文：引用规则 + 这些人物的当前档案
+
+        Args:
+            names: 人物姓名
+
+        Returns:
+            文本；没有已登记人物时为空字符串
+        """
+        return reference_context(self.snapshot(names))
+
+    def chapter_profiles(self, chapter: str, key: str, names: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        一章请求附带的档案快照：该章以相同请求键请求过时沿用当时记录的快照，否则取当前档案并记录
+
+        请求上下文与结果还原都使用这份快照，不受其他章节之后更新人物库的影响；
+        章节输入不变时请求内容也不变，删除结果后重新生成可以直接命中LLM缓存。
+        记录随下一次 save() 写入文件。
+
+        Args:
+            chapter: 章节标识（如章节文件名）
+            key: 该章不含人物库上下文的请求键
+            names: 本章提到的人物
+
+        Returns:
+            {姓名: 档案}
+        """
+        with self._lock:
+            recorded = self.contexts.get(chapter)
+            if recorded and recorded.get("key") == key:
+                return copy.deepcopy(recorded["profiles"])
+        profiles = self.snapshot(names)
+        with self._lock:
+            self.contexts[chapter] = {"key": key, "profiles": copy.deepcopy(profiles)}
+        return profiles
+
+    def expand_text(self, text: str, profiles: Optional[Dict[str, Dict[str, Any]]] = None) -> str:
+        """把 【人物:姓名】 展开为外貌描述，优先使用本章档案"""
+        def replace(match):
+            name = match.group(1).strip()
+            profile = (profiles or {}).get(name) or self.profile(name)
+            return appearance(profile) if profile else match.group(0)
+
+        return PLACEHOLDER_PATTERN.sub(replace, text)
+
+    def compact_chapter(self, data: Dict[str, Any], base: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """
+        压缩作为请求输入的章节JSON：已登记人物的档案换成引用（与人物库不同时附 "变化"），
+        删去 人物状态 中已登记人物的 详细外貌
+
+        Args:
+            data: 完整的章节JSON
+            base: 请求附带的档案快照（见 chapter_profiles）；给出时只压缩其中的人物，None 时使用人物库当前档案
+
+        Returns:
+            压缩后的章节JSON（新对象）
+        """
+        if base is None:
+            base = self.snapshot(self.characters)
+        data = copy.deepcopy(data)
+        profiles = data.get(PROFILE_KEY)
+        if isinstance(profiles, dict):
+            for name, profile in list(profiles.items()):
+                if name in base and isinstance(profile, dict):
+                    changes = diff(base[name], profile)
+                    profiles[name] = {REFERENCE_KEY: name, **({DELTA_KEY: changes} if changes else {})}
+
+        def walk(node):
+            if isinstance(node, dict):
+                name = node.get("人物")
+                if isinstance(name, str) and name in base:
+                    node.pop("详细外貌", None)
+                return {k: walk(v) for k, v in node.items()}
+            if isinstance(node, list):
+                return [walk(v) for v in node]
+            return node
+
+        return walk(data)
+
+    def expand_chapter(self, data: Dict[str, Any],
+                       profiles: Optional[Dict[str, Dict[str, Any]]] = None,
+                       base: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """
+        还原引用：人物特征库 中的 {"引用"} 换成完整档案（合并 "变化"），补回 人物状态 的 详细外貌，
+        展开所有字符串中的 【人物:姓名】
+
+        Args:
+            data: 模型返回的章节JSON（或其中的单个段落）
+            profiles: 优先使用的人物档案（如输入章节的 人物特征库），其次为结果自带的档案
+            base: 请求附带的档案快照（见 chapter_profiles），引用按它还原；不在其中的人物才使用人物库当前档案
+
+        Returns:
+            完整的章节JSON（新对象）
+        """
+        base = base or {}
+
+        def registered(name):
+            return copy.deepcopy(base[name]) if name in base else self.profile(name)
+
+        data = copy.deepcopy(data)
+        own = data.get(PROFILE_KEY) if isinstance(data.get(PROFILE_KEY), dict) else {}
+        if own:
+            for name, value in list(own.items()):
+                if isinstance(value, dict) and REFERENCE_KEY in value:
+                    referenced = registered(value[REFERENCE_KEY]) or registered(name)
+                    if referenced is None:
+                        logger.warning(f"引用了未登记的人物: {name}")
+                        continue
+                    own[name] = deep_merge(referenced, value.get(DELTA_KEY) or {})
+        profiles = {**base, **own, **(profiles or {})}
+
+        def walk(node):
+            if isinstance(node, dict):
+                name = node.get("人物")
+                if isinstance(name, str) and "详细外貌" not in node and ("表情" in node or "动作" in node):
+                    profile = profiles.get(name) or self.profile(name)
+                    if profile:
+                        node["详细外貌"] = appearance(profile)
+                return {k: walk(v) for k, v in node.items()}
+            if isinstance(node, list):
+                return [walk(v) for v in node]
+            if isinstance(node, str) and "【人物" in node:
+                return self.expand_text(node, profiles)
+            return node
+
+        return walk(data)
+
+    def save(self) -> None:
+        """原子写入人物库文件"""
+        with self._lock:
+            data = {"version": REGISTRY_VERSION, "updated_at": time.time(), "characters": self.characters,
+                    "contexts": self.contexts}
+            text = json.dumps(data, ensure_ascii=False, indent=2)
+        write_text(self.path, text)
+
+
+def build_registry(path: str, chapter_files: Iterable[str]) -> CharacterRegistry:
+    """
+    按章节顺序从已处理的章节JSON重建人物库
+
+    Args:
+        path: 人物库文件路径
+        chapter_files: chapter_*_processed.json 路径（按章节顺序）
+
+    Returns:
+        人物库（已保存）
+    """
+    registry = CharacterRegistry(path)
+    registry.characters = {}
+    for chapter_file in chapter_files:
+        with open(chapter_file, "r", encoding="utf-8") as f:
+            try:
+                data = json.load(f)
+            except json.JSONDecodeError:
+                logger.warning(f"跳过无法解析的章节: {chapter_file}")
+                continue
+        match = re.search(r"(\d+)", Path(chapter_file).name)
+        registry.merge(int(match.group(1)) if match else None, data.get(PROFILE_KEY) or {})
+    registry.save()
+    logger.info(f"人物库已重建: {len(registry.characters)} 个人物 -> {path}")
+    return registry
@@ -0,0 +1,182 @@
+"""
+章节分窗模块
+估算输入 token 数，把超出上下文预算的章节按 章节标题 > 段落 > 句子 的边界切成若干窗口，
+各窗口可并行请求；返回的 场景拆解 按窗口顺序确定性合并，重新编排 序号 和 场景编号。
+"""
+
+import copy
+import re
+from typing import Any, Dict, List, Optional
+
+
+# token 估算：中日韩字符按每字1个token，其他字符按每4个字符1个token（偏保守）
+CJK_TOKENS_PER_CHAR = 1.0
+OTHER_CHARS_PER_TOKEN = 4.0
+
+# 章节标题顶格书写（正文段落以全角空格缩进），且不会太长
+CHAPTER_HEADING = re.compile(r"^第[0-9零一二三四五六七八九十百千两]+[章回节][^\n]{0,40}$", re.MULTILINE)
+SENTENCE_END = re.compile(r"(?<=[。！？!?…」”])")
+CJK_CHAR = re.compile(r"[　-〿㐀-䶿一-鿿＀-￯]")
+
+PARAGRAPHS_KEY = "场景拆解"
+PROFILE_KEY = "人物特征库"
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    估算文本的 token 数
+
+    Args:
+        text: 文本
+
+    Returns:
+        估算的 token 数
+    """
+    return int(_tokens(text)) + 1
+
+
+def _tokens(text: str) -> float:
+    cjk = len(CJK_CHAR.findall(text))
+    return cjk * CJK_TOKENS_PER_CHAR + (len(text) - cjk) / OTHER_CHARS_PER_TOKEN
+
+
+def input_budget(context_tokens: int, max_output_tokens: int, fixed_text: str = "",
+                 target_tokens: Optional[int] = None) -> int:
+    """
+    单个窗口可用的输入 token 预算
+
+    Args:
+        context_tokens: 模型上下文窗口大小
+        max_output_tokens: 为输出预留的 token 数
+        fixed_text: 每个窗口都要附带的文本（系统提示词、人物库上下文等）
+        target_tokens: 期望的窗口大小上限（控制单次请求耗时），None 表示只受上下文限制
+
+    Returns:
+        token 数（至少为1）
+    """
+    budget = context_tokens - max_output_tokens - estimate_tokens(fixed_text)
+    if target_tokens is not None:
+        budget = min(budget, target_tokens)
+    return max(1, budget)
+
+
+def _split_sections(text: str) -> List[str]:
+    """按章节标题切分，标题归属其后的正文"""
+    starts = [m.start() for m in CHAPTER_HEADING.finditer(text)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    return [text[a:b] for a, b in zip(starts, starts[1:] + [len(text)]) if text[a:b].strip()]
+
+
+def _split_paragraphs(text: str) -> List[str]:
+    return [line for line in text.splitlines(keepends=True) if line.strip()]
+
+
+def _split_sentences(text: str) -> List[str]:
+    return [s for s in SENTENCE_END.split(text) if s]
+
+
+def _hard_split(text: str, max_tokens: int) -> List[str]:
+    """没有任何边界可用时按估算长度切开"""
+    pieces, start, used = [], 0, 0.0
+    for i, char in enumerate(text):
+        cost = _tokens(char)
+        if i > start and used + cost > max_tokens:
+            pieces.append(text[start:i])
+            start, used = i, 0.0
+        used += cost
+    return pieces + [text[start:]]
+
+
+def _pack(units: List[str], max_tokens: int, splitters) -> List[str]:
+    """贪心地把相邻单元装入窗口；单个单元超出预算时用下一级边界继续切分"""
+    windows: List[str] = []
+    current: List[str] = []
+    used = 0.0
+    for unit in units:
+        cost = _tokens(unit)
+        if cost > max_tokens:
+            if current:
+                windows.append("".join(current))
+                current, used = [], 0.0
+            if splitters:
+                windows.extend(_pack(splitters[0](unit), max_tokens, splitters[1:]))
+            else:
+                windows.extend(_hard_split(unit, max_tokens))
+            continue
+        if current and used + cost > max_tokens:
+            windows.append("".join(current))
+            current, used = [], 0.0
+        current.append(unit)
+        used += cost
+    if current:
+        windows.append("".join(current))
+    return windows
+
+
+def chunk_text(text: str, max_tokens: int) -> List[str]:
+    """
+    把文本切成不超过 max_tokens 的窗口，优先在章节标题处切分，其次段落、句子
+
+    Args:
+        text: 章节正文
+        max_tokens: 单个窗口的 token 预算
+
+    Returns:
+        窗口列表（按原文顺序，拼接后等于原文去掉空行）；不超预算时原样返回单个窗口
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+    return _pack(_split_sections(text), max_tokens, [_split_paragraphs, _split_sentences])
+
+
+def renumber_paragraph(paragraph: Dict[str, Any], number: int) -> Dict[str, Any]:
+    """
+    给段落重新编号：序号 改为 number，其 场景列表 的 场景编号 改为 <number>-<k>
+
+    Args:
+        paragraph: 场景拆解 中的一个段落
+        number: 新序号
+
+    Returns:
+        新段落对象
+    """
+    paragraph = copy.deepcopy(paragraph)
+    paragraph["序号"] = number
+    for k, scene in enumerate(paragraph.get("场景列表") or [], 1):
+        if isinstance(scene, dict):
+            scene["场景编号"] = f"{number}-{k}"
+    return paragraph
+
+
+def merge_breakdowns(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    按窗口顺序合并各窗口的拆解结果
+
+    章节信息 取第一个窗口并更新段落数量；人物特征库 按姓名合并，先出现的档案为准；
+    场景拆解 依次拼接并从1重新编号。
+
+    Args:
+        results: 各窗口返回的章节JSON（按窗口顺序）
+
+    Returns:
+        合并后的章节JSON
+    """
+    if len(results) == 1:
+        return copy.deepcopy(results[0])
+    merged: Dict[str, Any] = {}
+    profiles: Dict[str, Any] = {}
+    paragraphs: List[Dict[str, Any]] = []
+    for result in results:
+        for key, value in result.items():
+            if key not in (PROFILE_KEY, PARAGRAPHS_KEY) and key not in merged:
+                merged[key] = copy.deepcopy(value)
+        for name, profile in (result.get(PROFILE_KEY) or {}).items():
+            profiles.setdefault(name, copy.deepcopy(profile))
+        for paragraph in result.get(PARAGRAPHS_KEY) or []:
+            paragraphs.append(renumber_paragraph(paragraph, len(paragraphs) + 1))
+    if isinstance(merged.get("章节信息"), dict):
+        merged["章节信息"]["段落数量"] = f"{len(paragraphs)}个"
+    merged[PROFILE_KEY] = profiles
+    merged[PARAGRAPHS_KEY] = paragraphs
+    return merged
@@ -131,6 +131,17 @@ def get_tencent_config() -> Dict[str, Any]:
     return config.get('tencent_cloud', {})
 
 
+def get_scheduler_config() -> Dict[str, Any]:
+    """
+    获取章节任务图调度配置（network_workers / cpu_workers）
+    
+    Returns:
+        调度配置字典
+    """
+    config = get_config()
+    return config.get('scheduler', {}) or {}
+
+
 def update_config(key_path: str, value: Any, config_path: str = None) -> bool:
     """
     更新配置值（仅内存中，不写入文件）
@@ -0,0 +1,213 @@
+"""
+HLS 分段输出模块
+每个段落视频流复制切成 fMP4 分段（init.mp4 + seg_*.m4s + index.m3u8），
+章节播放列表和整本小说播放列表按顺序引用已就绪的段落，段落完成一个就追加一个，
+观众无需等待章节视频和完整电影写完即可开始观看。
+
+播放列表只包含从头开始连续就绪的段落（中间缺一段则停在缺口前），
+段落之间以 EXT-X-DISCONTINUITY 分隔并各自声明 EXT-X-MAP；
+章节全部段落就绪后写入 EXT-X-ENDLIST，小说播放列表在遇到未完成的章节处停止。
+播放列表先写临时文件再替换，播放器不会读到写了一半的文件。
+重写播放列表时对其旁边的 .<文件名>.lock 加 flock（Linux 的 NFS 客户端会转成 NFS 锁），
+多个工作进程同时发布时较慢的一个不会用旧快照覆盖较新的播放列表。
+"""
+
+import math
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from urllib.parse import quote, unquote
+from typing import Any, Dict, List, Sequence
+
+from modules.artifact_io import check_commit_guard
+
+DEFAULT_SEGMENT_DURATION = 6
+PLAYLIST_NAME = "index.m3u8"
+INIT_NAME = "init.mp4"
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+_playlist_lock = threading.Lock()
+
+
+@contextmanager
+def _locked(playlist_path: Path):
+    """读快照到替换完成期间独占播放列表：进程内用线程锁，跨进程用锁文件上的 flock"""
+    with _playlist_lock:
+        if fcntl is None:
+            yield
+            return
+        playlist_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(playlist_path.with_name(f".{playlist_path.name}.lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def build_segment_cmd(video_path: str, stream_dir: str, segment_duration: int = DEFAULT_SEGMENT_DURATION) -> List[str]:
+    """
+    把段落视频流复制切成fMP4分段的ffmpeg命令
+
+    Args:
+        video_path: 段落视频路径
+        stream_dir: 分段输出目录
+        segment_duration: 目标分段时长（秒），实际在关键帧处切分
+
+    Returns:
+        ffmpeg命令
+    """
+    stream_dir = Path(stream_dir)
+    return [
+        'ffmpeg', '-y',
+        '-i', str(video_path),
+        '-c', 'copy',
+        '-f', 'hls',
+        '-hls_time', str(segment_duration),
+        '-hls_playlist_type', 'vod',
+        '-hls_segment_type', 'fmp4',
+        '-hls_fmp4_init_filename', INIT_NAME,
+        '-hls_flags', 'independent_segments',
+        '-hls_segment_filename', str(stream_dir / 'seg_%03d.m4s'),
+        str(stream_dir / PLAYLIST_NAME)
+    ]
+
+
+def parse_playlist(path: str) -> Dict[str, Any]:
+    """
+    解析媒体播放列表，URI 解析为绝对路径
+
+    Args:
+        path: m3u8 路径
+
+    Returns:
+        {"blocks": [{"map": 初始化分段路径, "segments": [(时长, 分段路径)]}], "ended": 是否已结束}
+        以 EXT-X-MAP 划分块，每个块对应一个段落
+    """
+    base = Path(path).resolve().parent
+    blocks: List[Dict[str, Any]] = []
+    ended = False
+    duration = None
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("#EXT-X-MAP:"):
+                uri = line.split('URI="', 1)[1].split('"', 1)[0]
+                blocks.append({"map": str(base / unquote(uri)), "segments": []})
+            elif line.startswith("#EXTINF:"):
+                duration = float(line[len("#EXTINF:"):].split(",", 1)[0])
+            elif line == "#EXT-X-ENDLIST":
+                ended = True
+            elif line and not line.startswith("#"):
+                if not blocks:
+                    blocks.append({"map": None, "segments": []})
+                blocks[-1]["segments"].append((duration or 0.0, str(base / unquote(line))))
+                duration = None
+    return {"blocks": blocks, "ended": ended}
+
+
+def _relative_uri(path: str, base_dir: str) -> str:
+    return quote(Path(os.path.relpath(path, base_dir)).as_posix())
+
+
+def render_playlist(blocks: Sequence[Dict[str, Any]], base_dir: str, ended: bool) -> str:
+    """
+    生成媒体播放列表文本，URI 写成相对 base_dir 的路径（百分号编码，目录名可含中文）
+
+    Args:
+        blocks: parse_playlist 格式的块
+        base_dir: 播放列表所在目录
+        ended: 是否写入 EXT-X-ENDLIST
+
+    Returns:
+        m3u8 文本
+    """
+    durations = [d for block in blocks for d, _ in block["segments"]]
+    target = max(1, math.ceil(max(durations))) if durations else DEFAULT_SEGMENT_DURATION
+    lines = [
+        "#EXTM3U",
+        "#EXT-X-VERSION:7",
+        f"#EXT-X-TARGETDURATION:{target}",
+        "#EXT-X-MEDIA-SEQUENCE:0",
+        f"#EXT-X-PLAYLIST-TYPE:{'VOD' if ended else 'EVENT'}",
+        "#EXT-X-INDEPENDENT-SEGMENTS",
+    ]
+    for i, block in enumerate(blocks):
+        if i > 0:
+            lines.append("#EXT-X-DISCONTINUITY")
+        if block["map"]:
+            lines.append(f'#EXT-X-MAP:URI="{_relative_uri(block["map"], base_dir)}"')
+        for duration, segment in block["segments"]:
+            lines.append(f"#EXTINF:{duration:.6f},")
+            lines.append(_relative_uri(segment, base_dir))
+    if ended:
+        lines.append("#EXT-X-ENDLIST")
+    return "\n".join(lines) + "\n"
+
+
+def _write_atomic(path: Path, content: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+    with open(temp_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    try:
+        check_commit_guard()
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+    os.replace(temp_path, path)
+
+
+def update_chapter_playlist(playlist_path: str, paragraph_playlists: Sequence[str]) -> int:
+    """
+    按段落顺序重写章节播放列表，只包含从第一段起连续就绪的段落
+
+    Args:
+        playlist_path: 章节播放列表路径
+        paragraph_playlists: 本章所有段落的 index.m3u8 路径（按顺序，未就绪的可以不存在）
+
+    Returns:
+        已发布的段落数
+    """
+    playlist_path = Path(playlist_path)
+    # 读取和写入在同一把锁内，避免两个段落（或两个进程）同时完成时较早的快照覆盖较新的
+    with _locked(playlist_path):
+        blocks = []
+        for paragraph_playlist in paragraph_playlists:
+            if not Path(paragraph_playlist).exists():
+                break
+            blocks.extend(parse_playlist(paragraph_playlist)["blocks"])
+        ended = bool(paragraph_playlists) and all(Path(p).exists() for p in paragraph_playlists)
+        _write_atomic(playlist_path, render_playlist(blocks, str(playlist_path.resolve().parent), ended))
+    return len(blocks)
+
+
+def update_novel_playlist(playlist_path: str, chapter_playlists: Sequence[str]) -> int:
+    """
+    重写整本小说的播放列表：按章节顺序串联章节播放列表，遇到未完成的章节时包含其已就绪部分后停止
+
+    Args:
+        playlist_path: 小说播放列表路径
+        chapter_playlists: 按章节顺序排列的章节播放列表路径
+
+    Returns:
+        已发布的段落数
+    """
+    playlist_path = Path(playlist_path)
+    with _locked(playlist_path):
+        blocks = []
+        for chapter_playlist in chapter_playlists:
+            if not Path(chapter_playlist).exists():
+                break
+            chapter = parse_playlist(chapter_playlist)
+            blocks.extend(chapter["blocks"])
+            if not chapter["ended"]:
+                break
+        _write_atomic(playlist_path, render_playlist(blocks, str(playlist_path.resolve().parent), ended=False))
+    return len(blocks)
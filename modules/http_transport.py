@@ -0,0 +1,239 @@
+"""
+共享HTTP传输层
+所有对外HTTP调用（大模型接口、火山引擎视觉接口、图片下载）共用一个 requests.Session：
+
+- 每个主机（scheme + host + port）一个连接池，保持长连接，不再每次请求重新进行TCP/TLS握手
+- 统一的 (连接, 读取) 超时：调用方没有指定时使用默认值，不会有无限等待的请求
+- 连接错误、超时、408/429/5xx 按全抖动指数退避重试，优先遵循 Retry-After；
+  默认只重试幂等方法，POST 由调用方显式传入 retries（调用方自己有重试逻辑时传 0）
+- 按主机统计请求数、重试数、新建连接数、连接复用率和平均耗时
+
+settings.yaml 示例：
+
+http:
+  pool_size: 16        # 每个主机的最大空闲连接数（同一主机的并发请求数不宜超过它）
+  timeout: [10, 60]    # (连接, 读取) 秒
+  max_retries: 3
+"""
+
+import atexit
+import random
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from modules.config import get_config
+from modules.logger import get_logger
+
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+DEFAULT_POOL_SIZE = 16
+DEFAULT_MAX_HOSTS = 32
+DEFAULT_TIMEOUT = (10.0, 60.0)
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF_BASE = 1.0
+DEFAULT_BACKOFF_CAP = 30.0
+
+logger = get_logger(__name__)
+
+
+def backoff_delay(attempt: int, base: float = DEFAULT_BACKOFF_BASE, cap: float = DEFAULT_BACKOFF_CAP,
+                  retry_after: Optional[float] = None) -> float:
+    """
+    第 attempt 次重试前的等待时间（全抖动指数退避）
+
+    Args:
+        attempt: 已失败的次数（从1开始）
+        base: 退避基数（秒）
+        cap: 单次等待上限（秒）
+        retry_after: 服务商返回的 Retry-After（秒），存在时作为下限
+
+    Returns:
+        等待秒数
+    """
+    delay = random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+    if retry_after is not None:
+        delay = max(delay, min(cap, retry_after))
+    return delay
+
+
+def retry_after(response) -> Optional[float]:
+    """响应头中的 Retry-After（秒），没有或无法解析时为None"""
+    value = response.headers.get("Retry-After")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def host_of(url: str) -> str:
+    """统计用的主机标识 scheme://host[:port]"""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+class HTTPTransport:
+    """
+    带连接池、超时和重试策略的HTTP传输层，线程安全
+
+    用法:
+        transport = get_transport()
+        response = transport.request("GET", url)                   # 幂等方法默认重试
+        response = transport.request("POST", url, json=body, retries=0)
+        transport.stats()
+    """
+
+    def __init__(self, pool_size: int = DEFAULT_POOL_SIZE, max_hosts: int = DEFAULT_MAX_HOSTS,
+                 timeout: Tuple[float, float] = DEFAULT_TIMEOUT, max_retries: int = DEFAULT_MAX_RETRIES,
+                 backoff_base: float = DEFAULT_BACKOFF_BASE, backoff_cap: float = DEFAULT_BACKOFF_CAP):
+        """
+        初始化传输层
+
+        Args:
+            pool_size: 每个主机的连接池大小
+            max_hosts: 同时保留连接池的主机数
+            timeout: 默认 (连接超时, 读取超时) 秒
+            max_retries: 默认最大重试次数（只用于幂等方法）
+            backoff_base: 退避基数（秒）
+            backoff_cap: 单次退避上限（秒）
+        """
+        self.timeout = tuple(timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.session = requests.Session()
+        self.adapter = HTTPAdapter(pool_connections=max_hosts, pool_maxsize=pool_size)
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def close(self) -> None:
+        """关闭所有连接池"""
+        self.session.close()
+
+    def _record(self, host: str, elapsed: float, retried: bool = False, failed: bool = False) -> None:
+        with self._lock:
+            entry = self._stats.setdefault(host, {"requests": 0, "retries": 0, "errors": 0, "seconds": 0.0})
+            entry["requests"] += 1
+            entry["seconds"] += elapsed
+            entry["retries"] += retried
+            entry["errors"] += failed
+
+    def request(self, method: str, url: str, timeout: Optional[Any] = None, retries: Optional[int] = None,
+                **kwargs) -> requests.Response:
+        """
+        发送请求
+
+        Args:
+            method: HTTP方法
+            url: 地址
+            timeout: (连接, 读取) 秒或单个秒数，None 使用默认超时
+            retries: 最大重试次数；None 时幂等方法使用默认值、其他方法不重试
+            **kwargs: 传给 requests 的其他参数（headers、json、data、files、stream 等）
+
+        Returns:
+            最后一次的响应（状态码由调用方检查）
+
+        Raises:
+            requests.ConnectionError / requests.Timeout: 重试用尽后仍无法连接或超时
+        """
+        method = method.upper()
+        if retries is None:
+            retries = self.max_retries if method in IDEMPOTENT_METHODS else 0
+        host = host_of(url)
+        attempt = 0
+        while True:
+            start = time.monotonic()
+            try:
+                response = self.session.request(method, url, timeout=timeout or self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self._record(host, time.monotonic() - start, failed=True)
+                attempt += 1
+                if attempt > retries:
+                    raise
+                delay = backoff_delay(attempt, self.backoff_base, self.backoff_cap)
+                logger.warning(f"{method} {host} 失败: {e}，{delay:.1f} 秒后第 {attempt} 次重试")
+            else:
+                retryable = response.status_code in RETRYABLE_STATUS
+                self._record(host, time.monotonic() - start, failed=retryable)
+                if not retryable or attempt >= retries:
+                    return response
+                attempt += 1
+                delay = backoff_delay(attempt, self.backoff_base, self.backoff_cap, retry_after(response))
+                logger.warning(f"{method} {host} 返回 {response.status_code}，{delay:.1f} 秒后第 {attempt} 次重试")
+                response.close()
+            with self._lock:
+                self._stats[host]["retries"] += 1
+            time.sleep(delay)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        按主机的连接池统计
+
+        Returns:
+            {主机: {"requests", "retries", "errors", "connections"（新建连接数）,
+                    "reuse_rate"（复用已有连接的请求比例）, "avg_ms"（平均耗时）}}
+        """
+        connections: Dict[str, int] = {}
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                host = f"{key.key_scheme}://{key.key_host}:{key.key_port}"
+                connections[host] = connections.get(host, 0) + pool.num_connections
+        with self._lock:
+            result = {}
+            for host, entry in self._stats.items():
+                parts = urlsplit(host)
+                port = parts.port or (443 if parts.scheme == "https" else 80)
+                opened = connections.get(f"{parts.scheme}://{parts.hostname}:{port}", 0)
+                requests_made = int(entry["requests"])
+                result[host] = {
+                    "requests": requests_made,
+                    "retries": int(entry["retries"]),
+                    "errors": int(entry["errors"]),
+                    "connections": opened,
+                    "reuse_rate": max(0.0, 1 - opened / requests_made) if requests_made else 0.0,
+                    "avg_ms": entry["seconds"] / requests_made * 1000 if requests_made else 0.0,
+                }
+            return result
+
+
+_transport: Optional[HTTPTransport] = None
+_transport_lock = threading.Lock()
+
+
+def get_transport() -> HTTPTransport:
+    """
+    获取按 settings.yaml 中 http 配置创建的全局传输层（进程内单例）
+
+    Returns:
+        传输层实例
+    """
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            try:
+                config = get_config().get("http", {}) or {}
+            except FileNotFoundError:
+                config = {}
+            _transport = HTTPTransport(
+                pool_size=config.get("pool_size", DEFAULT_POOL_SIZE),
+                timeout=tuple(config.get("timeout", DEFAULT_TIMEOUT)),
+                max_retries=config.get("max_retries", DEFAULT_MAX_RETRIES),
+            )
+            # 连接池归整个进程共用，进程退出时统一关闭
+            atexit.register(_transport.close)
+        return _transport
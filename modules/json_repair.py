@@ -0,0 +1,336 @@
+"""
+JSON修复与校验模块
+大模型输出的章节JSON常见的问题有：前后夹带说明文字或 ```json 代码块、输出被截断、
+字符串中出现未转义的双引号或换行、末尾多余的逗号。repair_json 尽量把这类文本修成可解析的JSON，
+截断时丢弃最后一个不完整的值并补全括号。
+
+check_breakdown 按下游 loop.process_chapter 读取的字段校验 章节信息/场景拆解/场景列表，
+找出缺失或损坏的段落；调用方只需用 reask_prompt 对这些段落重新请求，
+再用 merge_paragraphs 把补回的段落按序号并入已有的有效段落。
+"""
+
+import copy
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from modules.chunker import renumber_paragraph
+from modules.logger import get_logger
+
+PARAGRAPHS_KEY = "场景拆解"
+SCENES_KEY = "场景列表"
+
+# 下游必需的字段
+CHAPTER_FIELDS = ("章节号",)
+PARAGRAPH_FIELDS = ("段落标题", "场景文案")
+SCENE_FIELDS = ("场景编号", "图片提示词")
+
+# repair_json 返回的修复说明
+FIX_FENCE = "去掉代码块标记"
+FIX_PROSE = "去掉JSON前后的说明文字"
+FIX_QUOTES = "转义字符串中的双引号或换行"
+FIX_COMMAS = "删除多余的逗号"
+FIX_TRUNCATED = "补全被截断的结尾"
+
+FENCE = re.compile(r"```(?:json)?", re.IGNORECASE)
+COUNT = re.compile(r"\d+")
+
+# 字符串中的双引号后紧跟这些字符时视为字符串结束，否则视为未转义的内容
+STRING_END_FOLLOWERS = ":}]"
+VALUE_STARTS = "\"{[]}-0123456789tfn"
+
+logger = get_logger(__name__)
+
+
+def _next_significant(text: str, start: int) -> Tuple[int, str]:
+    """start 之后第一个非空白字符的位置和字符，到结尾时字符为空"""
+    i = start
+    while i < len(text) and text[i] in " \t\r\n":
+        i += 1
+    return i, text[i] if i < len(text) else ""
+
+
+def _closes_string(text: str, i: int) -> bool:
+    """text[i] 处的双引号是否为字符串的结束引号"""
+    j, char = _next_significant(text, i + 1)
+    if char == "" or char in STRING_END_FOLLOWERS:
+        return True
+    if char == ",":
+        return _next_significant(text, j + 1)[1] in VALUE_STARTS
+    return False
+
+
+def _extract(text: str) -> Tuple[str, List[str]]:
+    """去掉代码块标记，截取第一个 { 到与之配对的 }（没有配对时到结尾）"""
+    fixes = []
+    stripped = FENCE.sub("", text)
+    if stripped != text:
+        fixes.append(FIX_FENCE)
+    start = stripped.find("{")
+    if start < 0:
+        raise json.JSONDecodeError("未找到JSON对象", text, 0)
+    depth, in_string, escape, end = 0, False, False, len(stripped)
+    for i in range(start, len(stripped)):
+        char = stripped[i]
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"' and _closes_string(stripped, i):
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            depth += 1
+        elif char in "}]":
+            depth -= 1
+            if depth == 0:
+                end = i + 1
+                break
+    if stripped[:start].strip() or stripped[end:].strip():
+        fixes.append(FIX_PROSE)
+    return stripped[start:end], fixes
+
+
+def _rewrite(text: str) -> Tuple[str, List[str]]:
+    """
+    逐字符重写：转义字符串中的裸双引号和换行、删除 ] 和 } 前多余的逗号；
+    文本在容器内结束时回退到最后一个完整的值并补全括号
+    """
+    out: List[str] = []
+    fixes = set()
+    stack: List[str] = []
+    # 截断时可回退到的位置：(输出长度, 当时的容器栈)
+    safe: Tuple[int, List[str]] = (0, [])
+    in_string = escape = is_key = False
+    previous = ""  # 字符串之外上一个非空白字符
+    for i, char in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                if not _closes_string(text, i):
+                    out.append('\\"')
+                    fixes.add(FIX_QUOTES)
+                    continue
+                in_string = False
+                out.append(char)
+                previous = char
+                if not is_key:
+                    safe = (len(out), stack[:])
+                continue
+            elif char in "\r\n":
+                out.append("\\n" if char == "\n" else "")
+                fixes.add(FIX_QUOTES)
+                continue
+            out.append(char)
+            continue
+        if char == '"':
+            in_string = True
+            # 对象中逗号或左花括号之后的字符串是键
+            is_key = bool(stack) and stack[-1] == "{" and previous in ("{", ",")
+        elif char in "{[":
+            stack.append(char)
+        elif char in "}]":
+            if stack:
+                stack.pop()
+            safe = (len(out) + 1, stack[:])
+        elif char == ",":
+            if _next_significant(text, i + 1)[1] in ("]", "}"):
+                fixes.add(FIX_COMMAS)
+                continue
+            safe = (len(out), stack[:])
+        out.append(char)
+        if char not in " \t\r\n":
+            previous = char
+    if in_string or stack:
+        fixes.add(FIX_TRUNCATED)
+        length, stack = safe
+        del out[length:]
+        while out and out[-1] in " \t\r\n,":
+            out.pop()
+        out.extend("}" if c == "{" else "]" for c in reversed(stack))
+    return "".join(out), sorted(fixes)
+
+
+def repair_json(text: str) -> Tuple[Any, List[str]]:
+    """
+    解析大模型输出的JSON，失败时依次尝试修复
+
+    Args:
+        text: 模型回复原文
+
+    Returns:
+        (解析结果, 修复说明列表)，能直接解析时修复说明为空
+
+    Raises:
+        json.JSONDecodeError: 修复后仍无法解析（如回复中没有JSON对象）
+    """
+    try:
+        return json.loads(text), []
+    except json.JSONDecodeError:
+        pass
+    extracted, fixes = _extract(text)
+    try:
+        return json.loads(extracted), fixes
+    except json.JSONDecodeError:
+        pass
+    rewritten, more = _rewrite(extracted)
+    return json.loads(rewritten), fixes + more
+
+
+def paragraph_count(chapter_info: Any) -> Optional[int]:
+    """章节信息 中声明的段落数量（如 "16个"），没有时为 None"""
+    if not isinstance(chapter_info, dict):
+        return None
+    match = COUNT.search(str(chapter_info.get("段落数量", "")))
+    return int(match.group(0)) if match else None
+
+
+def paragraph_errors(paragraph: Any) -> List[str]:
+    """
+    校验 场景拆解 中的单个段落
+
+    Args:
+        paragraph: 段落对象
+
+    Returns:
+        问题列表，为空表示有效
+    """
+    if not isinstance(paragraph, dict):
+        return ["段落不是对象"]
+    errors = []
+    if not isinstance(paragraph.get("序号"), int):
+        errors.append("缺少序号")
+    errors.extend(f"缺少{name}" for name in PARAGRAPH_FIELDS
+                  if not isinstance(paragraph.get(name), str) or not paragraph[name].strip())
+    scenes = paragraph.get(SCENES_KEY)
+    if not isinstance(scenes, list) or not scenes:
+        errors.append(f"缺少{SCENES_KEY}")
+        return errors
+    for k, scene in enumerate(scenes, 1):
+        if not isinstance(scene, dict):
+            errors.append(f"场景{k}不是对象")
+            continue
+        errors.extend(f"场景{k}缺少{name}" for name in SCENE_FIELDS
+                      if not isinstance(scene.get(name), str) or not scene[name].strip())
+    return errors
+
+
+@dataclass
+class BreakdownReport:
+    """章节拆解结果的校验报告"""
+    errors: List[str] = field(default_factory=list)      # 章节级问题（无法只补段落）
+    broken: List[int] = field(default_factory=list)      # 存在但无效的段落序号
+    missing: List[int] = field(default_factory=list)     # 声明了但没有出现的段落序号
+    open_ended: bool = False                              # 输出被截断且未声明段落数量，末尾可能还有段落
+
+    @property
+    def ok(self) -> bool:
+        return not (self.errors or self.broken or self.missing or self.open_ended)
+
+    @property
+    def todo(self) -> List[int]:
+        """需要重新请求的段落序号"""
+        return sorted(set(self.broken) | set(self.missing))
+
+
+def check_breakdown(data: Any, truncated: bool = False) -> BreakdownReport:
+    """
+    按 章节信息/场景拆解/场景列表 的结构校验章节拆解结果
+
+    Args:
+        data: 解析后的章节JSON
+        truncated: 原文是否被截断（repair_json 的修复说明含 FIX_TRUNCATED）
+
+    Returns:
+        校验报告；无法确定序号的无效段落按其位置记为 broken
+    """
+    report = BreakdownReport()
+    if not isinstance(data, dict):
+        report.errors.append("结果不是对象")
+        return report
+    info = data.get("章节信息")
+    if not isinstance(info, dict):
+        report.errors.append("缺少章节信息")
+    else:
+        report.errors.extend(f"章节信息缺少{name}" for name in CHAPTER_FIELDS if not info.get(name))
+    paragraphs = data.get(PARAGRAPHS_KEY)
+    if not isinstance(paragraphs, list):
+        report.errors.append(f"缺少{PARAGRAPHS_KEY}")
+        return report
+
+    seen = set()
+    for position, paragraph in enumerate(paragraphs, 1):
+        number = paragraph.get("序号") if isinstance(paragraph, dict) else None
+        number = number if isinstance(number, int) else position
+        if paragraph_errors(paragraph) or number in seen:
+            report.broken.append(number)
+        seen.add(number)
+    expected = paragraph_count(info)
+    if expected is not None:
+        report.missing = [n for n in range(1, expected + 1) if n not in seen]
+    elif truncated or not paragraphs:
+        report.open_ended = True
+    return report
+
+
+def reask_prompt(report: BreakdownReport, last: int) -> str:
+    """
+    只重新请求缺失或损坏段落的追问
+
+    Args:
+        report: check_breakdown 的结果
+        last: 已有段落的最大序号
+
+    Returns:
+        追问文本，作为 user 消息接在原请求和模型回复之后
+    """
+    parts = []
+    if report.todo:
+        parts.append("序号 " + "、".join(str(n) for n in report.todo) + " 的段落")
+    if report.open_ended:
+        parts.append(f"序号 {last} 之后被截断的全部段落（没有则输出空数组）")
+    return (
+        f"上面的输出中{'，以及'.join(parts)}缺失、被截断或格式有误。"
+        f"请只重新输出这些段落，格式为 {{\"{PARAGRAPHS_KEY}\": [段落, ...]}}，"
+        "段落结构和序号与之前相同，字段完整，不要输出其他内容。"
+    )
+
+
+def merge_paragraphs(data: Dict[str, Any], paragraphs: List[Any]) -> Dict[str, Any]:
+    """
+    把重新请求得到的段落按序号并入章节结果：有效段落替换同序号的段落或补到缺口，
+    无效段落忽略；合并后按序号排序并重编 场景编号
+
+    没有序号的段落按位置编号（与 check_breakdown 一致），同一序号只保留一个。
+
+    Args:
+        data: 章节JSON
+        paragraphs: 补回的段落列表
+
+    Returns:
+        合并后的章节JSON（新对象）
+    """
+    data = copy.deepcopy(data)
+    by_number: Dict[int, Any] = {}
+    for position, paragraph in enumerate(data.get(PARAGRAPHS_KEY) or [], 1):
+        number = paragraph.get("序号") if isinstance(paragraph, dict) else None
+        number = number if isinstance(number, int) else position
+        # 同一序号出现多次时保留第一个有效的
+        if number not in by_number or (paragraph_errors(by_number[number]) and not paragraph_errors(paragraph)):
+            by_number[number] = paragraph
+    for paragraph in paragraphs:
+        errors = paragraph_errors(paragraph)
+        if errors:
+            logger.warning(f"补回的段落仍无效，忽略: {'、'.join(errors)}")
+            continue
+        by_number[paragraph["序号"]] = paragraph
+    merged = [renumber_paragraph(by_number[n], n) if not paragraph_errors(by_number[n]) else by_number[n]
+              for n in sorted(by_number)]
+    data[PARAGRAPHS_KEY] = merged
+    return data
@@ -0,0 +1,127 @@
+"""
+增量JSON解析模块
+大模型流式输出章节拆解JSON时，逐段喂入文本，指定数组（如 场景拆解）中的每个元素对象
+在其右花括号到达时立即解析并返回，不必等整个回复结束。
+
+只跟踪字符串/转义状态和容器嵌套，不校验整体语法；JSON之前的 ```json 代码块标记等文本会被忽略。
+"""
+
+import json
+from typing import Any, Dict, Iterable, List, Optional
+
+from modules.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class IncrementalJSONParser:
+    """
+    从流式文本中提取指定数组里已完整的元素对象
+
+    用法:
+        parser = IncrementalJSONParser(["场景拆解"])
+        for delta in stream:
+            for scene in parser.feed(delta):
+                start_downstream(scene)
+        document = json.loads(parser.text)
+    """
+
+    def __init__(self, array_keys: Iterable[str]):
+        """
+        初始化解析器
+
+        Args:
+            array_keys: 需要提取元素的数组键名，任意嵌套深度都生效（数组嵌套在同名数组元素中时只提取外层）
+        """
+        self.array_keys = set(array_keys)
+        self._chunks: List[str] = []
+        self._buffer = ""          # 当前未完成元素的文本（不在元素中时为空）
+        self._in_string = False
+        self._escape = False
+        self._string: List[str] = []
+        self._last_string: Optional[str] = None
+        # 容器栈，每项为 [类型, 最近的键名, 是否为目标数组]
+        self._stack: List[List[Any]] = []
+        self._element_depth: Optional[int] = None  # 正在收集的元素对象所在栈深度
+        self.emitted = 0
+
+    @property
+    def text(self) -> str:
+        """迄今为止喂入的全部文本"""
+        return "".join(self._chunks)
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        """
+        喂入一段文本
+
+        Args:
+            text: 新到达的文本片段
+
+        Returns:
+            本次新完成的元素对象列表（按出现顺序）
+        """
+        self._chunks.append(text)
+        completed = []
+        start = 0
+        for i, char in enumerate(text):
+            if self._in_string:
+                self._string.append(char)
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._end_string()
+                continue
+            if char == '"':
+                self._in_string = True
+                self._string = [char]
+            elif char in "{[":
+                self._open(char)
+                if self._element_depth == len(self._stack):
+                    start = i
+            elif char in "}]":
+                element = self._element_depth is not None and self._element_depth == len(self._stack)
+                self._close()
+                if element:
+                    self._buffer += text[start:i + 1]
+                    obj = self._emit()
+                    if obj is not None:
+                        completed.append(obj)
+            elif char == ":":
+                if self._stack and self._stack[-1][0] == "{":
+                    self._stack[-1][1] = self._last_string
+        if self._element_depth is not None and self._element_depth <= len(self._stack):
+            self._buffer += text[start:]
+        return completed
+
+    def _end_string(self) -> None:
+        raw = "".join(self._string)
+        try:
+            self._last_string = json.loads(raw)
+        except json.JSONDecodeError:
+            self._last_string = None
+
+    def _open(self, char: str) -> None:
+        parent = self._stack[-1] if self._stack else None
+        key = parent[1] if parent and parent[0] == "{" else None
+        is_target = (char == "[" and key in self.array_keys and self._element_depth is None)
+        if char == "{" and parent and parent[2] and self._element_depth is None:
+            self._element_depth = len(self._stack) + 1
+            self._buffer = ""
+        self._stack.append([char, None, is_target])
+
+    def _close(self) -> None:
+        if self._stack:
+            self._stack.pop()
+
+    def _emit(self) -> Optional[Dict[str, Any]]:
+        raw, self._buffer, self._element_depth = self._buffer, "", None
+        try:
+            obj = json.loads(raw)
+        except json.JSONDecodeError as e:
+            logger.warning(f"流式元素解析失败，等待完整结果: {e}")
+            return None
+        self.emitted += 1
+        return obj
@@ -0,0 +1,286 @@
+"""
+基于共享文件系统的租约模块
+多台渲染机上的 loop.py 进程通过共享目录（如 NFS）中的租约文件认领章节，保证同一章节的输出目录同一时间只有一个进程在写。
+
+- 认领：O_CREAT | O_EXCL 创建 <key>.lease，写入持有者信息，只有一个进程能创建成功
+- 心跳：持有者的后台线程定期刷新租约文件的修改时间，每次都核对文件的持有者和 inode，
+  （认领时写入的随机令牌），文件不见了、被他人重新创建或被换成另一个文件时标记租约丢失
+- 过期接管：修改时间超过 ttl 的租约视为持有者已崩溃，先把它原子改名（只有一个进程能改名成功），
+  确认仍已过期后删除，再按正常流程认领
+- 处理期间：处理函数在每个节点开始前和每次提交产物前调用 Lease.check()，租约丢失时立即中止，
+  不会与接管的进程同时写同一个章节目录
+- 完成：处理成功后写入 <key>.done，其他进程不再认领
+
+过期判断使用租约文件修改时间与本机时间比较，各渲染机需要保持时钟同步（NTP），ttl 应远大于时钟偏差。
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+from modules.logger import get_logger
+
+DEFAULT_TTL = 60.0
+
+logger = get_logger(__name__)
+
+
+class LeaseLost(Exception):
+    """租约已被其他进程接管"""
+    pass
+
+
+def default_owner() -> str:
+    """持有者标识：主机名 + 进程号 + 随机后缀"""
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+class Lease:
+    """
+    单个键的租约
+
+    用法:
+        lease = Lease(lease_dir, "chapter_001", ttl=60)
+        if lease.acquire():
+            with lease:
+                ...  # 心跳线程在此期间保持租约
+    """
+
+    def __init__(self, lease_dir: str, key: str, ttl: float = DEFAULT_TTL,
+                 heartbeat_interval: Optional[float] = None, owner: Optional[str] = None):
+        """
+        初始化租约
+
+        Args:
+            lease_dir: 租约目录（所有工作进程共享）
+            key: 认领对象的键，如章节文件名
+            ttl: 心跳停止多久后租约视为过期（秒）
+            heartbeat_interval: 心跳间隔（秒），默认 ttl / 4
+            owner: 持有者标识，默认见 default_owner
+        """
+        self.lease_dir = Path(lease_dir)
+        self.key = key
+        self.ttl = ttl
+        self.heartbeat_interval = heartbeat_interval or ttl / 4
+        self.owner = owner or default_owner()
+        self.path = self.lease_dir / f"{key}.lease"
+        self.lost = threading.Event()
+        self._inode: Optional[int] = None
+        self._token: Optional[str] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _read_info(self, path: Optional[Path] = None) -> Dict[str, Any]:
+        try:
+            with open(path or self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _read_owner(self, path: Optional[Path] = None) -> Optional[str]:
+        return self._read_info(path).get("owner")
+
+    def _is_stale(self, path: Path) -> bool:
+        try:
+            return time.time() - path.stat().st_mtime > self.ttl
+        except FileNotFoundError:
+            return False
+
+    def _create(self) -> bool:
+        try:
+            fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return False
+        # 每次认领一个随机令牌：删除后新建的文件可能复用 inode 号，同一持有者标识也可能再次认领
+        self._token = uuid.uuid4().hex
+        info = {"owner": self.owner, "token": self._token, "host": socket.gethostname(), "pid": os.getpid(),
+                "acquired_at": time.time()}
+        self._inode = os.fstat(fd).st_ino
+        self.lost.clear()
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(info, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        return True
+
+    def _break_stale(self) -> None:
+        """把过期租约改名移走；改名是原子的，多个进程同时接管时只有一个成功"""
+        if not self._is_stale(self.path):
+            return
+        stale_path = self.lease_dir / f"{self.key}.lease.stale.{uuid.uuid4().hex[:8]}"
+        try:
+            os.rename(self.path, stale_path)
+        except FileNotFoundError:
+            return
+        if self._is_stale(stale_path):
+            logger.warning(f"接管过期租约: {self.key} (原持有者: {self._read_owner(stale_path)})")
+            stale_path.unlink(missing_ok=True)
+            return
+        # 改名前一刻持有者刚刷新了心跳，尽量放回原处（硬链接保留 inode，持有者的心跳核对仍能通过）
+        try:
+            os.link(stale_path, self.path)
+        except FileExistsError:
+            # 第三个进程已在空档中创建了新租约：原持有者的租约就此丢失，它的下一次心跳会发现并中止
+            logger.error(f"放回租约失败，原持有者 {self._read_owner(stale_path)} 的租约已丢失: {self.key}")
+        stale_path.unlink(missing_ok=True)
+
+    def acquire(self) -> bool:
+        """
+        尝试认领（不阻塞）
+
+        Returns:
+            是否认领成功
+        """
+        self.lease_dir.mkdir(parents=True, exist_ok=True)
+        if self._create():
+            return True
+        self._break_stale()
+        return self._create()
+
+    def _verify(self) -> None:
+        """核对租约文件仍是自己创建的那个文件（inode、持有者和认领令牌都一致）"""
+        try:
+            inode = self.path.stat().st_ino
+        except FileNotFoundError:
+            raise LeaseLost(f"租约文件已不存在: {self.key}")
+        info = self._read_info()
+        if inode != self._inode or info.get("owner") != self.owner or info.get("token") != self._token:
+            raise LeaseLost(f"租约已被接管: {self.key}")
+
+    def heartbeat(self) -> None:
+        """
+        核对持有关系并刷新租约修改时间
+
+        Raises:
+            LeaseLost: 租约文件已不存在或已被其他进程持有
+        """
+        self._verify()
+        os.utime(self.path)
+
+    def check(self) -> None:
+        """
+        确认仍持有租约，处理函数在开始每个节点和提交每个产物前调用
+
+        Raises:
+            LeaseLost: 心跳已发现租约丢失，或此刻核对发现租约已被接管
+        """
+        if self.lost.is_set():
+            raise LeaseLost(f"租约已丢失: {self.key}")
+        try:
+            self._verify()
+        except LeaseLost:
+            self.lost.set()
+            raise
+
+    def _heartbeat_loop(self) -> None:
+        while not self._stop.wait(self.heartbeat_interval):
+            try:
+                self.heartbeat()
+            except (LeaseLost, OSError) as e:
+                logger.error(f"租约心跳失败，停止续约: {e}")
+                self.lost.set()
+                return
+
+    def start_heartbeat(self) -> None:
+        """启动心跳线程"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._heartbeat_loop, name=f"lease-{self.key}", daemon=True)
+        self._thread.start()
+
+    def release(self) -> None:
+        """停止心跳并删除租约（只删除自己持有的租约）"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        try:
+            self._verify()
+        except LeaseLost:
+            return
+        self.path.unlink(missing_ok=True)
+
+    def __enter__(self):
+        self.start_heartbeat()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+
+def done_path(done_dir: str, key: str) -> Path:
+    """完成标记文件路径"""
+    return Path(done_dir) / f"{key}.done"
+
+
+def work_through(keys: Iterable[str], handler: Callable[[str, Lease], bool], lease_dir: str,
+                 ttl: float = DEFAULT_TTL, heartbeat_interval: Optional[float] = None,
+                 poll_interval: float = 5.0, owner: Optional[str] = None,
+                 done_dir: Optional[str] = None) -> Dict[str, List[str]]:
+    """
+    工作进程主循环：按顺序认领尚未完成的键并处理，直到所有键都完成
+
+    其他进程持有的键会在其租约过期后被重新认领；本进程处理失败的键不再重试（留给其他进程或下次运行），
+    剩余的键都被其他进程持有时每隔 poll_interval 重新检查一次。
+
+    Args:
+        keys: 所有待处理的键（按优先顺序）
+        handler: 处理函数 handler(键, 租约)，返回True表示完成（写入完成标记）；
+            处理期间应调用 lease.check()，租约丢失时由它抛出 LeaseLost 中止处理
+        lease_dir: 租约目录
+        ttl: 租约过期时间（秒）
+        heartbeat_interval: 心跳间隔（秒）
+        poll_interval: 等待其他进程时的检查间隔（秒）
+        owner: 持有者标识
+        done_dir: 完成标记目录，默认与租约目录相同（同一键在不同产物集合下分别记录完成时使用）
+
+    Returns:
+        {"done": 本进程完成的键, "failed": 本进程处理失败的键}
+    """
+    keys = list(keys)
+    owner = owner or default_owner()
+    done_dir = done_dir or lease_dir
+    Path(done_dir).mkdir(parents=True, exist_ok=True)
+    done: List[str] = []
+    failed: Set[str] = set()
+
+    while True:
+        pending = [k for k in keys if k not in failed and not done_path(done_dir, k).exists()]
+        if not pending:
+            break
+
+        claimed = False
+        for key in pending:
+            lease = Lease(lease_dir, key, ttl=ttl, heartbeat_interval=heartbeat_interval, owner=owner)
+            if not lease.acquire():
+                continue
+            claimed = True
+            with lease:
+                # 认领前一刻其他进程可能刚完成
+                if done_path(done_dir, key).exists():
+                    continue
+                logger.info(f"{owner} 认领: {key}")
+                try:
+                    ok = handler(key, lease)
+                except Exception as e:
+                    logger.error(f"处理失败: {key}，错误: {e}")
+                    ok = False
+                if lease.lost.is_set():
+                    logger.error(f"处理期间租约丢失，结果不标记完成: {key}")
+                    ok = False
+                if ok:
+                    done_path(done_dir, key).touch()
+                    done.append(key)
+                else:
+                    failed.add(key)
+            break
+
+        if not claimed:
+            time.sleep(poll_interval)
+
+    return {"done": done, "failed": sorted(failed)}
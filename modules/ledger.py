@@ -0,0 +1,329 @@
+"""
+任务台账模块
+用 SQLite（WAL 模式）记录每个产物（段落音频、场景图片、字幕、段落视频、章节视频）的状态、
+提交的 task_id、尝试次数、耗时和错误，替代每次整体重写的 .progress.json。
+
+每次状态变化是一条短事务，多个线程和同一台机器上的多个进程可以同时写入；
+产物按 (章节, 段落序号-标题, 类型, 名称) 唯一定位，不会因段落标题重复而互相覆盖。
+
+WAL 依赖共享内存，台账文件需要放在本地磁盘上（不要放在 NFS 上），可通过 ledger.path 配置。
+多机工作进程模式（loop.py --worker）下输出目录是共享挂载，必须配置 ledger.path 且不能位于输出目录下，
+见 require_local_ledger。
+"""
+
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from modules.config import get_config
+
+# 产物状态
+PENDING = "pending"
+RUNNING = "running"
+SUBMITTED = "submitted"
+DONE = "done"
+FAILED = "failed"
+
+DEFAULT_LEDGER_NAME = "ledger.sqlite3"
+
+
+class LedgerError(Exception):
+    """台账配置错误"""
+    pass
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS artifacts (
+    chapter     TEXT NOT NULL,
+    chapter_no  INTEGER,
+    paragraph   TEXT NOT NULL,
+    kind        TEXT NOT NULL,
+    name        TEXT NOT NULL,
+    path        TEXT,
+    state       TEXT NOT NULL DEFAULT 'pending',
+    task_id     TEXT,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    error       TEXT,
+    created_at  REAL NOT NULL,
+    started_at  REAL,
+    updated_at  REAL NOT NULL,
+    finished_at REAL,
+    duration    REAL,
+    PRIMARY KEY (chapter, paragraph, kind, name)
+);
+CREATE INDEX IF NOT EXISTS idx_artifacts_state ON artifacts (state, kind, chapter_no);
+"""
+
+
+@dataclass(frozen=True)
+class ArtifactKey:
+    """产物在台账中的唯一键"""
+    chapter: str
+    paragraph: str
+    kind: str       # audio / scene / subtitle / video / chapter_video
+    name: str
+
+    def as_params(self) -> Tuple[str, str, str, str]:
+        return (self.chapter, self.paragraph, self.kind, self.name)
+
+
+class JobLedger:
+    """
+    项目级任务台账
+
+    每个线程使用独立的 SQLite 连接；每次状态变化都是独立的短事务。
+    """
+
+    def __init__(self, path: str, busy_timeout: float = 30.0):
+        """
+        打开（必要时创建）台账
+
+        Args:
+            path: SQLite 文件路径
+            busy_timeout: 等待其他写入者释放锁的最长时间（秒）
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=self.busy_timeout, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _execute(self, sql: str, params: Sequence[Any] = ()) -> sqlite3.Cursor:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = conn.execute(sql, params)
+            conn.execute("COMMIT")
+            return cursor
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def register(self, key: ArtifactKey, chapter_no: Optional[int] = None, path: Optional[str] = None) -> None:
+        """
+        登记产物（已存在时保持原状态）
+
+        Args:
+            key: 产物键
+            chapter_no: 章节编号，用于按章节范围查询
+            path: 产物文件路径
+        """
+        now = time.time()
+        self._execute(
+            "INSERT INTO artifacts (chapter, paragraph, kind, name, chapter_no, path, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (chapter, paragraph, kind, name) DO UPDATE SET "
+            "chapter_no = excluded.chapter_no, path = COALESCE(excluded.path, artifacts.path)",
+            (*key.as_params(), chapter_no, path, now, now)
+        )
+
+    def start(self, key: ArtifactKey) -> None:
+        """开始一次生成尝试：尝试次数加一，记录开始时间"""
+        now = time.time()
+        self._execute(
+            "UPDATE artifacts SET state = ?, attempts = attempts + 1, started_at = ?, updated_at = ?, error = NULL "
+            "WHERE chapter = ? AND paragraph = ? AND kind = ? AND name = ?",
+            (RUNNING, now, now, *key.as_params())
+        )
+
+    def submitted(self, key: ArtifactKey, task_id: str) -> None:
+        """异步任务已提交到服务商"""
+        self._execute(
+            "UPDATE artifacts SET state = ?, task_id = ?, updated_at = ? "
+            "WHERE chapter = ? AND paragraph = ? AND kind = ? AND name = ?",
+            (SUBMITTED, task_id, time.time(), *key.as_params())
+        )
+
+    def done(self, key: ArtifactKey, path: Optional[str] = None) -> None:
+        """产物已生成（或已存在于磁盘/缓存），记录耗时"""
+        now = time.time()
+        self._execute(
+            "UPDATE artifacts SET state = ?, path = COALESCE(?, path), finished_at = ?, updated_at = ?, error = NULL, "
+            "duration = CASE WHEN state IN (?, ?) AND started_at IS NOT NULL THEN ? - started_at ELSE duration END "
+            "WHERE chapter = ? AND paragraph = ? AND kind = ? AND name = ?",
+            (DONE, path, now, now, RUNNING, SUBMITTED, now, *key.as_params())
+        )
+
+    def failed(self, key: ArtifactKey, error: Any) -> None:
+        """本次尝试失败，记录错误"""
+        now = time.time()
+        self._execute(
+            "UPDATE artifacts SET state = ?, error = ?, finished_at = ?, updated_at = ?, "
+            "duration = CASE WHEN started_at IS NOT NULL THEN ? - started_at ELSE duration END "
+            "WHERE chapter = ? AND paragraph = ? AND kind = ? AND name = ?",
+            (FAILED, str(error), now, now, now, *key.as_params())
+        )
+
+    def get(self, key: ArtifactKey) -> Optional[Dict[str, Any]]:
+        """读取单个产物记录"""
+        row = self._conn().execute(
+            "SELECT * FROM artifacts WHERE chapter = ? AND paragraph = ? AND kind = ? AND name = ?",
+            key.as_params()
+        ).fetchone()
+        return dict(row) if row else None
+
+    def query(self, state: Optional[str] = None, kind: Optional[str] = None,
+              chapters: Optional[Tuple[int, int]] = None, chapter: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        按条件查询产物记录
+
+        Args:
+            state: 状态，如 failed
+            kind: 产物类型，如 scene
+            chapters: 章节编号闭区间，如 (1, 40)
+            chapter: 章节目录名
+
+        Returns:
+            记录列表，按章节编号、段落、名称排序
+        """
+        clauses, params = [], []
+        if state is not None:
+            clauses.append("state = ?")
+            params.append(state)
+        if kind is not None:
+            clauses.append("kind = ?")
+            params.append(kind)
+        if chapters is not None:
+            clauses.append("chapter_no BETWEEN ? AND ?")
+            params.extend(chapters)
+        if chapter is not None:
+            clauses.append("chapter = ?")
+            params.append(chapter)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._conn().execute(
+            f"SELECT * FROM artifacts {where} ORDER BY chapter_no, chapter, paragraph, kind, name", params
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def summary(self, chapter: Optional[str] = None) -> Dict[str, Dict[str, int]]:
+        """
+        按类型和状态统计产物数量
+
+        Args:
+            chapter: 只统计该章节，默认统计全部
+
+        Returns:
+            {类型: {状态: 数量}}
+        """
+        where, params = ("WHERE chapter = ?", (chapter,)) if chapter else ("", ())
+        rows = self._conn().execute(
+            f"SELECT kind, state, COUNT(*) AS n FROM artifacts {where} GROUP BY kind, state", params
+        ).fetchall()
+        counts: Dict[str, Dict[str, int]] = {}
+        for row in rows:
+            counts.setdefault(row["kind"], {})[row["state"]] = row["n"]
+        return counts
+
+    def average_durations(self) -> Dict[str, float]:
+        """
+        各类型产物已完成尝试的平均耗时，用于估算运行时间
+
+        Returns:
+            {类型: 平均秒数}
+        """
+        rows = self._conn().execute(
+            "SELECT kind, AVG(duration) AS seconds FROM artifacts "
+            "WHERE state = ? AND duration IS NOT NULL GROUP BY kind", (DONE,)
+        ).fetchall()
+        return {row["kind"]: row["seconds"] for row in rows}
+
+
+class ArtifactJob:
+    """绑定到单个产物的台账记录器，传给各生成节点使用"""
+
+    def __init__(self, ledger: Optional[JobLedger], key: ArtifactKey):
+        self.ledger = ledger
+        self.key = key
+
+    def start(self) -> None:
+        if self.ledger:
+            self.ledger.start(self.key)
+
+    def submitted(self, task_id: str) -> None:
+        if self.ledger:
+            self.ledger.submitted(self.key, task_id)
+
+    def done(self, path: Optional[str] = None) -> None:
+        if self.ledger:
+            self.ledger.done(self.key, path)
+
+    def failed(self, error: Any) -> None:
+        if self.ledger:
+            self.ledger.failed(self.key, error)
+
+
+_ledgers: Dict[str, JobLedger] = {}
+_ledgers_lock = threading.Lock()
+
+
+def ledger_path(output_base: str = "output") -> Path:
+    """
+    项目台账路径
+
+    Args:
+        output_base: 输出目录根路径，未配置 ledger.path 时台账位于其下的 ledger.sqlite3
+
+    Returns:
+        绝对路径
+    """
+    try:
+        configured = (get_config().get("ledger", {}) or {}).get("path")
+    except FileNotFoundError:
+        configured = None
+    return Path(configured or Path(output_base) / DEFAULT_LEDGER_NAME).resolve()
+
+
+def require_local_ledger(output_base: str = "output") -> Path:
+    """
+    工作进程模式的台账路径检查：输出目录是多台渲染机共享的挂载（如 NFS），WAL 台账不能放在其下
+
+    Args:
+        output_base: 共享输出目录根路径
+
+    Returns:
+        台账的绝对路径
+
+    Raises:
+        LedgerError: 没有配置 ledger.path，或配置的路径位于输出目录下
+    """
+    try:
+        configured = (get_config().get("ledger", {}) or {}).get("path")
+    except FileNotFoundError:
+        configured = None
+    if not configured:
+        raise LedgerError("工作进程模式需要在 settings.yaml 中配置 ledger.path（本机磁盘上的路径，不要放在共享输出目录下）")
+    path = ledger_path(output_base)
+    if path.is_relative_to(Path(output_base).resolve()):
+        raise LedgerError(f"台账 {path} 位于共享输出目录 {output_base} 下，SQLite WAL 不能放在 NFS 上，"
+                          f"请把 ledger.path 改为本机磁盘上的路径")
+    return path
+
+
+def get_job_ledger(output_base: str = "output") -> JobLedger:
+    """
+    获取项目台账（进程内按路径单例）
+
+    Args:
+        output_base: 输出目录根路径，见 ledger_path
+
+    Returns:
+        台账
+    """
+    path = str(ledger_path(output_base))
+    with _ledgers_lock:
+        if path not in _ledgers:
+            _ledgers[path] = JobLedger(path)
+        return _ledgers[path]
@@ -0,0 +1,243 @@
+"""
+LLM 批处理任务模块
+面向 OpenAI 兼容的 Batch 接口（POST /files 上传任务文件，POST /batches 提交，GET /batches/{id} 轮询，
+GET /files/{id}/content 下载结果）：把多个 chat/completions 请求写成一个 JSONL 任务文件一次提交。
+批处理延迟高（服务商在 completion_window 内完成），但吞吐更高、单价更低，适合夜间批量处理。
+
+- 与 LLMClient 共用传输层（连接池）、鉴权头和模型；已在 modules.llm_cache 中缓存的请求不提交，直接回调
+- 提交后任务ID和各请求的键记录在状态文件中，进程中断后再次运行继续轮询同一个任务，不重复提交
+- 结果文件逐行下载，每个请求的结果到达即回调，不等整个文件下载完
+"""
+
+import json
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+
+from modules.artifact_io import sidecar_path, write_text
+from modules.llm_cache import LLMCache
+from modules.http_transport import RETRYABLE_STATUS
+from modules.llm_client import LLMClient, LLMError
+from modules.logger import get_logger
+
+CHAT_SUFFIX = "/chat/completions"
+DEFAULT_COMPLETION_WINDOW = "24h"
+DEFAULT_POLL_INTERVAL = 60.0  # 秒
+TERMINAL_STATUS = {"completed", "failed", "expired", "cancelled"}
+
+logger = get_logger(__name__)
+
+
+class LLMBatch:
+    """
+    chat/completions 批处理任务
+
+    用法:
+        batch = LLMBatch(client, "cache/llm_batches/prompt_image.json")
+        batch.run({"chapter_001": client.payload(messages, **params)}, on_result)
+    """
+
+    def __init__(self, client: LLMClient, state_path: str, poll_interval: float = DEFAULT_POLL_INTERVAL,
+                 completion_window: str = DEFAULT_COMPLETION_WINDOW, max_wait: Optional[float] = None):
+        """
+        初始化批处理任务
+
+        Args:
+            client: 同步接口使用的客户端，其 api_url 以 /chat/completions 结尾
+            state_path: 状态文件路径（记录已提交的任务，用于中断后续跑）
+            poll_interval: 轮询任务状态的间隔（秒）
+            completion_window: 提交时声明的完成时限
+            max_wait: 本次运行最多等待的秒数，None 表示等到任务结束；超时后保留状态文件，下次继续
+        """
+        if not client.api_url.endswith(CHAT_SUFFIX):
+            raise ValueError(f"无法从 {client.api_url} 推出批处理接口地址")
+        self.client = client
+        self.base_url = client.api_url[:-len(CHAT_SUFFIX)]
+        self.endpoint = urlparse(client.api_url).path
+        self.state_path = Path(state_path)
+        self.poll_interval = poll_interval
+        self.completion_window = completion_window
+        self.max_wait = max_wait
+
+    def _request(self, method: str, path: str, headers: Optional[Dict[str, str]] = None,
+                 **kwargs) -> requests.Response:
+        """
+        经共享传输层请求批处理接口：GET 按传输层策略重试；提交类的 POST 不重试，避免重复创建任务
+        （批处理管理接口调用次数少，不经过限流器）
+        """
+        retries = self.client.max_retries if method == "GET" else 0
+        try:
+            response = self.client.transport.request(method, self.base_url + path, timeout=self.client.timeout,
+                                                     headers=headers or self.client.headers, retries=retries,
+                                                     **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise LLMError(f"批处理请求失败: {e}", retryable=True) from e
+        if response.status_code != 200:
+            raise LLMError(f"批处理接口错误: {response.status_code} {response.text[:500]}",
+                           status_code=response.status_code, retryable=response.status_code in RETRYABLE_STATUS)
+        return response
+
+    def submit(self, payloads: Dict[str, Dict[str, Any]]) -> str:
+        """
+        上传任务文件并提交批处理任务
+
+        Args:
+            payloads: {custom_id: chat/completions 请求体}
+
+        Returns:
+            任务ID
+        """
+        lines = [json.dumps({"custom_id": custom_id, "method": "POST", "url": self.endpoint, "body": payload},
+                            ensure_ascii=False) for custom_id, payload in payloads.items()]
+        data = ("\n".join(lines) + "\n").encode("utf-8")
+        # 客户端默认的 content-type 为 application/json，上传时去掉，由 requests 生成 multipart 边界
+        headers = {k: v for k, v in self.client.headers.items() if k.lower() != "content-type"}
+        uploaded = self._request("POST", "/files", data={"purpose": "batch"},
+                                 files={"file": ("batch.jsonl", data, "application/jsonl")},
+                                 headers=headers).json()
+        batch = self._request("POST", "/batches", json={
+            "input_file_id": uploaded["id"],
+            "endpoint": self.endpoint,
+            "completion_window": self.completion_window,
+        }).json()
+        logger.info(f"已提交批处理任务 {batch['id']}: {len(payloads)} 个请求，任务文件 {len(data)} 字节")
+        return batch["id"]
+
+    def status(self, batch_id: str) -> Dict[str, Any]:
+        """查询任务状态（status、request_counts、output_file_id、error_file_id 等）"""
+        return self._request("GET", f"/batches/{batch_id}").json()
+
+    def results(self, file_id: str) -> Iterator[Tuple[str, Optional[Dict[str, Any]], Optional[str]]]:
+        """
+        逐行下载结果文件
+
+        Args:
+            file_id: output_file_id 或 error_file_id
+
+        Yields:
+            (custom_id, 回复JSON, 错误信息)；成功时错误信息为None，失败时回复为None
+        """
+        response = self._request("GET", f"/files/{file_id}/content", stream=True)
+        try:
+            for line in response.iter_lines():
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                body = (item.get("response") or {}).get("body")
+                status_code = (item.get("response") or {}).get("status_code")
+                if item.get("error") or status_code != 200 or not isinstance(body, dict) or body.get("error"):
+                    error = item.get("error") or (body or {}).get("error") or f"status {status_code}"
+                    yield item.get("custom_id"), None, str(error)
+                else:
+                    yield item.get("custom_id"), body, None
+        finally:
+            response.close()
+
+    def wait(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        """
+        轮询直到任务结束
+
+        Returns:
+            结束时的任务状态；超过 max_wait 仍未结束时返回None
+        """
+        started = time.monotonic()
+        while True:
+            batch = self.status(batch_id)
+            counts = batch.get("request_counts") or {}
+            logger.info(f"批处理任务 {batch_id}: {batch.get('status')} "
+                        f"({counts.get('completed', 0)}/{counts.get('total', '?')})")
+            if batch.get("status") in TERMINAL_STATUS:
+                return batch
+            if self.max_wait is not None and time.monotonic() - started >= self.max_wait:
+                return None
+            time.sleep(self.poll_interval)
+
+    def _load_state(self) -> Optional[Dict[str, Any]]:
+        if not self.state_path.exists():
+            return None
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"批处理状态文件无法读取，忽略: {e}")
+            return None
+
+    def _save_state(self, batch_id: str, payloads: Dict[str, Dict[str, Any]]) -> None:
+        state = {"batch_id": batch_id, "submitted_at": time.time(),
+                 "requests": {custom_id: LLMCache.make_key(payload) for custom_id, payload in payloads.items()}}
+        write_text(self.state_path, json.dumps(state, ensure_ascii=False, indent=2))
+
+    def _collect(self, batch: Dict[str, Any], payloads: Dict[str, Dict[str, Any]], keys: Dict[str, str],
+                 on_result: Callable[[str, Dict[str, Any]], Any], done: Dict[str, bool]) -> None:
+        """读取结束任务的结果；只回调 键与当前请求一致 的结果"""
+        for file_key in ("output_file_id", "error_file_id"):
+            if not batch.get(file_key):
+                continue
+            for custom_id, result, error in self.results(batch[file_key]):
+                payload = payloads.get(custom_id)
+                if payload is None or keys.get(custom_id) != LLMCache.make_key(payload):
+                    continue  # 提交后请求已变化（提示词或输入改过），结果作废
+                if error is not None:
+                    logger.error(f"批处理请求 {custom_id} 失败: {error}")
+                    done[custom_id] = False
+                    continue
+                truncated = any(c.get("finish_reason") == "length" for c in result.get("choices") or [])
+                if self.client.cache is not None and not truncated:
+                    self.client.cache.put(payload, result)
+                done[custom_id] = bool(on_result(custom_id, result))
+
+    def run(self, payloads: Dict[str, Dict[str, Any]],
+            on_result: Callable[[str, Dict[str, Any]], Any]) -> Dict[str, bool]:
+        """
+        批量执行请求：缓存命中的直接回调，其余提交为一个批处理任务（或继续上次未结束的任务）
+
+        Args:
+            payloads: {custom_id: 请求体}
+            on_result: 每个请求成功返回时调用 on_result(custom_id, 回复JSON)，返回值表示是否处理成功
+
+        Returns:
+            {custom_id: 是否成功}；本次运行未结束的请求不在其中
+        """
+        done: Dict[str, bool] = {}
+        pending = {}
+        for custom_id, payload in payloads.items():
+            cached = self.client.cache.get(payload) if self.client.cache is not None else None
+            if cached is not None:
+                done[custom_id] = bool(on_result(custom_id, cached))
+            else:
+                pending[custom_id] = payload
+
+        if not pending:
+            return done
+        keys = {custom_id: LLMCache.make_key(payload) for custom_id, payload in pending.items()}
+        state = self._load_state()
+        if state is not None and not any(state.get("requests", {}).get(cid) == key for cid, key in keys.items()):
+            logger.info(f"上次的批处理任务 {state['batch_id']} 不含当前需要的请求，不再等待")
+            state = None
+        if state is not None:
+            logger.info(f"继续上次提交的批处理任务 {state['batch_id']}")
+            submitted = state.get("requests") or {}
+        else:
+            state = {"batch_id": self.submit(pending)}
+            self._save_state(state["batch_id"], pending)
+            submitted = keys
+
+        batch = self.wait(state["batch_id"])
+        if batch is None:
+            logger.info(f"批处理任务 {state['batch_id']} 尚未结束，下次运行继续轮询")
+            return done
+        if batch.get("status") != "completed":
+            logger.error(f"批处理任务 {state['batch_id']} 结束状态: {batch.get('status')} {batch.get('errors') or ''}")
+        self._collect(batch, pending, submitted, on_result, done)
+        self.state_path.unlink(missing_ok=True)
+        sidecar_path(self.state_path).unlink(missing_ok=True)
+        left = [custom_id for custom_id in pending
+                if custom_id not in done and submitted.get(custom_id) != keys[custom_id]]
+        if left:
+            # 续跑的旧任务不包含（或提交后已变化）的请求，再提交一个任务
+            logger.info(f"{len(left)} 个请求不在上次的任务中，提交新任务")
+            done.update(self.run({custom_id: pending[custom_id] for custom_id in left}, on_result))
+        return done
@@ -0,0 +1,207 @@
+"""
+LLM 响应缓存模块
+按 模型 + 全部消息（系统提示词、用户输入、assistant 预填充）+ 生成参数（temperature、max_tokens 等）
+的哈希把 chat/completions 的回复缓存到磁盘。输出文件被删除或无关改动后重跑时直接命中，不再付费；
+系统提示词改动后键随之变化，只有受影响的请求重新生成。
+
+每个条目记录系统提示词版本（提示词内容哈希），清理时按命名空间删除旧版本提示词产生的条目。
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from modules.config import get_config
+from modules.logger import get_logger
+
+DEFAULT_CACHE_ROOT = "cache/llm"
+
+# 不影响回复内容的请求参数
+IGNORED_PARAMS = {"stream", "stream_options"}
+
+
+def prompt_version(text: str) -> str:
+    """提示词版本：内容的 sha256 前12位"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+
+
+def _system_prompt(payload: Dict[str, Any]) -> str:
+    return "".join(m.get("content") or "" for m in payload.get("messages", []) if m.get("role") == "system")
+
+
+class LLMCache:
+    """
+    chat/completions 回复的磁盘缓存
+
+    条目存放在 <root>/<namespace>/<键前两位>/<键>.json，内容为回复JSON和元数据
+    （prompt_version、模型、token 用量、写入时间）。
+    """
+
+    def __init__(self, root: str = DEFAULT_CACHE_ROOT, namespace: str = "default"):
+        """
+        初始化缓存
+
+        Args:
+            root: 缓存根目录
+            namespace: 命名空间，通常为系统提示词文件名（如 prompt_change），按命名空间清理旧版本
+        """
+        self.logger = get_logger(__name__)
+        self.root = Path(root) / namespace
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "saved_tokens": 0}
+
+    @staticmethod
+    def make_key(payload: Dict[str, Any]) -> str:
+        """
+        计算缓存键
+
+        Args:
+            payload: 请求体（model、messages 及其他参数）
+
+        Returns:
+            sha256十六进制字符串
+        """
+        params = {k: v for k, v in payload.items() if k not in IGNORED_PARAMS}
+        data = json.dumps(params, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def contains(self, key: str) -> bool:
+        """检查条目是否存在（不计入命中统计）"""
+        return self._entry_path(key).exists()
+
+    def get(self, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        查找缓存的回复
+
+        Args:
+            payload: 请求体
+
+        Returns:
+            接口返回的JSON；未命中时返回None
+        """
+        key = self.make_key(payload)
+        try:
+            with open(self._entry_path(key), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            with self._lock:
+                self._stats["misses"] += 1
+            return None
+        usage = entry["response"].get("usage") or {}
+        with self._lock:
+            self._stats["hits"] += 1
+            self._stats["saved_tokens"] += usage.get("total_tokens") or 0
+        self.logger.info(f"LLM缓存命中: {self.namespace}/{key[:12]}")
+        return entry["response"]
+
+    def put(self, payload: Dict[str, Any], response: Dict[str, Any]) -> str:
+        """
+        写入回复（先写临时文件再改名）
+
+        Args:
+            payload: 请求体
+            response: 接口返回的JSON
+
+        Returns:
+            缓存键
+        """
+        key = self.make_key(payload)
+        path = self._entry_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        entry = {
+            "key": key,
+            "model": payload.get("model"),
+            "prompt_version": prompt_version(_system_prompt(payload)),
+            "stored_at": time.time(),
+            "response": response,
+        }
+        temp_path = path.with_name(f".{key}.{uuid.uuid4().hex[:8]}.tmp")
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(temp_path, path)
+        finally:
+            temp_path.unlink(missing_ok=True)
+        with self._lock:
+            self._stats["stores"] += 1
+        return key
+
+    def discard(self, payload: Dict[str, Any]) -> None:
+        """删除条目（如回复内容无法使用时，避免下次命中同样的结果）"""
+        self._entry_path(self.make_key(payload)).unlink(missing_ok=True)
+
+    def _entries(self) -> List[Path]:
+        return list(self.root.glob("??/*.json")) if self.root.exists() else []
+
+    def invalidate(self, current_version: str) -> int:
+        """
+        删除不是由当前版本系统提示词产生的条目
+
+        Args:
+            current_version: 当前提示词版本（prompt_version(提示词内容)）
+
+        Returns:
+            删除的条目数
+        """
+        removed = 0
+        for path in self._entries():
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    version = json.load(f).get("prompt_version")
+            except (FileNotFoundError, json.JSONDecodeError):
+                version = None
+            if version != current_version:
+                path.unlink(missing_ok=True)
+                removed += 1
+        if removed:
+            self.logger.info(f"LLM缓存 {self.namespace}: 删除 {removed} 个旧版本提示词的条目")
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        命中统计
+
+        Returns:
+            hits / misses / stores / saved_tokens / hit_rate / entries
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["entries"] = len(self._entries())
+        return stats
+
+
+_caches: Dict[str, LLMCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_llm_cache(namespace: str) -> Optional[LLMCache]:
+    """
+    获取按 settings.yaml 中 llm_cache 配置创建的缓存（进程内按命名空间单例）
+
+    Args:
+        namespace: 命名空间，通常为系统提示词文件名
+
+    Returns:
+        缓存实例；llm_cache.enabled 为 false 时返回None
+    """
+    try:
+        cache_config = get_config().get("llm_cache", {}) or {}
+    except FileNotFoundError:
+        cache_config = {}
+    if not cache_config.get("enabled", True):
+        return None
+    with _caches_lock:
+        if namespace not in _caches:
+            _caches[namespace] = LLMCache(cache_config.get("root", DEFAULT_CACHE_ROOT), namespace)
+        return _caches[namespace]
@@ -0,0 +1,315 @@
+"""
+LLM 对话接口客户端
+面向 OpenAI 兼容的 chat/completions 接口（火山方舟、Claude 中转等）：
+
+- 请求经 modules.http_transport 的共享传输层发送（按主机的连接池、长连接），不再每个请求重新握手
+- 每个请求设置连接超时和读取超时
+- 连接错误、超时、408/429/5xx 按带抖动的指数退避重试，优先遵循 Retry-After
+- 请求受 modules.rate_limit 中对应服务商的令牌桶和并发槽位约束，429 时自动降速
+- 可选的 modules.llm_cache 磁盘缓存：相同请求直接返回缓存的回复，不占用限流额度
+- 支持 SSE 流式输出（stream=true），每个文本增量到达时回调，可配合 modules.json_stream 边生成边解析
+
+协程接口把阻塞的HTTP请求放到线程中执行，退避和等待限流时只挂起协程，不占用线程。
+"""
+
+import asyncio
+import json
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import requests
+
+from modules.http_transport import RETRYABLE_STATUS, HTTPTransport, backoff_delay, get_transport, retry_after
+from modules.llm_cache import LLMCache
+from modules.logger import get_logger
+from modules.rate_limit import get_rate_limiter
+
+DEFAULT_TIMEOUT = (10.0, 900.0)  # (连接, 读取) 秒；长上下文模型单次生成可达数分钟
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BACKOFF_BASE = 2.0
+DEFAULT_BACKOFF_CAP = 60.0
+
+logger = get_logger(__name__)
+
+
+class LLMError(Exception):
+    """LLM 请求失败"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, retryable: bool = False,
+                 retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+class LLMClient:
+    """
+    chat/completions 客户端，线程和协程均可并发使用同一个实例
+
+    用法:
+        client = LLMClient(API_URL, API_KEY, MODEL, limiter="ark")
+        result = client.chat(messages)                 # 同步
+        result = await client.chat_async(messages)     # 协程
+        text = LLMClient.content(result)
+    """
+
+    def __init__(self, api_url: str, api_key: str, model: str, limiter: Optional[str] = None,
+                 timeout: Tuple[float, float] = DEFAULT_TIMEOUT, max_retries: int = DEFAULT_MAX_RETRIES,
+                 backoff_base: float = DEFAULT_BACKOFF_BASE, backoff_cap: float = DEFAULT_BACKOFF_CAP,
+                 headers: Optional[Dict[str, str]] = None, cache: Optional[LLMCache] = None,
+                 transport: Optional[HTTPTransport] = None):
+        """
+        初始化客户端
+
+        Args:
+            api_url: chat/completions 接口地址
+            api_key: API密钥（Bearer）
+            model: 模型名称
+            limiter: 限流器名称（见 modules.rate_limit），None 表示不限流
+            timeout: (连接超时, 读取超时) 秒
+            max_retries: 失败后的最大重试次数
+            backoff_base: 退避基数（秒）
+            backoff_cap: 单次退避上限（秒）
+            headers: 附加请求头
+            cache: 回复缓存，None 表示不缓存
+            transport: HTTP传输层，None 表示使用全局共享的传输层（连接池大小见 http.pool_size）
+        """
+        self.api_url = api_url
+        self.model = model
+        self.limiter = get_rate_limiter(limiter) if limiter else None
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.cache = cache
+        self.transport = transport or get_transport()
+        self.headers = {
+            "Authorization": f"Bearer {api_key}",
+            "content-type": "application/json",
+            **(headers or {}),
+        }
+
+    def payload(self, messages: List[Dict[str, Any]], **params) -> Dict[str, Any]:
+        """请求体：模型 + 消息 + 其他参数（temperature、max_tokens 等）"""
+        return {"model": self.model, "messages": messages, **params}
+
+    def _send(self, payload: Dict[str, Any], stream: bool = False):
+        try:
+            # 重试由本客户端按限流器和退避策略处理，传输层不再重试
+            response = self.transport.request("POST", self.api_url, json=payload, headers=self.headers,
+                                              timeout=self.timeout, stream=stream, retries=0)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise LLMError(f"请求失败: {e}", retryable=True) from e
+        if response.status_code != 200:
+            raise LLMError(
+                f"API error: {response.status_code} {response.text[:500]}",
+                status_code=response.status_code,
+                retryable=response.status_code in RETRYABLE_STATUS,
+                retry_after=retry_after(response),
+            )
+        return response
+
+    def _log_usage(self, usage: Optional[Dict[str, Any]]) -> None:
+        if usage:
+            logger.info(f"Total tokens: {usage.get('total_tokens')}, prompt tokens: {usage.get('prompt_tokens')}")
+
+    def _post(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """发送一次请求，失败时抛出 LLMError（retryable 表示是否值得重试）"""
+        return self._parse(self._send(payload))
+
+    def _parse(self, response) -> Dict[str, Any]:
+        try:
+            result = response.json()
+        except (ValueError, json.JSONDecodeError) as e:
+            # 响应体被截断
+            raise LLMError(f"响应不是有效JSON: {e}", status_code=200, retryable=True) from e
+        if result.get("error"):
+            raise LLMError(f"API error: {result['error']}", status_code=200)
+        self._log_usage(result.get("usage"))
+        return result
+
+    def _post_stream(self, payload: Dict[str, Any], on_text: Optional[Callable[[str], None]]) -> Dict[str, Any]:
+        """
+        发送一次流式请求，逐个解析 SSE 事件并回调文本增量
+
+        已经回调过文本后连接中断时抛出不可重试的 LLMError：重试会从头生成不同的文本，
+        调用方已据此启动的下游工作无法撤回，由调用方决定是否整体重做。
+        """
+        response = self._send({**payload, "stream": True}, stream=True)
+        if "text/event-stream" not in response.headers.get("Content-Type", ""):
+            # 不支持流式的服务会忽略 stream 参数，直接返回完整JSON
+            result = self._parse(response)
+            if on_text is not None:
+                on_text(self.content(result))
+            return result
+        parts: List[str] = []
+        usage = None
+        finish_reason = None
+        finished = False
+        try:
+            for line in response.iter_lines(chunk_size=None):  # 数据到达即处理，不攒满缓冲区
+                if not line.startswith(b"data:"):
+                    continue  # 空行、注释（: keep-alive）和 event: 行
+                data = line[5:].strip()
+                if data == b"[DONE]":
+                    finished = True
+                    break
+                chunk = json.loads(data)
+                if chunk.get("error"):
+                    raise LLMError(f"API error: {chunk['error']}", status_code=200, retryable=not parts)
+                usage = chunk.get("usage") or usage
+                for choice in chunk.get("choices") or []:
+                    finish_reason = choice.get("finish_reason") or finish_reason
+                    delta = (choice.get("delta") or {}).get("content")
+                    if delta:
+                        parts.append(delta)
+                        if on_text is not None:
+                            on_text(delta)
+        except (requests.RequestException, ValueError) as e:
+            raise LLMError(f"流式响应中断: {e}", status_code=200, retryable=not parts) from e
+        finally:
+            response.close()
+        if not finished and finish_reason is None:
+            raise LLMError("流式响应未正常结束", status_code=200, retryable=not parts)
+        self._log_usage(usage)
+        return {
+            "choices": [{"message": {"role": "assistant", "content": "".join(parts)}, "finish_reason": finish_reason}],
+            "usage": usage,
+        }
+
+    def _cached(self, payload: Dict[str, Any],
+                on_text: Optional[Callable[[str], None]] = None) -> Optional[Dict[str, Any]]:
+        """查找缓存；流式调用命中时把完整文本作为一个增量回调"""
+        if self.cache is None:
+            return None
+        result = self.cache.get(payload)
+        if result is not None and on_text is not None:
+            on_text(self.content(result))
+        return result
+
+    def _store(self, payload: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Any]:
+        """写入缓存；因长度上限被截断的回复不缓存"""
+        truncated = any(c.get("finish_reason") == "length" for c in result.get("choices") or [])
+        if self.cache is not None and not truncated:
+            try:
+                self.cache.put(payload, result)
+            except OSError as e:
+                logger.warning(f"写入LLM缓存失败: {e}")
+        return result
+
+    def _should_retry(self, error: LLMError, attempt: int) -> Optional[float]:
+        """返回重试前的等待秒数，不再重试时返回None"""
+        if not error.retryable or attempt > self.max_retries:
+            return None
+        delay = backoff_delay(attempt, self.backoff_base, self.backoff_cap, error.retry_after)
+        logger.warning(f"{error}，{delay:.1f} 秒后第 {attempt} 次重试")
+        return delay
+
+    def _with_retries(self, send: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        attempt = 0
+        while True:
+            try:
+                if self.limiter is None:
+                    return send()
+                with self.limiter.slot():
+                    return send()
+            except LLMError as e:
+                attempt += 1
+                delay = self._should_retry(e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+
+    async def _with_retries_async(self, send: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        attempt = 0
+        while True:
+            try:
+                if self.limiter is None:
+                    return await asyncio.to_thread(send)
+                async with self.limiter.async_slot():
+                    return await asyncio.to_thread(send)
+            except LLMError as e:
+                attempt += 1
+                delay = self._should_retry(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+
+    def chat(self, messages: List[Dict[str, Any]], **params) -> Dict[str, Any]:
+        """
+        同步调用 chat/completions
+
+        Args:
+            messages: 消息列表
+            **params: 其他请求参数
+
+        Returns:
+            接口返回的JSON
+
+        Raises:
+            LLMError: 不可重试的错误或重试次数用尽
+        """
+        payload = self.payload(messages, **params)
+        cached = self._cached(payload)
+        if cached is not None:
+            return cached
+        return self._store(payload, self._with_retries(lambda: self._post(payload)))
+
+    async def chat_async(self, messages: List[Dict[str, Any]], **params) -> Dict[str, Any]:
+        """
+        协程版 chat：HTTP请求在线程中执行，限流等待和退避只挂起协程
+
+        Args:
+            messages: 消息列表
+            **params: 其他请求参数
+
+        Returns:
+            接口返回的JSON
+
+        Raises:
+            LLMError: 不可重试的错误或重试次数用尽
+        """
+        payload = self.payload(messages, **params)
+        cached = self._cached(payload)
+        if cached is not None:
+            return cached
+        return self._store(payload, await self._with_retries_async(lambda: self._post(payload)))
+
+    def chat_stream(self, messages: List[Dict[str, Any]], on_text: Optional[Callable[[str], None]] = None,
+                    **params) -> Dict[str, Any]:
+        """
+        流式调用 chat/completions
+
+        收到第一个文本增量之前的失败（连接、429、5xx）照常重试；之后的中断不重试，直接抛出。
+
+        Args:
+            messages: 消息列表
+            on_text: 每个文本增量到达时的回调
+            **params: 其他请求参数
+
+        Returns:
+            与非流式接口相同结构的结果（choices[0].message.content 为完整文本）
+
+        Raises:
+            LLMError: 不可重试的错误或重试次数用尽
+        """
+        payload = self.payload(messages, **params)
+        cached = self._cached(payload, on_text)
+        if cached is not None:
+            return cached
+        return self._store(payload, self._with_retries(lambda: self._post_stream(payload, on_text)))
+
+    async def chat_stream_async(self, messages: List[Dict[str, Any]],
+                                on_text: Optional[Callable[[str], None]] = None, **params) -> Dict[str, Any]:
+        """协程版 chat_stream；on_text 在执行请求的工作线程中调用"""
+        payload = self.payload(messages, **params)
+        cached = self._cached(payload, on_text)
+        if cached is not None:
+            return cached
+        return self._store(payload, await self._with_retries_async(lambda: self._post_stream(payload, on_text)))
+
+    @staticmethod
+    def content(result: Dict[str, Any]) -> str:
+        """取出第一条回复的文本"""
+        return result["choices"][0]["message"]["content"]
@@ -0,0 +1,237 @@
+"""
+媒体时长读取模块
+直接解析 RIFF/WAV 头和 MP4 的 moov/mvhd box 获取时长，避免每次启动 ffprobe 进程；
+未知格式才回退到 ffprobe。结果按 (路径, 大小, 修改时间) 缓存
+"""
+
+import os
+import struct
+import subprocess
+import threading
+from typing import Dict, Optional, Tuple
+
+from modules.logger import get_logger
+
+logger = get_logger(__name__)
+
+_duration_cache: Dict[Tuple[str, int, int], float] = {}
+_cache_lock = threading.Lock()
+_stats = {"native": 0, "ffprobe": 0, "cached": 0}
+
+# MP4中需要向下查找mvhd的容器box
+_MP4_CONTAINERS = {b"moov"}
+
+
+def read_wav_data_chunk(path: str) -> Optional[Tuple[int, int, int]]:
+    """
+    解析RIFF/WAV头，定位data块
+
+    Args:
+        path: 文件路径
+
+    Returns:
+        (每秒字节数, 头中声明的data大小, 文件中实际剩余的字节数)；不是WAV或头部不完整时返回None
+    """
+    with open(path, "rb") as f:
+        header = f.read(12)
+        if len(header) < 12 or header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+            return None
+
+        byte_rate = None
+        while True:
+            chunk_header = f.read(8)
+            if len(chunk_header) < 8:
+                return None
+            chunk_id, chunk_size = struct.unpack("<4sI", chunk_header)
+            if chunk_id == b"fmt ":
+                fmt = f.read(chunk_size)
+                if len(fmt) < 12:
+                    return None
+                byte_rate = struct.unpack("<I", fmt[8:12])[0]
+                if chunk_size % 2:
+                    f.seek(1, os.SEEK_CUR)
+            elif chunk_id == b"data":
+                if not byte_rate:
+                    return None
+                return byte_rate, chunk_size, os.path.getsize(path) - f.tell()
+            else:
+                f.seek(chunk_size + (chunk_size % 2), os.SEEK_CUR)
+
+
+def read_wav_duration(path: str) -> Optional[float]:
+    """
+    解析RIFF/WAV头计算时长
+
+    Args:
+        path: 文件路径
+
+    Returns:
+        时长（秒）；不是WAV或头部不完整时返回None
+    """
+    chunk = read_wav_data_chunk(path)
+    if chunk is None:
+        return None
+    byte_rate, declared, remaining = chunk
+    # 流式写出的WAV头里data大小可能是占位值，以实际文件剩余字节为上限
+    data_size = min(declared, remaining) if declared else remaining
+    return data_size / byte_rate
+
+
+def _iter_boxes(f, start: int, end: int):
+    """遍历 [start, end) 范围内的box，产出 (类型, 内容起点, box终点)"""
+    offset = start
+    while offset + 8 <= end:
+        f.seek(offset)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, box_type = struct.unpack(">I4s", header)
+        header_size = 8
+        if size == 1:
+            large = f.read(8)
+            if len(large) < 8:
+                return
+            size = struct.unpack(">Q", large)[0]
+            header_size = 16
+        elif size == 0:
+            size = end - offset
+        if size < header_size:
+            return
+        yield box_type, offset + header_size, offset + size
+        offset += size
+
+
+def read_mp4_duration(path: str) -> Optional[float]:
+    """
+    解析MP4的 moov/mvhd box 计算时长（moov位于文件头或文件尾均可）
+
+    Args:
+        path: 文件路径
+
+    Returns:
+        时长（秒）；不是MP4或缺少moov/mvhd时返回None
+    """
+    file_size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        head = f.read(8)
+        if len(head) < 8 or head[4:8] not in (b"ftyp", b"moov", b"mdat", b"free", b"wide"):
+            return None
+
+        def find_mvhd(start: int, end: int) -> Optional[float]:
+            for box_type, body_start, box_end in _iter_boxes(f, start, end):
+                if box_type == b"mvhd":
+                    f.seek(body_start)
+                    version = f.read(1)
+                    if not version:
+                        return None
+                    f.seek(3, os.SEEK_CUR)  # flags
+                    if version[0] == 1:
+                        data = f.read(28)
+                        if len(data) < 28:
+                            return None
+                        _, _, timescale, duration = struct.unpack(">QQIQ", data)
+                    else:
+                        data = f.read(16)
+                        if len(data) < 16:
+                            return None
+                        _, _, timescale, duration = struct.unpack(">IIII", data)
+                    if not timescale:
+                        return None
+                    return duration / timescale
+                if box_type in _MP4_CONTAINERS:
+                    return find_mvhd(body_start, box_end)
+            return None
+
+        return find_mvhd(0, file_size)
+
+
+_NATIVE_READERS = {
+    ".wav": read_wav_duration,
+    ".mp4": read_mp4_duration,
+    ".m4a": read_mp4_duration,
+    ".mov": read_mp4_duration,
+}
+
+
+def probe_duration_ffprobe(path: str) -> float:
+    """用ffprobe获取时长（秒），失败返回0.0"""
+    cmd = [
+        'ffprobe', '-v', 'error', '-show_entries', 'format=duration',
+        '-of', 'default=noprint_wrappers=1:nokey=1', str(path)
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        return float(result.stdout.strip())
+    except Exception:
+        return 0.0
+
+
+def get_media_duration(path: str, probe: bool = True) -> float:
+    """
+    获取媒体文件时长（秒）
+
+    优先在进程内解析WAV/MP4头，未知格式或解析失败时回退到ffprobe。
+    结果按 (路径, 大小, 修改时间) 缓存，文件被重写后自动失效。
+
+    Args:
+        path: 媒体文件路径
+        probe: 是否允许回退到ffprobe（只读的计划模式不启动任何子进程）
+
+    Returns:
+        时长（秒）；文件不存在或无法解析时返回0.0
+    """
+    path = str(path)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return 0.0
+
+    cache_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    with _cache_lock:
+        if cache_key in _duration_cache:
+            _stats["cached"] += 1
+            return _duration_cache[cache_key]
+
+    duration = None
+    reader = _NATIVE_READERS.get(os.path.splitext(path)[1].lower())
+    if reader is not None:
+        try:
+            duration = reader(path)
+        except (OSError, struct.error) as e:
+            logger.debug(f"解析媒体头失败，回退到ffprobe: {path}: {e}")
+            duration = None
+    if duration is not None and duration <= 0:
+        # 头里的时长为0（如分片MP4的mvhd不记录总时长），交给ffprobe
+        logger.debug(f"媒体头时长为0，回退到ffprobe: {path}")
+        duration = None
+
+    if duration is not None:
+        source = "native"
+    elif not probe:
+        return 0.0
+    else:
+        duration = probe_duration_ffprobe(path)
+        source = "ffprobe"
+
+    with _cache_lock:
+        _stats[source] += 1
+        if duration > 0:
+            _duration_cache[cache_key] = duration
+    return duration
+
+
+def get_stats() -> Dict[str, int]:
+    """
+    时长读取统计
+
+    Returns:
+        native（进程内解析）/ ffprobe（回退次数）/ cached（缓存命中）
+    """
+    with _cache_lock:
+        return dict(_stats)
+
+
+def clear_cache() -> None:
+    """清空时长缓存"""
+    with _cache_lock:
+        _duration_cache.clear()
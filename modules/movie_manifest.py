@@ -0,0 +1,152 @@
+"""
+完整电影增量拼接清单模块
+记录已拼入完整电影的章节（源视频大小/修改时间、时长、在电影中的起点）以及每章混好背景音乐的分段文件。
+再次生成时只为新增、变化或起点发生偏移的章节重新混音，其余章节直接复用分段，最终电影由分段流复制拼接
+"""
+
+import json
+import os
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+MANIFEST_VERSION = 1
+
+# 起点偏移容差（秒），小于该值视为未偏移
+START_TOLERANCE = 0.001
+
+
+def file_signature(path: str) -> Dict[str, int]:
+    """
+    文件签名（大小 + 修改时间），用于判断章节视频是否被重新生成
+
+    Args:
+        path: 文件路径
+
+    Returns:
+        {"size": ..., "mtime_ns": ...}
+    """
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def load_manifest(path: str) -> Optional[Dict[str, Any]]:
+    """
+    读取清单
+
+    Args:
+        path: 清单文件路径
+
+    Returns:
+        清单内容；文件不存在、损坏或版本不符时返回None（按全量重建处理）
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def save_manifest(path: str, manifest: Dict[str, Any]) -> None:
+    """
+    原子写入清单（先写临时文件再替换，中断时旧清单保持完整）
+
+    Args:
+        path: 清单文件路径
+        manifest: 清单内容
+    """
+    target = Path(path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = target.with_name(f".{target.name}.{uuid.uuid4().hex[:8]}.tmp")
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(temp_path, target)
+
+
+def plan_movie(chapters: Sequence[Tuple[str, str, float]], previous: Optional[Dict[str, Any]],
+               settings: Dict[str, Any], parts_dir: Optional[str]) -> Tuple[List[Dict[str, Any]], List[int]]:
+    """
+    对比上一次的清单，规划本次需要重新混音的章节
+
+    章节可复用的条件：名称和源视频路径相同、源视频签名未变、在电影中的起点未偏移、分段文件仍存在，
+    且混音设置（档位、音频码率、背景音乐签名）与上一次一致。
+    起点偏移会改变该章节对应的背景音乐位置，因此中间某章时长变化时，其后的章节都需要重新混音。
+
+    Args:
+        chapters: 按电影顺序排列的 (章节名称, 章节视频路径, 时长) 列表
+        previous: 上一次的清单，None表示没有可复用的清单
+        settings: 影响混音结果的设置
+        parts_dir: 分段文件目录；None表示不混音（无背景音乐），章节视频直接参与拼接
+
+    Returns:
+        (新清单的章节条目列表, 需要重新混音的条目下标列表)
+    """
+    reusable = {}
+    if previous and previous.get("settings") == settings:
+        reusable = {entry["name"]: entry for entry in previous.get("chapters", [])}
+
+    entries = []
+    dirty = []
+    start = 0.0
+    for name, video, duration in chapters:
+        entry = {
+            "name": name,
+            "video": str(video),
+            **file_signature(video),
+            "duration": duration,
+            "start": start,
+            "part": str(Path(parts_dir) / f"{name}.mp4") if parts_dir else None,
+        }
+        old = reusable.get(name)
+        if not (old
+                and old.get("video") == entry["video"]
+                and old.get("size") == entry["size"]
+                and old.get("mtime_ns") == entry["mtime_ns"]
+                and abs(old.get("start", -1.0) - start) < START_TOLERANCE
+                and old.get("part") == entry["part"]
+                and (entry["part"] is None or Path(entry["part"]).exists())):
+            dirty.append(len(entries))
+        entries.append(entry)
+        start += duration
+    return entries, dirty
+
+
+def build_manifest(entries: List[Dict[str, Any]], settings: Dict[str, Any], movie_path: str) -> Dict[str, Any]:
+    """
+    组装清单
+
+    Args:
+        entries: plan_movie 返回的章节条目
+        settings: 混音设置
+        movie_path: 完整电影路径
+
+    Returns:
+        清单内容
+    """
+    return {
+        "version": MANIFEST_VERSION,
+        "movie": str(movie_path),
+        "settings": settings,
+        "chapters": entries,
+    }
+
+
+def stale_parts(previous: Optional[Dict[str, Any]], entries: List[Dict[str, Any]]) -> List[str]:
+    """
+    已不再属于电影的分段文件（章节被删除或改名）
+
+    Args:
+        previous: 上一次的清单
+        entries: 本次的章节条目
+
+    Returns:
+        可删除的分段文件路径
+    """
+    if not previous:
+        return []
+    current = {entry["part"] for entry in entries}
+    return [entry["part"] for entry in previous.get("chapters", [])
+            if entry.get("part") and entry["part"] not in current]
@@ -0,0 +1,344 @@
+"""
+运行计划模块
+在真正执行前读取章节JSON、产物元数据文件和产物缓存，列出本次运行要做的全部工作：
+TTS调用、图片生成任务、缓存取回、段落视频（片段编码）和章节重新封装，并按任务台账中的历史耗时估算时间和费用。
+
+计划只读：不启动ffprobe（时长来自元数据文件或进程内解析的WAV/MP4头）、不调用任何服务商、不写任何文件。
+判断标准与 loop.py 执行时相同（verified_artifact + 时长校验），process_all_chapters 可以直接执行保存的计划。
+
+settings.yaml 示例：
+
+planner:
+  costs:
+    tts_per_char: 0.0002   # 腾讯云TTS每字费用（元）
+    image_per_job: 0.2     # 火山引擎每张图片费用（元）
+"""
+
+import json
+import os
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from modules.artifact_io import verified_artifact
+from modules.config import get_config
+
+PLAN_VERSION = 1
+
+# 章节JSON目录：pipeline.py 把合并了图片提示词的章节写到 chapters/merged/，
+# 还没合并的章节（流水线中断或只跑了一部分）仍读 chapters/processed/
+MERGED_CHAPTERS_DIR = "chapters/merged"
+PROCESSED_CHAPTERS_DIR = "chapters/processed"
+CHAPTER_PATTERN = "chapter_*_processed.json"
+
+# 动作
+GENERATE = "generate"  # 调用服务商
+FROM_CACHE = "cache"   # 从产物缓存取回
+RENDER = "render"      # 本地ffmpeg
+
+# 原因
+MISSING = "missing"    # 不存在或不完整
+STALE = "stale"        # 时长与上游不一致
+UPSTREAM = "upstream"  # 上游产物将重新生成
+
+# 没有历史记录时每类任务的默认耗时（秒）
+DEFAULT_SECONDS = {"audio": 3.0, "scene": 20.0, "video": 30.0, "chapter_video": 20.0}
+
+# 按公开价目估算的默认单价（元），可在 planner.costs 覆盖
+DEFAULT_COSTS = {"tts_per_char": 0.0002, "image_per_job": 0.2}
+
+NETWORK_KINDS = {"audio", "scene"}
+
+# 与执行时的时长校验一致
+DURATION_TOLERANCE = 1.0
+
+
+@dataclass
+class PlannedJob:
+    """计划中的一项工作，kind 与任务台账一致：audio / scene / video / chapter_video"""
+    chapter: str
+    paragraph: str
+    kind: str
+    path: str
+    action: str
+    reason: str
+    units: int = 1  # audio 为文本字数，video 为片段（场景）数
+
+
+@dataclass
+class ChapterPlan:
+    """单个章节的计划"""
+    chapter_json: str
+    chapter: str
+    chapter_no: Optional[int]
+    jobs: List[PlannedJob] = field(default_factory=list)
+
+
+@dataclass
+class RunPlan:
+    """一次运行的计划"""
+    profile: str
+    chapters: List[ChapterPlan]
+    estimate: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def jobs(self) -> List[PlannedJob]:
+        return [job for chapter in self.chapters for job in chapter.jobs]
+
+    def pending_chapters(self) -> List[ChapterPlan]:
+        """有工作要做的章节"""
+        return [chapter for chapter in self.chapters if chapter.jobs]
+
+    def counts(self) -> Dict[str, int]:
+        """按工作类型计数"""
+        jobs = self.jobs
+        return {
+            "tts_calls": sum(1 for j in jobs if j.kind == "audio" and j.action == GENERATE),
+            "tts_chars": sum(j.units for j in jobs if j.kind == "audio" and j.action == GENERATE),
+            "image_jobs": sum(1 for j in jobs if j.kind == "scene" and j.action == GENERATE),
+            "cache_fetches": sum(1 for j in jobs if j.action == FROM_CACHE),
+            "paragraph_videos": sum(1 for j in jobs if j.kind == "video"),
+            "segment_encodes": sum(j.units for j in jobs if j.kind == "video"),
+            "chapter_remuxes": sum(1 for j in jobs if j.kind == "chapter_video"),
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"version": PLAN_VERSION, **asdict(self)}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "RunPlan":
+        if data.get("version") != PLAN_VERSION:
+            raise ValueError(f"不支持的计划版本: {data.get('version')}")
+        chapters = [
+            ChapterPlan(
+                chapter_json=c["chapter_json"],
+                chapter=c["chapter"],
+                chapter_no=c.get("chapter_no"),
+                jobs=[PlannedJob(**j) for j in c["jobs"]],
+            )
+            for c in data["chapters"]
+        ]
+        return cls(profile=data["profile"], chapters=chapters, estimate=data.get("estimate", {}))
+
+    def save(self, path: str) -> None:
+        """保存为JSON（先写临时文件再替换）"""
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "RunPlan":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+
+def chapter_folder_name(chapter_info: Dict[str, Any]) -> str:
+    """章节输出目录名：<章节号数字>-<标题>，没有标题时为 <章节号数字>章"""
+    chapter_num = chapter_info["章节号"].replace("第", "").replace("章", "")
+    chapter_title = chapter_info.get("标题", "")
+    return f"{chapter_num}-{chapter_title}" if chapter_title else f"{chapter_num}章"
+
+
+def chapter_number(chapter_info: Dict[str, Any]) -> Optional[int]:
+    """章节编号（用于台账按范围查询），不是阿拉伯数字时为None"""
+    chapter_num = chapter_info["章节号"].replace("第", "").replace("章", "")
+    return int(chapter_num) if chapter_num.isdigit() else None
+
+
+def paragraph_dir_name(para: Dict[str, Any]) -> str:
+    """段落输出目录名：<序号>-<段落标题>"""
+    return f"{para['序号']}-{para['段落标题']}"
+
+
+def resolve_chapter_files(names: Optional[Sequence[str]] = None, chapters_dir: Optional[str] = None,
+                          search_dirs: Sequence[str] = (MERGED_CHAPTERS_DIR, PROCESSED_CHAPTERS_DIR)) -> List[Path]:
+    """
+    按章节逐个确定章节JSON路径：取 search_dirs 中第一个存在该文件的目录
+
+    Args:
+        names: 章节文件名（按处理顺序）；None 表示各目录中所有 chapter_*_processed.json，按文件名排序
+        chapters_dir: 指定时只在该目录中查找
+        search_dirs: 未指定 chapters_dir 时按优先级查找的目录
+
+    Returns:
+        章节JSON路径列表；所有目录都没有的章节返回最后一个目录中的路径（调用方据此报告文件不存在）
+    """
+    dirs = [Path(chapters_dir)] if chapters_dir else [Path(d) for d in search_dirs]
+    if names is None:
+        names = sorted({path.name for d in dirs if d.is_dir() for path in d.glob(CHAPTER_PATTERN)})
+    resolved = []
+    for name in names:
+        candidates = [d / name for d in dirs]
+        resolved.append(next((path for path in candidates if path.exists()), candidates[-1]))
+    return resolved
+
+
+def _duration(meta: Optional[Dict[str, Any]]) -> Optional[float]:
+    return (meta or {}).get("duration")
+
+
+def _durations_differ(a: Optional[float], b: Optional[float]) -> bool:
+    return a is not None and b is not None and abs(a - b) > DURATION_TOLERANCE
+
+
+def plan_chapter(chapter_json: str, output_base: str, profile, cache=None,
+                 tts_key: Optional[Callable[[str], str]] = None,
+                 image_key: Optional[Callable[[str], str]] = None,
+                 narration_name: str = "chapter_narration.flac") -> ChapterPlan:
+    """
+    计算单个章节需要做的工作
+
+    Args:
+        chapter_json: 章节JSON路径
+        output_base: 输出目录根路径
+        profile: 渲染档位对象
+        cache: 产物缓存，None 表示不使用缓存
+        tts_key: 文本 -> TTS缓存键
+        image_key: 提示词 -> 图片缓存键
+        narration_name: 章节旁白时间线文件名（按档位命名前）
+
+    Returns:
+        章节计划
+    """
+    with open(chapter_json, "r", encoding="utf-8") as f:
+        chapter_data = json.load(f)
+    chapter_info = chapter_data["章节信息"]
+    chapter = chapter_folder_name(chapter_info)
+    chapter_dir = Path(output_base) / chapter
+    plan = ChapterPlan(chapter_json=str(chapter_json), chapter=chapter, chapter_no=chapter_number(chapter_info))
+
+    def cached(key_func, value):
+        return cache is not None and key_func is not None and cache.contains(key_func(value))
+
+    paragraph_durations: List[Optional[float]] = []
+    any_paragraph_planned = False
+    for para in chapter_data["场景拆解"]:
+        paragraph = paragraph_dir_name(para)
+        para_dir = chapter_dir / paragraph
+        upstream = False
+
+        audio_path = para_dir / "audio.wav"
+        audio_meta = verified_artifact(audio_path, adopt=False)
+        if audio_meta is None:
+            upstream = True
+            action = FROM_CACHE if cached(tts_key, para["场景文案"]) else GENERATE
+            plan.jobs.append(PlannedJob(chapter, paragraph, "audio", str(audio_path), action, MISSING,
+                                        units=len(para["场景文案"])))
+
+        for scene in para["场景列表"]:
+            img_path = para_dir / f"scene_{scene['场景编号']}.jpg"
+            if verified_artifact(img_path, adopt=False) is None:
+                upstream = True
+                action = FROM_CACHE if cached(image_key, scene["图片提示词"]) else GENERATE
+                plan.jobs.append(PlannedJob(chapter, paragraph, "scene", str(img_path), action, MISSING))
+
+        video_path = para_dir / profile.output_name("paragraph_video.mp4")
+        video_meta = verified_artifact(video_path, adopt=False)
+        reason = None
+        if upstream:
+            reason = UPSTREAM
+        elif video_meta is None:
+            reason = MISSING
+        elif _durations_differ(_duration(video_meta), _duration(audio_meta)):
+            reason = STALE
+        if reason:
+            any_paragraph_planned = True
+            plan.jobs.append(PlannedJob(chapter, paragraph, "video", str(video_path), RENDER, reason,
+                                        units=len(para["场景列表"])))
+            paragraph_durations.append(None)
+        else:
+            paragraph_durations.append(_duration(video_meta))
+
+    if chapter_data["场景拆解"]:
+        chapter_video = chapter_dir / profile.output_name("chapter_video.mp4")
+        chapter_meta = verified_artifact(chapter_video, adopt=False)
+        narration = verified_artifact(chapter_dir / profile.output_name(narration_name), adopt=False)
+        reason = None
+        if any_paragraph_planned:
+            reason = UPSTREAM
+        elif chapter_meta is None or narration is None:
+            reason = MISSING
+        elif None not in paragraph_durations and \
+                _durations_differ(_duration(chapter_meta), sum(paragraph_durations)):
+            reason = STALE
+        if reason:
+            plan.jobs.append(PlannedJob(chapter, "", "chapter_video", str(chapter_video), RENDER, reason))
+    return plan
+
+
+def get_planner_costs() -> Dict[str, float]:
+    """planner.costs 覆盖的单价"""
+    try:
+        overrides = (get_config().get("planner", {}) or {}).get("costs", {}) or {}
+    except FileNotFoundError:
+        overrides = {}
+    return {**DEFAULT_COSTS, **overrides}
+
+
+def estimate_plan(plan: RunPlan, seconds: Optional[Dict[str, float]] = None,
+                  costs: Optional[Dict[str, float]] = None,
+                  network_workers: int = 4, cpu_workers: int = 1) -> Dict[str, Any]:
+    """
+    估算计划的耗时和费用
+
+    墙钟时间按网络池和CPU池各自满载并互相重叠估算（段落视频在本段素材就绪后即开始渲染），
+    即 max(网络总耗时 / 网络并发, CPU总耗时 / CPU并发)。
+
+    Args:
+        plan: 运行计划
+        seconds: 各类型任务的平均耗时（秒），通常来自任务台账，缺少的类型使用 DEFAULT_SECONDS
+        costs: 单价，默认见 DEFAULT_COSTS
+        network_workers: 网络池并发数
+        cpu_workers: CPU池并发数
+
+    Returns:
+        {"network_seconds", "cpu_seconds", "wall_seconds", "cost", "seconds_per_kind"}
+    """
+    per_kind = {**DEFAULT_SECONDS, **(seconds or {})}
+    costs = {**DEFAULT_COSTS, **(costs or {})}
+    network_seconds = cpu_seconds = 0.0
+    for job in plan.jobs:
+        if job.action == FROM_CACHE:
+            continue
+        if job.kind in NETWORK_KINDS:
+            network_seconds += per_kind[job.kind]
+        else:
+            cpu_seconds += per_kind[job.kind]
+    counts = plan.counts()
+    cost = counts["tts_chars"] * costs["tts_per_char"] + counts["image_jobs"] * costs["image_per_job"]
+    return {
+        "network_seconds": network_seconds,
+        "cpu_seconds": cpu_seconds,
+        "wall_seconds": max(network_seconds / max(1, network_workers), cpu_seconds / max(1, cpu_workers)),
+        "cost": round(cost, 4),
+        "seconds_per_kind": per_kind,
+    }
+
+
+def build_plan(chapter_jsons: Sequence[str], output_base: str, profile, cache=None,
+               tts_key: Optional[Callable[[str], str]] = None,
+               image_key: Optional[Callable[[str], str]] = None,
+               ledger=None, network_workers: int = 4, cpu_workers: int = 1) -> RunPlan:
+    """
+    生成整次运行的计划
+
+    Args:
+        chapter_jsons: 按处理顺序排列的章节JSON路径
+        output_base: 输出目录根路径
+        profile: 渲染档位对象
+        cache: 产物缓存
+        tts_key: 文本 -> TTS缓存键
+        image_key: 提示词 -> 图片缓存键
+        ledger: 任务台账，提供历史耗时；None 时使用默认耗时
+        network_workers: 网络池并发数
+        cpu_workers: CPU池并发数
+
+    Returns:
+        运行计划
+    """
+    chapters = [plan_chapter(path, output_base, profile, cache, tts_key, image_key) for path in chapter_jsons]
+    plan = RunPlan(profile=profile.name, chapters=chapters)
+    seconds = ledger.average_durations() if ledger is not None else None
+    plan.estimate = estimate_plan(plan, seconds, get_planner_costs(), network_workers, cpu_workers)
+    return plan
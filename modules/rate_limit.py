@@ -0,0 +1,323 @@
+"""
+服务商限流模块
+每个服务商一个令牌桶（每秒请求数 + 突发容量）和一个并发槽位上限，线程、asyncio 协程均可安全使用。
+并发上限只限制同时进行中的HTTP请求：请求返回即释放槽位。火山引擎这类异步接口提交后服务端仍在执行的任务数
+不归它管，由调用方控制（VolcengineTaskBatch 的 max_in_flight）。
+配置了 rate_limits.state_dir 时，令牌桶状态保存在该目录的文件中并用 flock 加锁，并发槽位用 flock 槽位文件实现，
+同一台机器上的多个进程共享同一组限额（进程崩溃时内核自动释放槽位）。
+
+收到限流错误（HTTP 429、火山引擎 50429/50430、腾讯云 RequestLimitExceeded 等）时速率减半并短暂暂停，
+之后每段时间无错误就逐步恢复到配置的速率（AIMD）。
+
+settings.yaml 示例：
+
+rate_limits:
+  state_dir: /tmp/agent-rate-limits   # 可选，跨进程共享限额
+  tencent_tts:
+    rate: 10            # 每秒请求数
+    burst: 10           # 突发容量，默认等于 rate
+    max_concurrent_requests: 5   # 同时进行中的HTTP请求数（旧名 max_concurrent 仍可用）
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from modules.config import get_config
+from modules.logger import get_logger
+
+try:
+    import fcntl
+except ImportError:  # Windows 上只在进程内限流
+    fcntl = None
+
+logger = get_logger(__name__)
+
+# 内置默认限额，可在 settings.yaml 的 rate_limits 中覆盖或新增
+DEFAULT_LIMITS: Dict[str, Dict[str, Any]] = {
+    "tencent_tts": {"rate": 10, "max_concurrent_requests": 10},
+    "volcengine_submit": {"rate": 2, "max_concurrent_requests": 4},  # 同时进行的提交请求，不是在途任务数
+    "volcengine_query": {"rate": 5},
+    "ark": {"rate": 1, "max_concurrent_requests": 8},
+    "claude": {"rate": 1, "max_concurrent_requests": 2},
+}
+
+# 限流错误判定
+RATE_LIMIT_HTTP_STATUS = {429}
+RATE_LIMIT_CODES = {50429, 50430, "RequestLimitExceeded", "LimitExceeded", "RequestLimitExceeded.UinLimitExceeded"}
+RATE_LIMIT_MARKERS = ("50429", "50430", "RequestLimitExceeded", "LimitExceeded", "rate limit", "Too Many Requests")
+
+# AIMD 参数
+DECREASE_FACTOR = 0.5      # 限流时速率乘以该系数
+INCREASE_STEP = 0.1        # 每次恢复增加配置速率的比例
+INCREASE_INTERVAL = 5.0    # 距上次调整速率至少这么久才恢复一步（秒）
+MIN_RATE_FACTOR = 0.05     # 速率下限为配置速率的比例
+SLOT_POLL_INTERVAL = 0.05  # 等待并发槽位的轮询间隔（秒）
+
+
+def is_rate_limited(error_or_result: Any) -> bool:
+    """
+    判断异常、HTTP响应或接口返回结果是否表示被限流
+
+    Args:
+        error_or_result: 异常、带 status_code 的响应对象或带 code 字段的字典
+
+    Returns:
+        是否为限流错误
+    """
+    if error_or_result is None:
+        return False
+    if isinstance(error_or_result, dict):
+        return error_or_result.get("code") in RATE_LIMIT_CODES
+    status = getattr(error_or_result, "status_code", None)
+    if status is not None:
+        return status in RATE_LIMIT_HTTP_STATUS
+    code = getattr(error_or_result, "code", None)
+    if code is not None and code in RATE_LIMIT_CODES:
+        return True
+    text = str(error_or_result)
+    return any(marker.lower() in text.lower() for marker in RATE_LIMIT_MARKERS)
+
+
+class RateLimiter:
+    """
+    单个服务商的令牌桶 + 并发槽位
+
+    用法:
+        limiter = get_rate_limiter("tencent_tts")
+        with limiter.slot():                 # 取令牌并占用一个并发槽位
+            resp = client.TextToVoice(req)   # 抛出限流异常时自动降速
+
+        async with limiter.async_slot():
+            ...
+    """
+
+    def __init__(self, name: str, rate: float, burst: Optional[float] = None,
+                 max_concurrent: Optional[int] = None, min_rate: Optional[float] = None,
+                 state_dir: Optional[str] = None):
+        """
+        初始化限流器
+
+        Args:
+            name: 服务商名称
+            rate: 每秒请求数（同时也是自适应恢复的上限）
+            burst: 突发容量，默认等于 max(rate, 1)
+            max_concurrent: 同时进行中的请求数上限（请求返回即释放），None 表示不限
+            min_rate: 自适应降速的下限，默认 rate * MIN_RATE_FACTOR
+            state_dir: 跨进程共享状态的目录，None 表示只在进程内限流
+        """
+        self.name = name
+        self.max_rate = float(rate)
+        self.burst = float(burst if burst is not None else max(rate, 1))
+        self.min_rate = float(min_rate if min_rate is not None else rate * MIN_RATE_FACTOR)
+        self.max_concurrent = max_concurrent
+        self.state_dir = Path(state_dir) if state_dir and fcntl is not None else None
+        if self.state_dir:
+            self.state_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._state = self._initial_state()
+        self._semaphore = threading.BoundedSemaphore(max_concurrent) if max_concurrent else None
+
+    def _initial_state(self) -> Dict[str, float]:
+        return {"tokens": self.burst, "updated": time.time(), "rate": self.max_rate,
+                "blocked_until": 0.0, "last_decrease": 0.0, "last_increase": 0.0}
+
+    @contextmanager
+    def _locked_state(self):
+        """加锁读写令牌桶状态（跨进程时为 flock 保护的状态文件）"""
+        if self.state_dir is None:
+            with self._lock:
+                yield self._state
+            return
+
+        lock_path = self.state_dir / f"{self.name}.lock"
+        state_path = self.state_dir / f"{self.name}.json"
+        with open(lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                try:
+                    with open(state_path, "r", encoding="utf-8") as f:
+                        state = json.load(f)
+                except (FileNotFoundError, json.JSONDecodeError):
+                    state = self._initial_state()
+                yield state
+                temp_path = state_path.with_name(f".{state_path.name}.{os.getpid()}.tmp")
+                with open(temp_path, "w", encoding="utf-8") as f:
+                    json.dump(state, f)
+                os.replace(temp_path, state_path)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _try_take(self) -> float:
+        """尝试取一个令牌，成功返回0，否则返回需要等待的秒数"""
+        with self._locked_state() as state:
+            now = time.time()
+            if now < state["blocked_until"]:
+                return state["blocked_until"] - now
+            elapsed = max(0.0, now - state["updated"])
+            state["tokens"] = min(self.burst, state["tokens"] + elapsed * state["rate"])
+            state["updated"] = now
+            if state["tokens"] >= 1:
+                state["tokens"] -= 1
+                return 0.0
+            return (1 - state["tokens"]) / state["rate"]
+
+    def acquire(self) -> None:
+        """阻塞直到取得一个令牌"""
+        while True:
+            wait = self._try_take()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self) -> None:
+        """协程版 acquire，等待期间不阻塞事件循环"""
+        while True:
+            wait = self._try_take()
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def report_rate_limited(self) -> None:
+        """服务商返回限流错误：速率减半、清空令牌并暂停一个发放间隔"""
+        with self._locked_state() as state:
+            now = time.time()
+            # 同一批并发请求同时被限流时只降一次
+            if now - state["last_decrease"] < 1 / state["rate"]:
+                return
+            state["rate"] = max(self.min_rate, state["rate"] * DECREASE_FACTOR)
+            state["tokens"] = 0.0
+            state["updated"] = now
+            state["blocked_until"] = now + max(1.0, 1 / state["rate"])
+            state["last_decrease"] = now
+            rate = state["rate"]
+        logger.warning(f"{self.name} 触发限流，速率降至 {rate:.2f}/秒")
+
+    def report_success(self) -> None:
+        """请求成功：距上次降速足够久时按固定步长恢复速率"""
+        with self._lock:
+            if self.state_dir is None and self._state["rate"] >= self.max_rate:
+                return
+        with self._locked_state() as state:
+            now = time.time()
+            last_change = max(state["last_decrease"], state.get("last_increase", 0.0))
+            if state["rate"] < self.max_rate and now - last_change >= INCREASE_INTERVAL:
+                state["rate"] = min(self.max_rate, state["rate"] + self.max_rate * INCREASE_STEP)
+                state["last_increase"] = now
+
+    def current_rate(self) -> float:
+        """当前（自适应调整后的）速率"""
+        with self._locked_state() as state:
+            return state["rate"]
+
+    def _try_open_slot(self):
+        """尝试占用一个并发槽位，成功返回释放用的句柄（None 表示不限并发），失败返回 False"""
+        if not self.max_concurrent:
+            return None
+        if self.state_dir is None:
+            return self._semaphore if self._semaphore.acquire(blocking=False) else False
+        for i in range(self.max_concurrent):
+            slot_file = open(self.state_dir / f"{self.name}.slot{i}", "a")
+            try:
+                fcntl.flock(slot_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return slot_file
+            except BlockingIOError:
+                slot_file.close()
+        return False
+
+    @staticmethod
+    def _release_slot(handle) -> None:
+        if handle is None:
+            return
+        if isinstance(handle, threading.Semaphore):
+            handle.release()
+        else:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+            handle.close()
+
+    def _report(self, error: Optional[BaseException]) -> None:
+        if error is None:
+            self.report_success()
+        elif is_rate_limited(error):
+            self.report_rate_limited()
+
+    @contextmanager
+    def slot(self):
+        """占用一个并发槽位并取一个令牌；块内抛出限流异常时自动降速，正常结束时计为成功"""
+        handle = self._try_open_slot()
+        while handle is False:
+            time.sleep(SLOT_POLL_INTERVAL)
+            handle = self._try_open_slot()
+        try:
+            self.acquire()
+            try:
+                yield self
+            except BaseException as e:
+                self._report(e)
+                raise
+            self._report(None)
+        finally:
+            self._release_slot(handle)
+
+    @asynccontextmanager
+    async def async_slot(self):
+        """协程版 slot"""
+        handle = self._try_open_slot()
+        while handle is False:
+            await asyncio.sleep(SLOT_POLL_INTERVAL)
+            handle = self._try_open_slot()
+        try:
+            await self.acquire_async()
+            try:
+                yield self
+            except BaseException as e:
+                self._report(e)
+                raise
+            self._report(None)
+        finally:
+            self._release_slot(handle)
+
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def _rate_limit_config() -> Dict[str, Any]:
+    try:
+        return get_config().get("rate_limits", {}) or {}
+    except FileNotFoundError:
+        return {}
+
+
+def get_rate_limiter(name: str) -> RateLimiter:
+    """
+    获取服务商的全局限流器（进程内单例）
+
+    Args:
+        name: 服务商名称，如 tencent_tts / volcengine_submit / volcengine_query / ark / claude
+
+    Returns:
+        限流器；没有配置且没有内置默认值的服务商使用每秒1次
+    """
+    with _limiters_lock:
+        if name not in _limiters:
+            config = _rate_limit_config()
+            limits = dict(DEFAULT_LIMITS.get(name, {"rate": 1}))
+            overrides = dict(config.get(name) or {})
+            if "max_concurrent" in overrides:
+                overrides.setdefault("max_concurrent_requests", overrides.pop("max_concurrent"))
+            limits.update(overrides)
+            _limiters[name] = RateLimiter(
+                name,
+                rate=limits["rate"],
+                burst=limits.get("burst"),
+                max_concurrent=limits.get("max_concurrent_requests"),
+                min_rate=limits.get("min_rate"),
+                state_dir=config.get("state_dir"),
+            )
+        return _limiters[name]
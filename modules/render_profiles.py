@@ -0,0 +1,132 @@
+"""
+渲染质量档位模块
+preview / draft / final 三个内置档位，覆盖分辨率、帧率、预放大、锐化、x264 preset/crf 和音频码率。
+可在 configs/settings.yaml 中覆盖或新增档位：
+
+render:
+  profile: final            # 默认档位
+  profiles:
+    preview:
+      width: 960
+      height: 540
+      crf: 30
+
+final 档位沿用原有文件名（paragraph_video.mp4 等），其他档位的视频输出带档位后缀
+（paragraph_video.preview.mp4），音频、图片和字幕等素材各档位共用
+"""
+
+from dataclasses import dataclass, fields, replace
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from modules.config import get_config
+
+DEFAULT_PROFILE = "final"
+
+
+@dataclass(frozen=True)
+class RenderProfile:
+    """一个渲染档位"""
+    name: str
+    width: int
+    height: int
+    fps: int
+    prescale: Optional[Tuple[int, int]]  # 运镜前的lanczos预放大尺寸，None表示不预放大
+    sharpen: Optional[str]               # unsharp滤镜参数，None表示不锐化
+    preset: str                          # x264 preset
+    crf: int                             # x264 crf
+    audio_bitrate: str                   # AAC码率
+
+    @property
+    def size(self) -> str:
+        """ffmpeg尺寸字符串，如 1920x1080"""
+        return f"{self.width}x{self.height}"
+
+    def output_name(self, filename: str) -> str:
+        """
+        档位对应的输出文件名
+
+        Args:
+            filename: final档位下的文件名，如 paragraph_video.mp4
+
+        Returns:
+            final档位原样返回，其他档位插入档位后缀，如 paragraph_video.preview.mp4
+        """
+        if self.name == DEFAULT_PROFILE:
+            return filename
+        path = Path(filename)
+        return f"{path.stem}.{self.name}{path.suffix}"
+
+
+BUILTIN_PROFILES: Dict[str, RenderProfile] = {
+    "preview": RenderProfile(
+        name="preview", width=960, height=540, fps=24,
+        prescale=None, sharpen=None,
+        preset="ultrafast", crf=30, audio_bitrate="64k",
+    ),
+    "draft": RenderProfile(
+        name="draft", width=1280, height=720, fps=30,
+        prescale=None, sharpen="3:3:1.0:3:3:0.3",
+        preset="veryfast", crf=26, audio_bitrate="96k",
+    ),
+    "final": RenderProfile(
+        name="final", width=1920, height=1080, fps=30,
+        prescale=(2400, 1350), sharpen="3:3:1.5:3:3:0.5",
+        preset="slow", crf=23, audio_bitrate="128k",
+    ),
+}
+
+
+def _render_config() -> Dict[str, Any]:
+    try:
+        return get_config().get("render", {}) or {}
+    except FileNotFoundError:
+        return {}
+
+
+def _apply_overrides(profile: RenderProfile, overrides: Dict[str, Any]) -> RenderProfile:
+    known = {f.name for f in fields(RenderProfile)} - {"name"}
+    unknown = set(overrides) - known
+    if unknown:
+        raise ValueError(f"渲染档位 {profile.name} 包含未知字段: {sorted(unknown)}")
+    values = dict(overrides)
+    if values.get("prescale") is not None:
+        values["prescale"] = tuple(values["prescale"])
+    return replace(profile, **values)
+
+
+def available_profiles() -> Dict[str, RenderProfile]:
+    """
+    内置档位合并 settings.yaml 中 render.profiles 的覆盖项
+
+    Returns:
+        档位名称到档位的映射
+    """
+    profiles = dict(BUILTIN_PROFILES)
+    for name, overrides in (_render_config().get("profiles") or {}).items():
+        base = profiles.get(name, BUILTIN_PROFILES[DEFAULT_PROFILE])
+        profiles[name] = _apply_overrides(replace(base, name=name), overrides or {})
+    return profiles
+
+
+def get_render_profile(name: Optional[str] = None) -> RenderProfile:
+    """
+    获取渲染档位
+
+    Args:
+        name: 档位名称，默认读取 render.profile，未配置时为 final
+
+    Returns:
+        渲染档位
+
+    Raises:
+        ValueError: 档位不存在
+    """
+    if isinstance(name, RenderProfile):
+        return name
+    if name is None:
+        name = _render_config().get("profile", DEFAULT_PROFILE)
+    profiles = available_profiles()
+    if name not in profiles:
+        raise ValueError(f"未知的渲染档位: {name}，可选: {', '.join(profiles)}")
+    return profiles[name]
@@ -0,0 +1,211 @@
+"""
+任务图调度模块
+将章节处理拆分为带显式依赖的产物节点（audio.wav、scene_*.jpg、paragraph_video.mp4、chapter_video.mp4），
+网络类节点与CPU类节点分别在两个有界线程池中执行，节点的依赖全部完成后立即被调度
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor, Future, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from modules.logger import get_logger
+
+# 节点所属的线程池
+NETWORK = "network"
+CPU = "cpu"
+
+# 节点状态
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+class TaskGraphError(Exception):
+    """任务图定义错误（重复节点、未知依赖、依赖成环）"""
+    pass
+
+
+@dataclass
+class TaskNode:
+    """任务图中的一个产物节点"""
+    name: str
+    func: Callable[[], Any]
+    deps: List[str] = field(default_factory=list)
+    pool: str = CPU
+    state: str = PENDING
+    result: Any = None
+    error: Optional[BaseException] = None
+
+
+def default_cpu_workers() -> int:
+    """CPU池默认大小：留一半核心给ffmpeg自身的编码线程"""
+    return max(1, (os.cpu_count() or 2) // 2)
+
+
+class TaskGraph:
+    """
+    产物依赖图
+
+    节点函数不接收参数，需要上游结果时通过 result(name) 读取。
+    节点抛出异常即视为失败，其所有下游节点会被标记为 skipped。
+    节点函数也可以返回一个 Future（例如批量图片任务中的单个场景），
+    此时节点在该 Future 完成后才算完成，等待期间不占用线程池。
+    """
+
+    def __init__(self):
+        self.logger = get_logger(__name__)
+        self.nodes: Dict[str, TaskNode] = {}
+
+    def add(self, name: str, func: Callable[[], Any], deps: Iterable[str] = (), pool: str = CPU) -> str:
+        """
+        添加节点
+
+        Args:
+            name: 节点名称（在图中唯一）
+            func: 节点执行函数
+            deps: 依赖的节点名称
+            pool: 执行线程池，NETWORK 或 CPU
+
+        Returns:
+            节点名称，便于作为其他节点的依赖
+        """
+        if name in self.nodes:
+            raise TaskGraphError(f"重复的节点: {name}")
+        if pool not in (NETWORK, CPU):
+            raise TaskGraphError(f"未知的线程池类型: {pool}")
+        self.nodes[name] = TaskNode(name=name, func=func, deps=list(deps), pool=pool)
+        return name
+
+    def result(self, name: str) -> Any:
+        """读取已完成节点的返回值"""
+        return self.nodes[name].result
+
+    def state(self, name: str) -> str:
+        """读取节点状态"""
+        return self.nodes[name].state
+
+    def validate(self) -> None:
+        """检查未知依赖和依赖环"""
+        for node in self.nodes.values():
+            for dep in node.deps:
+                if dep not in self.nodes:
+                    raise TaskGraphError(f"节点 {node.name} 依赖未知节点: {dep}")
+
+        # Kahn算法检测环
+        indegree = {name: len(node.deps) for name, node in self.nodes.items()}
+        dependents = self._dependents()
+        queue = [name for name, d in indegree.items() if d == 0]
+        visited = 0
+        while queue:
+            name = queue.pop()
+            visited += 1
+            for child in dependents[name]:
+                indegree[child] -= 1
+                if indegree[child] == 0:
+                    queue.append(child)
+        if visited != len(self.nodes):
+            raise TaskGraphError("任务图存在依赖环")
+
+    def _dependents(self) -> Dict[str, List[str]]:
+        dependents: Dict[str, List[str]] = {name: [] for name in self.nodes}
+        for node in self.nodes.values():
+            for dep in node.deps:
+                dependents[dep].append(node.name)
+        return dependents
+
+    def _skip_downstream(self, name: str, dependents: Dict[str, List[str]]) -> None:
+        stack = list(dependents[name])
+        while stack:
+            child = self.nodes[stack.pop()]
+            if child.state == PENDING:
+                child.state = SKIPPED
+                self.logger.warning(f"上游 {name} 未完成，跳过节点: {child.name}")
+                stack.extend(dependents[child.name])
+
+    @staticmethod
+    def _guarded(func: Callable[[], Any], guard: Callable[[], None]) -> Callable[[], Any]:
+        def run():
+            guard()
+            return func()
+        return run
+
+    def run(self, network_workers: int = 4, cpu_workers: Optional[int] = None,
+            guard: Optional[Callable[[], None]] = None) -> Dict[str, TaskNode]:
+        """
+        执行任务图，按添加顺序优先调度就绪节点
+
+        Args:
+            network_workers: 网络池（TTS、图片生成等）并发数
+            cpu_workers: CPU池（ffmpeg、字幕等）并发数，默认见 default_cpu_workers
+            guard: 每个节点开始执行前调用的检查函数（如工作进程的租约检查）；
+                它抛出异常时整个任务图中止：不再调度新节点，等在途节点结束后重新抛出该异常
+
+        Returns:
+            节点名称到节点的映射，可检查每个节点的状态、结果和异常
+        """
+        self.validate()
+        if cpu_workers is None:
+            cpu_workers = default_cpu_workers()
+        dependents = self._dependents()
+        pools = {
+            NETWORK: ThreadPoolExecutor(max_workers=max(1, network_workers), thread_name_prefix="net"),
+            CPU: ThreadPoolExecutor(max_workers=max(1, cpu_workers), thread_name_prefix="cpu"),
+        }
+        in_flight: Dict[Future, str] = {}
+        aborted = False
+
+        try:
+            while True:
+                if guard is not None:
+                    try:
+                        guard()
+                    except BaseException:
+                        aborted = True
+                        raise
+                # 提交所有依赖已完成的节点
+                for node in self.nodes.values():
+                    if node.state != PENDING:
+                        continue
+                    dep_states = [self.nodes[d].state for d in node.deps]
+                    if any(s in (FAILED, SKIPPED) for s in dep_states):
+                        node.state = SKIPPED
+                        self._skip_downstream(node.name, dependents)
+                        continue
+                    if all(s == DONE for s in dep_states):
+                        node.state = RUNNING
+                        func = node.func if guard is None else self._guarded(node.func, guard)
+                        in_flight[pools[node.pool].submit(func)] = node.name
+
+                if not in_flight:
+                    break
+
+                finished, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    node = self.nodes[in_flight.pop(future)]
+                    error = future.exception()
+                    if error is not None:
+                        node.state = FAILED
+                        node.error = error
+                        self.logger.error(f"节点执行失败: {node.name}，错误: {error}")
+                        self._skip_downstream(node.name, dependents)
+                    elif isinstance(future.result(), Future):
+                        # 节点交出了外部Future，等待其完成
+                        in_flight[future.result()] = node.name
+                    else:
+                        node.state = DONE
+                        node.result = future.result()
+        finally:
+            for pool in pools.values():
+                pool.shutdown(wait=True, cancel_futures=aborted)
+
+        return self.nodes
+
+    def summary(self) -> Dict[str, int]:
+        """按状态统计节点数量"""
+        counts: Dict[str, int] = {}
+        for node in self.nodes.values():
+            counts[node.state] = counts.get(node.state, 0) + 1
+        return counts
@@ -0,0 +1,82 @@
+"""
+分阶段流水线模块
+多个异步处理阶段用有界队列串联：每个条目完成一个阶段后立即进入下一阶段，各阶段同时运行，
+队列满时上游阻塞等待（背压），不会把全部中间结果堆在内存或磁盘上等下一阶段。
+
+用于 章节拆解 -> 图片提示词 -> 合并 -> 渲染：第二次大模型调用与第一次重叠，先完成的章节先往下走。
+"""
+
+import asyncio
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from modules.logger import get_logger
+
+logger = get_logger(__name__)
+
+_DONE = object()
+
+
+@dataclass
+class Stage:
+    """
+    流水线的一个阶段
+
+    func 返回传给下一阶段的值；返回 None 表示该条目到此为止（失败或无需继续），
+    抛出的异常记为失败，不影响其他条目。
+    """
+    name: str
+    func: Callable[[Any], Awaitable[Optional[Any]]]
+    workers: int = 1
+
+
+async def run_stages(items: Iterable[Any], stages: List[Stage], queue_size: int = 2) -> Dict[str, Dict[str, int]]:
+    """
+    让条目依次流过各阶段
+
+    Args:
+        items: 输入条目（进入第一阶段）
+        stages: 阶段列表（按顺序）
+        queue_size: 相邻阶段之间队列的容量
+
+    Returns:
+        {阶段名: {"done": 向下游传递的条目数, "dropped": 返回None的条目数, "failed": 抛出异常的条目数}}
+    """
+    queues = [asyncio.Queue(maxsize=max(1, queue_size)) for _ in stages]
+    stats = {stage.name: {"done": 0, "dropped": 0, "failed": 0} for stage in stages}
+
+    async def feed():
+        for item in items:
+            await queues[0].put(item)
+        for _ in range(max(1, stages[0].workers)):
+            await queues[0].put(_DONE)
+
+    async def worker(index: int, stage: Stage):
+        inbox = queues[index]
+        outbox = queues[index + 1] if index + 1 < len(stages) else None
+        while True:
+            item = await inbox.get()
+            if item is _DONE:
+                return
+            try:
+                result = await stage.func(item)
+            except Exception as e:
+                logger.error(f"[{stage.name}] 处理 {item} 失败: {e}")
+                stats[stage.name]["failed"] += 1
+                continue
+            if result is None:
+                stats[stage.name]["dropped"] += 1
+                continue
+            stats[stage.name]["done"] += 1
+            if outbox is not None:
+                await outbox.put(result)
+
+    async def run_stage(index: int, stage: Stage):
+        await asyncio.gather(*(worker(index, stage) for _ in range(max(1, stage.workers))))
+        # 本阶段所有工作协程结束后通知下一阶段的每个工作协程
+        if index + 1 < len(stages):
+            for _ in range(max(1, stages[index + 1].workers)):
+                await queues[index + 1].put(_DONE)
+
+    await asyncio.gather(feed(), *(run_stage(i, stage) for i, stage in enumerate(stages)))
+    return stats
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+内容寻址产物缓存测试
+"""
+
+import os
+import time
+
+from modules.artifact_cache import ArtifactCache
+
+
+def make_file(path, size):
+    path.write_bytes(os.urandom(size))
+    return path
+
+
+def test_key_depends_on_every_generation_parameter():
+    base = ArtifactCache.make_key("volcengine", "high_aes_general_v30l_zt2i", {"prompt": "p", "width": 1920, "seed": -1})
+    assert base == ArtifactCache.make_key("volcengine", "high_aes_general_v30l_zt2i", {"seed": -1, "width": 1920, "prompt": "p"})
+    assert base != ArtifactCache.make_key("volcengine", "high_aes_general_v30l_zt2i", {"prompt": "p", "width": 1280, "seed": -1})
+    assert base != ArtifactCache.make_key("volcengine", "other_req_key", {"prompt": "p", "width": 1920, "seed": -1})
+    assert base != ArtifactCache.make_key("tencent_tts", "high_aes_general_v30l_zt2i", {"prompt": "p", "width": 1920, "seed": -1})
+
+
+def test_fetch_after_store_is_a_hit(tmp_path):
+    cache = ArtifactCache(tmp_path / "cache", max_bytes=10 ** 6)
+    key = ArtifactCache.make_key("tencent_tts", "TextToVoice", {"Text": "你好"})
+    dest = tmp_path / "renamed_chapter" / "audio.wav"
+
+    assert not cache.fetch(key, str(dest))
+    src = make_file(tmp_path / "audio.wav", 100)
+    cache.store(key, str(src))
+    assert cache.fetch(key, str(dest))
+    assert dest.read_bytes() == src.read_bytes()
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["stores"] == 1
+    assert stats["hit_rate"] == 0.5
+    assert stats["entries"] == 1
+    assert stats["bytes"] == 100
+
+
+def test_cache_entry_survives_output_deletion(tmp_path):
+    cache = ArtifactCache(tmp_path / "cache", max_bytes=10 ** 6)
+    src = make_file(tmp_path / "scene.jpg", 50)
+    cache.store("k" * 64, str(src))
+    src.unlink()
+    assert cache.fetch("k" * 64, str(tmp_path / "again.jpg"))
+
+
+def test_lru_eviction_by_size(tmp_path):
+    cache = ArtifactCache(tmp_path / "cache", max_bytes=250)
+    keys = [c * 64 for c in "abc"]
+    for i, key in enumerate(keys[:2]):
+        cache.store(key, str(make_file(tmp_path / f"f{i}", 100)))
+        time.sleep(0.01)
+
+    # 访问a，使b成为最近最少使用
+    time.sleep(0.01)
+    assert cache.fetch(keys[0], str(tmp_path / "out_a"))
+    time.sleep(0.01)
+    cache.store(keys[2], str(make_file(tmp_path / "f2", 100)))
+
+    assert cache.contains(keys[0])
+    assert not cache.contains(keys[1])
+    assert cache.contains(keys[2])
+    assert cache.stats()["evictions"] == 1
+
+
+def test_store_only_rescans_when_over_capacity(tmp_path, monkeypatch):
+    cache = ArtifactCache(tmp_path / "cache", max_bytes=1000)
+    scans = []
+    entries = cache._entries
+    monkeypatch.setattr(cache, "_entries", lambda: scans.append(1) or entries())
+
+    for i in range(9):
+        cache.store(f"{i:02d}" * 32, str(make_file(tmp_path / f"f{i}", 100)))
+    # 覆盖已有条目不重复计入大小
+    cache.store("00" * 32, str(make_file(tmp_path / "again", 100)))
+    assert len(scans) == 1
+
+    cache.store("09" * 32, str(make_file(tmp_path / "f9", 100)))
+    cache.store("10" * 32, str(make_file(tmp_path / "f10", 100)))
+    assert len(scans) == 2
+    assert cache.stats()["evictions"] == 1 and cache.stats()["bytes"] == 1000
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+产物原子写入测试：元数据文件、续跑时信任元数据、识别写了一半的旧产物
+"""
+
+import hashlib
+import io
+import os
+import wave
+
+import pytest
+
+from modules import artifact_io, media_info
+
+
+def wav_bytes(seconds, rate=16000):
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(b"\x00\x00" * int(seconds * rate))
+    return buffer.getvalue()
+
+
+@pytest.fixture(autouse=True)
+def no_ffprobe(monkeypatch):
+    media_info.clear_cache()
+
+    def fail(path):
+        raise AssertionError(f"不应调用ffprobe: {path}")
+
+    monkeypatch.setattr(media_info, "probe_duration_ffprobe", fail)
+
+
+def test_write_bytes_commits_with_sidecar(tmp_path):
+    path = tmp_path / "para" / "audio.wav"
+    data = wav_bytes(1.5)
+    meta = artifact_io.write_bytes(path, data)
+
+    assert path.read_bytes() == data
+    assert meta["size"] == len(data)
+    assert meta["sha256"] == hashlib.sha256(data).hexdigest()
+    assert meta["duration"] == pytest.approx(1.5)
+    assert artifact_io.read_sidecar(path) == meta
+    # 目录中只剩产物和元数据文件，没有临时文件
+    assert sorted(p.name for p in path.parent.iterdir()) == ["audio.wav", "audio.wav.meta.json"]
+
+
+def test_failed_write_keeps_previous_artifact(tmp_path, monkeypatch):
+    path = tmp_path / "scene_1.jpg"
+    artifact_io.write_bytes(path, b"\xff\xd8old\xff\xd9")
+
+    def crash(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(artifact_io.os, "replace", crash)
+    with pytest.raises(OSError):
+        artifact_io.write_bytes(path, b"\xff\xd8new")
+    assert path.read_bytes() == b"\xff\xd8old\xff\xd9"
+    assert [p.name for p in tmp_path.iterdir() if ".tmp" in p.name] == []
+
+
+def test_commit_guard_blocks_commits(tmp_path):
+    path = tmp_path / "scene_1.jpg"
+    artifact_io.write_bytes(path, b"\xff\xd8old\xff\xd9")
+
+    def lost():
+        raise RuntimeError("lease lost")
+
+    with artifact_io.commit_guard(lost):
+        with pytest.raises(RuntimeError):
+            artifact_io.write_bytes(path, b"\xff\xd8new\xff\xd9")
+    assert path.read_bytes() == b"\xff\xd8old\xff\xd9"
+    artifact_io.write_bytes(path, b"\xff\xd8new\xff\xd9")
+    assert path.read_bytes() == b"\xff\xd8new\xff\xd9"
+
+
+def test_resume_trusts_sidecar_without_reparsing(tmp_path, monkeypatch):
+    path = tmp_path / "audio.wav"
+    artifact_io.write_bytes(path, wav_bytes(2.0))
+
+    def fail(*args):
+        raise AssertionError("元数据文件有效时不应重新解析媒体文件")
+
+    monkeypatch.setattr(artifact_io, "get_media_duration", fail)
+    monkeypatch.setattr(artifact_io, "validate_file", fail)
+    assert artifact_io.verified_artifact(path)["duration"] == pytest.approx(2.0)
+    assert artifact_io.artifact_duration(path) == pytest.approx(2.0)
+
+
+def test_modified_artifact_is_revalidated(tmp_path):
+    path = tmp_path / "audio.wav"
+    artifact_io.write_bytes(path, wav_bytes(2.0))
+    path.write_bytes(wav_bytes(3.0))
+    assert artifact_io.verified_artifact(path)["duration"] == pytest.approx(3.0)
+
+
+@pytest.mark.parametrize("name, data, complete", [
+    ("audio.wav", wav_bytes(1.0), True),
+    ("audio.wav", wav_bytes(1.0)[:-4000], False),
+    ("scene_1.jpg", b"\xff\xd8" + b"\x00" * 100 + b"\xff\xd9", True),
+    ("scene_1.jpg", b"\xff\xd8" + b"\x00" * 100, False),
+    ("scene_2.jpg", b"\x89PNG\r\n\x1a\n" + b"\x00" * 100 + b"\x00\x00\x00\x00IEND\xaeB`\x82", True),
+    ("paragraph_video.mp4", b"\x00\x00\x00\x18ftypisom" + b"\x00" * 12 + b"\x00\x00\x04\x08mdat", False),
+    ("empty.srt", b"", False),
+])
+def test_legacy_artifacts_are_validated_and_adopted(tmp_path, name, data, complete):
+    path = tmp_path / name
+    path.write_bytes(data)
+    meta = artifact_io.verified_artifact(path)
+    assert (meta is not None) == complete
+    assert artifact_io.sidecar_path(path).exists() == complete
+    if complete:
+        assert artifact_io.read_sidecar(path)["size"] == os.path.getsize(path)
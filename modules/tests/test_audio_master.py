@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+音频母带处理命令测试
+"""
+
+import pytest
+
+from modules import audio_master
+from modules.audio_master import MasteringSettings, build_master_cmd, build_mux_cmd, build_narration_cmd
+
+
+def test_narration_pads_each_paragraph_to_video_duration():
+    cmd = build_narration_cmd(["a.wav", "b.wav"], [3.5, 2.0], "narration.flac", MasteringSettings())
+    graph = cmd[cmd.index("-filter_complex") + 1]
+    assert "apad,atrim=end=3.500" in graph
+    assert "apad,atrim=end=2.000" in graph
+    assert "[n0][n1]concat=n=2:v=0:a=1[narration]" in graph
+    assert cmd[-3:] == ["-c:a", "flac", "narration.flac"]
+
+
+def test_master_loops_bgm_without_aloop_and_ducks_once(tmp_path):
+    bgm = tmp_path / "bgm.mp3"
+    bgm.write_bytes(b"bgm")
+    settings = MasteringSettings(bgm_path=str(bgm))
+    cmd = build_master_cmd(["-i", "narration.flac"], "master.m4a", settings, "128k", bgm_offset=42.5)
+    graph = cmd[cmd.index("-filter_complex") + 1]
+    assert cmd[cmd.index("-stream_loop") + 1] == "-1"
+    assert cmd[cmd.index("-ss") + 1] == "42.500"
+    assert "aloop" not in graph
+    assert graph.count("sidechaincompress") == 1
+    assert graph.count("loudnorm") == 1
+    assert cmd[-3:] == ["-b:a", "128k", "master.m4a"]
+
+
+def test_master_without_bgm_only_normalizes(tmp_path):
+    settings = MasteringSettings(bgm_path=str(tmp_path / "missing.mp3"))
+    cmd = build_master_cmd(["-i", "narration.flac"], "master.m4a", settings, "64k")
+    graph = cmd[cmd.index("-filter_complex") + 1]
+    assert "-stream_loop" not in cmd
+    assert "amix" not in graph and "loudnorm" in graph
+
+
+def test_mux_copies_both_streams():
+    cmd = build_mux_cmd(["-i", "video.mp4"], "master.m4a", "out.mp4")
+    assert cmd[cmd.index("-c") + 1] == "copy"
+    assert "-filter_complex" not in cmd
+
+
+def test_mastering_overrides(monkeypatch):
+    monkeypatch.setattr(audio_master, "get_config", lambda: {"render": {"mastering": {"loudness": -14}}})
+    assert audio_master.get_mastering_settings().loudness == -14
+    monkeypatch.setattr(audio_master, "get_config", lambda: {"render": {"mastering": {"gain": 2}}})
+    with pytest.raises(ValueError):
+        audio_master.get_mastering_settings()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+全局人物库测试：按姓名合并并记录版本、只附带本章人物、引用和占位符还原为完整章节JSON
+"""
+
+import json
+
+from modules.character_registry import CharacterRegistry, appearance, build_registry, reference_context
+
+ZHOU = {
+    "基本信息": {"年龄": "25岁", "性别": "男性"},
+    "面部特征": {"脸型": "方圆脸", "肤色": "黄皮肤", "眼睛": {"颜色": "深黑色", "形状": "单凤眼"}},
+    "头发特征": {"颜色": "深黑色", "发型": "短发"},
+    "服装风格": {"上衣": "橙色囚服"},
+}
+LIN = {"基本信息": {"年龄": "65岁", "性别": "男性"}, "面部特征": {"脸型": "长方脸"}}
+
+
+def write_chapter(tmp_path, number, profiles):
+    path = tmp_path / f"chapter_{number:03d}_processed.json"
+    path.write_text(json.dumps({"人物特征库": profiles, "场景拆解": []}, ensure_ascii=False), encoding="utf-8")
+    return str(path)
+
+
+def test_merge_by_name_with_versions(tmp_path):
+    jacket = {**ZHOU, "服装风格": {"上衣": "白衬衫"}}
+    files = [write_chapter(tmp_path, 1, {"周扬": ZHOU}), write_chapter(tmp_path, 2, {"周扬": ZHOU, "林培元": LIN}),
+             write_chapter(tmp_path, 3, {"周扬": jacket})]
+    registry = build_registry(str(tmp_path / "registry.json"), files)
+
+    assert registry.version("周扬") == 2 and registry.version("林培元") == 1
+    entry = registry.characters["周扬"]
+    assert entry["history"][-1] == {"version": 2, "chapter": 3, "changes": {"服装风格": {"上衣": "白衬衫"}}}
+    assert registry.profile("周扬")["面部特征"] == ZHOU["面部特征"]
+    assert CharacterRegistry(str(tmp_path / "registry.json")).characters == registry.characters
+
+
+def test_context_only_includes_mentioned_characters(tmp_path):
+    registry = CharacterRegistry(str(tmp_path / "registry.json"))
+    registry.merge(1, {"周扬": ZHOU, "林培元": LIN})
+    names = registry.mentioned("周扬推开了门。")
+    assert names == ["周扬"]
+    context = registry.context(names)
+    assert "方圆脸" in context and "长方脸" not in context
+    assert registry.context(registry.mentioned("无人出场")) == ""
+
+
+def test_references_expand_to_full_chapter(tmp_path):
+    registry = CharacterRegistry(str(tmp_path / "registry.json"))
+    registry.merge(1, {"周扬": ZHOU})
+    reply = {
+        "人物特征库": {"周扬": {"引用": "周扬", "变化": {"服装风格": {"上衣": "白衬衫"}}}, "林培元": LIN},
+        "场景拆解": [{"场景列表": [{
+            "人物状态": [{"人物": "周扬", "表情": "专注"}, {"人物": "林培元", "详细外貌": "自述", "表情": "严肃"}],
+            "图片提示词": "写实风格，【人物:周扬】，白衬衫，【人物：林培元】站在右侧",
+        }]}],
+    }
+    full = registry.expand_chapter(reply)
+
+    assert full["人物特征库"]["周扬"]["服装风格"]["上衣"] == "白衬衫"
+    assert full["人物特征库"]["周扬"]["面部特征"] == ZHOU["面部特征"]
+    scene = full["场景拆解"][0]["场景列表"][0]
+    assert scene["人物状态"][0]["详细外貌"] == appearance(ZHOU)
+    assert scene["人物状态"][1]["详细外貌"] == "自述"
+    assert scene["图片提示词"] == f"写实风格，{appearance(ZHOU)}，白衬衫，{appearance(LIN)}站在右侧"
+
+    changed = registry.merge(2, full["人物特征库"])
+    assert changed == {"周扬": {"服装风格": {"上衣": "白衬衫"}}, "林培元": LIN}
+
+
+def test_compact_chapter_replaces_registered_profiles(tmp_path):
+    registry = CharacterRegistry(str(tmp_path / "registry.json"))
+    registry.merge(1, {"周扬": ZHOU})
+    chapter = {"人物特征库": {"周扬": ZHOU, "林培元": LIN},
+               "场景拆解": [{"人物状态": [{"人物": "周扬", "详细外貌": "很长的描述", "动作": "坐下"}]}]}
+    compact = registry.compact_chapter(chapter)
+    assert compact["人物特征库"] == {"周扬": {"引用": "周扬"}, "林培元": LIN}
+    assert compact["场景拆解"][0]["人物状态"][0] == {"人物": "周扬", "动作": "坐下"}
+    assert registry.expand_chapter(compact)["人物特征库"]["周扬"] == ZHOU
+
+
+def test_out_of_order_merge_keeps_latest_chapter(tmp_path):
+    jacket = {**ZHOU, "服装风格": {"上衣": "白衬衫"}}
+    suit = {**ZHOU, "服装风格": {"上衣": "黑西装"}}
+    registry = CharacterRegistry(str(tmp_path / "registry.json"))
+    registry.merge(1, {"周扬": ZHOU})
+    registry.merge(10, {"周扬": suit})
+    # 第3章晚于第10章完成：插入历史中间，当前档案仍是第10章的
+    assert registry.merge(3, {"周扬": jacket}) == {"周扬": {"服装风格": {"上衣": "白衬衫"}}}
+    entry = registry.characters["周扬"]
+    assert [h["chapter"] for h in entry["history"]] == [1, 3, 10]
+    assert entry["updated_chapter"] == 10
+    assert registry.profile("周扬")["服装风格"]["上衣"] == "黑西装"
+    # 重新合并同一章替换原记录，结果不变时不产生新版本
+    version = registry.version("周扬")
+    assert registry.merge(3, {"周扬": jacket}) == {}
+    assert registry.version("周扬") == version
+
+
+def test_chapter_profiles_are_pinned_per_request(tmp_path):
+    registry = CharacterRegistry(str(tmp_path / "registry.json"))
+    registry.merge(1, {"周扬": ZHOU})
+    pinned = registry.chapter_profiles("chapter_003_detailed.txt", "key-3", ["周扬"])
+    registry.merge(10, {"周扬": {**ZHOU, "头发特征": {"颜色": "银白色", "发型": "长发"}}})
+
+    # 同一请求键沿用记录的快照（请求内容不变，可命中缓存），并按快照还原引用
+    registry.save()
+    reloaded = CharacterRegistry(str(tmp_path / "registry.json"))
+    assert reloaded.chapter_profiles("chapter_003_detailed.txt", "key-3", ["周扬"]) == pinned
+    assert reference_context(pinned) == reference_context({"周扬": ZHOU})
+    reply = {"人物特征库": {"周扬": {"引用": "周扬"}}, "场景拆解": [{"图片提示词": "【人物:周扬】"}]}
+    full = reloaded.expand_chapter(reply, base=pinned)
+    assert full["人物特征库"]["周扬"] == ZHOU
+    assert full["场景拆解"][0]["图片提示词"] == appearance(ZHOU)
+    # 章节输入改变后取当前档案
+    assert reloaded.chapter_profiles("chapter_003_detailed.txt", "key-3b", ["周扬"])["周扬"]["头发特征"]["颜色"] == "银白色"
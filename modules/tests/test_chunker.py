@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+章节分窗测试：token 估算、按章节标题/段落/句子边界切分、合并结果重新编号
+"""
+
+from modules.chunker import chunk_text, estimate_tokens, input_budget, merge_breakdowns
+
+
+def chapter(number, paragraphs, length=100):
+    body = "".join(f"　　第{number}章第{i}段" + "字" * length + "。\n" for i in range(paragraphs))
+    return f"第{number}章 标题{number}\n{body}"
+
+
+def test_estimate_tokens_and_budget():
+    assert estimate_tokens("周扬" * 100) == 201
+    assert estimate_tokens("a" * 400) == 101
+    assert input_budget(1000, 300, "系统" * 100) == 499
+    assert input_budget(1000, 300, target_tokens=200) == 200
+
+
+def test_small_chapter_is_one_window():
+    text = chapter(1, 3)
+    assert chunk_text(text, 10000) == [text]
+
+
+def test_splits_at_chapter_headings_first():
+    text = "".join(chapter(n, 5) for n in range(1, 7))
+    size = estimate_tokens(chapter(1, 5))
+    windows = chunk_text(text, size * 2 + 10)
+    assert "".join(windows) == text
+    assert len(windows) == 3
+    assert all(w.startswith("第") and w.count("章 标题") == 2 for w in windows)
+    assert all(estimate_tokens(w) <= size * 2 + 10 for w in windows)
+
+
+def test_oversized_chapter_falls_back_to_paragraphs_and_sentences():
+    text = chapter(1, 10)
+    windows = chunk_text(text, 300)
+    assert "".join(windows) == text and len(windows) > 1
+    assert all(w.endswith("\n") for w in windows)
+
+    run_on = "很长的一句话" * 200 + "。" + "另一句" * 100 + "。"
+    windows = chunk_text(run_on, 500)
+    assert "".join(windows) == run_on
+    assert all(estimate_tokens(w) <= 501 for w in windows)
+
+
+def test_merge_renumbers_paragraphs_and_scenes():
+    def window(titles, people):
+        return {
+            "章节信息": {"章节号": "第1章", "段落数量": f"{len(titles)}个"},
+            "人物特征库": people,
+            "场景拆解": [
+                {"序号": i + 1, "段落标题": t, "场景列表": [{"场景编号": f"{i + 1}-{k}"} for k in (1, 2)]}
+                for i, t in enumerate(titles)
+            ],
+        }
+
+    results = [window(["a", "b"], {"周扬": {"v": 1}}), window(["c"], {"周扬": {"v": 2}, "林": {"v": 1}})]
+    merged = merge_breakdowns(results)
+    assert list(merged) == ["章节信息", "人物特征库", "场景拆解"]
+    assert merged["章节信息"]["段落数量"] == "3个"
+    assert merged["人物特征库"] == {"周扬": {"v": 1}, "林": {"v": 1}}
+    assert [(p["序号"], p["段落标题"], [s["场景编号"] for s in p["场景列表"]]) for p in merged["场景拆解"]] == [
+        (1, "a", ["1-1", "1-2"]), (2, "b", ["2-1", "2-2"]), (3, "c", ["3-1", "3-2"])]
+    assert merge_breakdowns(results) == merged
+    assert results[1]["场景拆解"][0]["序号"] == 1
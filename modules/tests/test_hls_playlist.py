@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+HLS 播放列表测试（模拟ffmpeg切出的段落分段）
+"""
+
+import multiprocessing
+import time
+from pathlib import Path
+
+from modules import hls_playlist
+from modules.hls_playlist import parse_playlist, update_chapter_playlist, update_novel_playlist
+
+
+def make_paragraph(stream_dir, durations):
+    stream_dir.mkdir(parents=True)
+    lines = ["#EXTM3U", "#EXT-X-VERSION:7", "#EXT-X-TARGETDURATION:6", '#EXT-X-MAP:URI="init.mp4"']
+    for i, duration in enumerate(durations):
+        lines += [f"#EXTINF:{duration},", f"seg_{i:03d}.m4s"]
+    lines.append("#EXT-X-ENDLIST")
+    playlist = stream_dir / "index.m3u8"
+    playlist.write_text("\n".join(lines) + "\n")
+    return playlist
+
+
+def test_chapter_playlist_publishes_contiguous_prefix(tmp_path):
+    chapter = tmp_path / "1-开端"
+    playlists = [chapter / f"{i}-段落" / "stream" / "index.m3u8" for i in (1, 2, 3)]
+    make_paragraph(playlists[0].parent, [6.0, 2.5])
+    make_paragraph(playlists[2].parent, [6.0])
+
+    assert update_chapter_playlist(str(chapter / "chapter.m3u8"), playlists) == 1
+    text = (chapter / "chapter.m3u8").read_text()
+    assert "EVENT" in text and "ENDLIST" not in text
+    assert '#EXT-X-MAP:URI="1-%E6%AE%B5%E8%90%BD/stream/init.mp4"' in text
+
+    make_paragraph(playlists[1].parent, [7.2])
+    assert update_chapter_playlist(str(chapter / "chapter.m3u8"), playlists) == 3
+    parsed = parse_playlist(str(chapter / "chapter.m3u8"))
+    assert parsed["ended"]
+    assert [len(b["segments"]) for b in parsed["blocks"]] == [2, 1, 1]
+    assert parsed["blocks"][1]["segments"][0] == (7.2, str((playlists[1].parent / "seg_000.m4s").resolve()))
+    text = (chapter / "chapter.m3u8").read_text()
+    assert text.count("#EXT-X-DISCONTINUITY") == 2
+    assert "#EXT-X-TARGETDURATION:8" in text
+
+
+def test_novel_playlist_stops_at_unfinished_chapter(tmp_path):
+    chapter_playlists = []
+    for c, ready in ((1, 2), (2, 1), (3, 1)):
+        chapter = tmp_path / f"{c}-章"
+        playlists = [chapter / f"{i}" / "stream" / "index.m3u8" for i in range(2)]
+        for playlist in playlists[:ready]:
+            make_paragraph(playlist.parent, [5.0])
+        update_chapter_playlist(str(chapter / "chapter.m3u8"), playlists)
+        chapter_playlists.append(chapter / "chapter.m3u8")
+
+    novel = tmp_path / "novel.m3u8"
+    assert update_novel_playlist(str(novel), chapter_playlists) == 3
+    parsed = parse_playlist(str(novel))
+    assert not parsed["ended"]
+    assert parsed["blocks"][-1]["map"] == str((tmp_path / "2-章" / "0" / "stream" / "init.mp4").resolve())
+
+
+def hold_playlist_lock(playlist_path, locked, seconds):
+    with hls_playlist._locked(Path(playlist_path)):
+        locked.set()
+        time.sleep(seconds)
+
+
+def test_playlist_rewrite_waits_for_other_process(tmp_path):
+    chapter = tmp_path / "1-开端"
+    playlists = [make_paragraph(chapter / "1-段落" / "stream", [6.0])]
+    playlist_path = chapter / "chapter.m3u8"
+    ctx = multiprocessing.get_context("fork")
+    locked = ctx.Event()
+    holder = ctx.Process(target=hold_playlist_lock, args=(str(playlist_path), locked, 0.3))
+    holder.start()
+    assert locked.wait(5)
+    start = time.monotonic()
+    assert update_chapter_playlist(str(playlist_path), playlists) == 1
+    holder.join()
+    assert time.monotonic() - start >= 0.2
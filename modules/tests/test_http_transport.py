@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+共享HTTP传输层测试：长连接复用与连接池统计、幂等方法按 Retry-After 重试、POST 默认不重试、默认超时
+"""
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from modules import http_transport
+from modules.http_transport import HTTPTransport
+
+
+class Server:
+    """按顺序返回预设状态码（用完后返回200），可设置每次响应前的延迟"""
+
+    def __init__(self, statuses=(), delay=0.0):
+        self.statuses = list(statuses)
+        self.delay = delay
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def handle_one(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                self.rfile.read(length)
+                stub.requests.append((self.command, self.client_address))
+                status = stub.statuses.pop(0) if stub.statuses else 200
+                time.sleep(stub.delay)
+                try:
+                    self.send_response(status)
+                    if status == 429:
+                        self.send_header("Retry-After", "0")
+                    self.send_header("Content-Length", "2")
+                    self.end_headers()
+                    self.wfile.write(b"ok")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # 客户端已超时断开
+
+            do_GET = do_POST = handle_one
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(http_transport, "backoff_delay", lambda *args, **kwargs: 0.0)
+
+
+def test_keep_alive_reuses_one_connection_and_reports_stats():
+    server = Server()
+    transport = HTTPTransport()
+    try:
+        for _ in range(5):
+            assert transport.get(server.url).text == "ok"
+        assert len({address for _, address in server.requests}) == 1
+        stats = transport.stats()[server.url.rstrip("/")]
+        assert (stats["requests"], stats["connections"], stats["retries"]) == (5, 1, 0)
+        assert stats["reuse_rate"] == pytest.approx(0.8)
+    finally:
+        transport.close()
+        server.close()
+
+
+def test_idempotent_requests_retry_but_post_does_not(no_backoff):
+    server = Server([503, 429, 500])
+    transport = HTTPTransport(max_retries=3)
+    try:
+        assert transport.get(server.url).status_code == 200
+        assert len(server.requests) == 4
+        server.statuses = [503, 503]
+        assert transport.post(server.url, data=b"x").status_code == 503
+        assert transport.post(server.url, data=b"x", retries=1).status_code == 200
+        assert transport.stats()[server.url.rstrip("/")]["retries"] == 4
+    finally:
+        transport.close()
+        server.close()
+
+
+def test_default_timeout_applies(no_backoff):
+    server = Server(delay=0.5)
+    transport = HTTPTransport(timeout=(1, 0.1), max_retries=1)
+    try:
+        with pytest.raises(requests.Timeout):
+            transport.get(server.url)
+        assert len(server.requests) == 2
+        assert transport.stats()[server.url.rstrip("/")]["errors"] == 2
+    finally:
+        transport.close()
+        server.close()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+JSON修复测试：代码块和说明文字、截断、未转义双引号、多余逗号；按结构校验找出需要重新请求的段落并按序号合并
+"""
+
+import json
+
+import pytest
+
+from modules.json_repair import (FIX_COMMAS, FIX_PROSE, FIX_QUOTES, FIX_TRUNCATED, check_breakdown,
+                                 merge_paragraphs, reask_prompt, repair_json)
+
+
+def paragraph(number, scenes=2):
+    return {"序号": number, "段落标题": f"标题{number}", "场景文案": f"文案{number}",
+            "场景列表": [{"场景编号": f"{number}-{k}", "图片提示词": f"提示词{number}-{k}"}
+                     for k in range(1, scenes + 1)]}
+
+
+def chapter(paragraphs, declared=None):
+    info = {"章节号": "第1章", "标题": "标题"}
+    if declared is not None:
+        info["段落数量"] = f"{declared}个"
+    return {"章节信息": info, "场景拆解": paragraphs}
+
+
+def test_valid_json_is_untouched():
+    data = chapter([paragraph(1)], 1)
+    assert repair_json(json.dumps(data, ensure_ascii=False)) == (data, [])
+
+
+def test_strips_fences_prose_and_trailing_commas():
+    data = chapter([paragraph(1)], 1)
+    body = json.dumps(data, ensure_ascii=False, indent=2).replace('"提示词1-2"', '"提示词1-2",')
+    text = f"好的，以下是拆解结果：\n```json\n{body}\n```\n以上共1个段落。"
+    repaired, fixes = repair_json(text)
+    assert repaired == data
+    assert FIX_PROSE in fixes and FIX_COMMAS in fixes
+
+
+def test_escapes_inner_quotes_and_newlines():
+    text = '{"章节信息": {"章节号": "第1章"}, "场景拆解": [{"场景文案": "他大喊"快跑"，然后\n转身", "序号": 1}]}'
+    repaired, fixes = repair_json(text)
+    assert repaired["场景拆解"][0]["场景文案"] == '他大喊"快跑"，然后\n转身'
+    assert fixes == [FIX_QUOTES]
+
+
+@pytest.mark.parametrize("cut", ['"图片提示词": "提示词2-', '"场景文案": ', '{"序号": 3', '"场景列表": [{"场景编号": "2-1",'])
+def test_truncated_output_keeps_complete_paragraphs(cut):
+    full = json.dumps(chapter([paragraph(1), paragraph(2), paragraph(3)], 3), ensure_ascii=False)
+    text = full[:full.index(cut, full.index('"序号": 2')) + len(cut)]
+    repaired, fixes = repair_json(text)
+    assert FIX_TRUNCATED in fixes
+    assert repaired["场景拆解"][0] == paragraph(1)
+    report = check_breakdown(repaired, FIX_TRUNCATED in fixes)
+    assert not report.errors and not report.ok
+    assert 1 not in report.todo and 3 in report.todo
+
+
+def test_no_json_raises():
+    with pytest.raises(json.JSONDecodeError):
+        repair_json("抱歉，我无法完成这个请求。")
+
+
+def test_check_and_merge_only_reasks_broken_paragraphs():
+    broken = paragraph(2)
+    del broken["场景列表"][1]["图片提示词"]
+    data = chapter([paragraph(1), broken, paragraph(4)], 4)
+    report = check_breakdown(data)
+    assert (report.broken, report.missing, report.todo) == ([2], [3], [2, 3])
+    assert "序号 2、3 的段落" in reask_prompt(report, 4)
+
+    fixed = paragraph(2, scenes=3)
+    fixed["场景列表"][0]["场景编号"] = "x"
+    merged = merge_paragraphs(data, [fixed, paragraph(3), {"序号": 5}])
+    assert check_breakdown(merged).ok
+    assert [p["序号"] for p in merged["场景拆解"]] == [1, 2, 3, 4]
+    assert [s["场景编号"] for s in merged["场景拆解"][1]["场景列表"]] == ["2-1", "2-2", "2-3"]
+    assert data["场景拆解"][1] is broken
+
+
+def test_truncated_without_declared_count_is_open_ended():
+    report = check_breakdown(chapter([paragraph(1)]), truncated=True)
+    assert report.open_ended and not report.todo
+    assert "序号 1 之后" in reask_prompt(report, 1)
+    assert check_breakdown({"场景拆解": []}).errors == ["缺少章节信息"]
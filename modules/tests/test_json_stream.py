@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+增量JSON解析测试：场景对象在右花括号到达时立即返回，切分位置、嵌套和字符串中的括号不影响结果
+"""
+
+import json
+
+import pytest
+
+from modules.json_stream import IncrementalJSONParser
+
+DOCUMENT = {
+    "章节信息": {"章节号": "第1章", "场景拆解": "同名的字符串值不是数组"},
+    "场景拆解": [
+        {
+            "序号": i,
+            "场景文案": f"他说：\"{{括号}}[{i}]\"\\n",
+            "场景列表": [{"场景编号": f"{i}-1", "场景拆解": [{"嵌套": True}]}],
+        }
+        for i in range(1, 4)
+    ],
+    "结尾": "}]",
+}
+
+
+def feed_all(parser, text, size):
+    emitted = []
+    for start in range(0, len(text), size):
+        emitted.extend(parser.feed(text[start:start + size]))
+    return emitted
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, 10000])
+def test_emits_each_scene_once_for_any_split(size):
+    text = "```json\n" + json.dumps(DOCUMENT, ensure_ascii=False, indent=2) + "\n```"
+    parser = IncrementalJSONParser(["场景拆解"])
+    assert feed_all(parser, text, size) == DOCUMENT["场景拆解"]
+    assert parser.text == text
+
+
+def test_scene_is_emitted_as_soon_as_it_closes():
+    text = json.dumps(DOCUMENT, ensure_ascii=False)
+    first_end = text.index(', {"序号": 2') - 1
+    parser = IncrementalJSONParser(["场景拆解"])
+    assert parser.feed(text[:first_end]) == []
+    assert parser.feed(text[first_end]) == [DOCUMENT["场景拆解"][0]]
+    assert parser.feed(text[first_end + 1:]) == DOCUMENT["场景拆解"][1:]
+
+
+def test_malformed_element_is_skipped():
+    parser = IncrementalJSONParser(["列表"])
+    assert parser.feed('{"列表": [{"a": 1,}, {"b": 2}]}') == [{"b": 2}]
+    assert parser.emitted == 1
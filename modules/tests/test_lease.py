@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+租约测试：多进程工作进程、模拟崩溃后的接管和吞吐扩展
+"""
+
+import multiprocessing
+import os
+import time
+
+import pytest
+
+from modules.lease import Lease, LeaseLost, done_path, work_through
+
+TTL = 0.5
+HEARTBEAT = 0.1
+POLL = 0.05
+
+
+def render(key, output_dir, seconds):
+    """模拟渲染：独占创建章节目录中的标记文件，同一章节被并发渲染时会失败"""
+    marker = os.path.join(output_dir, f"{key}.rendering")
+    fd = os.open(marker, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    os.close(fd)
+    time.sleep(seconds)
+    with open(os.path.join(output_dir, f"{key}.rendered"), "a") as f:
+        f.write(f"{os.getpid()}\n")
+    os.remove(marker)
+    return True
+
+
+def worker(keys, lease_dir, output_dir, seconds):
+    work_through(keys, lambda key, lease: render(key, output_dir, seconds), lease_dir,
+                 ttl=TTL, heartbeat_interval=HEARTBEAT, poll_interval=POLL)
+
+
+def crashing_worker(key, lease_dir):
+    """认领后不释放、不心跳直接退出，模拟渲染机崩溃"""
+    assert Lease(lease_dir, key, ttl=TTL).acquire()
+    os._exit(1)
+
+
+def run_workers(count, keys, lease_dir, output_dir, seconds):
+    ctx = multiprocessing.get_context("fork")
+    procs = [ctx.Process(target=worker, args=(keys, lease_dir, output_dir, seconds)) for _ in range(count)]
+    start = time.monotonic()
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(timeout=60)
+        assert p.exitcode == 0
+    return time.monotonic() - start
+
+
+def test_lease_is_exclusive_until_stale(tmp_path):
+    first = Lease(str(tmp_path), "chapter_001", ttl=TTL)
+    second = Lease(str(tmp_path), "chapter_001", ttl=TTL)
+    assert first.acquire()
+    assert not second.acquire()
+    with first:
+        time.sleep(TTL * 2)
+        assert not second.acquire()  # 心跳期间不会过期
+    assert second.acquire()
+    second.release()
+
+
+def test_crashed_worker_lease_is_reclaimed(tmp_path):
+    lease_dir, output_dir = str(tmp_path / "leases"), str(tmp_path / "output")
+    os.makedirs(output_dir)
+    keys = [f"chapter_{i:03d}" for i in range(8)]
+
+    crash = multiprocessing.get_context("fork").Process(target=crashing_worker, args=(keys[0], lease_dir))
+    crash.start()
+    crash.join()
+    assert os.path.exists(os.path.join(lease_dir, f"{keys[0]}.lease"))
+
+    run_workers(3, keys, lease_dir, output_dir, 0.05)
+    for key in keys:
+        assert done_path(lease_dir, key).exists()
+        with open(os.path.join(output_dir, f"{key}.rendered")) as f:
+            assert len(f.read().split()) == 1  # 每个章节只渲染一次
+    assert not [name for name in os.listdir(lease_dir) if name.endswith(".lease")]
+
+
+def test_throughput_scales_with_workers(tmp_path):
+    keys = [f"chapter_{i:03d}" for i in range(12)]
+    timings = {}
+    for count in (1, 4):
+        lease_dir, output_dir = str(tmp_path / f"leases{count}"), str(tmp_path / f"output{count}")
+        os.makedirs(output_dir)
+        timings[count] = run_workers(count, keys, lease_dir, output_dir, 0.2)
+    assert timings[1] / timings[4] > 2.5
+
+
+def test_stalled_holder_notices_takeover_before_writing(tmp_path):
+    holder = Lease(str(tmp_path), "chapter_001", ttl=TTL, owner="same")
+    assert holder.acquire()
+    holder.check()
+    time.sleep(TTL * 2)  # 心跳停顿（如GC或NFS卡顿）超过 ttl
+    taker = Lease(str(tmp_path), "chapter_001", ttl=TTL, owner="same")
+    assert taker.acquire()
+    # 即使持有者标识相同，文件已换成接管者创建的新文件
+    with pytest.raises(LeaseLost):
+        holder.check()
+    assert holder.lost.is_set()
+    taker.check()
+    holder.release()  # 不会删除接管者的租约
+    assert os.path.exists(os.path.join(str(tmp_path), "chapter_001.lease"))
+    taker.release()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+任务台账测试：状态流转、多线程/多进程并发写入和跨章节查询
+"""
+
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from modules import ledger as ledger_module
+from modules.ledger import DONE, FAILED, SUBMITTED, ArtifactJob, ArtifactKey, JobLedger, LedgerError, require_local_ledger
+
+
+def scene_key(chapter_no, paragraph, scene_no):
+    return ArtifactKey(f"{chapter_no}-章节", paragraph, "scene", f"scene_{scene_no}.jpg")
+
+
+def test_state_transitions(tmp_path):
+    ledger = JobLedger(str(tmp_path / "ledger.sqlite3"))
+    key = scene_key(1, "1-开端", 1)
+    ledger.register(key, chapter_no=1, path="/tmp/scene_1.jpg")
+    job = ArtifactJob(ledger, key)
+
+    job.start()
+    job.submitted("task-1")
+    assert ledger.get(key)["state"] == SUBMITTED
+    assert ledger.get(key)["task_id"] == "task-1"
+    job.failed(RuntimeError("50430 超时"))
+    job.start()
+    job.done()
+
+    row = ledger.get(key)
+    assert row["state"] == DONE
+    assert row["attempts"] == 2
+    assert row["error"] is None
+    assert row["duration"] is not None and row["duration"] >= 0
+    # 重复登记不覆盖已有状态
+    ledger.register(key, chapter_no=1)
+    assert ledger.get(key)["state"] == DONE
+    assert ledger.get(key)["path"] == "/tmp/scene_1.jpg"
+
+
+def test_concurrent_threads(tmp_path):
+    ledger = JobLedger(str(tmp_path / "ledger.sqlite3"))
+    keys = [scene_key(1, f"{p}-段落", s) for p in range(10) for s in range(10)]
+
+    def run(key):
+        ledger.register(key, chapter_no=1)
+        ledger.start(key)
+        ledger.submitted(key, f"task-{key.paragraph}-{key.name}")
+        ledger.done(key)
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        list(executor.map(run, keys))
+
+    assert ledger.summary() == {"scene": {DONE: len(keys)}}
+
+
+def process_worker(path, chapter_no, fail_every):
+    ledger = JobLedger(path)
+    for p in range(5):
+        for s in range(4):
+            key = scene_key(chapter_no, f"{p}-段落", s)
+            ledger.register(key, chapter_no=chapter_no)
+            ledger.start(key)
+            if (p * 4 + s) % fail_every == 0:
+                ledger.failed(key, "生成失败")
+            else:
+                ledger.done(key)
+
+
+def test_concurrent_processes_and_range_query(tmp_path):
+    path = str(tmp_path / "ledger.sqlite3")
+    JobLedger(path)
+    ctx = multiprocessing.get_context("spawn")
+    processes = [ctx.Process(target=process_worker, args=(path, chapter_no, 5)) for chapter_no in range(1, 51)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+        assert process.exitcode == 0
+
+    ledger = JobLedger(path)
+    assert ledger.summary() == {"scene": {DONE: 50 * 16, FAILED: 50 * 4}}
+
+    failed = ledger.query(state=FAILED, kind="scene", chapters=(1, 40))
+    assert len(failed) == 40 * 4
+    assert {row["chapter_no"] for row in failed} == set(range(1, 41))
+    assert all(row["error"] == "生成失败" for row in failed)
+
+
+def test_worker_mode_requires_ledger_outside_shared_output(tmp_path, monkeypatch):
+    output = tmp_path / "output"
+    settings = {}
+    monkeypatch.setattr(ledger_module, "get_config", lambda: settings)
+    with pytest.raises(LedgerError):
+        require_local_ledger(str(output))
+    settings["ledger"] = {"path": str(output / "ledger.sqlite3")}
+    with pytest.raises(LedgerError):
+        require_local_ledger(str(output))
+    settings["ledger"] = {"path": str(tmp_path / "local" / "ledger.sqlite3")}
+    assert require_local_ledger(str(output)) == (tmp_path / "local" / "ledger.sqlite3").resolve()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+LLM 批处理任务测试（本地批处理接口桩服务）：提交任务文件、轮询、逐条回调结果、缓存命中不提交、中断后续跑不重复提交
+"""
+
+import json
+import threading
+from email.parser import BytesParser
+from email.policy import default
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from modules.llm_batch import LLMBatch
+from modules.llm_cache import LLMCache
+from modules.llm_client import LLMClient
+
+
+class BatchServer:
+    """
+    OpenAI 兼容的批处理接口桩：/v1/files、/v1/batches；任务在被查询 polls_needed 次后完成，
+    回复内容为请求中最后一条消息，custom_id 在 fail_ids 中的请求写入错误文件
+    """
+
+    def __init__(self, polls_needed=2, fail_ids=()):
+        self.polls_needed = polls_needed
+        self.fail_ids = set(fail_ids)
+        self.files = {}
+        self.batches = {}
+        self.uploads = []
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                with stub.lock:
+                    if self.path == "/v1/files":
+                        message = BytesParser(policy=default).parsebytes(
+                            b"Content-Type: " + self.headers["Content-Type"].encode() + b"\r\n\r\n" + body)
+                        data = next(p for p in message.iter_parts() if p.get_filename()).get_content()
+                        stub.uploads.append(data if isinstance(data, bytes) else data.encode("utf-8"))
+                        file_id = f"file-{len(stub.files)}"
+                        stub.files[file_id] = stub.uploads[-1]
+                        self.reply({"id": file_id, "purpose": "batch"})
+                    elif self.path == "/v1/batches":
+                        request = json.loads(body)
+                        batch_id = f"batch-{len(stub.batches)}"
+                        stub.batches[batch_id] = {"id": batch_id, "status": "in_progress", "polls": 0,
+                                                  "input_file_id": request["input_file_id"],
+                                                  "endpoint": request["endpoint"]}
+                        self.reply({"id": batch_id, "status": "validating"})
+                    else:
+                        self.reply({"error": "not found"}, 404)
+
+            def do_GET(self):
+                with stub.lock:
+                    if self.path.startswith("/v1/batches/"):
+                        self.reply(stub.poll(self.path.rsplit("/", 1)[1]))
+                    elif self.path.endswith("/content"):
+                        data = stub.files[self.path.split("/")[3]]
+                        self.send_response(200)
+                        self.send_header("Content-Length", str(len(data)))
+                        self.end_headers()
+                        self.wfile.write(data)
+                    else:
+                        self.reply({"error": "not found"}, 404)
+
+            def reply(self, payload, status=200):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/v1/chat/completions"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def poll(self, batch_id):
+        batch = self.batches[batch_id]
+        batch["polls"] += 1
+        lines = [json.loads(line) for line in self.files[batch["input_file_id"]].decode("utf-8").splitlines()]
+        if batch["polls"] >= self.polls_needed and batch["status"] != "completed":
+            batch["status"] = "completed"
+            output, errors = [], []
+            for line in lines:
+                if line["custom_id"] in self.fail_ids:
+                    errors.append({"custom_id": line["custom_id"], "response": None,
+                                   "error": {"code": "server_error", "message": "boom"}})
+                    continue
+                body = {"choices": [{"message": {"content": line["body"]["messages"][-1]["content"]},
+                                     "finish_reason": "stop"}], "usage": {"total_tokens": 10}}
+                output.append({"custom_id": line["custom_id"], "response": {"status_code": 200, "body": body},
+                               "error": None})
+            for key, items in (("output_file_id", output), ("error_file_id", errors)):
+                if items:
+                    file_id = f"file-{len(self.files)}"
+                    self.files[file_id] = "".join(json.dumps(i) + "\n" for i in items).encode("utf-8")
+                    batch[key] = file_id
+        return {**batch, "request_counts": {"total": len(lines), "completed": batch["polls"]}}
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def server():
+    stub = BatchServer(fail_ids={"c"})
+    yield stub
+    stub.close()
+
+
+@pytest.fixture
+def client(server, tmp_path):
+    client = LLMClient(server.url, "key", "m", cache=LLMCache(str(tmp_path / "cache"), "prompt_image"))
+    return client
+
+
+def payloads(client, names):
+    return {name: client.payload([{"role": "user", "content": f"回复{name}"}], temperature=0.7) for name in names}
+
+
+def test_submit_poll_and_collect(server, client, tmp_path):
+    batch = LLMBatch(client, str(tmp_path / "state.json"), poll_interval=0.01)
+    received = {}
+    done = batch.run(payloads(client, "abc"), lambda cid, result: received.setdefault(cid, LLMClient.content(result)))
+
+    assert done == {"a": True, "b": True, "c": False}
+    assert received == {"a": "回复a", "b": "回复b"}
+    lines = [json.loads(line) for line in server.uploads[0].decode("utf-8").splitlines()]
+    assert [(line["custom_id"], line["url"]) for line in lines] == [("a", "/v1/chat/completions"),
+                                                                     ("b", "/v1/chat/completions"),
+                                                                     ("c", "/v1/chat/completions")]
+    assert server.batches["batch-0"]["endpoint"] == "/v1/chat/completions"
+    assert not list(tmp_path.glob("state.json*"))
+
+    # 成功的结果已缓存，重跑只提交失败的请求
+    received.clear()
+    done = batch.run(payloads(client, "abc"), lambda cid, result: received.setdefault(cid, True))
+    assert done == {"a": True, "b": True, "c": False} and len(server.batches) == 2
+    assert [json.loads(line)["custom_id"] for line in server.uploads[1].decode("utf-8").splitlines()] == ["c"]
+
+
+def test_resume_polls_existing_batch(server, client, tmp_path):
+    state = tmp_path / "state.json"
+    server.polls_needed = 3
+    assert LLMBatch(client, str(state), poll_interval=0.01, max_wait=0).run(payloads(client, "ab"), None) == {}
+    assert json.loads(state.read_text(encoding="utf-8"))["batch_id"] == "batch-0"
+
+    received = []
+    done = LLMBatch(client, str(state), poll_interval=0.01).run(
+        payloads(client, "abd"), lambda cid, result: received.append(cid) or True)
+    assert done == {"a": True, "b": True, "d": True}
+    assert len(server.batches) == 2 and sorted(received) == ["a", "b", "d"]
+    assert [json.loads(line)["custom_id"] for line in server.uploads[1].decode("utf-8").splitlines()] == ["d"]
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+LLM 响应缓存测试：键覆盖模型/提示词/输入/预填充/温度、命中不再请求、流式命中回放、按提示词版本清理
+"""
+
+import pytest
+
+from modules.llm_cache import LLMCache, prompt_version
+from modules.llm_client import LLMClient
+
+
+def payload(system="系统", user="章节", prefill=None, **params):
+    messages = [{"role": "system", "content": system}, {"role": "user", "content": user}]
+    if prefill is not None:
+        messages.append({"role": "assistant", "content": prefill})
+    return {"model": "m", "messages": messages, "temperature": 0.7, **params}
+
+
+def response(text, finish_reason="stop"):
+    return {"choices": [{"message": {"content": text}, "finish_reason": finish_reason}],
+            "usage": {"total_tokens": 100}}
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    client = LLMClient("http://127.0.0.1:9/unused", "key", "m", cache=LLMCache(str(tmp_path), "prompt_change"))
+    calls = []
+
+    def post(body):
+        calls.append(body)
+        return response(f"回复{len(calls)}", "length" if body["messages"][1]["content"] == "长" else "stop")
+
+    monkeypatch.setattr(client, "_post", post)
+    monkeypatch.setattr(client, "_post_stream", lambda body, on_text: post(body))
+    client.calls = calls
+    return client
+
+
+def test_key_covers_everything_that_changes_the_reply():
+    base = LLMCache.make_key(payload())
+    assert LLMCache.make_key(payload(stream=True)) == base
+    for changed in (payload(system="新系统"), payload(user="另一章"), payload(prefill="{"),
+                    payload(temperature=0.2), {**payload(), "model": "other"}):
+        assert LLMCache.make_key(changed) != base
+
+
+def test_hit_skips_request_and_counts(client):
+    messages = payload()["messages"]
+    first = client.chat(messages, temperature=0.7)
+    second = client.chat(messages, temperature=0.7)
+    assert first == second and len(client.calls) == 1
+    client.chat(messages, temperature=0.2)
+    stats = client.cache.stats()
+    assert (stats["hits"], stats["misses"], stats["stores"], stats["entries"]) == (1, 2, 2, 2)
+    assert stats["saved_tokens"] == 100
+
+
+def test_stream_hit_replays_text_and_truncated_reply_is_not_cached(client):
+    messages = payload()["messages"]
+    client.chat(messages, temperature=0.7)
+    received = []
+    result = client.chat_stream(messages, on_text=received.append, temperature=0.7)
+    assert received == [LLMClient.content(result)] and len(client.calls) == 1
+
+    truncated = payload(user="长")["messages"]
+    client.chat(truncated)
+    client.chat(truncated)
+    assert len(client.calls) == 3
+
+
+def test_invalidate_removes_only_old_prompt_versions(tmp_path):
+    cache = LLMCache(str(tmp_path), "prompt_change")
+    cache.put(payload(system="旧提示词"), response("a"))
+    cache.put(payload(system="新提示词", user="1"), response("b"))
+    cache.put(payload(system="新提示词", user="2"), response("c"))
+    other = LLMCache(str(tmp_path), "prompt_image")
+    other.put(payload(system="旧提示词"), response("d"))
+
+    assert cache.invalidate(prompt_version("新提示词")) == 1
+    assert cache.get(payload(system="旧提示词")) is None
+    assert cache.get(payload(system="新提示词", user="2")) == response("c")
+    assert other.stats()["entries"] == 1
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+LLM 客户端测试：超时和 429/5xx 重试、不可重试错误、协程并发共享连接池、SSE 流式输出
+"""
+
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from modules import llm_client
+from modules.http_transport import HTTPTransport
+from modules.llm_client import LLMClient, LLMError, backoff_delay
+
+
+class SSE:
+    """流式响应：依次发送的事件数据，每个事件发送前调用 before(序号)"""
+
+    def __init__(self, events, before=None):
+        self.events = events
+        self.before = before
+
+
+def sse_deltas(texts, finish=True):
+    events = [json.dumps({"choices": [{"delta": {"content": t}, "finish_reason": None}]}) for t in texts]
+    if finish:
+        events.append(json.dumps({"choices": [{"delta": {}, "finish_reason": "stop"}],
+                                  "usage": {"total_tokens": 5, "prompt_tokens": 1}}))
+        events.append("[DONE]")
+    return events
+
+
+class StubServer:
+    """本地 chat/completions 桩服务：按顺序返回预设的响应，用完后一律返回200"""
+
+    def __init__(self, responses=(), delay=0.0):
+        self.responses = list(responses)
+        self.delay = delay
+        self.requests = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with stub.lock:
+                    stub.requests.append((body, self.client_address))
+                    response = stub.responses.pop(0) if stub.responses else None
+                    stub.active += 1
+                    stub.max_active = max(stub.max_active, stub.active)
+                try:
+                    if isinstance(response, SSE):
+                        self.send_sse(response)
+                        return
+                    status, payload, sleep = response or (200, None, stub.delay)
+                    time.sleep(sleep)
+                    if payload is None:
+                        payload = {"choices": [{"message": {"content": body["messages"][-1]["content"]}}],
+                                   "usage": {"total_tokens": 3, "prompt_tokens": 1}}
+                    data = json.dumps(payload).encode("utf-8")
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    with stub.lock:
+                        stub.active -= 1
+
+            def send_sse(self, response):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for i, event in enumerate(response.events):
+                    if response.before:
+                        response.before(i)
+                    data = f"data: {event}\n\n".encode("utf-8")
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/chat/completions"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(llm_client, "backoff_delay", lambda *args, **kwargs: 0.0)
+
+
+def make_client(server, **kwargs):
+    return LLMClient(server.url, "key", "model", **kwargs)
+
+
+def test_retries_timeouts_and_transient_errors(no_backoff):
+    server = StubServer([(200, None, 1.0), (429, {"error": "Too Many Requests"}, 0), (503, {}, 0)])
+    client = make_client(server, timeout=(1, 0.3), max_retries=3)
+    try:
+        result = client.chat([{"role": "user", "content": "你好"}], temperature=0.7)
+        assert LLMClient.content(result) == "你好"
+        assert len(server.requests) == 4
+        assert server.requests[-1][0] == {"model": "model", "messages": [{"role": "user", "content": "你好"}],
+                                          "temperature": 0.7}
+    finally:
+        server.close()
+
+
+def test_non_retryable_error_and_exhausted_retries(no_backoff):
+    server = StubServer([(400, {"error": "bad"}, 0), (500, {}, 0), (500, {}, 0)])
+    client = make_client(server, max_retries=1)
+    try:
+        with pytest.raises(LLMError) as bad:
+            client.chat([{"role": "user", "content": "x"}])
+        assert bad.value.status_code == 400 and not bad.value.retryable
+        assert len(server.requests) == 1
+        with pytest.raises(LLMError) as exhausted:
+            client.chat([{"role": "user", "content": "x"}])
+        assert exhausted.value.status_code == 500 and len(server.requests) == 3
+    finally:
+        server.close()
+
+
+def test_backoff_is_jittered_and_honours_retry_after():
+    delays = [backoff_delay(3, base=1, cap=60) for _ in range(50)]
+    assert all(0 <= d <= 4 for d in delays) and len(set(delays)) > 1
+    assert backoff_delay(10, base=1, cap=5) <= 5
+    assert backoff_delay(1, base=1, cap=60, retry_after=7) >= 7
+
+
+def test_async_requests_run_concurrently_on_shared_pool():
+    server = StubServer(delay=0.3)
+    transport = HTTPTransport(pool_size=4)
+    client = make_client(server, transport=transport)
+
+    async def run():
+        semaphore = asyncio.Semaphore(4)
+
+        async def one(i):
+            async with semaphore:
+                return await client.chat_async([{"role": "user", "content": str(i)}])
+
+        return await asyncio.gather(*(one(i) for i in range(8)))
+
+    try:
+        start = time.monotonic()
+        results = asyncio.run(run())
+        elapsed = time.monotonic() - start
+        assert [LLMClient.content(r) for r in results] == [str(i) for i in range(8)]
+        assert server.max_active > 1
+        assert elapsed < 8 * 0.3
+        # 长连接复用：并发数不超过连接池大小时，8个请求最多建立4个TCP连接
+        assert len({address for _, address in server.requests}) <= 4
+    finally:
+        transport.close()
+        server.close()
+
+
+def test_stream_delivers_deltas_before_completion():
+    first_seen = threading.Event()
+    texts = ["你", "好", "世界"]
+
+    def before(i):
+        # 第二个增量要等客户端收到第一个后才发送，证明不是攒完整个响应再回调
+        if i == 1:
+            assert first_seen.wait(5)
+
+    server = StubServer([SSE(sse_deltas(texts), before)])
+    client = make_client(server)
+    received = []
+
+    def on_text(delta):
+        received.append(delta)
+        first_seen.set()
+
+    try:
+        result = client.chat_stream([{"role": "user", "content": "x"}], on_text=on_text)
+        assert received == texts
+        assert LLMClient.content(result) == "你好世界"
+        assert result["usage"]["total_tokens"] == 5
+        assert server.requests[0][0]["stream"] is True
+    finally:
+        server.close()
+
+
+def test_stream_retries_only_before_first_delta(no_backoff):
+    server = StubServer([(503, {}, 0), SSE(sse_deltas(["半"], finish=False)), SSE(sse_deltas(["ok"]))])
+    client = make_client(server, max_retries=3)
+    try:
+        with pytest.raises(LLMError) as truncated:
+            client.chat_stream([{"role": "user", "content": "x"}], on_text=lambda delta: None)
+        # 503 重试了；已输出文本后的中断不重试
+        assert not truncated.value.retryable and len(server.requests) == 2
+    finally:
+        server.close()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+媒体时长读取测试（构造WAV/MP4头，不依赖ffprobe）
+"""
+
+import struct
+import wave
+
+import pytest
+
+from modules import media_info
+
+
+def write_wav(path, seconds, rate=16000):
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(b"\x00\x00" * int(seconds * rate))
+
+
+def box(box_type, payload):
+    return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+
+def mvhd(timescale, duration, version=0):
+    if version == 1:
+        body = struct.pack(">B3xQQIQ", 1, 0, 0, timescale, duration)
+    else:
+        body = struct.pack(">B3xIIII", 0, 0, 0, timescale, duration)
+    return box(b"mvhd", body + b"\x00" * 80)
+
+
+def write_mp4(path, timescale, duration, moov_at_end=False, version=0):
+    ftyp = box(b"ftyp", b"isom\x00\x00\x02\x00isomiso2mp41")
+    moov = box(b"moov", mvhd(timescale, duration, version) + box(b"trak", b"\x00" * 16))
+    mdat = box(b"mdat", b"\x00" * 1024)
+    parts = [ftyp, mdat, moov] if moov_at_end else [ftyp, moov, mdat]
+    path.write_bytes(b"".join(parts))
+
+
+@pytest.fixture(autouse=True)
+def no_ffprobe(monkeypatch):
+    media_info.clear_cache()
+
+    def fail(path):
+        raise AssertionError(f"不应回退到ffprobe: {path}")
+
+    monkeypatch.setattr(media_info, "probe_duration_ffprobe", fail)
+
+
+def test_wav_duration(tmp_path):
+    path = tmp_path / "audio.wav"
+    write_wav(path, 2.5)
+    assert media_info.get_media_duration(path) == pytest.approx(2.5)
+
+
+@pytest.mark.parametrize("moov_at_end", [False, True])
+@pytest.mark.parametrize("version", [0, 1])
+def test_mp4_duration(tmp_path, moov_at_end, version):
+    path = tmp_path / "paragraph_video.mp4"
+    write_mp4(path, timescale=1000, duration=12345, moov_at_end=moov_at_end, version=version)
+    assert media_info.get_media_duration(path) == pytest.approx(12.345)
+
+
+def test_cache_invalidated_when_file_changes(tmp_path):
+    path = tmp_path / "audio.wav"
+    write_wav(path, 1.0)
+    assert media_info.get_media_duration(path) == pytest.approx(1.0)
+    before = media_info.get_stats()["cached"]
+    assert media_info.get_media_duration(path) == pytest.approx(1.0)
+    assert media_info.get_stats()["cached"] == before + 1
+
+    write_wav(path, 3.0)
+    assert media_info.get_media_duration(path) == pytest.approx(3.0)
+
+
+def test_unknown_format_falls_back_to_ffprobe(tmp_path, monkeypatch):
+    path = tmp_path / "bgm.mp3"
+    path.write_bytes(b"ID3" + b"\x00" * 100)
+    monkeypatch.setattr(media_info, "probe_duration_ffprobe", lambda p: 42.0)
+    assert media_info.get_media_duration(path) == 42.0
+
+
+def test_zero_header_duration_falls_back_to_ffprobe(tmp_path, monkeypatch):
+    path = tmp_path / "fragmented.mp4"
+    write_mp4(path, timescale=1000, duration=0)
+    assert media_info.get_media_duration(path, probe=False) == 0.0
+    monkeypatch.setattr(media_info, "probe_duration_ffprobe", lambda p: 7.5)
+    assert media_info.get_media_duration(path) == 7.5
+
+
+def test_missing_file_is_zero(tmp_path):
+    assert media_info.get_media_duration(tmp_path / "missing.wav") == 0.0
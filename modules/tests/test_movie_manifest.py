@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+完整电影增量拼接清单测试
+"""
+
+import os
+
+from modules.movie_manifest import build_manifest, load_manifest, plan_movie, save_manifest, stale_parts
+
+SETTINGS = {"profile": "final", "audio_bitrate": "128k", "bgm": None}
+
+
+def make_chapters(tmp_path, durations):
+    chapters = []
+    for i, duration in enumerate(durations, 1):
+        video = tmp_path / f"chapter_{i:03d}.mp4"
+        if not video.exists():
+            video.write_bytes(b"v")
+        chapters.append((f"chapter_{i:03d}", str(video), duration))
+    return chapters
+
+
+def first_pass(tmp_path, durations, parts_dir):
+    chapters = make_chapters(tmp_path, durations)
+    entries, dirty = plan_movie(chapters, None, SETTINGS, parts_dir)
+    for entry in entries:
+        if entry["part"]:
+            open(entry["part"], "wb").close()
+    return build_manifest(entries, SETTINGS, "movie.mp4"), dirty
+
+
+def test_append_only_plans_new_chapters(tmp_path):
+    parts = tmp_path / "parts"
+    parts.mkdir()
+    manifest, dirty = first_pass(tmp_path, [10.0, 20.0], str(parts))
+    assert dirty == [0, 1]
+
+    entries, dirty = plan_movie(make_chapters(tmp_path, [10.0, 20.0, 5.0]), manifest, SETTINGS, str(parts))
+    assert dirty == [2]
+    assert entries[2]["start"] == 30.0
+
+
+def test_changed_chapter_replans_shifted_tail(tmp_path):
+    parts = tmp_path / "parts"
+    parts.mkdir()
+    manifest, _ = first_pass(tmp_path, [10.0, 20.0, 5.0], str(parts))
+
+    video = tmp_path / "chapter_002.mp4"
+    video.write_bytes(b"longer")
+    _, dirty = plan_movie(make_chapters(tmp_path, [10.0, 25.0, 5.0]), manifest, SETTINGS, str(parts))
+    assert dirty == [1, 2]
+
+    # 源视频未变但分段丢失也需要重新混音
+    os.remove(parts / "chapter_001.mp4")
+    _, dirty = plan_movie(make_chapters(tmp_path, [10.0, 20.0, 5.0]), manifest, SETTINGS, str(parts))
+    assert 0 in dirty
+
+
+def test_settings_change_replans_everything(tmp_path):
+    manifest, _ = first_pass(tmp_path, [10.0, 20.0], None)
+    _, dirty = plan_movie(make_chapters(tmp_path, [10.0, 20.0]), manifest, SETTINGS, None)
+    assert dirty == []
+    _, dirty = plan_movie(make_chapters(tmp_path, [10.0, 20.0]), manifest, dict(SETTINGS, audio_bitrate="64k"), None)
+    assert dirty == [0, 1]
+
+
+def test_manifest_roundtrip_and_stale_parts(tmp_path):
+    parts = tmp_path / "parts"
+    parts.mkdir()
+    manifest, _ = first_pass(tmp_path, [10.0, 20.0], str(parts))
+    path = tmp_path / "movie.manifest.json"
+    save_manifest(str(path), manifest)
+    assert load_manifest(str(path)) == manifest
+
+    path.write_text("{broken")
+    assert load_manifest(str(path)) is None
+
+    entries, _ = plan_movie(make_chapters(tmp_path, [10.0]), manifest, SETTINGS, str(parts))
+    assert stale_parts(manifest, entries) == [str(parts / "chapter_002.mp4")]
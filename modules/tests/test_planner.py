@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+运行计划测试：只读、按产物状态和缓存列出工作、历史耗时估算、保存和读取
+"""
+
+import io
+import json
+import subprocess
+import wave
+
+import pytest
+
+from modules import artifact_io
+from modules.planner import (FROM_CACHE, GENERATE, MISSING, UPSTREAM, RunPlan, build_plan, estimate_plan,
+                             resolve_chapter_files)
+from modules.render_profiles import BUILTIN_PROFILES
+
+PROFILE = BUILTIN_PROFILES["final"]
+
+
+def wav_bytes(seconds, rate=8000):
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(b"\x00\x00" * int(seconds * rate))
+    return buffer.getvalue()
+
+
+class FakeCache:
+    def __init__(self, keys):
+        self.keys = set(keys)
+
+    def contains(self, key):
+        return key in self.keys
+
+    def fetch(self, key, dest):
+        raise AssertionError("计划模式不应取回缓存")
+
+
+def write_chapter(tmp_path, chapter_no, paragraphs):
+    data = {
+        "章节信息": {"章节号": f"第{chapter_no}章", "标题": "测试"},
+        "场景拆解": [
+            {
+                "序号": i + 1,
+                "段落标题": f"段落{i + 1}",
+                "场景文案": text,
+                "场景列表": [{"场景编号": f"{chapter_no}-{i + 1}-{s}", "图片提示词": f"提示词{i}-{s}"} for s in range(2)],
+            }
+            for i, text in enumerate(paragraphs)
+        ],
+    }
+    path = tmp_path / f"chapter_{chapter_no:03d}_processed.json"
+    path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    return str(path)
+
+
+@pytest.fixture(autouse=True)
+def no_subprocess(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("计划模式不应启动子进程")
+
+    monkeypatch.setattr(subprocess, "run", fail)
+    monkeypatch.setattr(subprocess, "Popen", fail)
+
+
+def test_plan_lists_exact_work(tmp_path):
+    output = tmp_path / "output"
+    chapter = write_chapter(tmp_path, 1, ["第一段文案", "第二段"])
+    para1 = output / "1-测试" / "1-段落1"
+    # 段落1：音频和两张图都已就绪，段落视频缺失
+    artifact_io.write_bytes(para1 / "audio.wav", wav_bytes(1.0))
+    for s in range(2):
+        artifact_io.write_bytes(para1 / f"scene_1-1-{s}.jpg", b"\xff\xd8data\xff\xd9")
+    # 段落2：音频缺失但在缓存中，一张旧图写了一半
+    para2 = output / "1-测试" / "2-段落2"
+    para2.mkdir(parents=True)
+    (para2 / "scene_1-2-0.jpg").write_bytes(b"\xff\xd8trunc")
+    (para2 / "scene_1-2-1.jpg").write_bytes(b"\xff\xd8ok\xff\xd9")
+
+    cache = FakeCache({"tts:第二段", "img:提示词1-0"})
+    plan = build_plan([chapter], str(output), PROFILE, cache=cache,
+                      tts_key=lambda text: f"tts:{text}", image_key=lambda prompt: f"img:{prompt}")
+
+    jobs = [(j.paragraph, j.kind, j.action, j.reason) for j in plan.jobs]
+    assert jobs == [
+        ("1-段落1", "video", "render", MISSING),
+        ("2-段落2", "audio", FROM_CACHE, MISSING),
+        ("2-段落2", "scene", FROM_CACHE, MISSING),
+        ("2-段落2", "video", "render", UPSTREAM),
+        ("", "chapter_video", "render", UPSTREAM),
+    ]
+    counts = plan.counts()
+    assert counts["tts_calls"] == 0 and counts["image_jobs"] == 0 and counts["cache_fetches"] == 2
+    assert counts["segment_encodes"] == 4 and counts["chapter_remuxes"] == 1
+    # 只读：旧图没有被补写元数据文件
+    assert not artifact_io.sidecar_path(para2 / "scene_1-2-1.jpg").exists()
+
+
+def test_estimate_uses_history_and_costs(tmp_path):
+    output = tmp_path / "output"
+    chapter = write_chapter(tmp_path, 2, ["一二三四五", "六七八九十"])
+    plan = build_plan([chapter], str(output), PROFILE)
+    counts = plan.counts()
+    assert counts["tts_calls"] == 2 and counts["tts_chars"] == 10 and counts["image_jobs"] == 4
+    assert all(j.action == GENERATE for j in plan.jobs if j.kind in ("audio", "scene"))
+
+    estimate = estimate_plan(plan, seconds={"audio": 2.0, "scene": 10.0, "video": 6.0, "chapter_video": 4.0},
+                             costs={"tts_per_char": 0.01, "image_per_job": 0.5}, network_workers=2, cpu_workers=1)
+    assert estimate["network_seconds"] == pytest.approx(2 * 2.0 + 4 * 10.0)
+    assert estimate["cpu_seconds"] == pytest.approx(2 * 6.0 + 4.0)
+    assert estimate["wall_seconds"] == pytest.approx(22.0)
+    assert estimate["cost"] == pytest.approx(10 * 0.01 + 4 * 0.5)
+
+
+def test_plan_round_trip(tmp_path):
+    done_chapter = write_chapter(tmp_path, 3, [])
+    todo_chapter = write_chapter(tmp_path, 4, ["文案"])
+    plan = build_plan([done_chapter, todo_chapter], str(tmp_path / "output"), PROFILE)
+    path = tmp_path / "plan.json"
+    plan.save(str(path))
+    loaded = RunPlan.load(str(path))
+    assert loaded == plan
+    assert [c.chapter_json for c in loaded.pending_chapters()] == [todo_chapter]
+
+
+def test_chapter_files_resolve_per_chapter(tmp_path):
+    merged, processed = tmp_path / "merged", tmp_path / "processed"
+    merged.mkdir()
+    processed.mkdir()
+    for name in ("chapter_001_processed.json", "chapter_002_processed.json", "chapter_003_processed.json"):
+        (processed / name).write_text("{}", encoding="utf-8")
+    # 流水线中断：只合并了第2章
+    (merged / "chapter_002_processed.json").write_text("{}", encoding="utf-8")
+    dirs = (str(merged), str(processed))
+
+    assert resolve_chapter_files(search_dirs=dirs) == [
+        processed / "chapter_001_processed.json",
+        merged / "chapter_002_processed.json",
+        processed / "chapter_003_processed.json",
+    ]
+    assert resolve_chapter_files(["chapter_002_processed.json", "chapter_009_processed.json"], search_dirs=dirs) == [
+        merged / "chapter_002_processed.json", processed / "chapter_009_processed.json"]
+    # 指定目录时只读该目录
+    assert resolve_chapter_files(chapters_dir=str(merged)) == [merged / "chapter_002_processed.json"]
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+限流器测试：令牌桶速率、并发槽位、自适应降速/恢复、asyncio 和跨进程共享
+"""
+
+import asyncio
+import multiprocessing
+import threading
+import time
+
+import pytest
+
+from modules import rate_limit
+from modules.rate_limit import RateLimiter, is_rate_limited
+
+
+def test_bucket_limits_rate_after_burst():
+    limiter = RateLimiter("test", rate=20, burst=5)
+    start = time.monotonic()
+    for _ in range(15):
+        limiter.acquire()
+    # 前5个来自突发容量，其余10个按每秒20个发放
+    assert 0.4 <= time.monotonic() - start < 1.0
+
+
+def test_slot_caps_concurrency_across_threads():
+    limiter = RateLimiter("test", rate=1000, max_concurrent=3)
+    active, peak, lock = [0], [0], threading.Lock()
+
+    def call():
+        with limiter.slot():
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.05)
+            with lock:
+                active[0] -= 1
+
+    threads = [threading.Thread(target=call) for _ in range(12)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert peak[0] == 3
+
+
+def test_rate_limit_error_halves_rate_then_recovers(monkeypatch):
+    monkeypatch.setattr(rate_limit, "INCREASE_INTERVAL", 0.0)
+    limiter = RateLimiter("test", rate=10)
+
+    class ThrottledError(Exception):
+        code = "RequestLimitExceeded"
+
+    with pytest.raises(ThrottledError):
+        with limiter.slot():
+            raise ThrottledError("too fast")
+    assert limiter.current_rate() == 5
+
+    limiter.report_success()
+    assert limiter.current_rate() == pytest.approx(6)
+
+
+def test_is_rate_limited():
+    assert is_rate_limited({"code": 50429})
+    assert not is_rate_limited({"code": 10000})
+    assert is_rate_limited(type("Response", (), {"status_code": 429})())
+    assert is_rate_limited(Exception("429 Client Error: Too Many Requests"))
+    assert not is_rate_limited(ValueError("bad prompt"))
+
+
+def test_async_slot_shares_bucket():
+    limiter = RateLimiter("test", rate=20, burst=1, max_concurrent=2)
+
+    async def call():
+        async with limiter.async_slot():
+            await asyncio.sleep(0.01)
+
+    async def main():
+        await asyncio.gather(*(call() for _ in range(6)))
+
+    start = time.monotonic()
+    asyncio.run(main())
+    assert time.monotonic() - start >= 0.2
+
+
+def take_tokens(state_dir, count, timestamps):
+    limiter = RateLimiter("shared", rate=20, burst=1, state_dir=state_dir)
+    for _ in range(count):
+        limiter.acquire()
+        timestamps.append(time.time())
+
+
+def test_bucket_is_shared_across_processes(tmp_path):
+    ctx = multiprocessing.get_context("fork")
+    with ctx.Manager() as manager:
+        timestamps = manager.list()
+        procs = [ctx.Process(target=take_tokens, args=(str(tmp_path), 5, timestamps)) for _ in range(3)]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join(timeout=30)
+        stamps = sorted(timestamps)
+    # 3个进程共取15个令牌，共享每秒20个的速率，约需0.7秒
+    assert len(stamps) == 15
+    assert stamps[-1] - stamps[0] >= 0.6
+
+
+def test_concurrency_limit_reads_legacy_key(monkeypatch):
+    monkeypatch.setattr(rate_limit, "_limiters", {})
+    monkeypatch.setattr(rate_limit, "_rate_limit_config",
+                        lambda: {"volcengine_submit": {"max_concurrent": 2}, "claude": {"max_concurrent_requests": 3}})
+    assert rate_limit.get_rate_limiter("volcengine_submit").max_concurrent == 2
+    assert rate_limit.get_rate_limiter("claude").max_concurrent == 3
+    assert rate_limit.get_rate_limiter("tencent_tts").max_concurrent == 10
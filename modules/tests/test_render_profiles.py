@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+渲染档位测试
+"""
+
+import pytest
+
+from modules import render_profiles
+from modules.render_profiles import BUILTIN_PROFILES, get_render_profile
+
+
+@pytest.fixture
+def render_config(monkeypatch):
+    config = {}
+    monkeypatch.setattr(render_profiles, "_render_config", lambda: config)
+    return config
+
+
+def test_output_name_keeps_final_names():
+    assert BUILTIN_PROFILES["final"].output_name("paragraph_video.mp4") == "paragraph_video.mp4"
+    assert BUILTIN_PROFILES["preview"].output_name("paragraph_video.mp4") == "paragraph_video.preview.mp4"
+
+
+def test_default_profile_from_config(render_config):
+    assert get_render_profile().name == "final"
+    render_config["profile"] = "draft"
+    assert get_render_profile().size == "1280x720"
+
+
+def test_config_overrides_and_custom_profiles(render_config):
+    render_config["profiles"] = {
+        "preview": {"crf": 32},
+        "review": {"width": 1600, "height": 900, "prescale": [2000, 1125]},
+    }
+    assert get_render_profile("preview").crf == 32
+    assert get_render_profile("preview").fps == 24
+    review = get_render_profile("review")
+    assert review.prescale == (2000, 1125)
+    assert review.preset == BUILTIN_PROFILES["final"].preset
+
+
+def test_unknown_profile_and_field(render_config):
+    with pytest.raises(ValueError):
+        get_render_profile("4k")
+    render_config["profiles"] = {"preview": {"bitrate": "1M"}}
+    with pytest.raises(ValueError):
+        get_render_profile("preview")
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+单张场景图片生成测试（非批量路径，使用假客户端，不访问网络）：提交后台账记录task_id，完成后标记done
+"""
+
+import pytest
+
+pytest.importorskip("requests")
+
+from modules import volcengine_img2img_official as volc
+from modules.ledger import DONE, SUBMITTED, ArtifactJob, ArtifactKey, JobLedger
+
+
+DONE_RESULT = {"code": 10000, "data": {"status": "done", "image_urls": ["http://x/task-1.jpg"]}}
+
+
+class FakeClient:
+    """提交立即返回task_id，查询直接完成，保存时写入图片文件"""
+
+    build_prompt_form = staticmethod(volc.VolcengineImg2ImgOfficial.build_prompt_form)
+
+    def __init__(self, access_key_id, secret_access_key, region="cn-north-1"):
+        pass
+
+    def prompt_to_image(self, prompt, **kwargs):
+        return {"code": 10000, "data": {"task_id": "task-1"}}
+
+    def get_task_result(self, task_id):
+        return DONE_RESULT
+
+    def save_result(self, result, output_path):
+        with open(output_path, "wb") as f:
+            f.write(b"\xff\xd8\xff\xe0jpeg")
+        return output_path
+
+
+@pytest.fixture
+def fake_client(monkeypatch):
+    monkeypatch.setattr(volc, "VolcengineImg2ImgOfficial", FakeClient)
+    return FakeClient
+
+
+def test_generate_image_from_prompt_reports_task_id(tmp_path, fake_client):
+    submitted = []
+    path = volc.generate_image_from_prompt(str(tmp_path / "scene_1.jpg"), "ak", "sk", prompt="写实风格",
+                                           on_submit=submitted.append)
+    assert path == str(tmp_path / "scene_1.jpg")
+    assert submitted == ["task-1"]
+
+
+def test_single_scene_image_goes_through_submitted_to_done(tmp_path, fake_client, monkeypatch):
+    loop = pytest.importorskip("loop")
+    ledger = JobLedger(str(tmp_path / "ledger.sqlite3"))
+    key = ArtifactKey("1-章节", "1-开端", "scene", "scene_1.jpg")
+    ledger.register(key, chapter_no=1)
+    job = ArtifactJob(ledger, key)
+    seen = []
+    # 等待结果时台账应已记录提交的task_id
+    monkeypatch.setattr(FakeClient, "get_task_result",
+                        lambda self, task_id: seen.append(ledger.get(key)["state"]) or DONE_RESULT)
+
+    img_path = tmp_path / "scene_1.jpg"
+    result = loop.ensure_scene_image({"access_key_id": "ak", "secret_access_key": "sk"},
+                                     {"图片提示词": "写实风格"}, img_path, job)
+    assert result == str(img_path)
+    assert seen == [SUBMITTED]
+    row = ledger.get(key)
+    assert row["state"] == DONE and row["task_id"] == "task-1"
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+任务图调度器测试
+"""
+
+import threading
+import time
+
+import pytest
+
+from modules.scheduler import TaskGraph, TaskGraphError, NETWORK, CPU, DONE, FAILED, SKIPPED
+
+
+def test_dependencies_run_before_dependents():
+    graph = TaskGraph()
+    order = []
+    lock = threading.Lock()
+
+    def step(name):
+        def run():
+            with lock:
+                order.append(name)
+            return name
+        return run
+
+    graph.add("audio", step("audio"), pool=NETWORK)
+    graph.add("image", step("image"), pool=NETWORK)
+    graph.add("video", step("video"), deps=["audio", "image"], pool=CPU)
+    graph.add("chapter", lambda: graph.result("video") + "+chapter", deps=["video"])
+    graph.run(network_workers=2, cpu_workers=2)
+
+    assert order.index("video") > order.index("audio")
+    assert order.index("video") > order.index("image")
+    assert graph.result("chapter") == "video+chapter"
+    assert graph.summary() == {DONE: 4}
+
+
+def test_paragraph_starts_before_other_paragraph_inputs_finish():
+    graph = TaskGraph()
+    events = {}
+
+    def slow_image():
+        time.sleep(0.3)
+        events["slow_image_done"] = time.monotonic()
+
+    def video():
+        events["p0_video_start"] = time.monotonic()
+
+    graph.add("p0/audio", lambda: None, pool=NETWORK)
+    graph.add("p1/image", slow_image, pool=NETWORK)
+    graph.add("p0/video", video, deps=["p0/audio"])
+    graph.add("p1/video", lambda: None, deps=["p1/image"])
+    graph.run(network_workers=2, cpu_workers=1)
+
+    assert events["p0_video_start"] < events["slow_image_done"]
+
+
+def test_failure_skips_only_downstream():
+    graph = TaskGraph()
+
+    def boom():
+        raise RuntimeError("tts failed")
+
+    graph.add("p0/audio", boom, pool=NETWORK)
+    graph.add("p0/video", lambda: None, deps=["p0/audio"])
+    graph.add("p1/audio", lambda: None, pool=NETWORK)
+    graph.add("p1/video", lambda: None, deps=["p1/audio"])
+    graph.add("chapter", lambda: None, deps=["p0/video", "p1/video"])
+    nodes = graph.run()
+
+    assert nodes["p0/audio"].state == FAILED
+    assert isinstance(nodes["p0/audio"].error, RuntimeError)
+    assert nodes["p0/video"].state == SKIPPED
+    assert nodes["p1/video"].state == DONE
+    assert nodes["chapter"].state == SKIPPED
+
+
+def test_pools_are_bounded():
+    graph = TaskGraph()
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def work():
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.pop()
+
+    for i in range(8):
+        graph.add(f"n{i}", work, pool=NETWORK)
+    graph.run(network_workers=3, cpu_workers=1)
+
+    assert max(peak) <= 3
+
+
+def test_invalid_graphs_are_rejected():
+    graph = TaskGraph()
+    graph.add("a", lambda: None)
+    with pytest.raises(TaskGraphError):
+        graph.add("a", lambda: None)
+
+    graph.add("b", lambda: None, deps=["missing"])
+    with pytest.raises(TaskGraphError):
+        graph.run()
+
+    cyclic = TaskGraph()
+    cyclic.add("x", lambda: None, deps=["y"])
+    cyclic.add("y", lambda: None, deps=["x"])
+    with pytest.raises(TaskGraphError):
+        cyclic.validate()
+
+
+def test_guard_failure_aborts_graph():
+    graph = TaskGraph()
+    ran = []
+    lost = threading.Event()
+
+    def guard():
+        if lost.is_set():
+            raise RuntimeError("lease lost")
+
+    def first():
+        ran.append("first")
+        lost.set()
+
+    graph.add("first", first)
+    graph.add("second", lambda: ran.append("second"), deps=["first"])
+    with pytest.raises(RuntimeError):
+        graph.run(cpu_workers=1, guard=guard)
+    assert ran == ["first"]
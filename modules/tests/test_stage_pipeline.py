@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+分阶段流水线测试：条目完成一个阶段即进入下一阶段、有界队列限制积压、失败和中止的条目不影响其他条目
+"""
+
+import asyncio
+
+from modules.stage_pipeline import Stage, run_stages
+
+
+def test_items_flow_through_stages_as_soon_as_ready():
+    events = []
+
+    async def first(item):
+        await asyncio.sleep(0.01 * item)
+        events.append(("first", item))
+        return item
+
+    async def second(item):
+        events.append(("second", item))
+        return item * 10
+
+    results = []
+
+    async def sink(item):
+        results.append(item)
+        return item
+
+    stats = asyncio.run(run_stages(range(1, 6), [Stage("first", first, 5), Stage("second", second, 1),
+                                                 Stage("sink", sink)]))
+    # 第一个条目在其余条目完成第一阶段之前就进入了第二阶段
+    assert events.index(("second", 1)) < events.index(("first", 5))
+    assert sorted(results) == [10, 20, 30, 40, 50]
+    assert stats["second"] == {"done": 5, "dropped": 0, "failed": 0}
+
+
+def test_bounded_queue_applies_backpressure():
+    started = []
+    release = None
+
+    async def produce(item):
+        started.append(item)
+        return item
+
+    async def slow(item):
+        await release.wait()
+        return item
+
+    async def main():
+        nonlocal release
+        release = asyncio.Event()
+        task = asyncio.create_task(run_stages(range(20), [Stage("produce", produce), Stage("slow", slow)],
+                                              queue_size=2))
+        await asyncio.sleep(0.05)
+        blocked = len(started)
+        release.set()
+        return blocked, await task
+
+    blocked, stats = asyncio.run(main())
+    # 下游卡住时：下游手里1个 + 队列中2个 + 上游等待放入的1个
+    assert blocked == 4
+    assert stats["slow"]["done"] == 20
+
+
+def test_failures_and_drops_do_not_stop_other_items():
+    async def check(item):
+        if item == 2:
+            raise ValueError("bad")
+        return None if item == 3 else item
+
+    passed = []
+
+    async def collect(item):
+        passed.append(item)
+        return item
+
+    stats = asyncio.run(run_stages(range(5), [Stage("check", check, 2), Stage("collect", collect)]))
+    assert sorted(passed) == [0, 1, 4]
+    assert stats["check"] == {"done": 3, "dropped": 1, "failed": 1}
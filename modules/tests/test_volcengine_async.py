@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+异步火山引擎客户端测试（使用假客户端，不访问网络）：按观测耗时排期、结果流式回调、失败与查询异常、截止时间和取消
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("requests")
+
+from modules.volcengine_async import AsyncVolcengineClient, VolcengineTaskFailed, generate_images_async
+from modules.volcengine_img2img_official import VolcengineImg2ImgError
+
+
+class FakeClient:
+    """每个任务提交 latency 秒后完成；fail_prompts 中的任务失败，flaky 次查询先抛异常"""
+
+    def __init__(self, latency=0.2, fail_prompts=(), flaky=0):
+        self.latency = latency
+        self.fail_prompts = set(fail_prompts)
+        self.flaky = flaky
+        self.lock = threading.Lock()
+        self.tasks = {}
+        self.polls = {}
+
+    def prompt_to_image(self, prompt, **kwargs):
+        with self.lock:
+            task_id = f"task-{len(self.tasks)}"
+            self.tasks[task_id] = (prompt, time.monotonic())
+            self.polls[task_id] = 0
+        return {"code": 10000, "data": {"task_id": task_id}}
+
+    def query_task(self, task_id):
+        with self.lock:
+            self.polls[task_id] += 1
+            if self.flaky:
+                self.flaky -= 1
+                raise VolcengineImg2ImgError("查询接口超时")
+        prompt, submitted = self.tasks[task_id]
+        if time.monotonic() - submitted < self.latency:
+            return {"code": 10000, "data": {"status": "generating"}}
+        if prompt in self.fail_prompts:
+            return {"code": 10000, "data": {"status": "failed", "message": "bad prompt"}}
+        return {"code": 10000, "data": {"status": "done", "image_urls": [f"http://x/{task_id}.jpg"]}}
+
+    def save_result(self, result, output_path):
+        return output_path
+
+
+def make_client(fake, **kwargs):
+    kwargs.setdefault("min_poll_interval", 0.02)
+    kwargs.setdefault("max_poll_interval", 0.1)
+    return AsyncVolcengineClient(fake, **kwargs)
+
+
+def test_results_stream_to_callback_and_polls_follow_observed_latency():
+    fake = FakeClient(latency=0.2)
+    client = make_client(fake)
+    streamed = []
+
+    async def main():
+        first = await client.submit_many([{"prompt": "warmup"}])
+        await client.wait_many(first)
+        task_ids = await client.submit_many([{"prompt": f"p{i}"} for i in range(5)])
+        results = await client.wait_many(task_ids, on_result=lambda t, r, e: streamed.append((t, e)))
+        return task_ids, results
+
+    task_ids, results = asyncio.run(main())
+    assert sorted(t for t, _ in streamed) == sorted(task_ids)
+    assert all(error is None and results[t]["data"]["status"] == "done" for t, error in streamed)
+    assert client.expected_latency() >= 0.2
+    # 已知典型耗时后，第二批任务在接近完成时才开始查询，每个任务只查询一两次
+    assert all(fake.polls[t] <= 2 for t in task_ids)
+
+
+def test_failures_and_query_errors_only_affect_their_own_task():
+    fake = FakeClient(latency=0.05, fail_prompts={"bad"}, flaky=2)
+    jobs = [{"output_path": "out/good.jpg", "prompt": "good"}, {"output_path": "out/bad.jpg", "prompt": "bad"}]
+    outputs = asyncio.run(generate_images_async(jobs, fake, min_poll_interval=0.02, max_poll_interval=0.1))
+    assert outputs["out/good.jpg"] == "out/good.jpg"
+    assert isinstance(outputs["out/bad.jpg"], VolcengineTaskFailed)
+
+
+def test_deadline_and_cancel():
+    fake = FakeClient(latency=10)
+    client = make_client(fake)
+
+    async def main():
+        task_ids = await client.submit_many([{"prompt": "a"}, {"prompt": "b"}])
+        start = time.monotonic()
+        results = await client.wait_many(task_ids, deadline=0.2)
+        elapsed = time.monotonic() - start
+
+        task_ids = await client.submit_many([{"prompt": "c"}])
+        asyncio.get_running_loop().call_later(0.05, client.cancel)
+        cancelled = await client.wait_many(task_ids)
+        return results, elapsed, cancelled
+
+    results, elapsed, cancelled = asyncio.run(main())
+    assert elapsed < 1
+    assert all(isinstance(r, VolcengineImg2ImgError) for r in results.values())
+    assert all(isinstance(r, asyncio.CancelledError) for r in cancelled.values())
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+批量文生图任务测试（使用假客户端，不访问网络）
+"""
+
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("requests")
+
+from modules.volcengine_img2img_official import VolcengineTaskBatch, VolcengineImg2ImgError
+
+
+class FakeClient:
+    """每个任务在被查询 polls_needed 次后完成"""
+
+    def __init__(self, polls_needed=2, fail_prompts=()):
+        self.polls_needed = polls_needed
+        self.fail_prompts = set(fail_prompts)
+        self.lock = threading.Lock()
+        self.polls = {}
+        self.prompts = {}
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.submitted = []
+
+    def prompt_to_image(self, prompt, **kwargs):
+        with self.lock:
+            task_id = f"task-{len(self.submitted)}"
+            self.submitted.append(prompt)
+            self.prompts[task_id] = prompt
+            self.polls[task_id] = 0
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        return {"code": 10000, "data": {"task_id": task_id}}
+
+    def query_task(self, task_id):
+        with self.lock:
+            self.polls[task_id] += 1
+            if self.polls[task_id] < self.polls_needed:
+                return {"code": 10000, "data": {"status": "generating"}}
+            self.in_flight -= 1
+        if self.prompts[task_id] in self.fail_prompts:
+            return {"code": 10000, "data": {"status": "failed", "message": "bad prompt"}}
+        return {"code": 10000, "data": {"status": "done", "image_urls": [f"http://x/{task_id}.jpg"]}}
+
+    def save_result(self, result, output_path):
+        return output_path
+
+
+def test_batch_respects_in_flight_limit_and_completes_all():
+    client = FakeClient(polls_needed=2)
+    batch = VolcengineTaskBatch(client, max_in_flight=3, poll_interval=0.01)
+    futures = [batch.add(f"out/scene_{i}.jpg", f"prompt {i}") for i in range(10)]
+    batch.start().join(timeout=10)
+
+    assert [f.result() for f in futures] == [f"out/scene_{i}.jpg" for i in range(10)]
+    assert client.peak_in_flight <= 3
+    assert len(client.submitted) == 10
+
+
+def test_failed_task_only_fails_its_own_future():
+    client = FakeClient(polls_needed=1, fail_prompts={"bad"})
+    batch = VolcengineTaskBatch(client, max_in_flight=4, poll_interval=0.01)
+    good = batch.add("out/good.jpg", "good")
+    bad = batch.add("out/bad.jpg", "bad")
+    batch.start().join(timeout=10)
+
+    assert good.result() == "out/good.jpg"
+    assert isinstance(bad.exception(), VolcengineImg2ImgError)
+
+
+def test_cancel_pending_fails_unsubmitted_jobs_only():
+    client = FakeClient(polls_needed=3)
+    batch = VolcengineTaskBatch(client, max_in_flight=1, poll_interval=0.05)
+    first = batch.add("out/first.jpg", "first")
+    rest = [batch.add(f"out/scene_{i}.jpg", f"prompt {i}") for i in range(3)]
+    batch.start()
+    while not client.submitted:
+        time.sleep(0.01)
+    assert batch.cancel_pending() == 3
+    batch.join(timeout=10)
+
+    assert first.result() == "out/first.jpg"
+    assert all(isinstance(f.exception(), VolcengineImg2ImgError) for f in rest)
+    assert client.submitted == ["first"]
+
+
+def test_rate_limited_submit_waits_before_retrying():
+    client = FakeClient(polls_needed=1)
+    submit = client.prompt_to_image
+    attempts = []
+
+    def limited(prompt, **kwargs):
+        attempts.append(time.monotonic())
+        if len(attempts) <= 3:
+            raise VolcengineImg2ImgError("提交被限流: code=50430")
+        return submit(prompt, **kwargs)
+
+    client.prompt_to_image = limited
+    batch = VolcengineTaskBatch(client, max_in_flight=2, poll_interval=0.05)
+    future = batch.add("out/scene.jpg", "prompt")
+    batch.start().join(timeout=10)
+
+    assert future.result() == "out/scene.jpg"
+    assert len(attempts) == 4
+    assert attempts[-1] - attempts[0] >= 3 * 0.05
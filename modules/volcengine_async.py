@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+火山引擎异步任务客户端（asyncio）
+在一个事件循环里提交和轮询大量 task_id，不再每个任务占一个线程、固定间隔睡眠：
+
+- 每个任务单独排期：记录已完成任务从提交到完成的耗时，新任务在典型完成时间附近才开始密集查询，
+  超过典型耗时后从最小间隔开始逐次翻倍（不超过最大间隔）
+- 查询出错（网络异常、被限流）只推迟该任务的下一次查询，不影响其他任务
+- 支持整体截止时间和取消（取消 wait_many 所在的协程，或用 cancel() 放弃部分任务）
+- 每个任务一结束就回调 on_result，不必等整批完成
+
+SDK 和备用实现都是同步接口，实际请求通过 asyncio.to_thread 执行，查询频率仍受 volcengine_query 限流器约束。
+"""
+
+import asyncio
+import heapq
+import statistics
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Union
+
+from modules.logger import get_logger
+from modules.rate_limit import is_rate_limited
+from modules.volcengine_img2img_official import (VolcengineImg2ImgError, VolcengineImg2ImgOfficial,
+                                                 extract_task_id)
+
+logger = get_logger(__name__)
+
+DEFAULT_MIN_POLL_INTERVAL = 0.5
+DEFAULT_MAX_POLL_INTERVAL = 5.0
+DEFAULT_MAX_WAIT_TIME = 300
+DEFAULT_CONCURRENCY = 8
+LATENCY_WINDOW = 50  # 用于估计典型完成耗时的最近完成任务数
+
+# on_result(task_id, 结果, 异常)：成功时异常为None，失败时结果为None；可以是普通函数或协程函数
+ResultCallback = Callable[[str, Optional[Any], Optional[BaseException]], Union[None, Awaitable[None]]]
+
+
+class VolcengineTaskFailed(VolcengineImg2ImgError):
+    """服务端返回任务失败（不再重试查询）"""
+    pass
+
+
+class AsyncVolcengineClient:
+    """
+    批量提交和等待火山引擎异步任务
+
+    用法:
+        client = AsyncVolcengineClient(VolcengineImg2ImgOfficial(ak, sk))
+        task_ids = await client.submit_many([{"prompt": "..."}, ...])
+        results = await client.wait_many([t for t in task_ids if isinstance(t, str)],
+                                         on_result=callback, deadline=600)
+    """
+
+    def __init__(self, client: VolcengineImg2ImgOfficial,
+                 min_poll_interval: float = DEFAULT_MIN_POLL_INTERVAL,
+                 max_poll_interval: float = DEFAULT_MAX_POLL_INTERVAL,
+                 max_wait_time: float = DEFAULT_MAX_WAIT_TIME,
+                 concurrency: int = DEFAULT_CONCURRENCY):
+        """
+        初始化
+
+        Args:
+            client: 同步的火山引擎客户端（提供 prompt_to_image / query_task / save_result）
+            min_poll_interval: 最小查询间隔（秒）
+            max_poll_interval: 最大查询间隔（秒）
+            max_wait_time: 单个任务从提交起的最大等待时间（秒）
+            concurrency: 同时进行的提交/查询/下载请求数（占用的线程数）
+        """
+        self.client = client
+        self.min_poll_interval = min_poll_interval
+        self.max_poll_interval = max(min_poll_interval, max_poll_interval)
+        self.max_wait_time = max_wait_time
+        self.concurrency = max(1, int(concurrency))
+        self._latencies: deque = deque(maxlen=LATENCY_WINDOW)
+        self._submitted_at: Dict[str, float] = {}
+        self._cancelled: set = set()
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def expected_latency(self) -> Optional[float]:
+        """最近完成任务从提交到完成耗时的中位数（秒），还没有完成的任务时为None"""
+        return statistics.median(self._latencies) if self._latencies else None
+
+    def next_delay(self, age: float, misses: int) -> float:
+        """
+        任务下一次查询前的等待时间
+
+        Args:
+            age: 任务已等待的时间（秒）
+            misses: 超过典型完成耗时后已查询且未完成的次数
+
+        Returns:
+            等待秒数
+        """
+        expected = self.expected_latency()
+        if expected is not None and age < expected:
+            delay = expected - age
+        else:
+            delay = self.min_poll_interval * 2 ** misses
+        return max(self.min_poll_interval, min(self.max_poll_interval, delay))
+
+    def cancel(self, task_ids: Optional[Iterable[str]] = None) -> None:
+        """
+        放弃等待部分（默认全部）任务；对应任务以 asyncio.CancelledError 结束。
+        火山引擎没有取消接口，已提交的任务仍会在服务端执行完。
+        """
+        if task_ids is None:
+            self._cancelled.update(self._submitted_at)
+        else:
+            self._cancelled.update(task_ids)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def submit_many(self, jobs: List[Dict[str, Any]]) -> List[Union[str, Exception]]:
+        """
+        并发提交文生图任务
+
+        Args:
+            jobs: prompt_to_image 的参数字典列表
+
+        Returns:
+            与 jobs 一一对应的 task_id；提交失败的位置为异常对象
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        loop = asyncio.get_running_loop()
+
+        async def submit(params: Dict[str, Any]) -> Union[str, Exception]:
+            async with semaphore:
+                try:
+                    task_id = extract_task_id(await asyncio.to_thread(self.client.prompt_to_image, **params))
+                except Exception as e:
+                    logger.error(f"任务提交失败: {e}")
+                    return e
+            self._submitted_at[task_id] = loop.time()
+            return task_id
+
+        return list(await asyncio.gather(*(submit(params) for params in jobs)))
+
+    async def _query(self, task_id: str, output_path: Optional[str]) -> Optional[Any]:
+        """查询一次；未完成返回None，完成返回查询结果（给出 output_path 时下载后返回保存路径）"""
+        result = await asyncio.to_thread(self.client.query_task, task_id)
+        data = result.get("data", {})
+        status = data.get("status")
+        if status == "failed":
+            raise VolcengineTaskFailed(f"任务执行失败: {data.get('message', '任务失败')}")
+        if status != "done":
+            return None
+        if output_path is None:
+            return result
+        return await asyncio.to_thread(self.client.save_result, result, output_path)
+
+    async def wait_many(self, task_ids: Union[Iterable[str], Dict[str, str]],
+                        on_result: Optional[ResultCallback] = None,
+                        deadline: Optional[float] = None) -> Dict[str, Any]:
+        """
+        等待一批任务结束
+
+        Args:
+            task_ids: task_id 列表；或 {task_id: 输出路径}，此时任务完成后下载保存，结果为保存路径
+            on_result: 每个任务结束时调用 on_result(task_id, 结果, 异常)
+            deadline: 整体截止时间（从调用起的秒数），到期仍未完成的任务以超时异常结束
+
+        Returns:
+            {task_id: 结果或异常对象}
+        """
+        output_paths = dict(task_ids) if isinstance(task_ids, dict) else {task_id: None for task_id in task_ids}
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        end = start + deadline if deadline is not None else None
+        self._wakeup = asyncio.Event()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results: Dict[str, Any] = {}
+        misses: Dict[str, int] = {}
+        schedule: List = []  # (下次查询时间, task_id)
+        for task_id in output_paths:
+            submitted = self._submitted_at.setdefault(task_id, start)
+            misses[task_id] = 0
+            heapq.heappush(schedule, (submitted + self.next_delay(0, 0), task_id))
+        polling: Dict[asyncio.Task, str] = {}
+
+        async def finish(task_id: str, result: Optional[Any], error: Optional[BaseException]) -> None:
+            results[task_id] = error if error is not None else result
+            self._submitted_at.pop(task_id, None)
+            if on_result is not None:
+                try:
+                    outcome = on_result(task_id, result, error)
+                    if asyncio.iscoroutine(outcome):
+                        await outcome
+                except Exception as e:
+                    logger.warning(f"结果回调失败: {task_id}，错误: {e}")
+
+        async def poll(task_id: str) -> Optional[Any]:
+            async with semaphore:
+                return await self._query(task_id, output_paths[task_id])
+
+        def reschedule(task_id: str, now: float) -> None:
+            age = now - self._submitted_at[task_id]
+            heapq.heappush(schedule, (now + self.next_delay(age, misses[task_id]), task_id))
+            expected = self.expected_latency()
+            if expected is None or age >= expected:
+                misses[task_id] += 1
+
+        try:
+            while schedule or polling:
+                now = loop.time()
+                # 被取消的任务
+                for task_id in [t for t in output_paths if t in self._cancelled and t not in results]:
+                    for task, polled in list(polling.items()):
+                        if polled == task_id:
+                            task.cancel()
+                            del polling[task]
+                    schedule = [(due, t) for due, t in schedule if t != task_id]
+                    heapq.heapify(schedule)
+                    await finish(task_id, None, asyncio.CancelledError(f"已取消: {task_id}"))
+                # 整体截止时间和单任务超时
+                expired = [(due, t) for due, t in schedule
+                           if (end is not None and now >= end) or now - self._submitted_at[t] >= self.max_wait_time]
+                for item in expired:
+                    schedule.remove(item)
+                    await finish(item[1], None, VolcengineImg2ImgError(f"任务超时: {item[1]}"))
+                heapq.heapify(schedule)
+                if end is not None and now >= end:
+                    for task, task_id in list(polling.items()):
+                        task.cancel()
+                        await finish(task_id, None, VolcengineImg2ImgError(f"任务超时: {task_id}"))
+                    polling.clear()
+                # 到期的任务发起查询
+                while schedule and schedule[0][0] <= now:
+                    _, task_id = heapq.heappop(schedule)
+                    polling[asyncio.create_task(poll(task_id))] = task_id
+                if not schedule and not polling:
+                    break
+
+                timeout = schedule[0][0] - now if schedule else None
+                if end is not None:
+                    timeout = max(0.0, min(timeout, end - now) if timeout is not None else end - now)
+                self._wakeup.clear()
+                waker = asyncio.create_task(self._wakeup.wait())
+                done, _ = await asyncio.wait(set(polling) | {waker}, timeout=timeout,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                waker.cancel()
+
+                now = loop.time()
+                for task in done - {waker}:
+                    task_id = polling.pop(task)
+                    try:
+                        result = task.result()
+                    except VolcengineTaskFailed as e:
+                        await finish(task_id, None, e)
+                        continue
+                    except Exception as e:
+                        # 被限流、查询接口报错或下载失败：只推迟这个任务
+                        level = "被限流" if is_rate_limited(e) else "失败"
+                        logger.warning(f"查询任务 {task_id} {level}: {e}")
+                        reschedule(task_id, now)
+                        continue
+                    if result is None:
+                        reschedule(task_id, now)
+                    else:
+                        self._latencies.append(now - self._submitted_at[task_id])
+                        await finish(task_id, result, None)
+        finally:
+            # wait_many 本身被取消时，停止所有在途查询
+            for task in polling:
+                task.cancel()
+            self._wakeup = None
+            self._cancelled.difference_update(output_paths)
+        return results
+
+
+async def generate_images_async(jobs: List[Dict[str, Any]], client: VolcengineImg2ImgOfficial,
+                                on_result: Optional[ResultCallback] = None, deadline: Optional[float] = None,
+                                **kwargs) -> Dict[str, Any]:
+    """
+    批量文生图：并发提交，统一轮询，完成一个下载一个
+
+    Args:
+        jobs: 参数字典列表，每项包含 output_path 和 prompt_to_image 的参数
+        client: 同步的火山引擎客户端
+        on_result: 每个任务结束时调用 on_result(task_id, 保存路径, 异常)
+        deadline: 整体截止时间（秒）
+        **kwargs: AsyncVolcengineClient 的其他参数
+
+    Returns:
+        {输出路径: 保存路径或异常对象}
+    """
+    async_client = AsyncVolcengineClient(client, **kwargs)
+    params = [{k: v for k, v in job.items() if k != "output_path"} for job in jobs]
+    submitted = await async_client.submit_many(params)
+    outputs: Dict[str, Any] = {}
+    waiting: Dict[str, str] = {}
+    for job, task_id in zip(jobs, submitted):
+        if isinstance(task_id, Exception):
+            outputs[job["output_path"]] = task_id
+        else:
+            waiting[task_id] = job["output_path"]
+    results = await async_client.wait_many(waiting, on_result=on_result, deadline=deadline)
+    outputs.update({waiting[task_id]: result for task_id, result in results.items()})
+    return outputs
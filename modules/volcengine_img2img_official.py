@@ -8,10 +8,15 @@ import os
 import json
 import time
 import base64
-import requests
-from typing import Dict, Any, Optional
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Any, List, Optional, Tuple
 import logging
 
+from modules.http_transport import get_transport
+from modules.rate_limit import get_rate_limiter, is_rate_limited
+from modules.artifact_io import write_bytes
+
 # 设置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -71,7 +76,7 @@ class VolcengineImg2ImgOfficial:
         """
         try:
             logger.info(f"下载图片: {image_url}")
-            response = requests.get(image_url, timeout=30)
+            response = get_transport().get(image_url, timeout=(10, 30))
             response.raise_for_status()
             
             # 转换为base64
@@ -143,12 +148,47 @@ class VolcengineImg2ImgOfficial:
         
         try:
             logger.info(f"发送备用请求: {url}")
-            response = requests.post(url, headers=headers, data=body, timeout=120)
+            response = get_transport().post(url, headers=headers, data=body, timeout=(10, 120))
             response.raise_for_status()
             return response.json()
         except Exception as e:
             raise VolcengineImg2ImgError(f"备用请求失败: {e}")
     
+    def _submit_task(self, form: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        提交异步任务（受 volcengine_submit 限流器约束，被限流时自动降速）
+        
+        限流器的并发槽位在提交请求返回时释放，只限制同时进行的提交请求；
+        服务端在途任务数由 VolcengineTaskBatch 的 max_in_flight 控制
+        
+        Args:
+            form: 请求参数
+            
+        Returns:
+            任务提交结果，包含task_id
+        """
+        try:
+            with get_rate_limiter("volcengine_submit").slot():
+                if OFFICIAL_SDK_AVAILABLE and self.visual_service:
+                    # 使用官方SDK提交异步任务
+                    logger.info("使用官方SDK提交图生图任务")
+                    logger.info(f"提交参数: {form}")
+                    result = self.visual_service.cv_sync2async_submit_task(form)
+                    logger.info(f"SDK返回结果: {result}")
+                else:
+                    # 使用备用实现
+                    logger.info("使用备用实现提交图生图任务")
+                    result = self._fallback_request(form)
+                if is_rate_limited(result):
+                    raise VolcengineImg2ImgError(f"提交被限流: code={result.get('code')} {result.get('message', '')}")
+            
+            logger.info(f"任务提交成功: {result}")
+            return result
+            
+        except Exception as e:
+            logger.error(f"图生图任务提交失败: {e}")
+            raise VolcengineImg2ImgError(f"图生图任务提交失败: {e}")
+    
     def image_to_image(self, 
                       image_url: str,
                       prompt: str = "高质量人像写真",
@@ -190,24 +230,36 @@ class VolcengineImg2ImgOfficial:
             "seed": seed
         }
         
-        try:
-            if OFFICIAL_SDK_AVAILABLE and self.visual_service:
-                # 使用官方SDK提交异步任务
-                logger.info("使用官方SDK提交图生图任务")
-                logger.info(f"提交参数: {form}")
-                result = self.visual_service.cv_sync2async_submit_task(form)
-                logger.info(f"SDK返回结果: {result}")
-            else:
-                # 使用备用实现
-                logger.info("使用备用实现提交图生图任务")
-                result = self._fallback_request(form)
-            
-            logger.info(f"任务提交成功: {result}")
-            return result
+        return self._submit_task(form)
+    
+    @staticmethod
+    def build_prompt_form(prompt: str = "高质量人像写真",
+                          scale: int = 8,
+                          width: int = 1920,
+                          height: int = 1080,
+                          seed: int = -1) -> Dict[str, Any]:
+        """
+        构建文生图请求参数，同样用作产物缓存键
+        
+        Args:
+            prompt: 提示词描述
+            scale: 影响文本描述的程度
+            width: 输出图像宽度
+            height: 输出图像高度
+            seed: 随机种子，-1表示随机
             
-        except Exception as e:
-            logger.error(f"图生图任务提交失败: {e}")
-            raise VolcengineImg2ImgError(f"图生图任务提交失败: {e}")
+        Returns:
+            请求参数（包含req_key）
+        """
+        return {
+            "req_key": "high_aes_general_v30l_zt2i",
+            "prompt": prompt,
+            "scale": scale,
+            "width": width,
+            "height": height,
+            "seed": seed,
+            "return_url": True,
+        }
     
     def prompt_to_image(self, 
                       prompt: str = "高质量人像写真",
@@ -228,84 +280,86 @@ class VolcengineImg2ImgOfficial:
             任务提交结果，包含task_id
         """
         # 构建请求参数
+        form = self.build_prompt_form(prompt, scale=scale, width=width, height=height, seed=seed)
+        
+        return self._submit_task(form)
+    
+    def query_task(self, task_id: str) -> Dict[str, Any]:
+        """
+        查询一次异步任务状态（不等待）
+        
+        Args:
+            task_id: 任务ID
+            
+        Returns:
+            查询结果，任务状态位于 result["data"]["status"]
+            
+        Raises:
+            VolcengineImg2ImgError: 查询接口返回错误码
+        """
         form = {
-            "req_key": "high_aes_general_v30l_zt2i",
-            "prompt": prompt,
-            "scale": scale,
-            "width": width,
-            "height": height,
-            "seed": seed,
-            "return_url": True,
+            "req_key": "i2i_portrait_photo",
+            "task_id": task_id,
+            "req_json": "{\"logo_info\":{\"add_logo\":true,\"position\":0,\"language\":0,\"opacity\":0.3,\"logo_text_content\":\"这里是明水印内容\"},\"return_url\":true}"
         }
         
-        try:
+        with get_rate_limiter("volcengine_query").slot():
             if OFFICIAL_SDK_AVAILABLE and self.visual_service:
-                # 使用官方SDK提交异步任务
-                logger.info("使用官方SDK提交图生图任务")
-                logger.info(f"提交参数: {form}")
-                result = self.visual_service.cv_sync2async_submit_task(form)
-                logger.info(f"SDK返回结果: {result}")
+                # 使用官方SDK获取结果
+                result = self.visual_service.cv_sync2async_get_result(form)
             else:
-                # 使用备用实现
-                logger.info("使用备用实现提交图生图任务")
+                # 使用备用实现 - 需要调用结果查询接口
                 result = self._fallback_request(form)
-            
-            logger.info(f"任务提交成功: {result}")
-            return result
-            
-        except Exception as e:
-            logger.error(f"图生图任务提交失败: {e}")
-            raise VolcengineImg2ImgError(f"图生图任务提交失败: {e}")
+            if is_rate_limited(result):
+                raise VolcengineImg2ImgError(f"查询被限流: code={result.get('code')} {result.get('message', '')}")
+        
+        if result.get("code") != 10000:
+            error_msg = result.get("message", "获取结果失败")
+            raise VolcengineImg2ImgError(f"获取任务结果失败: {error_msg}")
+        return result
     
-    def get_task_result(self, task_id: str, max_wait_time: int = 300) -> Dict[str, Any]:
+    def get_task_result(self, task_id: str, max_wait_time: int = 300,
+                        min_poll_interval: float = 1.0, max_poll_interval: float = 5.0) -> Dict[str, Any]:
         """
         获取异步任务结果
         
+        轮询间隔从 min_poll_interval 开始逐次翻倍，最大 max_poll_interval；
+        查询频率另受 volcengine_query 限流器约束。多个任务一起等待见 modules/volcengine_async.py
+        
         Args:
             task_id: 任务ID
             max_wait_time: 最大等待时间（秒）
+            min_poll_interval: 初始轮询间隔（秒）
+            max_poll_interval: 最大轮询间隔（秒）
             
         Returns:
             任务结果
         """
-        form = {
-            "req_key": "i2i_portrait_photo",
-            "task_id": task_id,
-            "req_json": "{\"logo_info\":{\"add_logo\":true,\"position\":0,\"language\":0,\"opacity\":0.3,\"logo_text_content\":\"这里是明水印内容\"},\"return_url\":true}"
-        }
-        
         start_time = time.time()
+        poll_interval = min_poll_interval
         
         while time.time() - start_time < max_wait_time:
             try:
-                if OFFICIAL_SDK_AVAILABLE and self.visual_service:
-                    # 使用官方SDK获取结果
-                    result = self.visual_service.cv_sync2async_get_result(form)
-                else:
-                    # 使用备用实现 - 需要调用结果查询接口
-                    result = self._fallback_request(form)
-                
-                # 检查任务状态
-                if result.get("code") == 10000:
-                    data = result.get("data", {})
-                    status = data.get("status")
-                    
-                    if status == "done":
-                        logger.info("任务完成")
-                        return result
-                    elif status == "failed":
-                        error_msg = data.get("message", "任务失败")
-                        raise VolcengineImg2ImgError(f"任务执行失败: {error_msg}")
-                    else:
-                        logger.info(f"任务状态: {status}，等待中...")
-                        time.sleep(5)  # 等待5秒后重试
-                else:
-                    error_msg = result.get("message", "获取结果失败")
-                    raise VolcengineImg2ImgError(f"获取任务结果失败: {error_msg}")
-                    
+                result = self.query_task(task_id)
             except Exception as e:
+                # 查询失败不代表任务变慢：按最小间隔重试，不累加退避
                 logger.error(f"获取任务结果异常: {e}")
-                time.sleep(5)
+                time.sleep(min_poll_interval)
+                continue
+            
+            # 检查任务状态
+            data = result.get("data", {})
+            status = data.get("status")
+            
+            if status == "done":
+                logger.info("任务完成")
+                return result
+            elif status == "failed":
+                error_msg = data.get("message", "任务失败")
+                raise VolcengineImg2ImgError(f"任务执行失败: {error_msg}")
+            logger.info(f"任务状态: {status}，等待中...")
+            time.sleep(poll_interval)
+            poll_interval = min(max_poll_interval, poll_interval * 2)
         
         raise VolcengineImg2ImgError(f"任务超时，最大等待时间: {max_wait_time}秒")
     
@@ -332,7 +386,7 @@ class VolcengineImg2ImgOfficial:
                 if "image_urls" in data and data["image_urls"]:
                     image_url = data["image_urls"][0]
                     logger.info(f"从URL下载结果图片: {image_url}")
-                    response = requests.get(image_url, timeout=30)
+                    response = get_transport().get(image_url, timeout=(10, 30))
                     response.raise_for_status()
                     image_data = response.content
                 
@@ -344,11 +398,8 @@ class VolcengineImg2ImgOfficial:
                     image_data = base64.b64decode(image_b64)
             
             if image_data:
-                # 确保输出目录存在
-                os.makedirs(os.path.dirname(output_path), exist_ok=True)
-                
-                with open(output_path, 'wb') as f:
-                    f.write(image_data)
+                # 先写临时文件再改名，中断时不会留下写了一半的图片
+                write_bytes(output_path, image_data)
                 
                 logger.info(f"结果已保存到: {output_path}")
                 return output_path
@@ -364,11 +415,36 @@ class VolcengineImg2ImgOfficial:
             raise VolcengineImg2ImgError(f"保存结果失败: {e}")
 
 
+def extract_task_id(submit_result: Dict[str, Any]) -> str:
+    """
+    从任务提交结果中提取task_id
+    
+    Args:
+        submit_result: image_to_image / prompt_to_image 的返回值
+        
+    Returns:
+        任务ID
+        
+    Raises:
+        VolcengineImg2ImgError: 返回值中没有task_id
+    """
+    task_id = None
+    if "data" in submit_result and "task_id" in submit_result["data"]:
+        task_id = submit_result["data"]["task_id"]
+    elif "task_id" in submit_result:
+        task_id = submit_result["task_id"]
+    
+    if not task_id:
+        raise VolcengineImg2ImgError("提交任务成功但未获取到task_id")
+    return task_id
+
+
 def generate_image_from_url(image_url: str, 
                           output_path: str,
                           access_key_id: str,
                           secret_access_key: str,
                           prompt: str = "高质量人像写真",
+                          on_submit: Optional[Callable[[str], None]] = None,
                           **kwargs) -> str:
     """
     从图片URL生成新图片并保存到本地的便捷函数
@@ -379,6 +455,7 @@ def generate_image_from_url(image_url: str,
         access_key_id: 火山引擎访问密钥ID
         secret_access_key: 火山引擎访问密钥
         prompt: 生成提示词
+        on_submit: 任务提交成功后以task_id调用的回调（如写入任务台账）
         **kwargs: 其他参数
         
     Returns:
@@ -404,16 +481,11 @@ def generate_image_from_url(image_url: str,
         )
         
         # 提取task_id
-        task_id = None
-        if "data" in submit_result and "task_id" in submit_result["data"]:
-            task_id = submit_result["data"]["task_id"]
-        elif "task_id" in submit_result:
-            task_id = submit_result["task_id"]
-        
-        if not task_id:
-            raise VolcengineImg2ImgError("提交任务成功但未获取到task_id")
+        task_id = extract_task_id(submit_result)
         
         logger.info(f"任务ID: {task_id}")
+        if on_submit:
+            on_submit(task_id)
         
         # 等待任务完成
         logger.info("等待任务完成...")
@@ -432,6 +504,7 @@ def generate_image_from_prompt(
                           access_key_id: str,
                           secret_access_key: str,
                           prompt: str = "高质量人像写真",
+                          on_submit: Optional[Callable[[str], None]] = None,
                           **kwargs) -> str:
     """
     从图片URL生成新图片并保存到本地的便捷函数
@@ -442,6 +515,7 @@ def generate_image_from_prompt(
         access_key_id: 火山引擎访问密钥ID
         secret_access_key: 火山引擎访问密钥
         prompt: 生成提示词
+        on_submit: 任务提交成功后以task_id调用的回调（如写入任务台账）
         **kwargs: 其他参数
         
     Returns:
@@ -465,16 +539,11 @@ def generate_image_from_prompt(
         )
         
         # 提取task_id
-        task_id = None
-        if "data" in submit_result and "task_id" in submit_result["data"]:
-            task_id = submit_result["data"]["task_id"]
-        elif "task_id" in submit_result:
-            task_id = submit_result["task_id"]
-        
-        if not task_id:
-            raise VolcengineImg2ImgError("提交任务成功但未获取到task_id")
+        task_id = extract_task_id(submit_result)
         
         logger.info(f"任务ID: {task_id}")
+        if on_submit:
+            on_submit(task_id)
         
         # 等待任务完成
         logger.info("等待任务完成...")
@@ -488,6 +557,177 @@ def generate_image_from_prompt(
         logger.error(f"图生图处理失败: {e}")
         raise
 
+class VolcengineTaskBatch:
+    """
+    批量文生图任务：一次性登记多个场景，在后台线程中按在途上限提交任务，
+    每轮统一轮询所有在途task_id，任务完成后立即下载保存。
+    每个场景对应一个 concurrent.futures.Future，完成时结果为保存路径。
+    """
+    
+    def __init__(self,
+                 client: VolcengineImg2ImgOfficial,
+                 max_in_flight: int = 4,
+                 poll_interval: float = 5.0,
+                 max_wait_time: int = 300):
+        """
+        初始化批量任务
+        
+        Args:
+            client: 火山引擎客户端
+            max_in_flight: 同时在途（已提交未完成）的任务上限
+            poll_interval: 两轮轮询之间的间隔（秒）
+            max_wait_time: 单个任务从提交起的最大等待时间（秒）
+        """
+        self.client = client
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.poll_interval = poll_interval
+        self.max_wait_time = max_wait_time
+        self._pending: List[Tuple[Dict[str, Any], str, Future, Optional[Callable[[str], None]]]] = []
+        self._in_flight: Dict[str, Tuple[str, Future, float]] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    def add(self, output_path: str, prompt: str, on_submit: Optional[Callable[[str], None]] = None,
+            **kwargs) -> Future:
+        """
+        登记一个文生图任务
+        
+        Args:
+            output_path: 输出文件路径
+            prompt: 生成提示词
+            on_submit: 任务提交成功后以task_id调用的回调
+            **kwargs: prompt_to_image 的其他参数
+            
+        Returns:
+            任务完成时结果为保存路径的Future
+        """
+        future: Future = Future()
+        future.set_running_or_notify_cancel()
+        with self._lock:
+            self._pending.append((dict(prompt=prompt, **kwargs), output_path, future, on_submit))
+        self._wakeup.set()
+        return future
+    
+    def start(self) -> "VolcengineTaskBatch":
+        """启动后台提交/轮询线程"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="volc-batch", daemon=True)
+            self._thread.start()
+        return self
+    
+    def join(self, timeout: Optional[float] = None) -> None:
+        """等待所有已登记任务结束"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+    
+    def cancel_pending(self) -> int:
+        """
+        放弃所有尚未提交的任务（调用方中止时避免继续付费提交），已提交的任务仍等待完成
+        
+        Returns:
+            放弃的任务数
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for _, output_path, future, _ in pending:
+            future.set_exception(VolcengineImg2ImgError(f"批量任务已取消: {output_path}"))
+        self._wakeup.set()
+        return len(pending)
+    
+    def _submit_pending(self) -> None:
+        while True:
+            with self._lock:
+                if not self._pending or len(self._in_flight) >= self.max_in_flight:
+                    return
+                params, output_path, future, on_submit = self._pending.pop(0)
+            try:
+                task_id = extract_task_id(self.client.prompt_to_image(**params))
+                logger.info(f"批量任务已提交: {task_id} -> {output_path}")
+                with self._lock:
+                    self._in_flight[task_id] = (output_path, future, time.time())
+                if on_submit:
+                    try:
+                        on_submit(task_id)
+                    except Exception as e:
+                        logger.warning(f"提交回调失败: {task_id}，错误: {e}")
+            except Exception as e:
+                if is_rate_limited(e):
+                    # 被限流的任务放回队首，限流器降速后下一轮再提交
+                    with self._lock:
+                        self._pending.insert(0, (params, output_path, future, on_submit))
+                    return
+                future.set_exception(e)
+    
+    def _poll_in_flight(self) -> None:
+        with self._lock:
+            in_flight = list(self._in_flight.items())
+        for task_id, (output_path, future, submitted_at) in in_flight:
+            finished = True
+            try:
+                result = self.client.query_task(task_id)
+                data = result.get("data", {})
+                status = data.get("status")
+                if status == "done":
+                    future.set_result(self.client.save_result(result, output_path))
+                elif status == "failed":
+                    future.set_exception(VolcengineImg2ImgError(f"任务执行失败: {data.get('message', '任务失败')}"))
+                elif time.time() - submitted_at > self.max_wait_time:
+                    future.set_exception(VolcengineImg2ImgError(f"任务超时，最大等待时间: {self.max_wait_time}秒"))
+                else:
+                    finished = False
+            except Exception as e:
+                # 查询失败时下一轮重试，超时后放弃
+                logger.error(f"获取任务结果异常: {task_id}: {e}")
+                finished = time.time() - submitted_at > self.max_wait_time
+                if finished:
+                    future.set_exception(e)
+            if finished:
+                with self._lock:
+                    self._in_flight.pop(task_id, None)
+    
+    def _run(self) -> None:
+        while True:
+            self._submit_pending()
+            with self._lock:
+                idle = not self._pending and not self._in_flight
+            if idle:
+                return
+            self._wakeup.clear()
+            if self._in_flight:
+                self._wakeup.wait(self.poll_interval)
+                self._poll_in_flight()
+            else:
+                # 提交被限流且没有在途任务：等一个轮询间隔再重试，不空转
+                time.sleep(self.poll_interval)
+
+
+def generate_images_from_prompts(jobs: List[Tuple[str, str]],
+                                 access_key_id: str,
+                                 secret_access_key: str,
+                                 max_in_flight: int = 4,
+                                 poll_interval: float = 5.0,
+                                 **kwargs) -> Dict[str, Any]:
+    """
+    批量从提示词生成图片：所有任务先提交（受在途上限约束），统一轮询，完成一个下载一个
+    
+    Args:
+        jobs: (输出文件路径, 提示词) 列表
+        access_key_id: 火山引擎访问密钥ID
+        secret_access_key: 火山引擎访问密钥
+        max_in_flight: 同时在途的任务上限
+        poll_interval: 轮询间隔（秒）
+        **kwargs: prompt_to_image 的其他参数
+        
+    Returns:
+        输出路径到结果的映射，成功为保存路径，失败为异常对象
+    """
+    client = VolcengineImg2ImgOfficial(access_key_id, secret_access_key)
+    batch = VolcengineTaskBatch(client, max_in_flight=max_in_flight, poll_interval=poll_interval)
+    futures = {output_path: batch.add(output_path, prompt, **kwargs) for output_path, prompt in jobs}
+    batch.start().join()
+    return {path: (f.exception() or f.result()) for path, f in futures.items()}
+
 # 示例使用
 if __name__ == "__main__":
     # 配置参数
@@ -16,6 +16,8 @@ from typing import Dict, Any, Optional
 from pathlib import Path
 import logging
 
+from modules.http_transport import get_transport
+
 # 设置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -102,7 +104,7 @@ class SimpleVolcengineImg2Img:
         """
         try:
             logger.info(f"下载图片: {image_url}")
-            response = requests.get(image_url, timeout=30)
+            response = get_transport().get(image_url, timeout=(10, 30))
             response.raise_for_status()
             
             # 转换为base64
@@ -180,7 +182,7 @@ class SimpleVolcengineImg2Img:
         
         try:
             logger.info(f"发送图生图请求: {url}")
-            response = requests.post(url, headers=headers, data=body, timeout=120)
+            response = get_transport().post(url, headers=headers, data=body, timeout=(10, 120))
             response.raise_for_status()
             
             result = response.json()
@@ -222,7 +224,7 @@ class SimpleVolcengineImg2Img:
                 if image_urls:
                     image_url = image_urls[0]
                     logger.info(f"从URL下载结果图片: {image_url}")
-                    response = requests.get(image_url, timeout=30)
+                    response = get_transport().get(image_url, timeout=(10, 30))
                     response.raise_for_status()
                     image_data = response.content
             
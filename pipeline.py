@@ -0,0 +1,118 @@
+"""
+章节流水线：拆解（build_prompt）-> 图片提示词（claude_api）-> 合并 -> 渲染（loop，可选）
+
+每个章节完成一个阶段后立即进入下一阶段，阶段之间用有界队列衔接：
+第二次大模型调用与第一次重叠，合并后的章节JSON直接交给 loop.py，不再需要手动运行各个脚本。
+已是最新的中间结果（按各脚本记录的请求键判断）直接复用，不重复请求。
+
+合并结果写到 chapters/merged/，不覆盖 chapters/processed/ 中的拆解结果，
+否则图片提示词阶段的输入改变，下次运行会误判为过期。
+"""
+
+import json
+import asyncio
+import argparse
+from pathlib import Path
+from loguru import logger
+
+import build_prompt
+import claude_api
+from modules.artifact_io import write_text
+from modules.stage_pipeline import Stage, run_stages
+from update_processed_with_image_prompt import merge_image_prompts
+
+MERGED_DIR = Path("chapters/merged")
+QUEUE_SIZE = 2  # 相邻阶段之间最多积压的章节数
+IMAGE_CONCURRENCY = 2  # 图片提示词阶段并发章节数；实际速率仍受 rate_limits.claude 约束
+
+
+def merged_path(chapter_file):
+    return MERGED_DIR / chapter_file.name
+
+
+def merge_chapter(processed_file, image_file):
+    """把图片提示词合并进拆解结果，原子写入 MERGED_DIR；返回合并后的文件路径"""
+    with open(processed_file, "r", encoding="utf-8") as f:
+        processed_data = json.load(f)
+    with open(image_file, "r", encoding="utf-8") as f:
+        image_data = json.load(f)
+    updated = merge_image_prompts(processed_data, image_data)
+    output_file = merged_path(processed_file)
+    write_text(output_file, json.dumps(processed_data, ensure_ascii=False, indent=2))
+    logger.info(f"{output_file.name} 已合并 {updated} 个场景的图片提示词")
+    return output_file
+
+
+async def run(chapter_files, concurrency, image_concurrency, queue_size=QUEUE_SIZE, stream=True, registry=None,
+              render=False, profile=None):
+    """
+    让章节依次流过各阶段
+
+    返回各阶段的统计 {阶段名: {"done", "dropped", "failed"}}
+    """
+    breakdown_client = build_prompt.get_client()
+    image_client = claude_api.get_client()
+    breakdown_prompt = build_prompt.load_system_prompt()
+    image_prompt = claude_api.load_system_prompt()
+
+    async def breakdown(chapter_file):
+        if not build_prompt.is_up_to_date(chapter_file, breakdown_prompt):
+            ok = await build_prompt.process_chapter(breakdown_client, breakdown_prompt, chapter_file, stream,
+                                                    registry=registry)
+            if not ok:
+                return None
+        return build_prompt.output_path(chapter_file)
+
+    async def image_prompts(processed_file):
+        image_file = await claude_api.process_chapter(image_client, image_prompt, processed_file, registry)
+        return (processed_file, image_file) if image_file is not None else None
+
+    async def merge(files):
+        return await asyncio.to_thread(merge_chapter, *files)
+
+    stages = [
+        Stage("拆解", breakdown, concurrency),
+        Stage("图片提示词", image_prompts, image_concurrency),
+        Stage("合并", merge, 1),
+    ]
+    if render:
+        import loop  # 渲染依赖较重，只在需要时导入
+
+        async def render_chapter(merged_file):
+            await asyncio.to_thread(loop.process_chapter, str(merged_file), profile=profile)
+            return merged_file
+
+        stages.append(Stage("渲染", render_chapter, 1))
+
+    return await run_stages(chapter_files, stages, queue_size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="章节流水线：拆解 -> 图片提示词 -> 合并 -> 渲染")
+    parser.add_argument("--concurrency", type=int, default=build_prompt.CONCURRENCY,
+                        help=f"拆解阶段并发章节数（默认 {build_prompt.CONCURRENCY}）")
+    parser.add_argument("--image-concurrency", type=int, default=IMAGE_CONCURRENCY,
+                        help=f"图片提示词阶段并发章节数（默认 {IMAGE_CONCURRENCY}）")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE, help=f"阶段之间的队列容量（默认 {QUEUE_SIZE}）")
+    parser.add_argument("--no-stream", action="store_true", help="拆解阶段关闭流式输出")
+    parser.add_argument("--no-registry", action="store_true", help="不使用全局人物库")
+    parser.add_argument("--render", action="store_true", help="合并后直接调用 loop.py 渲染章节视频")
+    parser.add_argument("--profile", help="渲染档位: preview / draft / final（默认读取 render.profile）")
+    args = parser.parse_args()
+
+    if not build_prompt.API_KEY:
+        logger.error("请先设置环境变量 CLAUDE_API_KEY")
+        return
+
+    build_prompt.OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    chapter_files = sorted(build_prompt.CHAPTERS_DIR.glob("chapter_*_detailed.txt"))
+    logger.info(f"共检测到 {len(chapter_files)} 个章节文件。")
+    registry = None if args.no_registry else build_prompt.get_registry()
+    stats = asyncio.run(run(chapter_files, max(1, args.concurrency), max(1, args.image_concurrency),
+                            args.queue_size, not args.no_stream, registry, args.render, args.profile))
+    for name, counts in stats.items():
+        logger.info(f"{name}: 完成 {counts['done']}，未继续 {counts['dropped']}，失败 {counts['failed']}")
+
+
+if __name__ == "__main__":
+    main()
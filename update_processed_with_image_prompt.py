@@ -1,16 +1,15 @@
 import json
+import argparse
 from pathlib import Path
 
-def update_processed_with_image_prompt(processed_path, image_path, output_path=None):
+from modules.artifact_io import write_text
+
+
+def merge_image_prompts(processed_data, image_data):
     """
-    将 image_path 中每个场景的“完整图片提示词”补充到 processed_path 的每个场景的“图片提示词”字段。
-    如果 output_path 未指定，则覆盖 processed_path。
+    将 image_data 中每个场景的“完整图片提示词”补充到 processed_data 的每个场景的“图片提示词”字段（原地修改）。
+    返回补充的场景数。
     """
-    with open(processed_path, 'r', encoding='utf-8') as f:
-        processed_data = json.load(f)
-    with open(image_path, 'r', encoding='utf-8') as f:
-        image_data = json.load(f)
-
     # 构建 (原场景编号, 完整图片提示词) 映射，确保key为字符串
     image_prompt_map = {}
     for scene in image_data["场景提示词列表"]:
@@ -20,25 +19,49 @@ def update_processed_with_image_prompt(processed_path, image_path, output_path=N
         image_prompt_map[scene_id] = image_prompt
 
     # 遍历 processed_data，强制补充图片提示词
+    updated = 0
     for para in processed_data["场景拆解"]:
         for scene in para["场景列表"]:
             scene_id = str(scene["场景编号"])
             if scene_id in image_prompt_map:
                 scene["图片提示词"] = image_prompt_map[scene_id]
+                updated += 1
+    return updated
+
+
+def update_processed_with_image_prompt(processed_path, image_path, output_path=None):
+    """
+    将 image_path 中每个场景的“完整图片提示词”补充到 processed_path 的每个场景的“图片提示词”字段。
+    如果 output_path 未指定，则覆盖 processed_path。结果原子写入，返回输出路径。
+    """
+    with open(processed_path, 'r', encoding='utf-8') as f:
+        processed_data = json.load(f)
+    with open(image_path, 'r', encoding='utf-8') as f:
+        image_data = json.load(f)
+
+    merge_image_prompts(processed_data, image_data)
 
     # 保存
     if not output_path:
         output_path = processed_path
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(processed_data, f, ensure_ascii=False, indent=2)
+    write_text(output_path, json.dumps(processed_data, ensure_ascii=False, indent=2))
     print(f"已补充图片提示词: {output_path}")
+    return output_path
 
 # 用法示例：
-# update_processed_with_image_prompt('chapters/processed/chapter_001_processed.json', 'chapters/processed/chapter_001_image.json') 
+# python update_processed_with_image_prompt.py 11
+# python update_processed_with_image_prompt.py chapters/processed/chapter_001_processed.json chapters/processed/chapter_001_image.json
 
 if __name__ == "__main__":
-    update_processed_with_image_prompt('chapters/processed/chapter_011_processed.json', 'chapters/processed/chapter_011_image.json')
-    # update_processed_with_image_prompt('chapters/processed/chapter_008_processed.json', 'chapters/processed/chapter_008_image.json')
-    # update_processed_with_image_prompt('chapters/processed/chapter_003_processed.json', 'chapters/processed/chapter_003_image.json')
-    # update_processed_with_image_prompt('chapters/processed/chapter_004_processed.json', 'chapters/processed/chapter_004_image.json')
-    # update_processed_with_image_prompt('chapters/processed/chapter_005_processed.json', 'chapters/processed/chapter_005_image.json')
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="把图片提示词补充到章节JSON（整条流水线见 pipeline.py）")
+    parser.add_argument("chapter", help="章节编号（如 11），或章节JSON路径")
+    parser.add_argument("image", nargs="?", help="图片提示词JSON路径（默认与章节JSON同目录的 chapter_XXX_image.json）")
+    parser.add_argument("-o", "--output", help="输出路径（默认覆盖章节JSON）")
+    args = parser.parse_args()
+
+    if args.chapter.isdigit():
+        processed = Path(f"chapters/processed/chapter_{int(args.chapter):03d}_processed.json")
+    else:
+        processed = Path(args.chapter)
+    image = args.image or processed.with_name(processed.name.replace("_processed", "_image"))
+    update_processed_with_image_prompt(str(processed), str(image), args.output)